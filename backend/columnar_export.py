@@ -0,0 +1,195 @@
+"""
+Kolumnowy eksport tabel analitycznych do Parquet / Arrow IPC (analizy ad hoc w pandas, DuckDB, ...).
+
+Zamiast kopiowania product_states.db i czytania tabel wiersz po wierszu analityk dostaje zwarty
+plik kolumnowy z zachowanymi typami kolumn:
+- INTEGER -> int64, REAL/NUMERIC -> float64, DATE -> date32, pozostałe -> string,
+- wartości NULL zostają wartościami pustymi (kolumny całkowite nie zamieniają się we float).
+Typ kolumny wynika z deklaracji w schemacie SQLite; wartości są rzutowane już w zapytaniu
+(CAST / date()), więc pojedyncze wiersze zapisane z innym typem nie przerywają eksportu.
+
+Tabela czytana jest porcjami po BATCH_ROWS wierszy - każda porcja jest transponowana do kolumn
+i zapisywana jako jedna partia (row group Parquet / record batch Arrow) przed pobraniem kolejnej.
+
+Wymaga pakietu pyarrow (importowany dopiero przy eksporcie).
+
+Użycie z linii poleceń:
+    python columnar_export.py --format parquet --output eksport
+    python columnar_export.py --format arrow --tables products sales_history
+"""
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+from sql_stream import iter_chunks
+
+BATCH_ROWS = 65536
+
+# Tabele analityczne i lokalne tabele faktów (sprzedaż, dostawy, stany)
+EXPORT_TABLES = (
+    "products",
+    "sales_history",
+    "dead_stock_analysis",
+    "sales_daily",
+    "sales_weekly",
+    "deliveries",
+    "product_stock",
+    "stock_snapshot_deltas",
+    "purchase_price_history",
+)
+
+# format -> (rozszerzenie pliku, typ MIME)
+COLUMNAR_FORMATS = {
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrow", "application/vnd.apache.arrow.file"),
+}
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError as e:
+        raise RuntimeError("Eksport Parquet/Arrow wymaga pakietu pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def _column_kind(declared_type):
+    """Rodzaj kolumny według zadeklarowanego typu (reguły powinowactwa typów SQLite)"""
+    declared_type = (declared_type or "").upper()
+    if "INT" in declared_type:
+        return "int"
+    if declared_type == "DATE":
+        return "date"
+    if any(name in declared_type for name in ("CHAR", "CLOB", "TEXT")) or not declared_type:
+        return "text"
+    return "real"
+
+
+def table_columns(conn, table):
+    """Kolumny tabeli: lista (nazwa, rodzaj) - rodzaj: int / real / date / text"""
+    return [(row[1], _column_kind(row[2])) for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+
+def existing_tables(conn, tables=EXPORT_TABLES):
+    """Tabele z listy, które istnieją w bazie (tabele lokalne powstają przy pierwszej synchronizacji)"""
+    present = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [table for table in tables if table in present]
+
+
+def _select_expression(name, kind):
+    if kind == "int":
+        return f'CAST("{name}" AS INTEGER)'
+    if kind == "real":
+        return f'CAST("{name}" AS REAL)'
+    if kind == "date":
+        return f'date("{name}")'
+    return f'CAST("{name}" AS TEXT)'
+
+
+def _arrow_schema(pa, columns):
+    arrow_types = {"int": pa.int64(), "real": pa.float64(), "date": pa.date32(), "text": pa.string()}
+    return pa.schema([(name, arrow_types[kind]) for name, kind in columns])
+
+
+def iter_record_batches(conn, table, batch_rows=BATCH_ROWS):
+    """
+    Zwraca (schemat, generator partii RecordBatch) dla tabeli z EXPORT_TABLES.
+    Wiersze pobierane są porcjami po batch_rows i transponowane do tablic kolumnowych.
+    """
+    pa = _import_pyarrow()
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Tabela {table} nie jest dostępna do eksportu")
+
+    columns = table_columns(conn, table)
+    schema = _arrow_schema(pa, columns)
+    cursor = conn.execute(
+        f'SELECT {", ".join(_select_expression(name, kind) for name, kind in columns)} FROM "{table}"'
+    )
+
+    def batches():
+        for rows in iter_chunks(cursor, batch_rows):
+            arrays = []
+            for (name, kind), values in zip(columns, zip(*rows)):
+                if kind == "date":
+                    arrays.append(pa.array(values, type=pa.string()).cast(pa.date32()))
+                else:
+                    arrays.append(pa.array(values, type=schema.field(name).type))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    return schema, batches()
+
+
+def write_table(conn, table, sink, export_format="parquet", batch_rows=BATCH_ROWS):
+    """Zapisuje tabelę do pliku (ścieżka lub obiekt plikowy) w formacie parquet / arrow. Zwraca liczbę wierszy."""
+    if export_format not in COLUMNAR_FORMATS:
+        raise ValueError(f"Nieobsługiwany format: {export_format} (dostępne: {', '.join(COLUMNAR_FORMATS)})")
+    pa = _import_pyarrow()
+
+    schema, batches = iter_record_batches(conn, table, batch_rows)
+    if export_format == "parquet":
+        writer = pa.parquet.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_file(sink, schema, options=pa.ipc.IpcWriteOptions(compression="zstd"))
+
+    rows = 0
+    with writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    return rows
+
+
+def export_tables(database_file, output_dir, tables=None, export_format="parquet"):
+    """
+    Eksportuje tabele do plików <tabela>.<rozszerzenie> w output_dir.
+    Pomija tabele, których jeszcze nie ma w bazie. Zwraca {tabela: liczba wierszy}.
+    """
+    extension = COLUMNAR_FORMATS[export_format][0]
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(str(database_file))
+    try:
+        exported = {}
+        for table in existing_tables(conn, tables or EXPORT_TABLES):
+            path = output_dir / f"{table}{extension}"
+            exported[table] = write_table(conn, table, str(path), export_format)
+            print(f"[EXPORT] {table}: {exported[table]} wierszy -> {path}")
+        return exported
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Eksport tabel analitycznych product_states.db do Parquet / Arrow IPC"
+    )
+    parser.add_argument(
+        "--database",
+        default=str(Path(__file__).parent.parent / "product_states.db"),
+        help="Plik bazy SQLite (domyslnie: product_states.db)"
+    )
+    parser.add_argument(
+        "--output",
+        default=f"eksport_{datetime.now().strftime('%Y%m%d_%H%M')}",
+        help="Katalog docelowy (domyslnie: eksport_RRRRMMDD_GGMM)"
+    )
+    parser.add_argument(
+        "--format",
+        choices=list(COLUMNAR_FORMATS),
+        default="parquet",
+        help="Format plikow (domyslnie: parquet)"
+    )
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        choices=list(EXPORT_TABLES),
+        help="Tabele do eksportu (domyslnie: wszystkie dostepne)"
+    )
+
+    args = parser.parse_args()
+    export_tables(args.database, args.output, args.tables, args.format)
@@ -0,0 +1,418 @@
+"""
+Prognozowanie popytu (tabele demand_forecasts i demand_forecast_summary).
+
+Skrypt wsadowy (product_data_manager_optimized.py) raz dziennie, przy pierwszej synchronizacji
+po północy, dopasowuje modele dla wszystkich symboli i wszystkich ModelSP jednocześnie. Wejściem
+jest tygodniowa sprzedaż z sales_weekly (pełne tygodnie ISO). Serwer (main.py) tylko czyta
+gotowe prognozy.
+
+Dobór metody wg klasyfikacji Syntetos-Boylan (ADI = aktywne tygodnie / tygodnie ze sprzedażą):
+- ADI <= 1.32 (popyt regularny): wygładzanie wykładnicze, z profilem sezonowym (tydzień ISO)
+  gdy historia ma co najmniej 2 lata - SEASONAL, inaczej SES
+- ADI > 1.32 (popyt sporadyczny): Croston (SBA); TSB gdy od ostatniej sprzedaży minęło więcej
+  niż 2×ADI tygodni - TSB obniża prognozę produktów, które przestają się sprzedawać
+- mniej niż 2 tygodnie ze sprzedażą: średnia (NONE)
+
+Parametr wygładzania wybierany per seria z ALPHA_GRID (najmniejszy błąd prognozy o tydzień
+naprzód). Przedziały 90%: prognoza ± 1.645·σ·sqrt(1 + (h-1)·α²), σ z błędów w historii.
+Wszystkie rekurencje liczone są wektorowo (numpy) po całym katalogu - pętla tylko po tygodniach.
+"""
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from sales_weekly import week_start
+
+FORECAST_WEEKS = 8
+SUMMARY_WEEKS = 4  # Forecast4w w podsumowaniu - suma prognoz na 4 tygodnie
+ALPHA_GRID = (0.05, 0.1, 0.2, 0.3, 0.5)
+ADI_THRESHOLD = 1.32
+SEASONAL_MIN_WEEKS = 104
+ACCURACY_WEEKS = 13  # okno WAPE do oceny dokładności
+Z_90 = 1.645
+
+LEVEL_SYMBOL = 'symbol'
+LEVEL_MODEL = 'model'
+LEVEL_TOTAL = 'total'
+
+
+def init_demand_forecast_tables(database_file):
+    """Tworzy tabele prognoz jeśli nie istnieją"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS demand_forecasts (
+            Level TEXT NOT NULL,
+            Key TEXT NOT NULL,
+            WeekStart TEXT NOT NULL,
+            Forecast REAL,
+            Lower REAL,
+            Upper REAL,
+            PRIMARY KEY (Level, Key, WeekStart)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS demand_forecast_summary (
+            Level TEXT NOT NULL,
+            Key TEXT NOT NULL,
+            Method TEXT,
+            Alpha REAL,
+            HistoryWeeks INTEGER,
+            SalesWeeks INTEGER,
+            Adi REAL,
+            Sigma REAL,
+            Wape REAL,
+            Forecast4w REAL,
+            Lower4w REAL,
+            Upper4w REAL,
+            ComputedAt TEXT,
+            PRIMARY KEY (Level, Key)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_demand_forecast_summary_forecast ON demand_forecast_summary(Level, Forecast4w)')
+    # Stany i nazwy modeli na liście prognoz ModelSP
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products'")
+    if cursor.fetchone():
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_model_sp ON products(ModelSP)')
+    conn.commit()
+    conn.close()
+
+
+def last_computed_date(database_file):
+    """Data ostatniego przeliczenia prognoz (None gdy nie było)"""
+    try:
+        conn = sqlite3.connect(str(database_file))
+        row = conn.execute('SELECT MAX(ComputedAt) FROM demand_forecast_summary').fetchone()
+        conn.close()
+    except sqlite3.Error:
+        return None
+    return date.fromisoformat(row[0][:10]) if row and row[0] else None
+
+
+def load_weekly_matrix(conn, current_week):
+    """
+    Macierz sprzedaży symbol × tydzień (pełne tygodnie przed current_week, ciągły zakres tygodni).
+    Zwraca (symbole, lista poniedziałków, macierz numpy).
+    """
+    import numpy as np
+    import pandas as pd
+
+    df = pd.read_sql_query('''
+        SELECT Symbol, WeekStart, IloscSprzedana
+        FROM sales_weekly
+        WHERE WeekStart < ?
+    ''', conn, params=(current_week.isoformat(),))
+    if df.empty:
+        return [], [], np.zeros((0, 0))
+
+    first_week = date.fromisoformat(df['WeekStart'].min())
+    weeks = []
+    week = first_week
+    while week < current_week:
+        weeks.append(week.isoformat())
+        week += timedelta(weeks=1)
+
+    matrix = df.pivot_table(index='Symbol', columns='WeekStart', values='IloscSprzedana', aggfunc='sum', fill_value=0.0)
+    matrix = matrix.reindex(columns=weeks, fill_value=0.0)
+    return list(matrix.index), weeks, matrix.to_numpy(dtype=float)
+
+
+class _ErrorStats:
+    """Suma kwadratów błędów prognoz o krok (per seria i alfa) oraz błędy z ostatnich ACCURACY_WEEKS tygodni"""
+
+    def __init__(self, n, periods, groups):
+        import numpy as np
+
+        self.sse = np.zeros((n, groups))
+        self.count = np.zeros((n, groups))
+        self.recent_from = max(periods - ACCURACY_WEEKS, 0)
+        self.recent = np.full((n, periods - self.recent_from, groups), np.nan)
+
+    def add(self, t, error):
+        import numpy as np
+
+        valid = ~np.isnan(error)
+        self.sse += np.where(valid, error, 0.0) ** 2
+        self.count += valid
+        if t >= self.recent_from:
+            self.recent[:, t - self.recent_from, :] = error
+
+
+def _smooth(values, active, alpha):
+    """
+    Wygładzanie wykładnicze (SES) dla wielu serii i wielu alf naraz.
+    values, active: (n, T); alpha: (G,). Zwraca poziom końcowy (n, G) i statystyki błędów.
+    """
+    import numpy as np
+
+    n, periods = values.shape
+    level = np.full((n, len(alpha)), np.nan)
+    stats = _ErrorStats(n, periods, len(alpha))
+    for t in range(periods):
+        x = values[:, t:t + 1]
+        on = active[:, t:t + 1]
+        started = on & ~np.isnan(level)
+        error = np.where(started, x - level, np.nan)
+        stats.add(t, error)
+        level = np.where(started, level + alpha * np.nan_to_num(error), level)
+        level = np.where(on & np.isnan(level), x, level)
+    return np.nan_to_num(level), stats
+
+
+def _croston(values, active, alpha):
+    """Croston z korektą SBA: wielkość sprzedaży i odstęp między sprzedażami aktualizowane przy sprzedaży"""
+    import numpy as np
+
+    n, periods = values.shape
+    shape = (n, len(alpha))
+    size = np.full(shape, np.nan)
+    interval = np.full(shape, np.nan)
+    since = np.ones(shape)  # tygodnie od ostatniej sprzedaży
+    stats = _ErrorStats(n, periods, len(alpha))
+    for t in range(periods):
+        x = values[:, t:t + 1]
+        on = active[:, t:t + 1]
+        demand = on & (x > 0)
+        ready = on & ~np.isnan(size)
+        stats.add(t, np.where(ready, x - (1 - alpha / 2) * size / interval, np.nan))
+
+        first = demand & np.isnan(size)
+        update = demand & ~np.isnan(size)
+        size = np.where(update, size + alpha * (x - size), np.where(first, x, size))
+        interval = np.where(update, interval + alpha * (since - interval), np.where(first, since, interval))
+        since = np.where(demand, 1.0, np.where(ready, since + 1, since))
+    return np.nan_to_num((1 - alpha / 2) * size / interval), stats
+
+
+def _tsb(values, active, alpha):
+    """TSB: prawdopodobieństwo sprzedaży aktualizowane co tydzień, wielkość tylko przy sprzedaży"""
+    import numpy as np
+
+    n, periods = values.shape
+    shape = (n, len(alpha))
+    size = np.full(shape, np.nan)
+    probability = np.full(shape, np.nan)
+    stats = _ErrorStats(n, periods, len(alpha))
+    for t in range(periods):
+        x = values[:, t:t + 1]
+        on = active[:, t:t + 1]
+        demand = on & (x > 0)
+        ready = on & ~np.isnan(size)
+        stats.add(t, np.where(ready, x - probability * size, np.nan))
+
+        first = demand & np.isnan(size)
+        probability = np.where(ready, probability + alpha * (demand - probability), np.where(first, 1.0, probability))
+        size = np.where(ready & demand, size + alpha * (x - size), np.where(first, x, size))
+    return np.nan_to_num(probability * size), stats
+
+
+def forecast_matrix(values, weeks, horizon_weeks):
+    """
+    Dopasowuje modele do wszystkich serii (wiersze macierzy) i zwraca słownik tablic:
+    method, alpha, history_weeks, sales_weeks, adi, sigma, wape, forecast/lower/upper (n, H).
+    """
+    import numpy as np
+
+    values = np.clip(values, 0, None)  # tygodnie z przewagą zwrotów traktowane jak brak sprzedaży
+    n, periods = values.shape
+    alpha = np.array(ALPHA_GRID)
+
+    # Seria aktywna od pierwszego tygodnia ze sprzedażą
+    has_sales = values > 0
+    first_sale = np.where(has_sales.any(axis=1), has_sales.argmax(axis=1), periods)
+    active = np.arange(periods)[None, :] >= first_sale[:, None]
+    history_weeks = active.sum(axis=1)
+    sales_weeks = has_sales.sum(axis=1)
+    last_sale = np.where(sales_weeks > 0, periods - 1 - has_sales[:, ::-1].argmax(axis=1), -1)
+    weeks_since_sale = periods - 1 - last_sale
+    adi = np.where(sales_weeks > 0, history_weeks / np.maximum(sales_weeks, 1), np.inf)
+
+    # Profil sezonowy: średnia sprzedaż w danym tygodniu ISO minus średnia serii,
+    # wygładzona średnią kroczącą z 3 sąsiednich tygodni
+    phases = np.array([min(date.fromisoformat(w).isocalendar()[1], 52) - 1 for w in weeks], dtype=int)
+    one_hot = np.zeros((periods, 52))
+    one_hot[np.arange(periods), phases] = 1
+    active_values = np.where(active, values, 0.0)
+    phase_sum = active_values @ one_hot
+    phase_count = active.astype(float) @ one_hot
+    mean = active_values.sum(axis=1) / np.maximum(history_weeks, 1)
+    profile = np.where(phase_count > 0, phase_sum / np.maximum(phase_count, 1), mean[:, None]) - mean[:, None]
+    profile = (np.roll(profile, 1, axis=1) + profile + np.roll(profile, -1, axis=1)) / 3
+    seasonal_ok = history_weeks >= SEASONAL_MIN_WEEKS
+
+    # Wybór metody per seria
+    method = np.where(
+        sales_weeks < 2, 'NONE',
+        np.where(
+            adi > ADI_THRESHOLD,
+            np.where(weeks_since_sale > 2 * adi, 'TSB', 'CROSTON'),
+            np.where(seasonal_ok, 'SEASONAL', 'SES')
+        )
+    )
+
+    # Każda metoda liczona tylko dla swoich serii; alfa z najmniejszym MSE
+    best = np.zeros(n, dtype=int)
+    base = mean.copy()
+    sigma = np.sqrt(np.where(active, (values - mean[:, None]) ** 2, 0).sum(axis=1) / np.maximum(history_weeks, 1))
+    recent_errors = np.full((n, min(ACCURACY_WEEKS, periods)), np.nan)
+    fitters = {
+        'SES': lambda rows: _smooth(values[rows], active[rows], alpha),
+        'SEASONAL': lambda rows: _smooth(values[rows] - profile[rows][:, phases], active[rows], alpha),
+        'CROSTON': lambda rows: _croston(values[rows], active[rows], alpha),
+        'TSB': lambda rows: _tsb(values[rows], active[rows], alpha),
+    }
+    for name, fit in fitters.items():
+        rows = np.flatnonzero(method == name)
+        if not len(rows):
+            continue
+        final, stats = fit(rows)
+        mse = np.where(stats.count > 0, stats.sse / np.maximum(stats.count, 1), np.inf)
+        chosen = np.argmin(mse, axis=1)
+        picked = np.arange(len(rows))
+        best[rows] = chosen
+        base[rows] = final[picked, chosen]
+        sigma[rows] = np.where(np.isinf(mse[picked, chosen]), 0.0, np.sqrt(mse[picked, chosen]))
+        recent_errors[rows] = stats.recent[picked, :, chosen]
+
+    none = method == 'NONE'
+    chosen_alpha = np.where(none, 0.0, alpha[best])
+
+    # Prognoza na kolejne tygodnie (od bieżącego)
+    current = date.fromisoformat(weeks[-1]) + timedelta(weeks=1) if weeks else week_start(date.today())
+    horizon = [current + timedelta(weeks=h) for h in range(horizon_weeks)]
+    horizon_phases = np.array([min(w.isocalendar()[1], 52) - 1 for w in horizon], dtype=int)
+    forecast = np.repeat(base[:, None], horizon_weeks, axis=1)
+    seasonal = method == 'SEASONAL'
+    forecast[seasonal] += profile[seasonal][:, horizon_phases]
+    forecast = np.clip(forecast, 0, None)
+
+    steps = np.arange(horizon_weeks)[None, :]
+    half_width = Z_90 * sigma[:, None] * np.sqrt(1 + steps * chosen_alpha[:, None] ** 2)
+    lower = np.clip(forecast - half_width, 0, None)
+    upper = forecast + half_width
+
+    # Dokładność: WAPE prognoz o krok w ostatnich ACCURACY_WEEKS tygodniach
+    recent_values = np.where(np.isnan(recent_errors), 0, values[:, periods - recent_errors.shape[1]:])
+    recent_sum = recent_values.sum(axis=1)
+    wape = np.where(recent_sum > 0, np.nansum(np.abs(recent_errors), axis=1) / np.maximum(recent_sum, 1e-9), np.nan)
+
+    return {
+        'method': method,
+        'alpha': chosen_alpha,
+        'history_weeks': history_weeks,
+        'sales_weeks': sales_weeks,
+        'adi': np.where(np.isinf(adi), np.nan, adi),
+        'sigma': sigma,
+        'wape': wape,
+        'weeks': [w.isoformat() for w in horizon],
+        'forecast': forecast,
+        'lower': lower,
+        'upper': upper,
+        'recent_errors': np.nan_to_num(recent_errors),
+        'recent_sales': recent_sum,
+    }
+
+
+def _rows(level, keys, result, computed_at):
+    """Wiersze do zapisu w demand_forecasts i demand_forecast_summary"""
+    import numpy as np
+
+    forecast_rows = []
+    summary_rows = []
+    half_4w = np.sqrt((((result['upper'] - result['forecast'])[:, :SUMMARY_WEEKS]) ** 2).sum(axis=1))
+    forecast_4w = result['forecast'][:, :SUMMARY_WEEKS].sum(axis=1)
+
+    def clean(value):
+        value = float(value)
+        return None if np.isnan(value) else round(value, 4)
+
+    for i, key in enumerate(keys):
+        for h, week in enumerate(result['weeks']):
+            forecast_rows.append((
+                level, key, week,
+                round(float(result['forecast'][i, h]), 3),
+                round(float(result['lower'][i, h]), 3),
+                round(float(result['upper'][i, h]), 3)
+            ))
+        summary_rows.append((
+            level, key, str(result['method'][i]), clean(result['alpha'][i]),
+            int(result['history_weeks'][i]), int(result['sales_weeks'][i]),
+            clean(result['adi'][i]), clean(result['sigma'][i]), clean(result['wape'][i]),
+            round(float(forecast_4w[i]), 3),
+            round(float(max(forecast_4w[i] - half_4w[i], 0)), 3),
+            round(float(forecast_4w[i] + half_4w[i]), 3),
+            computed_at
+        ))
+    return forecast_rows, summary_rows
+
+
+def compute_demand_forecasts(database_file, today=None):
+    """
+    Przelicza prognozy dla symboli, ModelSP i sumy całego sklepu i zapisuje je w tabelach.
+    Zwraca liczby wierszy dla historii synchronizacji.
+    """
+    import numpy as np
+    import pandas as pd
+
+    today = today or date.today()
+    current_week = week_start(today)
+    init_demand_forecast_tables(database_file)
+
+    conn = sqlite3.connect(str(database_file))
+    symbols, weeks, values = load_weekly_matrix(conn, current_week)
+    if not symbols:
+        conn.close()
+        print("[Prognozy] Brak tygodniowej sprzedaży w sales_weekly - pomijam")
+        return {'rows_read': 0, 'rows_written': 0}
+
+    computed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    forecast_rows = []
+    summary_rows = []
+
+    # Symbole
+    by_symbol = forecast_matrix(values, weeks, FORECAST_WEEKS)
+    rows = _rows(LEVEL_SYMBOL, symbols, by_symbol, computed_at)
+    forecast_rows += rows[0]
+    summary_rows += rows[1]
+
+    # ModelSP - suma sprzedaży symboli modelu
+    models = pd.read_sql_query("SELECT Symbol, ModelSP FROM products WHERE ModelSP IS NOT NULL AND ModelSP != ''", conn)
+    model_of = dict(zip(models['Symbol'], models['ModelSP']))
+    model_keys = pd.Series([model_of.get(symbol) for symbol in symbols])
+    known = model_keys.notna().to_numpy()
+    if known.any():
+        grouped = pd.DataFrame(values[known]).groupby(model_keys[known].to_numpy()).sum()
+        by_model = forecast_matrix(grouped.to_numpy(), weeks, FORECAST_WEEKS)
+        rows = _rows(LEVEL_MODEL, list(grouped.index), by_model, computed_at)
+        forecast_rows += rows[0]
+        summary_rows += rows[1]
+
+    # Suma sklepu - prognozy symboli zsumowane, przedział z sumy wariancji (niezależne serie)
+    total_half = np.sqrt(((by_symbol['upper'] - by_symbol['forecast']) ** 2).sum(axis=0))
+    total_forecast = by_symbol['forecast'].sum(axis=0)
+    total = {
+        'method': np.array(['SUM']), 'alpha': np.array([np.nan]),
+        'history_weeks': np.array([len(weeks)]), 'sales_weeks': np.array([int((values.sum(axis=0) > 0).sum())]),
+        'adi': np.array([np.nan]), 'sigma': np.array([np.nan]),
+        # błędy symboli sumowane w tygodniu - dokładność prognozy sumy, a nie średnia z symboli
+        'wape': np.array([np.abs(by_symbol['recent_errors'].sum(axis=0)).sum() / by_symbol['recent_sales'].sum()
+                          if by_symbol['recent_sales'].sum() > 0 else np.nan]),
+        'weeks': by_symbol['weeks'],
+        'forecast': total_forecast[None, :],
+        'lower': np.clip(total_forecast - total_half, 0, None)[None, :],
+        'upper': (total_forecast + total_half)[None, :],
+    }
+    rows = _rows(LEVEL_TOTAL, ['ALL'], total, computed_at)
+    forecast_rows += rows[0]
+    summary_rows += rows[1]
+
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM demand_forecasts')
+    cursor.execute('DELETE FROM demand_forecast_summary')
+    cursor.executemany('INSERT INTO demand_forecasts VALUES (?, ?, ?, ?, ?, ?)', forecast_rows)
+    cursor.executemany('INSERT INTO demand_forecast_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', summary_rows)
+    conn.commit()
+    conn.close()
+
+    methods = pd.Series(by_symbol['method']).value_counts().to_dict()
+    print(f"[Prognozy] {len(symbols)} symboli ({methods}), {len(summary_rows) - len(symbols) - 1} modeli, {len(weeks)} tygodni historii")
+    return {'rows_read': int(values.size), 'rows_written': len(forecast_rows) + len(summary_rows)}
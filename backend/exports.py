@@ -0,0 +1,176 @@
+"""
+Strumieniowy eksport tabel do CSV i XLSX (endpointy /api/export/... w main.py).
+
+Wiersze są zapisywane i wysyłane porcjami po ROWS_PER_CHUNK - pobieranie zaczyna się od razu,
+a pamięć nie zależy od liczby wierszy (poza samym źródłem wierszy).
+
+- CSV: UTF-8 z BOM i separatorem ';' (polski Excel otwiera plik bez importu),
+- XLSX: minimalny skoroszyt z jednym arkuszem, pisany strumieniowo do ZIP (bez zależności -
+  arkusz zapisywany wiersz po wierszu jako inlineStr/liczby, ZIP z deskryptorami danych).
+"""
+import csv
+import io
+import math
+import numbers
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+ROWS_PER_CHUNK = 1000
+
+CSV_MEDIA_TYPE = "text/csv"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXPORT_FORMATS = ("csv", "xlsx")
+
+# Znaki sterujące niedozwolone w XML (poza tab, LF, CR)
+_XML_ILLEGAL = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _is_number(value):
+    return isinstance(value, numbers.Number) and not isinstance(value, bool)
+
+
+def _csv_value(value):
+    if value is None or (_is_number(value) and isinstance(value, float) and math.isnan(value)):
+        return ''
+    return value
+
+
+def stream_csv(columns, rows):
+    """Generator porcji CSV (bytes): nagłówek i wiersze (krotki w kolejności columns)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\r\n')
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([_csv_value(value) for value in row])
+        count += 1
+        if count % ROWS_PER_CHUNK == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Strumień bez przewijania zbierający zapisane bajty do odebrania przez generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '<Relationship Id="rId2" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/></cellXfs>'
+    '</styleSheet>'
+)
+
+
+def _workbook(sheet_name):
+    return (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        f'<sheets><sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    )
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if _is_number(value):
+        number = float(value)
+        if math.isnan(number) or math.isinf(number):
+            return '<c/>'
+        return f'<c><v>{value if isinstance(value, numbers.Integral) else repr(number)}</v></c>'
+    text = escape(_XML_ILLEGAL.sub('', str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def stream_xlsx(columns, rows, sheet_name="Eksport"):
+    """Generator porcji pliku XLSX (bytes): arkusz z nagłówkiem i wierszami"""
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/workbook.xml', _workbook(sheet_name))
+        archive.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        archive.writestr('xl/styles.xml', _STYLES)
+        yield sink.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(('<row>' + ''.join(_xlsx_cell(str(column)) for column in columns) + '</row>').encode('utf-8'))
+            parts = []
+            for row in rows:
+                parts.append('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>')
+                if len(parts) == ROWS_PER_CHUNK:
+                    sheet.write(''.join(parts).encode('utf-8'))
+                    parts.clear()
+                    data = sink.drain()
+                    if data:
+                        yield data
+            sheet.write((''.join(parts) + '</sheetData></worksheet>').encode('utf-8'))
+    yield sink.drain()
+
+
+def stream_export(export_format, columns, rows, sheet_name="Eksport"):
+    """Generator porcji pliku w wybranym formacie (csv / xlsx)"""
+    if export_format == "xlsx":
+        return stream_xlsx(columns, rows, sheet_name)
+    return stream_csv(columns, rows)
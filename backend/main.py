@@ -1,39 +1,83 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
+from contextlib import asynccontextmanager
 import sqlite3
 from datetime import datetime, timedelta
 from pathlib import Path
 import subprocess
+import sys
 import threading
 import time
 from typing import Dict, List, Optional
-import pyodbc
 import os
 from dotenv import load_dotenv
 import csv
 import requests
+from collections import OrderedDict
 from io import StringIO
 import socket
-from bs4 import BeautifulSoup
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.interval import IntervalTrigger
 import math
+import tempfile
+
+# Ciężkie zależności (pyodbc, bs4, apscheduler, pandas, selenium) importowane są
+# leniwie w funkcjach, które ich używają - import modułu i start serwera nie
+# wymagają sterownika ODBC ani bibliotek do scrapowania.
+
+from sync_runs import SyncRun, init_sync_runs_tables, init_run_stamp_columns, fail_running_sync_runs, get_last_run_id
+from purchase_proposals import (
+    BASE_COLUMNS as PURCHASE_PROPOSALS_BASE_COLUMNS,
+    init_purchase_proposals_table, compute_purchase_proposals, compute_proposals_frame,
+    proposals_records, proposals_summary, sort_proposals
+)
+from sales_weekly import init_sales_weekly_table, refresh_sales_weekly, read_weekly_sales, week_start
+from demand_forecast import (
+    LEVEL_SYMBOL, LEVEL_MODEL, LEVEL_TOTAL, init_demand_forecast_tables, compute_demand_forecasts
+)
+from reorder_points import (
+    init_reorder_suggestions_table, compute_reorder_suggestions, COMPUTED_AT_STATE as REORDER_COMPUTED_AT
+)
+from product_sync import (
+    CATALOG_HASH_COLUMN, init_row_hash_columns, load_fingerprints, changed_rows, bulk_upsert_products
+)
+from sql_stream import iter_chunks
+from purchase_prices import init_purchase_price_history_table, sync_purchase_prices as sync_purchase_prices_from_documents
+from sales_plans import init_sales_plans_table, apply_sales_plans_csv, to_iso_date
+from product_stock import init_product_stock_table, SYNCED_AT_STATE as PRODUCT_STOCK_SYNCED_AT
+from stock_movements import read_sync_state
+from stock_history import init_stock_history_table, read_stock_history, summarize_stock_history
+from exports import stream_export, EXPORT_FORMATS, CSV_MEDIA_TYPE, XLSX_MEDIA_TYPE
+from columnar_export import COLUMNAR_FORMATS, EXPORT_TABLES as COLUMNAR_EXPORT_TABLES, existing_tables, write_table
 
 load_dotenv()
 
-app = FastAPI(title="Inteligentne Zakupy API")
 
-# Scheduler dla cyklicznej synchronizacji
-scheduler = BackgroundScheduler()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start i zatrzymanie serwera - fazy startu opisane w run_startup_phases()"""
+    run_startup_phases()
+    yield
+    stop_scheduler()
+
+
+app = FastAPI(title="Inteligentne Zakupy API", lifespan=lifespan)
+
+# Scheduler dla cyklicznej synchronizacji (tworzony w start_scheduler())
+scheduler = None
 sync_lock = threading.Lock()  # Lock do synchronizacji aby nie uruchamiać wielu jednocześnie
 
-# Cache dla purchase-proposals
+# Cache dla purchase-proposals - wiersze bazowe (stan, sprzedaż 90 dni, parametry niestandardowe)
+# wybranego przeznaczenia/grupy z tabeli purchase_proposals; propozycje liczone są z nich
+# w pamięci dla dowolnego min_stock_days. Klucze pochodzą z parametrów zapytań, więc cache trzyma
+# najwyżej max_categories ostatnio używanych kombinacji (LRU) - tylko one są odświeżane w tle
 purchase_proposals_cache = {
-    "data": None,
-    "timestamp": None,
+    "categories": OrderedDict(),  # (przeznaczenie, grupa) -> {"base": DataFrame indeksowany Symbol, "timestamp": ...}
+    "max_categories": 16,
     "cache_duration": 600  # 10 minut w sekundach
 }
+purchase_proposals_lock = threading.Lock()
 
 # Cache dla dashboard-stats
 dashboard_stats_cache = {
@@ -70,6 +114,273 @@ global_data_cache = {
 }
 cache_refresh_lock = threading.Lock()
 
+# ==================== METRYKI (format Prometheus) ====================
+# Czasy requestów per route, czasy i liczba wierszy zapytań SQL (per funkcja wywołująca),
+# trafienia cache i liczba requestów w toku - eksport w /api/metrics
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+metrics_lock = threading.Lock()
+metrics_state = {
+    "requests": {},      # (metoda, route, status) -> liczba
+    "latency": {},       # (metoda, route) -> histogram
+    "in_flight": 0,
+    "queries": {},       # (baza, nazwa zapytania) -> histogram + wiersze, czas pobierania, błędy
+    "cache": {},         # nazwa cache -> {"hit": n, "miss": n}
+}
+route_paths = {}  # funkcja endpointu -> szablon ścieżki (np. /api/minimal-stocks/{group_id})
+
+
+def new_histogram():
+    return {"buckets": [0] * len(METRICS_BUCKETS), "sum": 0.0, "count": 0}
+
+
+def observe_histogram(histogram, value):
+    """Dodaje obserwację do histogramu (wywoływać pod metrics_lock)"""
+    for i, bound in enumerate(METRICS_BUCKETS):
+        if value <= bound:
+            histogram["buckets"][i] += 1
+    histogram["sum"] += value
+    histogram["count"] += 1
+
+
+def record_cache_access(cache_name: str, hit: bool):
+    """Rejestruje trafienie lub chybienie cache"""
+    with metrics_lock:
+        counters = metrics_state["cache"].setdefault(cache_name, {"hit": 0, "miss": 0})
+        counters["hit" if hit else "miss"] += 1
+
+
+def record_query(db: str, name: str, duration: float, error: bool = False):
+    with metrics_lock:
+        stats = metrics_state["queries"].get((db, name))
+        if stats is None:
+            stats = metrics_state["queries"][(db, name)] = {
+                **new_histogram(), "rows": 0, "fetch_seconds": 0.0, "errors": 0
+            }
+        observe_histogram(stats, duration)
+        if error:
+            stats["errors"] += 1
+
+
+def record_fetch(db: str, name: str, rows: int, duration: float):
+    with metrics_lock:
+        stats = metrics_state["queries"].get((db, name))
+        if stats is not None:
+            stats["rows"] += rows
+            stats["fetch_seconds"] += duration
+
+
+class TimedCursor:
+    """
+    Kursor mierzący czas zapytań i liczbę pobranych wierszy.
+    Nazwa zapytania = nazwa funkcji wywołującej execute() (lub query_name).
+    """
+
+    def __init__(self, cursor, db: str):
+        self._cursor = cursor
+        self._db = db
+        self._name = None
+
+    def _run(self, method, sql, params, name):
+        self._name = name
+        start = time.perf_counter()
+        try:
+            method(sql, *params)
+        except Exception:
+            record_query(self._db, name, time.perf_counter() - start, error=True)
+            raise
+        record_query(self._db, name, time.perf_counter() - start)
+        return self
+
+    def execute(self, sql, *params, query_name: Optional[str] = None):
+        return self._run(self._cursor.execute, sql, params, query_name or sys._getframe(1).f_code.co_name)
+
+    def executemany(self, sql, *params, query_name: Optional[str] = None):
+        return self._run(self._cursor.executemany, sql, params, query_name or sys._getframe(1).f_code.co_name)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        result = method(*args)
+        rows = len(result) if isinstance(result, list) else (1 if result is not None else 0)
+        if self._name:
+            record_fetch(self._db, self._name, rows, time.perf_counter() - start)
+        return result
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def __iter__(self):
+        # Iteracja po kursorze (for row in cursor) - wiersze i czas pobierania zliczane jak w fetch*;
+        # czas obejmuje tylko pobieranie wierszy, nie przetwarzanie ich w pętli wywołującego
+        name = self._name
+        rows = 0
+        duration = 0.0
+        iterator = iter(self._cursor)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    row = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    duration += time.perf_counter() - start
+                rows += 1
+                yield row
+        finally:
+            if name:
+                record_fetch(self._db, name, rows, duration)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TimedConnection:
+    """Połączenie (SQLite lub pyodbc) zwracające kursory TimedCursor"""
+
+    def __init__(self, connection, db: str):
+        object.__setattr__(self, "_connection", connection)
+        object.__setattr__(self, "_db", db)
+
+    def cursor(self):
+        return TimedCursor(self._connection.cursor(), self._db)
+
+    def execute(self, sql, *params, query_name: Optional[str] = None):
+        cursor = TimedCursor(self._connection.cursor(), self._db)
+        return cursor.execute(sql, *params, query_name=query_name or sys._getframe(1).f_code.co_name)
+
+    def __enter__(self):
+        self._connection.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._connection.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._connection, name, value)
+
+
+def connect_sqlite():
+    """Połączenie z lokalną bazą SQLite z pomiarem czasu zapytań"""
+    return TimedConnection(sqlite3.connect(str(DATABASE_FILE)), "sqlite")
+
+
+def format_labels(**labels):
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def format_histogram(lines, metric, labels, histogram):
+    for bound, count in zip(METRICS_BUCKETS, histogram["buckets"]):
+        lines.append(f"{metric}_bucket{format_labels(**labels, le=bound)} {count}")
+    lines.append(f"{metric}_bucket{format_labels(**labels, le='+Inf')} {histogram['count']}")
+    lines.append(f"{metric}_sum{format_labels(**labels)} {histogram['sum']:.6f}")
+    lines.append(f"{metric}_count{format_labels(**labels)} {histogram['count']}")
+
+
+def render_metrics() -> str:
+    """Zwraca metryki w formacie tekstowym Prometheus"""
+    with metrics_lock:
+        snapshot = {
+            "requests": dict(metrics_state["requests"]),
+            "latency": {k: {**v, "buckets": list(v["buckets"])} for k, v in metrics_state["latency"].items()},
+            "in_flight": metrics_state["in_flight"],
+            "queries": {k: {**v, "buckets": list(v["buckets"])} for k, v in metrics_state["queries"].items()},
+            "cache": {k: dict(v) for k, v in metrics_state["cache"].items()},
+        }
+
+    lines = [
+        "# HELP iz_http_requests_total Liczba requestów HTTP",
+        "# TYPE iz_http_requests_total counter",
+    ]
+    for (method, route, status), count in sorted(snapshot["requests"].items()):
+        lines.append(f"iz_http_requests_total{format_labels(method=method, route=route, status=status)} {count}")
+
+    lines += [
+        "# HELP iz_http_request_duration_seconds Czas obsługi requestu",
+        "# TYPE iz_http_request_duration_seconds histogram",
+    ]
+    for (method, route), histogram in sorted(snapshot["latency"].items()):
+        format_histogram(lines, "iz_http_request_duration_seconds", {"method": method, "route": route}, histogram)
+
+    lines += [
+        "# HELP iz_http_requests_in_flight Requesty w trakcie obsługi",
+        "# TYPE iz_http_requests_in_flight gauge",
+        f"iz_http_requests_in_flight {snapshot['in_flight']}",
+        "# HELP iz_db_query_duration_seconds Czas wykonania zapytania (execute)",
+        "# TYPE iz_db_query_duration_seconds histogram",
+    ]
+    for (db, name), stats in sorted(snapshot["queries"].items()):
+        format_histogram(lines, "iz_db_query_duration_seconds", {"db": db, "query": name}, stats)
+
+    for metric, key, help_text in (
+        ("iz_db_query_fetch_seconds_total", "fetch_seconds", "Łączny czas pobierania wierszy"),
+        ("iz_db_query_rows_total", "rows", "Liczba pobranych wierszy"),
+        ("iz_db_query_errors_total", "errors", "Liczba błędów zapytań"),
+    ):
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+        for (db, name), stats in sorted(snapshot["queries"].items()):
+            value = f"{stats[key]:.6f}" if isinstance(stats[key], float) else stats[key]
+            lines.append(f"{metric}{format_labels(db=db, query=name)} {value}")
+
+    lines += [
+        "# HELP iz_cache_requests_total Odwołania do cache",
+        "# TYPE iz_cache_requests_total counter",
+    ]
+    for cache_name, counters in sorted(snapshot["cache"].items()):
+        for result in ("hit", "miss"):
+            lines.append(f"iz_cache_requests_total{format_labels(cache=cache_name, result=result)} {counters[result]}")
+    lines += [
+        "# HELP iz_cache_hit_ratio Udział trafień cache",
+        "# TYPE iz_cache_hit_ratio gauge",
+    ]
+    for cache_name, counters in sorted(snapshot["cache"].items()):
+        total = counters["hit"] + counters["miss"]
+        ratio = counters["hit"] / total if total else 0.0
+        lines.append(f"iz_cache_hit_ratio{format_labels(cache=cache_name)} {ratio:.4f}")
+
+    return "\n".join(lines) + "\n"
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Mierzy czas obsługi requestu i liczbę requestów w toku"""
+    with metrics_lock:
+        metrics_state["in_flight"] += 1
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        duration = time.perf_counter() - start
+        endpoint = request.scope.get("endpoint")
+        if endpoint is not None and not route_paths:
+            route_paths.update({r.endpoint: r.path for r in app.routes if hasattr(r, "endpoint")})
+        # Niedopasowane ścieżki w jednej etykiecie - bez eksplozji liczby serii
+        route = route_paths.get(endpoint, "unmatched") if endpoint is not None else "unmatched"
+        with metrics_lock:
+            metrics_state["in_flight"] -= 1
+            key = (request.method, route)
+            metrics_state["requests"][(request.method, route, status)] = \
+                metrics_state["requests"].get((request.method, route, status), 0) + 1
+            histogram = metrics_state["latency"].get(key)
+            if histogram is None:
+                histogram = metrics_state["latency"][key] = new_histogram()
+            observe_histogram(histogram, duration)
+
 # Kompresja GZIP - drastycznie przyspiesza transfer dużych JSON (~7MB -> ~700KB)
 app.add_middleware(GZipMiddleware, minimum_size=1000)  # Kompresuj odpowiedzi > 1KB
 
@@ -92,115 +403,55 @@ SALES_PLANS_CSV = BASE_DIR / "backend" / "sales_plans.csv"
 GOOGLE_SHEETS_URL = "https://docs.google.com/spreadsheets/d/1B05iP_oad2Be-F-wbT02kipF0UJkObenHkSRRm6PfJU/export?format=csv&gid=0"
 
 
-def parse_polish_number(value):
-    """Parsuje liczbę w polskim formacie (przecinek jako separator dziesiętny)"""
-    if not value:
-        return 0.0
-    try:
-        # Usuń cudzysłowy i zamień przecinek na kropkę
-        clean = str(value).strip().replace('"', '').replace(',', '.')
-        return float(clean) if clean else 0.0
-    except (ValueError, TypeError):
-        return 0.0
-
-def sync_sales_plans_from_google():
-    """Synchronizuje plany sprzedażowe z Google Sheets do SQLite"""
+def sync_sales_plans_from_google(trigger_source="scheduled"):
+    """Synchronizuje plany sprzedażowe z Google Sheets do SQLite (tylko zmienione wiersze)"""
+    run = SyncRun(DATABASE_FILE, "sales_plans", trigger_source)
     try:
         print("[SYNC] Pobieranie danych z Google Sheets...")
         response = requests.get(GOOGLE_SHEETS_URL, timeout=30, allow_redirects=True)
         response.raise_for_status()
 
         csv_content = response.text
-        csv_reader = csv.DictReader(StringIO(csv_content))
-
-        conn = sqlite3.connect(str(DATABASE_FILE))
-        cursor = conn.cursor()
-
-        # Utwórz tabelę jeśli nie istnieje
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS sales_plans (
-                date TEXT PRIMARY KEY,
-                gls REAL DEFAULT 0,
-                four_f REAL DEFAULT 0,
-                jeans REAL DEFAULT 0,
-                total REAL DEFAULT 0,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        rows_updated = 0
-        for row in csv_reader:
-            try:
-                # Obsługa różnych wariantów nazwy kolumny DATA/Data/data
-                date = row.get('DATA', row.get('Data', row.get('data', ''))).strip()
-                if not date:
-                    continue
+        run.stage("fetch_google_sheets", rows_read=csv_content.count('\n'))
 
-                gls = parse_polish_number(row.get('GLS', row.get('gls', 0)))
-                four_f = parse_polish_number(row.get('4F', row.get('four_f', 0)))
-                jeans = parse_polish_number(row.get('JEANS', row.get('jeans', 0)))
-                total = gls + four_f + jeans
-
-                cursor.execute("""
-                    INSERT INTO sales_plans (date, gls, four_f, jeans, total, updated_at)
-                    VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-                    ON CONFLICT(date) DO UPDATE SET
-                        gls = excluded.gls,
-                        four_f = excluded.four_f,
-                        jeans = excluded.jeans,
-                        total = excluded.total,
-                        updated_at = CURRENT_TIMESTAMP
-                """, (date, gls, four_f, jeans, total))
-                rows_updated += 1
-            except (ValueError, KeyError) as e:
-                print(f"[SYNC] Pomijam wiersz: {e}")
-                continue
-
-        conn.commit()
-        conn.close()
-        print(f"[SYNC] Zsynchronizowano {rows_updated} wierszy")
+        result = apply_sales_plans_csv(DATABASE_FILE, csv_content)
+        if result['skipped']:
+            print("[SYNC] Arkusz bez zmian - pomijam zapis")
+        else:
+            print(f"[SYNC] Zsynchronizowano {result['rows_read']} wierszy, zapisano zmienione: {result['rows_written']}")
+        run.stage("write_sales_plans", rows_read=result['rows_read'], rows_written=result['rows_written'])
+        run.finish()
         return True
 
     except Exception as e:
         print(f"[SYNC] Błąd synchronizacji: {e}")
         import traceback
         traceback.print_exc()
+        run.finish(error=str(e))
         return False
 
 
 def get_sales_plans_from_db(start_date=None, end_date=None):
-    """Pobiera plany sprzedażowe z bazy SQLite"""
+    """Pobiera plany sprzedażowe z bazy SQLite (zakres dat po indeksowanej kolumnie date_iso)"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
-        # Konwertuj daty z DD.MM.YYYY na YYYY-MM-DD dla poprawnego porównania
-        def convert_date(date_str):
-            if not date_str:
-                return None
-            parts = date_str.split('.')
-            if len(parts) == 3:
-                return f"{parts[2]}-{parts[1]}-{parts[0]}"  # YYYY-MM-DD
-            return date_str
-
-        # Użyj substr do konwersji daty w bazie na format YYYY-MM-DD
-        # date w formacie DD.MM.YYYY -> substr(date,7,4)||'-'||substr(date,4,2)||'-'||substr(date,1,2)
-        date_expr = "substr(date,7,4)||'-'||substr(date,4,2)||'-'||substr(date,1,2)"
-
         query = "SELECT date, gls, four_f, jeans, total FROM sales_plans"
         params = []
 
+        # Daty z parametrów w formacie DD.MM.YYYY porównywane jako YYYY-MM-DD
         if start_date or end_date:
             conditions = []
             if start_date:
-                conditions.append(f"{date_expr} >= ?")
-                params.append(convert_date(start_date))
+                conditions.append("date_iso >= ?")
+                params.append(to_iso_date(start_date) or start_date)
             if end_date:
-                conditions.append(f"{date_expr} <= ?")
-                params.append(convert_date(end_date))
+                conditions.append("date_iso <= ?")
+                params.append(to_iso_date(end_date) or end_date)
             query += " WHERE " + " AND ".join(conditions)
 
-        query += f" ORDER BY {date_expr} DESC"
+        query += " ORDER BY date_iso DESC"
 
         cursor.execute(query, params)
         rows = cursor.fetchall()
@@ -238,12 +489,12 @@ def get_local_ip():
         return "127.0.0.1"
 
 
-def run_python_script():
+def run_python_script(trigger_source="manual"):
     """Uruchamia skrypt Pythona do aktualizacji danych"""
     print(f"Uruchamiam skrypt Pythona: {PYTHON_SCRIPT}")
     try:
         result = subprocess.run(
-            ["python3", str(PYTHON_SCRIPT)],
+            ["python3", str(PYTHON_SCRIPT), "--trigger", trigger_source],
             capture_output=True,
             text=True,
             timeout=300  # 5 minut timeout
@@ -254,8 +505,10 @@ def run_python_script():
         print(f"Skrypt Pythona zakończył działanie z kodem: {result.returncode}")
         if result.returncode != 0:
             print("Błąd podczas uruchamiania skryptu Pythona. Sprawdź logi.")
+            fail_running_sync_runs(DATABASE_FILE, "full", f"Kod wyjścia {result.returncode}: {result.stderr[-500:]}")
     except subprocess.TimeoutExpired:
         print("Skrypt Pythona przekroczył limit czasu (5 minut)")
+        fail_running_sync_runs(DATABASE_FILE, "full", "Przekroczony limit czasu (5 minut)")
     except Exception as e:
         print(f"Błąd podczas uruchamiania skryptu: {e}")
 
@@ -263,7 +516,7 @@ def run_python_script():
 def schedule_python_script():
     """Uruchamia skrypt Pythona co 5 minut"""
     while True:
-        run_python_script()
+        run_python_script("scheduled")
         time.sleep(5 * 60)  # 5 minut
 
 
@@ -282,10 +535,6 @@ def schedule_sales_plans_sync():
             print(f"[AUTO-SYNC] Błąd synchronizacji planów: {e}")
 
 
-# Startup event - nie uruchamiamy już niczego przy starcie
-# Harmonogram działa w tle przez APScheduler (co godzinę)
-
-
 @app.post("/api/update-database")
 async def update_database_now():
     """Ręczne uruchomienie aktualizacji bazy danych"""
@@ -314,7 +563,7 @@ async def update_database_now():
 async def get_database_status():
     """Sprawdza status ostatniej aktualizacji bazy danych"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         # Pobierz ostatnią aktualizację
@@ -339,6 +588,112 @@ async def get_database_status():
         )
 
 
+@app.get("/api/sync-runs")
+async def get_sync_runs(limit: int = 50, run_type: Optional[str] = None, status: Optional[str] = None):
+    """
+    Historia uruchomień synchronizacji (najnowsze pierwsze).
+
+    - run_type: full, products, sales_plans, purchase_prices
+    - status: running, success, partial, failed
+    Podsumowanie per typ: liczba uruchomień, średni/maksymalny czas i przepustowość z ostatnich 7 dni.
+    """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        sql_query = "SELECT * FROM sync_runs WHERE 1=1"
+        params = []
+        if run_type:
+            sql_query += " AND run_type = ?"
+            params.append(run_type)
+        if status:
+            sql_query += " AND status = ?"
+            params.append(status)
+        sql_query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+
+        cursor.execute(sql_query, params)
+        runs = [dict(row) for row in cursor.fetchall()]
+
+        cursor.execute("""
+            SELECT run_type,
+                   COUNT(*) AS runs,
+                   SUM(CASE WHEN status = 'success' THEN 1 ELSE 0 END) AS successful,
+                   ROUND(AVG(duration_seconds), 3) AS avg_duration_seconds,
+                   ROUND(MAX(duration_seconds), 3) AS max_duration_seconds,
+                   ROUND(SUM(rows_read) / NULLIF(SUM(duration_seconds), 0), 1) AS rows_read_per_second,
+                   MAX(started_at) AS last_started_at
+            FROM sync_runs
+            WHERE started_at >= ?
+            GROUP BY run_type
+        """, ((datetime.now() - timedelta(days=7)).isoformat(),))
+        summary = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        return {"runs": runs, "summary_7d": summary, "count": len(runs)}
+
+    except sqlite3.OperationalError as e:
+        if "no such table" in str(e):
+            return {"runs": [], "summary_7d": [], "count": 0}
+        raise HTTPException(status_code=500, detail=f"Błąd bazy danych: {str(e)}")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Błąd podczas pobierania historii synchronizacji: {str(e)}")
+
+
+@app.get("/api/sync-runs/{run_id}")
+async def get_sync_run(run_id: int):
+    """Szczegóły uruchomienia synchronizacji z czasami i liczbami wierszy poszczególnych etapów"""
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM sync_runs WHERE id = ?", (run_id,))
+        run = cursor.fetchone()
+        if not run:
+            conn.close()
+            raise HTTPException(status_code=404, detail=f"Nie znaleziono uruchomienia {run_id}")
+
+        cursor.execute("SELECT * FROM sync_run_stages WHERE run_id = ? ORDER BY id", (run_id,))
+        stages = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        result = dict(run)
+        for stage in stages:
+            stage["rows_per_second"] = round(stage["rows_read"] / stage["duration_seconds"], 1) \
+                if stage["duration_seconds"] else None
+        result["stages"] = stages
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Błąd podczas pobierania uruchomienia: {str(e)}")
+
+
+def get_sql_server_connection(timeout: int = 30):
+    """
+    Tworzy połączenie z SQL Server (Subiekt).
+    pyodbc importowany leniwie - moduł ładuje się także bez sterownika ODBC.
+    """
+    import pyodbc
+
+    server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
+    database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
+    username = os.getenv('SQL_USERNAME', 'zestawienia2')
+    password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
+
+    return TimedConnection(pyodbc.connect(
+        'DRIVER={ODBC Driver 18 for SQL Server};'
+        f'SERVER={server};'
+        f'DATABASE={database};'
+        f'UID={username};'
+        f'PWD={password};'
+        'TrustServerCertificate=yes;'
+        f'Connection Timeout={timeout};'
+    ), "sqlserver")
+
+
 def get_db_connection():
     """Tworzy połączenie z bazą danych SQLite"""
     if not DATABASE_FILE.exists():
@@ -347,7 +702,7 @@ def get_db_connection():
             detail=f"Baza danych nie istnieje: {DATABASE_FILE}"
         )
 
-    conn = sqlite3.connect(str(DATABASE_FILE))
+    conn = connect_sqlite()
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -361,7 +716,7 @@ def load_sales_data_to_cache():
         print("[CACHE] Ładowanie sales_data do cache...")
         global_data_cache["sales_data"]["loading"] = True
 
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM products")
@@ -390,7 +745,7 @@ def load_dead_stock_to_cache():
         print("[CACHE] Ładowanie dead_stock do cache...")
         global_data_cache["dead_stock"]["loading"] = True
 
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
@@ -459,7 +814,7 @@ def load_sales_summary_to_cache():
         print("[CACHE] Ładowanie sales_summary do cache...")
         global_data_cache["sales_summary"]["loading"] = True
 
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM products")
@@ -554,6 +909,7 @@ def refresh_all_cache():
     print("[CACHE] Rozpoczynam odswiezanie wszystkich danych...")
     load_sales_data_to_cache()
     load_dead_stock_to_cache()
+    refresh_purchase_proposals_cache()
     print("[CACHE] Zakonczono odswiezanie wszystkich danych")
 
 
@@ -569,11 +925,183 @@ def init_cache_on_startup():
         load_dead_stock_to_cache()
         print("[CACHE] Wszystkie dane zaladowane do cache")
 
-    thread = threading.Thread(target=load_all)
-    thread.start()
+    start_background_task("cache_warmup", load_all)
     print("[CACHE] Uruchomiono ladowanie danych w tle...")
 
 
+# ==================== FAZY STARTU SERWERA ====================
+# 1. schema    - tabele lokalnej bazy SQLite (szybko, synchronicznie)
+# 2. cache     - ładowanie cache w tle
+# 3. network   - synchronizacje sieciowe (Google Sheets, AGIS/TopReports, SQL Server) w tle
+# 4. scheduler - zadania cykliczne APScheduler
+# Serwer przyjmuje żądania zaraz po fazie 1, postęp pozostałych widać w /api/ready.
+# ENABLE_BACKGROUND_JOBS=0 wyłącza fazy 2-4 (np. benchmarki, praca offline).
+ENABLE_BACKGROUND_JOBS = os.getenv('ENABLE_BACKGROUND_JOBS', '1') != '0'
+
+# Cache ładowane przy starcie - od nich zależy flaga "warm" w /api/ready
+STARTUP_CACHES = ("sales_data", "dead_stock")
+
+startup_state = {
+    "started_at": None,
+    "schema_ready": False,
+    "scheduler_running": False,
+    "tasks": {}  # nazwa zadania -> status, czasy, błąd
+}
+
+
+def start_background_task(name: str, target):
+    """Uruchamia zadanie startowe w tle i zapisuje jego status w startup_state"""
+    task = {
+        "status": "running",
+        "started_at": datetime.now().isoformat(),
+        "finished_at": None,
+        "error": None
+    }
+    startup_state["tasks"][name] = task
+
+    def run():
+        try:
+            result = target()
+            task["status"] = "failed" if result is False else "done"
+        except Exception as e:
+            task["status"] = "failed"
+            task["error"] = str(e)
+            print(f"[STARTUP] Błąd zadania {name}: {e}")
+        finally:
+            task["finished_at"] = datetime.now().isoformat()
+
+    threading.Thread(target=run, daemon=True, name=f"startup-{name}").start()
+
+
+def init_local_schema():
+    """Faza 1: tworzy tabele lokalnej bazy, z których korzystają endpointy"""
+    if not DATABASE_FILE.exists():
+        print(f"[STARTUP] Baza danych nie istnieje: {DATABASE_FILE} - pomijam inicjalizację tabel")
+        return
+    init_ignored_products_table()
+    init_minimal_stocks_table()
+    init_sync_runs_tables(DATABASE_FILE)
+    init_run_stamp_columns(DATABASE_FILE)
+    init_row_hash_columns(DATABASE_FILE)
+    init_purchase_proposals_table(DATABASE_FILE)
+    init_sales_weekly_table(DATABASE_FILE)
+    init_demand_forecast_tables(DATABASE_FILE)
+    init_reorder_suggestions_table(DATABASE_FILE)
+    init_purchase_price_history_table(DATABASE_FILE)
+    init_sales_plans_table(DATABASE_FILE)
+    init_product_stock_table(DATABASE_FILE)
+    init_stock_history_table(DATABASE_FILE)
+    init_store_metrics_history_table()
+    startup_state["schema_ready"] = True
+
+
+def start_scheduler():
+    """Faza 4: konfiguruje i uruchamia zadania cykliczne"""
+    global scheduler
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.interval import IntervalTrigger
+
+    scheduler = BackgroundScheduler()
+
+    # Cykliczna synchronizacja co godzinę (bez początkowej synchronizacji)
+    scheduler.add_job(
+        run_data_sync,
+        trigger=IntervalTrigger(hours=1),
+        id='data_sync_job',
+        name='Synchronizacja danych co godzinę',
+        replace_existing=True
+    )
+
+    # Synchronizacja planów sprzedaży z Google Sheets co 30 minut
+    scheduler.add_job(
+        sync_sales_plans_from_google,
+        trigger=IntervalTrigger(minutes=30),
+        id='sales_plans_sync_job',
+        name='Synchronizacja planów sprzedaży co 30 minut',
+        replace_existing=True
+    )
+
+    # Odświeżanie cache danych co 5 minut (dane w pamięci są zawsze świeże)
+    scheduler.add_job(
+        refresh_all_cache,
+        trigger=IntervalTrigger(minutes=5),
+        id='cache_refresh_job',
+        name='Odświeżanie cache danych co 5 minut',
+        replace_existing=True
+    )
+
+    # Odświeżanie footfall w tle co 5 minut (NIE BLOKUJE API!)
+    scheduler.add_job(
+        refresh_footfall_background,
+        trigger=IntervalTrigger(minutes=5),
+        id='footfall_refresh_job',
+        name='Odświeżanie footfall w tle co 5 minut',
+        replace_existing=True
+    )
+
+    # Odświeżanie metryk 4F z Google Sheets w tle co 5 minut
+    scheduler.add_job(
+        refresh_store_metrics_background,
+        trigger=IntervalTrigger(minutes=5),
+        id='store_metrics_refresh_job',
+        name='Odświeżanie metryk sklepów w tle co 5 minut',
+        replace_existing=True
+    )
+
+    # Synchronizacja produktów z SQL Server co 30 minut
+    scheduler.add_job(
+        sync_products_from_sql_server,
+        trigger=IntervalTrigger(minutes=30),
+        id='products_sync_job',
+        name='Synchronizacja produktów z SQL Server co 30 minut',
+        replace_existing=True
+    )
+
+    scheduler.start()
+    startup_state["scheduler_running"] = True
+    print(f"[OK] Zaplanowano automatyczną synchronizację danych co 1 godzinę")
+    print(f"[OK] Zaplanowano automatyczną synchronizację planów sprzedaży co 30 minut")
+    print(f"[OK] Zaplanowano odświeżanie cache co 5 minut")
+    print(f"[OK] Zaplanowano odświeżanie footfall w tle co 5 minut")
+    print(f"[OK] Zaplanowano odświeżanie metryk sklepów w tle co 5 minut")
+    print(f"[OK] Zaplanowano synchronizację produktów z SQL Server co 30 minut")
+
+
+def stop_scheduler():
+    """Zatrzymuje scheduler przy zamykaniu serwera"""
+    if scheduler is not None and scheduler.running:
+        scheduler.shutdown(wait=False)
+        startup_state["scheduler_running"] = False
+        print("[OK] Scheduler zatrzymany")
+
+
+def run_startup_phases():
+    """Wykonuje fazy startu - tylko faza 1 blokuje przyjmowanie żądań"""
+    startup_state["started_at"] = datetime.now().isoformat()
+
+    init_local_schema()
+
+    if not ENABLE_BACKGROUND_JOBS:
+        print("[STARTUP] ENABLE_BACKGROUND_JOBS=0 - pomijam cache, synchronizacje i scheduler")
+        return
+
+    init_cache_on_startup()
+
+    print("[SYNC] Synchronizacja planów sprzedaży w tle...")
+    start_background_task("sales_plans_sync", lambda: sync_sales_plans_from_google("startup"))
+
+    print("[SYNC] Rozpoczynam pobieranie footfall w tle...")
+    start_background_task("footfall_refresh", refresh_footfall_background)
+
+    print("[SYNC] Rozpoczynam pobieranie metryk sklepów w tle...")
+    start_background_task("store_metrics_refresh", refresh_store_metrics_background)
+
+    print("[SYNC] Rozpoczynam synchronizację produktów z SQL Server w tle...")
+    start_background_task("products_sync", lambda: sync_products_from_sql_server("startup"))
+
+    start_scheduler()
+
+
 @app.get("/api/server-info")
 async def get_server_info():
     """Zwraca informacje o serwerze - IP i port"""
@@ -624,6 +1152,64 @@ async def get_cache_status():
     }
 
 
+@app.get("/api/ready")
+async def get_ready_status():
+    """
+    Status gotowości serwera.
+    ready = lokalne tabele utworzone (API obsługuje żądania),
+    warm = cache startowe załadowane, tasks = zadania startowe w tle.
+    """
+    caches = {}
+    for cache_name, cache_info in global_data_cache.items():
+        caches[cache_name] = {
+            "warm": cache_info["data"] is not None,
+            "loading": cache_info["loading"],
+            "timestamp": cache_info["timestamp"].isoformat() if cache_info["timestamp"] else None
+        }
+
+    caches["dashboard_stats"] = {
+        "warm": dashboard_stats_cache["data"] is not None,
+        "loading": False,
+        "timestamp": datetime.fromtimestamp(dashboard_stats_cache["timestamp"]).isoformat() if dashboard_stats_cache["timestamp"] else None
+    }
+    proposal_timestamps = [entry["timestamp"] for entry in purchase_proposals_cache["categories"].values()]
+    caches["purchase_proposals"] = {
+        "warm": bool(proposal_timestamps),
+        "loading": False,
+        "timestamp": datetime.fromtimestamp(max(proposal_timestamps)).isoformat() if proposal_timestamps else None
+    }
+    caches["store_metrics"] = {
+        "warm": store_metrics_cache["4F"] is not None,
+        "loading": store_metrics_cache["loading"],
+        "timestamp": datetime.fromtimestamp(store_metrics_cache["timestamp"]).isoformat() if store_metrics_cache["timestamp"] else None
+    }
+    caches["footfall"] = {
+        "warm": footfall_cache["gls"] is not None,
+        "loading": footfall_cache["loading"],
+        "timestamp": datetime.fromtimestamp(footfall_cache["timestamp"]).isoformat() if footfall_cache["timestamp"] else None
+    }
+
+    return {
+        "ready": startup_state["schema_ready"],
+        "warm": all(caches[name]["warm"] for name in STARTUP_CACHES),
+        "started_at": startup_state["started_at"],
+        "background_jobs": ENABLE_BACKGROUND_JOBS,
+        "scheduler_running": startup_state["scheduler_running"],
+        "caches": caches,
+        "tasks": startup_state["tasks"],
+        "server_time": datetime.now().isoformat()
+    }
+
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metryki w formacie tekstowym Prometheus:
+    czasy requestów per route, czasy i wiersze zapytań SQL Server/SQLite, trafienia cache, requesty w toku
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/")
 async def root():
     """Endpoint główny"""
@@ -653,7 +1239,9 @@ async def get_sales_data(force_refresh: bool = False):
     if global_data_cache["sales_data"]["data"] is not None and not force_refresh:
         cache_age = (datetime.now() - global_data_cache["sales_data"]["timestamp"]).total_seconds()
         print(f"[CACHE HIT] sales-data - wiek cache: {cache_age:.0f}s")
+        record_cache_access("sales_data", True)
         return global_data_cache["sales_data"]["data"]
+    record_cache_access("sales_data", False)
 
     # Jeśli cache nie jest dostępny lub wymuszono odświeżenie, załaduj synchronicznie
     try:
@@ -843,10 +1431,11 @@ async def get_new_products():
     try:
         conn = get_db_connection()
         cursor = conn.cursor()
+        # Indeks częściowy idx_products_new_ts (LastUpdatedTs WHERE IsNew = 1)
         cursor.execute("""
             SELECT * FROM products
             WHERE IsNew = 1
-            ORDER BY LastUpdated DESC
+            ORDER BY LastUpdatedTs DESC
         """)
         rows = cursor.fetchall()
         conn.close()
@@ -862,16 +1451,32 @@ async def get_new_products():
 
 
 @app.get("/api/products/updated")
-async def get_updated_products(minutes: int = 10):
-    """Pobiera produkty zaktualizowane w ostatnich X minutach"""
+async def get_updated_products(minutes: int = 10, run_id: Optional[int] = None, last_run: bool = False):
+    """
+    Pobiera produkty zaktualizowane w ostatnich X minutach.
+    run_id - produkty zapisane przez dane uruchomienie synchronizacji (/api/sync-runs),
+    last_run=true - przez ostatnie zakończone uruchomienie.
+    """
     try:
+        if last_run and run_id is None:
+            run_id = get_last_run_id(DATABASE_FILE)
+            if run_id is None:
+                return []
+
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute(f"""
-            SELECT * FROM products
-            WHERE datetime(LastUpdated) > datetime('now', '-{minutes} minutes')
-            ORDER BY LastUpdated DESC
-        """)
+        if run_id is not None:
+            cursor.execute("""
+                SELECT * FROM products
+                WHERE LastRunId = ?
+                ORDER BY LastUpdatedTs DESC
+            """, (run_id,))
+        else:
+            cursor.execute("""
+                SELECT * FROM products
+                WHERE LastUpdatedTs > ?
+                ORDER BY LastUpdatedTs DESC
+            """, (int(time.time()) - minutes * 60,))
         rows = cursor.fetchall()
         conn.close()
 
@@ -989,23 +1594,9 @@ async def get_sales_items(
     - limit: Maksymalna liczba rekordów (domyślnie 500)
     """
     try:
-        # Połączenie z SQL Server
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
         try:
-            sql_connection = pyodbc.connect(
-                'DRIVER={ODBC Driver 18 for SQL Server};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'UID={username};'
-                f'PWD={password};'
-                'TrustServerCertificate=yes;'
-                'Connection Timeout=30;'
-            )
-        except pyodbc.Error as conn_err:
+            sql_connection = get_sql_server_connection()
+        except Exception as conn_err:
             raise HTTPException(
                 status_code=503,
                 detail=f"Błąd połączenia z SQL Server: {str(conn_err)}"
@@ -1162,23 +1753,9 @@ async def get_sales_items_trend(
     - group_by: Grupowanie - day (dzień), week (tydzień), month (miesiąc)
     """
     try:
-        # Połączenie z SQL Server
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
         try:
-            sql_connection = pyodbc.connect(
-                'DRIVER={ODBC Driver 18 for SQL Server};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'UID={username};'
-                f'PWD={password};'
-                'TrustServerCertificate=yes;'
-                'Connection Timeout=30;'
-            )
-        except pyodbc.Error as conn_err:
+            sql_connection = get_sql_server_connection()
+        except Exception as conn_err:
             raise HTTPException(
                 status_code=503,
                 detail=f"Błąd połączenia z SQL Server: {str(conn_err)}"
@@ -1338,22 +1915,27 @@ async def get_statistics():
         cursor.execute("SELECT COUNT(*) FROM products WHERE IsNew = 1")
         new_products = cursor.fetchone()[0]
 
+        since_ts = int(time.time()) - 10 * 60
         cursor.execute("""
             SELECT COUNT(*) FROM products
-            WHERE datetime(LastUpdated) > datetime('now', '-10 minutes')
+            WHERE LastUpdatedTs > ?
             AND IsNew = 0
-        """)
+        """, (since_ts,))
         recently_updated = cursor.fetchone()[0]
 
-        cursor.execute("""
-            SELECT COUNT(*) FROM change_log
-            WHERE datetime(ChangeDate) > datetime('now', '-10 minutes')
-        """)
+        cursor.execute("SELECT COUNT(*) FROM change_log WHERE ChangeTs > ?", (since_ts,))
         recent_changes = cursor.fetchone()[0]
 
         cursor.execute("SELECT COUNT(*) FROM change_log")
         total_changes = cursor.fetchone()[0]
 
+        # Zdarzenia starsze niż okres retencji zwinięte do podsumowań dziennych
+        try:
+            cursor.execute("SELECT COALESCE(SUM(Changes), 0) FROM change_log_daily")
+            compacted_changes = cursor.fetchone()[0]
+        except sqlite3.OperationalError:
+            compacted_changes = 0
+
         conn.close()
 
         return {
@@ -1361,7 +1943,8 @@ async def get_statistics():
             "new_products": new_products,
             "recently_updated": recently_updated,
             "recent_changes": recent_changes,
-            "total_changes_logged": total_changes
+            "total_changes_logged": total_changes,
+            "total_changes_compacted": compacted_changes
         }
 
     except sqlite3.Error as e:
@@ -1399,7 +1982,9 @@ async def get_dashboard_stats(force_refresh: bool = False):
                     "cache_age_seconds": int(cache_age),
                     "cache_expires_in": int(dashboard_stats_cache["cache_duration"] - cache_age)
                 }
+                record_cache_access("dashboard_stats", True)
                 return cached_data
+        record_cache_access("dashboard_stats", False)
         # Połączenie z SQLite dla stanów magazynowych
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -1414,22 +1999,9 @@ async def get_dashboard_stats(force_refresh: bool = False):
         conn.close()
 
         # Połączenie z SQL Server dla danych sprzedaży
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
         try:
-            sql_connection = pyodbc.connect(
-                'DRIVER={ODBC Driver 18 for SQL Server};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'UID={username};'
-                f'PWD={password};'
-                'TrustServerCertificate=yes;'
-                'Connection Timeout=30;'
-            )
-        except pyodbc.Error as conn_err:
+            sql_connection = get_sql_server_connection()
+        except Exception as conn_err:
             raise HTTPException(
                 status_code=500,
                 detail=f"Błąd połączenia z SQL Server: {str(conn_err)}"
@@ -1552,15 +2124,7 @@ async def get_dashboard_stats(force_refresh: bool = False):
         GROUP BY dok_MagId
         """
 
-        sql_connection = pyodbc.connect(
-            'DRIVER={ODBC Driver 18 for SQL Server};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-            f'UID={username};'
-            f'PWD={password};'
-            'TrustServerCertificate=yes;'
-            'Connection Timeout=30;'
-        )
+        sql_connection = get_sql_server_connection()
         sql_cursor = sql_connection.cursor()
         sql_cursor.execute(query_per_warehouse, (today,))
         warehouse_rows = sql_cursor.fetchall()
@@ -1660,6 +2224,60 @@ async def get_dashboard_stats(force_refresh: bool = False):
 
 
 
+def filter_dead_stock_items(items, min_days, min_value, category, marka, rotation_status, sort_by):
+    """Filtry i sortowanie /api/dead-stock na wierszach z cache"""
+    if min_days > 0:
+        items = [i for i in items if i.get('DaysNoMovement', 0) >= min_days]
+    if min_value > 0:
+        items = [i for i in items if i.get('FrozenValue', 0) >= min_value]
+    if category:
+        items = [i for i in items if i.get('Rodzaj') == category]
+    if marka:
+        items = [i for i in items if i.get('Marka') == marka]
+    if rotation_status:
+        items = [i for i in items if i.get('Category', '').upper() == rotation_status.upper()]
+
+    # Sortowanie
+    sort_key_map = {
+        "days_no_movement": lambda x: x.get('DaysNoMovement', 0),
+        "frozen_value": lambda x: x.get('FrozenValue', 0),
+        "dni_zapasu": lambda x: x.get('DniZapasu', 0)
+    }
+    sort_func = sort_key_map.get(sort_by, sort_key_map["frozen_value"])
+    return sorted(items, key=sort_func, reverse=True)
+
+
+def dead_stock_query(min_days, min_value, category, marka, rotation_status, sort_by):
+    """Zapytanie /api/dead-stock do tabeli dead_stock_analysis (gdy cache jest pusty): (sql, parametry)"""
+    sql_query = "SELECT * FROM dead_stock_analysis WHERE 1=1"
+    params = []
+
+    if min_days > 0:
+        sql_query += " AND DaysNoMovement >= ?"
+        params.append(min_days)
+    if min_value > 0:
+        sql_query += " AND FrozenValue >= ?"
+        params.append(min_value)
+    if category:
+        sql_query += " AND Rodzaj = ?"
+        params.append(category)
+    if marka:
+        sql_query += " AND Marka = ?"
+        params.append(marka)
+    if rotation_status:
+        sql_query += " AND Category = ?"
+        params.append(rotation_status.upper())
+
+    sort_column = {
+        "days_no_movement": "DaysNoMovement DESC",
+        "frozen_value": "FrozenValue DESC",
+        "dni_zapasu": "DniZapasu DESC"
+    }.get(sort_by, "DaysNoMovement DESC")
+
+    sql_query += f" ORDER BY {sort_column}"
+    return sql_query, params
+
+
 @app.get("/api/dead-stock")
 async def get_dead_stock(
     min_days: Optional[int] = 0,
@@ -1690,30 +2308,12 @@ async def get_dead_stock(
     if cache_data is not None and not force_refresh:
         cache_age = (datetime.now() - global_data_cache["dead_stock"]["timestamp"]).total_seconds()
         print(f"[CACHE HIT] dead-stock - wiek cache: {cache_age:.0f}s")
+        record_cache_access("dead_stock", True)
 
         # Filtruj dane z cache w pamięci
-        items = cache_data["items"]
-
-        # Zastosuj filtry
-        if min_days > 0:
-            items = [i for i in items if i.get('DaysNoMovement', 0) >= min_days]
-        if min_value > 0:
-            items = [i for i in items if i.get('FrozenValue', 0) >= min_value]
-        if category:
-            items = [i for i in items if i.get('Rodzaj') == category]
-        if marka:
-            items = [i for i in items if i.get('Marka') == marka]
-        if rotation_status:
-            items = [i for i in items if i.get('Category', '').upper() == rotation_status.upper()]
-
-        # Sortowanie
-        sort_key_map = {
-            "days_no_movement": lambda x: x.get('DaysNoMovement', 0),
-            "frozen_value": lambda x: x.get('FrozenValue', 0),
-            "dni_zapasu": lambda x: x.get('DniZapasu', 0)
-        }
-        sort_func = sort_key_map.get(sort_by, sort_key_map["frozen_value"])
-        items = sorted(items, key=sort_func, reverse=True)
+        items = filter_dead_stock_items(
+            cache_data["items"], min_days, min_value, category, marka, rotation_status, sort_by
+        )
 
         # Oblicz średnią
         avg_days = sum(item.get('DaysNoMovement', 0) for item in items) / len(items) if items else 0
@@ -1739,38 +2339,13 @@ async def get_dead_stock(
         }
 
     # Fallback do bazy danych jeśli cache pusty
+    record_cache_access("dead_stock", False)
     try:
         print("[CACHE MISS] dead-stock - ładowanie z bazy...")
         conn = get_db_connection()
         cursor = conn.cursor()
 
-        sql_query = "SELECT * FROM dead_stock_analysis WHERE 1=1"
-        params = []
-
-        if min_days > 0:
-            sql_query += " AND DaysNoMovement >= ?"
-            params.append(min_days)
-        if min_value > 0:
-            sql_query += " AND FrozenValue >= ?"
-            params.append(min_value)
-        if category:
-            sql_query += " AND Rodzaj = ?"
-            params.append(category)
-        if marka:
-            sql_query += " AND Marka = ?"
-            params.append(marka)
-        if rotation_status:
-            sql_query += " AND Category = ?"
-            params.append(rotation_status.upper())
-
-        sort_column = {
-            "days_no_movement": "DaysNoMovement DESC",
-            "frozen_value": "FrozenValue DESC",
-            "dni_zapasu": "DniZapasu DESC"
-        }.get(sort_by, "DaysNoMovement DESC")
-
-        sql_query += f" ORDER BY {sort_column}"
-
+        sql_query, params = dead_stock_query(min_days, min_value, category, marka, rotation_status, sort_by)
         cursor.execute(sql_query, params)
         rows = cursor.fetchall()
         columns = [description[0] for description in cursor.description]
@@ -1966,7 +2541,7 @@ async def get_sales_plans(
     try:
         # Jeśli sync=True, zsynchronizuj z Google Sheets
         if sync:
-            success = sync_sales_plans_from_google()
+            success = sync_sales_plans_from_google("manual")
             if not success:
                 raise HTTPException(
                     status_code=500,
@@ -2013,10 +2588,169 @@ async def get_sales_plans(
         )
 
 
+# Metryki 4F z Google Sheets (zakładka PANEL_ZARZADZANIA) - pobierane w tle przez scheduler,
+# endpoint zwraca ostatni odczyt z pamięci (lub z tabeli store_metrics_history po restarcie)
+STORE_METRICS_SHEET_ID = "1j1hBF_QfN5wL1f2jUO4HKUlbPy_W914cDaHgUWZP2cI"
+STORE_METRICS_SHEET_NAME = "PANEL_ZARZADZANIA"
+STORE_METRICS_FIELDS = ('wynik', 'wejscia', 'sztuki', 'paragony', 'upt', 'konwersja')
+
+store_metrics_cache = {
+    "4F": None,
+    "timestamp": None,
+    "error": None,
+    "loading": False  # Czy trwa odświeżanie w tle
+}
+
+
+def init_store_metrics_history_table():
+    """Inicjalizuje tabelę historii metryk sklepów (jeden odczyt na godzinę)"""
+    try:
+        conn = connect_sqlite()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS store_metrics_history (
+                jednostka TEXT NOT NULL,
+                date TEXT NOT NULL,
+                hour INTEGER NOT NULL,
+                wynik REAL DEFAULT 0,
+                wejscia INTEGER DEFAULT 0,
+                sztuki INTEGER DEFAULT 0,
+                paragony INTEGER DEFAULT 0,
+                upt REAL DEFAULT 0,
+                konwersja REAL DEFAULT 0,
+                fetched_at TEXT NOT NULL,
+                PRIMARY KEY (jednostka, date, hour)
+            )
+        """)
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"[DB] Błąd tworzenia tabeli store_metrics_history: {e}")
+
+
+def fetch_store_metrics_4f():
+    """
+    Pobiera metryki 4F z Google Sheets. Dane 4F są w komórkach B123:C128 (6 wierszy):
+    0: WYNIK, 1: WEJSCIA, 2: SZTUKI, 3: PARAGONY, 4: UPT, 5: KONWERSJA
+    """
+    # Pobierz TYLKO zakres B123:C128 który zawiera dane 4F (6 wierszy)
+    url = (f"https://docs.google.com/spreadsheets/d/{STORE_METRICS_SHEET_ID}/gviz/tq"
+           f"?tqx=out:csv&sheet={STORE_METRICS_SHEET_NAME}&range=B123:C128")
+
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+
+    # Parsuj CSV - użyj modułu csv żeby poprawnie obsłużyć przecinki w wartościach
+    lines = list(csv.reader(StringIO(response.text)))
+
+    # Funkcja parsowania wartości
+    def parse_value(val):
+        if not val or val.strip() == '' or val.strip() == '""':
+            return 0
+        # Usuń cudzysłowy i zamień przecinek dziesiętny na kropkę
+        val = val.strip().strip('"').replace(',', '.').replace(' ', '')
+        try:
+            return float(val)
+        except:
+            return 0
+
+    store_4f = {"jednostka": "4F"}
+
+    for idx, metric_name in enumerate(STORE_METRICS_FIELDS):
+        if idx < len(lines):
+            row = lines[idx]
+            if len(row) >= 2:
+                value = parse_value(row[1])
+
+                if metric_name == 'paragony':
+                    store_4f['paragony'] = int(value)
+                elif metric_name == 'upt':
+                    store_4f['upt'] = round(value, 2)
+                elif metric_name == 'konwersja':
+                    # Konwersja jest jako ułamek (0.17), zamień na procent (17)
+                    store_4f['konwersja'] = round(value * 100, 2) if value < 1 else round(value, 2)
+                elif metric_name == 'wynik':
+                    store_4f['wynik'] = round(value, 2)
+                elif metric_name == 'wejscia':
+                    store_4f['wejscia'] = int(value)
+                elif metric_name == 'sztuki':
+                    store_4f['sztuki'] = int(value)
+
+    return store_4f
+
+
+def save_store_metrics_to_db(metrics: dict, fetched_at: datetime):
+    """Zapisuje odczyt metryk do historii (ostatni odczyt w danej godzinie)"""
+    try:
+        conn = connect_sqlite()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO store_metrics_history
+            (jednostka, date, hour, {', '.join(STORE_METRICS_FIELDS)}, fetched_at)
+            VALUES (?, ?, ?, {', '.join('?' * len(STORE_METRICS_FIELDS))}, ?)
+        """, (
+            metrics["jednostka"], fetched_at.strftime('%Y-%m-%d'), fetched_at.hour,
+            *[metrics.get(field, 0) for field in STORE_METRICS_FIELDS],
+            fetched_at.isoformat()
+        ))
+        conn.commit()
+        conn.close()
+    except Exception as e:
+        print(f"[STORE METRICS] Błąd zapisu do bazy: {e}")
+
+
+def get_latest_store_metrics_from_db(jednostka: str = "4F"):
+    """Ostatni dzisiejszy odczyt metryk z historii (gdy cache jest pusty, np. po restarcie)"""
+    try:
+        conn = connect_sqlite()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {', '.join(STORE_METRICS_FIELDS)}, fetched_at
+            FROM store_metrics_history
+            WHERE jednostka = ? AND date = ?
+            ORDER BY hour DESC
+            LIMIT 1
+        """, (jednostka, datetime.now().strftime('%Y-%m-%d')))
+        row = cursor.fetchone()
+        conn.close()
+        if not row:
+            return None, None
+        metrics = {"jednostka": jednostka, **dict(zip(STORE_METRICS_FIELDS, row[:-1]))}
+        return metrics, datetime.fromisoformat(row[-1])
+    except Exception as e:
+        print(f"[STORE METRICS] Błąd odczytu z bazy: {e}")
+        return None, None
+
+
+def refresh_store_metrics_background():
+    """
+    Odświeża metryki 4F w tle (wywoływane przez scheduler).
+    Ta funkcja NIE blokuje API - endpoint zwraca ostatni odczyt.
+    """
+    if store_metrics_cache["loading"]:
+        print("[STORE METRICS BG] Pomijam - poprzednie odświeżanie jeszcze trwa")
+        return
+
+    store_metrics_cache["loading"] = True
+    try:
+        store_4f = fetch_store_metrics_4f()
+        fetched_at = datetime.now()
+        store_metrics_cache["4F"] = store_4f
+        store_metrics_cache["timestamp"] = fetched_at.timestamp()
+        store_metrics_cache["error"] = None
+        save_store_metrics_to_db(store_4f, fetched_at)
+        print(f"[STORE METRICS BG] Metryki 4F zaktualizowane: {store_4f}")
+    except Exception as e:
+        store_metrics_cache["error"] = str(e)
+        print(f"[STORE METRICS BG] Błąd pobierania metryk 4F: {e}")
+    finally:
+        store_metrics_cache["loading"] = False
+
+
 @app.get("/api/store-metrics")
 async def get_store_metrics():
     """
-    Pobiera metryki TYLKO dla 4F z Google Sheets (zakładka PANEL_ZARZADZANIA):
+    Zwraca metryki TYLKO dla 4F (Google Sheets, zakładka PANEL_ZARZADZANIA):
     - Paragony (transakcje)
     - UPT (Units Per Transaction)
     - Konwersja
@@ -2024,84 +2758,39 @@ async def get_store_metrics():
     - Wejścia
     - Sztuki
 
-    Dane 4F są w komórkach B123:C128 (6 wierszy):
-    0: WYNIK
-    1: WEJSCIA
-    2: SZTUKI
-    3: PARAGONY
-    4: UPT
-    5: KONWERSJA
+    WAŻNE: Ten endpoint NIGDY nie czeka na Google Sheets - zwraca ostatni odczyt z cache
+    lub z tabeli store_metrics_history. Metryki są odświeżane w tle przez scheduler co 5 minut.
 
     GLS i JEANS pobierają dane z bazy SQL (dashboard-stats).
     """
-    try:
-        SHEET_ID = "1j1hBF_QfN5wL1f2jUO4HKUlbPy_W914cDaHgUWZP2cI"
-        SHEET_NAME = "PANEL_ZARZADZANIA"
-        # Pobierz TYLKO zakres B123:C128 który zawiera dane 4F (6 wierszy)
-        url = f"https://docs.google.com/spreadsheets/d/{SHEET_ID}/gviz/tq?tqx=out:csv&sheet={SHEET_NAME}&range=B123:C128"
-
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-
-        # Parsuj CSV - użyj modułu csv żeby poprawnie obsłużyć przecinki w wartościach
-        import csv as csv_module
-        from io import StringIO as SIO
-        lines = list(csv_module.reader(SIO(response.text)))
-
-        # Funkcja parsowania wartości
-        def parse_value(val):
-            if not val or val.strip() == '' or val.strip() == '""':
-                return 0
-            # Usuń cudzysłowy i zamień przecinek dziesiętny na kropkę
-            val = val.strip().strip('"').replace(',', '.').replace(' ', '')
-            try:
-                return float(val)
-            except:
-                return 0
-
-        # Struktura danych 4F (6 wierszy) - kolejność z arkusza:
-        # 0: WYNIK, 1: WEJSCIA, 2: SZTUKI, 3: PARAGONY, 4: UPT, 5: KONWERSJA
-        metric_names = ['wynik', 'wejscia', 'sztuki', 'paragony', 'upt', 'konwersja']
-
-        store_4f = {"jednostka": "4F"}
-
-        for idx, metric_name in enumerate(metric_names):
-            if idx < len(lines):
-                row = lines[idx]
-                if len(row) >= 2:
-                    value = parse_value(row[1])
-
-                    if metric_name == 'paragony':
-                        store_4f['paragony'] = int(value)
-                    elif metric_name == 'upt':
-                        store_4f['upt'] = round(value, 2)
-                    elif metric_name == 'konwersja':
-                        # Konwersja jest jako ułamek (0.17), zamień na procent (17)
-                        store_4f['konwersja'] = round(value * 100, 2) if value < 1 else round(value, 2)
-                    elif metric_name == 'wynik':
-                        store_4f['wynik'] = round(value, 2)
-                    elif metric_name == 'wejscia':
-                        store_4f['wejscia'] = int(value)
-                    elif metric_name == 'sztuki':
-                        store_4f['sztuki'] = int(value)
-
-        return {
-            "success": True,
-            "metrics": {
-                "4F": store_4f
-            }
-        }
+    if store_metrics_cache["4F"] is not None:
+        store_4f = store_metrics_cache["4F"]
+        fetched_at = datetime.fromtimestamp(store_metrics_cache["timestamp"])
+        source = "cache"
+    else:
+        store_4f, fetched_at = get_latest_store_metrics_from_db("4F")
+        source = "database"
 
-    except Exception as e:
-        print(f"[ERROR] Błąd pobierania metryk 4F: {e}")
-        import traceback
-        traceback.print_exc()
+    if store_4f is None:
         return {
             "success": False,
-            "error": str(e),
+            "error": store_metrics_cache["error"] or "Brak odczytu metryk - trwa pobieranie w tle",
+            "background_refresh_active": store_metrics_cache["loading"],
             "metrics": {}
         }
 
+    return {
+        "success": True,
+        "metrics": {
+            "4F": store_4f
+        },
+        "source": source,
+        "fetched_at": fetched_at.isoformat(),
+        "cache_age_seconds": int((datetime.now() - fetched_at).total_seconds()),
+        "last_error": store_metrics_cache["error"],
+        "background_refresh_active": store_metrics_cache["loading"]
+    }
+
 
 @app.get("/api/sales-plans/today")
 async def get_today_sales_plan(sync: bool = False):
@@ -2112,7 +2801,7 @@ async def get_today_sales_plan(sync: bool = False):
     try:
         # Jeśli sync=True, zsynchronizuj z Google Sheets
         if sync:
-            sync_sales_plans_from_google()
+            sync_sales_plans_from_google("manual")
 
         # Pobierz plan na dzisiaj z bazy danych
         today = datetime.now().strftime('%d.%m.%Y')
@@ -2171,7 +2860,7 @@ async def sync_sales_plans():
     - Pomija rekordy bez zmian
     """
     try:
-        success = sync_sales_plans_from_google()
+        success = sync_sales_plans_from_google("manual")
 
         if success:
             # Pobierz aktualne dane z bazy
@@ -2196,280 +2885,176 @@ async def sync_sales_plans():
         )
 
 
-@app.get("/api/purchase-proposals")
-async def get_purchase_proposals(min_stock_days: int = 30, force_refresh: bool = False):
+def load_purchase_proposals_base(przeznaczenie, grupa):
     """
-    Zwraca propozycje zakupowe dla suplementów.
-    Oblicza stan minimalny na podstawie średniego zużycia przez ostatnie 90 dni.
-
-    Parametry:
-    - min_stock_days: liczba dni zapasu do obliczenia stanu minimalnego (domyślnie 30)
-    - force_refresh: wymusza odświeżenie cache (domyślnie False)
-
-    Zwraca produkty z przeznaczenia "SUPLEMENTY" z informacjami:
-    - Aktualny stan
-    - Średnie dzienne zużycie (ostatnie 90 dni)
-    - Stan minimalny (średnie zużycie * min_stock_days)
-    - Różnica (stan - stan minimalny)
-    - Status: PONIŻEJ / OK / NADMIAR
-
-    CACHE: Wyniki są cachowane przez 10 minut dla lepszej wydajności
+    Ładuje do cache wiersze bazowe propozycji dla przeznaczenia/grupy z tabeli purchase_proposals
+    (przeliczanej przez skrypt wsadowy po każdej synchronizacji). Stan i ceny są bieżące z products.
     """
-    try:
-        # Sprawdź cache (tylko dla min_stock_days=30 - domyślna wartość)
-        if not force_refresh and min_stock_days == 30:
-            cache_age = None
-            if purchase_proposals_cache["timestamp"]:
-                cache_age = time.time() - purchase_proposals_cache["timestamp"]
-
-            # Jeśli cache jest świeży (< 10 minut), zwróć dane z cache
-            if cache_age is not None and cache_age < purchase_proposals_cache["cache_duration"]:
-                cached_data = purchase_proposals_cache["data"].copy()
-                cached_data["cache_info"] = {
-                    "cached": True,
-                    "cache_age_seconds": int(cache_age),
-                    "cache_expires_in": int(purchase_proposals_cache["cache_duration"] - cache_age)
-                }
-                return cached_data
-        # Połączenie z SQLite dla stanów magazynowych
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Pobierz produkty z przeznaczenia "SUPLEMENTY" z niestandardowymi parametrami jeśli istnieją
-        cursor.execute("""
-            SELECT p.Symbol, p.Nazwa, p.Stan, p.DetalicznaNetto, p.DetalicznaBrutto,
-                   p.Marka, p.Rozmiar, p.Przeznaczenie, p.JM,
-                   c.delivery_time_days, c.order_frequency_days, c.optimal_order_quantity, c.notes,
-                   p.CenaZakupuNetto, p.StawkaVAT
-            FROM products p
-            LEFT JOIN custom_stock_periods c ON p.Symbol = c.symbol
-            WHERE UPPER(p.Przeznaczenie) = 'SUPLEMENTY'
-            AND p.Stan >= 0
-        """)
-        products = cursor.fetchall()
-        conn.close()
-
-        if not products:
-            return {
-                "success": True,
-                "total_items": 0,
-                "items": [],
-                "summary": {
-                    "total_products": 0,
-                    "products_below_minimum": 0,
-                    "products_ok": 0,
-                    "products_excess": 0,
-                    "total_purchase_value": 0
-                }
-            }
+    import pandas as pd
 
-        # Połączenie z SQL Server dla historii sprzedaży
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
+    conn = connect_sqlite()
+    cursor = conn.cursor()
 
+    # Tabela pusta (np. przed pierwszą synchronizacją) - przelicz ją raz na żądanie
+    cursor.execute("SELECT 1 FROM purchase_proposals LIMIT 1")
+    if cursor.fetchone() is None:
         try:
-            sql_connection = pyodbc.connect(
-                'DRIVER={ODBC Driver 18 for SQL Server};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'UID={username};'
-                f'PWD={password};'
-                'TrustServerCertificate=yes;'
-                'Connection Timeout=30;'
-            )
-        except pyodbc.Error as conn_err:
+            sql_connection = get_sql_server_connection()
+        except Exception as conn_err:
+            conn.close()
             raise HTTPException(
                 status_code=500,
                 detail=f"Błąd połączenia z SQL Server: {str(conn_err)}"
             )
+        try:
+            compute_purchase_proposals(DATABASE_FILE, sql_connection)
+        finally:
+            sql_connection.close()
 
-        sql_cursor = sql_connection.cursor()
+    conditions = ["p.Stan >= 0"]
+    params = []
+    if przeznaczenie:
+        conditions.append("pp.Przeznaczenie = ?")
+        params.append(przeznaczenie)
+    if grupa:
+        conditions.append("pp.Grupa = ?")
+        params.append(grupa)
+
+    cursor.execute(f"""
+        SELECT pp.Symbol, pp.Sprzedaz90Dni, {PURCHASE_PROPOSALS_BASE_COLUMNS}
+        FROM purchase_proposals pp
+        INNER JOIN products p ON p.Symbol = pp.Symbol
+        LEFT JOIN custom_stock_periods c ON c.symbol = pp.Symbol
+        WHERE {" AND ".join(conditions)}
+    """, params)
+    columns = [description[0] for description in cursor.description]
+    base = pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+    conn.close()
+
+    # Parametry niestandardowe jako object - patch_purchase_proposals_product wpisuje do nich None
+    custom_columns = ["delivery_time_days", "order_frequency_days", "optimal_order_quantity", "notes"]
+    base[custom_columns] = base[custom_columns].astype(object)
+    base.index = base["Symbol"]
+
+    with purchase_proposals_lock:
+        categories = purchase_proposals_cache["categories"]
+        categories[(przeznaczenie, grupa)] = {
+            "base": base,
+            "timestamp": time.time()
+        }
+        categories.move_to_end((przeznaczenie, grupa))
+        # Najdawniej używane kombinacje usuwane ponad limit
+        while len(categories) > purchase_proposals_cache["max_categories"]:
+            categories.popitem(last=False)
+    return base
 
-        # Pobierz sprzedaż z ostatnich 90 dni dla suplementów
-        sales_query = """
-        WITH FilteredTowar AS (
-            SELECT tw_Id, tw_Symbol
-            FROM tw__Towar
-            WHERE UPPER(tw_pole7) = 'SUPLEMENTY'
-        )
-        SELECT
-            MAX(FilteredTowar.tw_Symbol) AS Symbol,
-            SUM(CASE
-                    WHEN dok_Typ IN (14, 6) THEN -ob_IloscMag
-                    ELSE ob_IloscMag
-                END) AS IloscSprzedana
-        FROM vwZstSprzWgKhnt
-        LEFT JOIN FilteredTowar ON ob_TowId = FilteredTowar.tw_Id
-        WHERE
-            CAST(dok_DataWyst AS DATE) >= DATEADD(day, -90, CAST(GETDATE() AS DATE))
-            AND dok_MagId IN (1,2,7,9)
-            AND dok_Podtyp <> 1
-            AND dok_Status <> 2
-        GROUP BY ob_TowId
-        """
 
+def refresh_purchase_proposals_cache():
+    """Odświeża w tle wczytane już przeznaczenia/grupy (błąd nie przerywa odświeżania innych cache)"""
+    for przeznaczenie, grupa in list(purchase_proposals_cache["categories"]):
         try:
-            sql_cursor.execute(sales_query)
-            sales_rows = sql_cursor.fetchall()
+            load_purchase_proposals_base(przeznaczenie, grupa)
         except Exception as e:
-            sql_cursor.close()
-            sql_connection.close()
-            raise HTTPException(
-                status_code=500,
-                detail=f"Błąd zapytania SQL: {str(e)}"
-            )
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            print(f"[CACHE] Błąd odświeżania propozycji zakupowych {przeznaczenie}/{grupa}: {detail}")
 
-        # Konwertuj dane sprzedaży na słownik
-        sales_data = {}
-        for row in sales_rows:
-            symbol = row[0]
-            if symbol:
-                sales_data[symbol] = float(row[1] or 0)
 
-        sql_cursor.close()
-        sql_connection.close()
+def patch_purchase_proposals_product(symbol, params):
+    """
+    Aktualizuje niestandardowe parametry jednego produktu w cache propozycji
+    (params=None - usunięcie parametrów) zamiast czyszczenia całego cache.
+    """
+    with purchase_proposals_lock:
+        for entry in purchase_proposals_cache["categories"].values():
+            base = entry["base"]
+            if symbol not in base.index:
+                continue
+            for key in ("delivery_time_days", "order_frequency_days", "optimal_order_quantity", "notes"):
+                base.at[symbol, key] = params.get(key) if params else None
 
-        # Przygotuj propozycje zakupowe
-        proposals = []
-        products_below_minimum = 0
-        products_ok = 0
-        products_excess = 0
-        total_purchase_value = 0
-
-        for product in products:
-            product_dict = dict(product)
-            symbol = product_dict.get('Symbol')
-            stan = float(product_dict.get('Stan') or 0)
-
-            # Pobierz parametry: czas dostawy, częstotliwość zamawiania, optymalna wielkość partii
-            delivery_time = product_dict.get('delivery_time_days')
-            order_frequency = product_dict.get('order_frequency_days')
-            optimal_quantity = product_dict.get('optimal_order_quantity')
-            custom_notes = product_dict.get('notes')
-
-            # Użyj domyślnych wartości jeśli nie ma niestandardowych
-            delivery_time_days = delivery_time if delivery_time is not None else 7  # Domyślnie 7 dni dostawy
-            order_frequency_days = order_frequency if order_frequency is not None else min_stock_days  # Domyślnie z parametru
-            optimal_order_quantity = optimal_quantity if optimal_quantity is not None else 0
-
-            # Pobierz sprzedaż z ostatnich 90 dni
-            sales_90_days = sales_data.get(symbol, 0)
-
-            # Oblicz średnie dzienne zużycie (sprzedaż / 90 dni)
-            avg_daily_usage = sales_90_days / 90.0 if sales_90_days > 0 else 0
-
-            # NOWA LOGIKA: Stan minimalny = (Czas dostawy + Częstotliwość zamawiania) × Średnie dzienne zużycie
-            min_stock = avg_daily_usage * (delivery_time_days + order_frequency_days)
-
-            # Oblicz różnicę
-            difference = stan - min_stock
-
-            # Określ status
-            if difference < 0:
-                status = "PONIŻEJ"
-                status_color = "red"
-                products_below_minimum += 1
-            elif difference < min_stock * 0.2:  # Mniej niż 20% powyżej minimum
-                status = "OK"
-                status_color = "green"
-                products_ok += 1
-            else:
-                status = "NADMIAR"
-                status_color = "blue"
-                products_excess += 1
 
-            # Oblicz ile trzeba zamówić (jeśli poniżej minimum)
-            # Zaokrąglij zawsze do góry jeśli są liczby po przecinku
-            quantity_to_order = math.ceil(abs(difference)) if difference < 0 else 0
+def purchase_proposals_frame(min_stock_days, przeznaczenie, grupa, force_refresh=False):
+    """
+    Posortowane propozycje dla przeznaczenia/grupy z cache wierszy bazowych (wczytywanych
+    ponownie po wygaśnięciu). Zwraca (ramka, czy z cache, wiek cache w sekundach).
+    """
+    key = (przeznaczenie, grupa)
+    entry = purchase_proposals_cache["categories"].get(key)
+    cache_age = time.time() - entry["timestamp"] if entry else None
+    cached = (
+        not force_refresh
+        and cache_age is not None
+        and cache_age < purchase_proposals_cache["cache_duration"]
+    )
+    record_cache_access("purchase_proposals", cached)
+    if cached:
+        base = entry["base"]
+        with purchase_proposals_lock:
+            if key in purchase_proposals_cache["categories"]:
+                purchase_proposals_cache["categories"].move_to_end(key)
+    else:
+        base = load_purchase_proposals_base(przeznaczenie, grupa)
 
-            # Pobierz ceny detaliczne
-            price_detaliczna_netto = float(product_dict.get('DetalicznaNetto') or 0)
-            price_detaliczna_brutto = float(product_dict.get('DetalicznaBrutto') or 0)
+    with purchase_proposals_lock:
+        frame = compute_proposals_frame(base, min_stock_days)
 
-            # Pobierz cenę zakupu (tc_CenaMag z bazy) i VAT
-            cena_zakupu_netto = float(product_dict.get('CenaZakupuNetto') or 0)
-            stawka_vat = float(product_dict.get('StawkaVAT') or 0)
+    return sort_proposals(frame), cached, cache_age
 
-            # Jeśli brak stawki VAT, oblicz ją z cen detalicznych
-            if stawka_vat == 0 and price_detaliczna_netto > 0 and price_detaliczna_brutto > 0:
-                stawka_vat = ((price_detaliczna_brutto / price_detaliczna_netto) - 1) * 100
 
-            # Oblicz cenę zakupu brutto (cena zakupu netto * (1 + VAT/100))
-            if cena_zakupu_netto > 0:
-                cena_zakupu_brutto = cena_zakupu_netto * (1 + stawka_vat / 100)
-            else:
-                # Fallback: cena magazynowa (tc_CenaMag) jest niedostępna w bazie
-                # Użyj 60% ceny detalicznej jako oszacowanie ceny zakupu
-                cena_zakupu_netto = price_detaliczna_netto * 0.6
-                if stawka_vat == 0:
-                    stawka_vat = 23.0  # Domyślna stawka VAT
-                cena_zakupu_brutto = cena_zakupu_netto * (1 + stawka_vat / 100)
-
-            # Oblicz wartość zamówienia: ilość do zamówienia × cena zakupu brutto
-            order_value = quantity_to_order * cena_zakupu_brutto
-
-            if quantity_to_order > 0:
-                total_purchase_value += order_value
-
-            proposals.append({
-                "Symbol": symbol,
-                "Nazwa": product_dict.get('Nazwa', ''),
-                "Marka": product_dict.get('Marka', ''),
-                "Rozmiar": product_dict.get('Rozmiar', ''),
-                "JM": product_dict.get('JM', 'szt.'),
-                "Stan": round(stan, 2),
-                "Sprzedaz90Dni": round(sales_90_days, 2),
-                "SrednieDzienneZuzycie": round(avg_daily_usage, 2),
-                "StanMinimalny": round(min_stock, 2),
-                "Roznica": round(difference, 2) if abs(difference) >= 0.01 else 0,
-                "Status": status,
-                "StatusColor": status_color,
-                "IloscDoZamowienia": int(quantity_to_order),  # Liczba całkowita
-                "CenaZakupuNetto": round(cena_zakupu_netto, 2),
-                "CenaZakupuBrutto": round(cena_zakupu_brutto, 2),
-                "StawkaVAT": round(stawka_vat, 2),
-                "WartoscZamowienia": round(order_value, 2),
-                "CenaDetalicznaNetto": round(price_detaliczna_netto, 2),
-                "CenaDetalicznaBrutto": round(price_detaliczna_brutto, 2),
-                # Nowe pola
-                "CzasDostawy": delivery_time_days,
-                "CzestotliwoscZamawiania": order_frequency_days,
-                "OptymalnaWielkoscPartii": optimal_order_quantity,
-                "CustomNotes": custom_notes
-            })
+@app.get("/api/purchase-proposals")
+async def get_purchase_proposals(
+    min_stock_days: int = 30,
+    przeznaczenie: Optional[str] = "SUPLEMENTY",
+    grupa: Optional[str] = None,
+    force_refresh: bool = False
+):
+    """
+    Zwraca propozycje zakupowe dla wybranego przeznaczenia i/lub grupy.
+    Oblicza stan minimalny na podstawie średniego zużycia przez ostatnie 90 dni.
 
-        # Sortuj: najpierw poniżej minimum, potem po największej różnicy
-        proposals.sort(key=lambda x: (
-            0 if x["Status"] == "PONIŻEJ" else 1 if x["Status"] == "OK" else 2,
-            x["Roznica"]
-        ))
+    Parametry:
+    - min_stock_days: liczba dni zapasu do obliczenia stanu minimalnego (domyślnie 30)
+    - przeznaczenie: przeznaczenie produktów (domyślnie SUPLEMENTY, pusty = wszystkie)
+    - grupa: grupa produktów (opcjonalnie)
+    - force_refresh: wymusza odświeżenie cache (domyślnie False)
 
-        result = {
-            "success": True,
-            "total_items": len(proposals),
-            "min_stock_days": min_stock_days,
-            "items": proposals,
-            "summary": {
-                "total_products": len(proposals),
-                "products_below_minimum": products_below_minimum,
-                "products_ok": products_ok,
-                "products_excess": products_excess,
-                "total_purchase_value": round(total_purchase_value, 2)
-            },
-            "cache_info": {
+    Zwraca produkty z informacjami:
+    - Aktualny stan
+    - Średnie dzienne zużycie (ostatnie 90 dni)
+    - Stan minimalny (średnie zużycie * min_stock_days)
+    - Różnica (stan - stan minimalny)
+    - Status: PONIŻEJ / OK / NADMIAR
+
+    CACHE: Sprzedaż z 90 dni pochodzi z tabeli purchase_proposals (przeliczanej po każdej synchronizacji),
+    wiersze kategorii są cachowane przez 10 minut - propozycje dla dowolnego min_stock_days liczone są w pamięci
+    """
+    try:
+        przeznaczenie = przeznaczenie.strip().upper() if przeznaczenie and przeznaczenie.strip() else None
+        grupa = grupa.strip().upper() if grupa and grupa.strip() else None
+        frame, cached, cache_age = purchase_proposals_frame(min_stock_days, przeznaczenie, grupa, force_refresh)
+
+        if cached:
+            cache_info = {
+                "cached": True,
+                "cache_age_seconds": int(cache_age),
+                "cache_expires_in": int(purchase_proposals_cache["cache_duration"] - cache_age)
+            }
+        else:
+            cache_info = {
                 "cached": False,
                 "generated_at": datetime.now().isoformat()
             }
-        }
-
-        # Zapisz do cache (tylko dla min_stock_days=30)
-        if min_stock_days == 30:
-            purchase_proposals_cache["data"] = result.copy()
-            purchase_proposals_cache["timestamp"] = time.time()
 
-        return result
+        return {
+            "success": True,
+            "total_items": len(frame),
+            "min_stock_days": min_stock_days,
+            "przeznaczenie": przeznaczenie,
+            "grupa": grupa,
+            "items": proposals_records(frame),
+            "summary": proposals_summary(frame),
+            "cache_info": cache_info
+        }
 
     except HTTPException:
         raise
@@ -2480,8 +3065,51 @@ async def get_purchase_proposals(min_stock_days: int = 30, force_refresh: bool =
         )
 
 
+@app.get("/api/purchase-proposals/categories")
+async def get_purchase_proposal_categories():
+    """
+    Przeznaczenia i grupy dostępne w propozycjach zakupowych.
+    Liczby produktów poniżej minimum i wartość zamówień dotyczą domyślnego okresu zapasu (30 dni)
+    z ostatniego przeliczenia tabeli purchase_proposals.
+    """
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        categories = {}
+        for column in ("Przeznaczenie", "Grupa"):
+            cursor.execute(f"""
+                SELECT {column} AS name,
+                       COUNT(*) AS products,
+                       SUM(CASE WHEN Status = 'PONIŻEJ' THEN 1 ELSE 0 END) AS below_minimum,
+                       ROUND(SUM(WartoscZamowienia), 2) AS purchase_value
+                FROM purchase_proposals
+                WHERE {column} != ''
+                GROUP BY {column}
+                ORDER BY {column}
+            """)
+            categories[column] = [dict(row) for row in cursor.fetchall()]
+
+        cursor.execute("SELECT MAX(ComputedAt) FROM purchase_proposals")
+        computed_at = cursor.fetchone()[0]
+        conn.close()
+
+        return {
+            "success": True,
+            "przeznaczenia": categories["Przeznaczenie"],
+            "grupy": categories["Grupa"],
+            "computed_at": computed_at
+        }
+
+    except sqlite3.Error as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Błąd bazy danych: {str(e)}"
+        )
+
+
 @app.post("/api/purchase-proposals/custom-period")
-async def save_custom_stock_period(
+def save_custom_stock_period(
     symbol: str,
     delivery_time_days: int = 7,
     order_frequency_days: int = 14,
@@ -2535,9 +3163,14 @@ async def save_custom_stock_period(
         conn.commit()
         conn.close()
 
-        # Inwaliduj cache po zapisaniu
-        purchase_proposals_cache["timestamp"] = None
-        purchase_proposals_cache["data"] = None
+        # Zaktualizuj w cache tylko ten produkt
+        patch_purchase_proposals_product(symbol, {
+            "delivery_time_days": delivery_time_days,
+            "order_frequency_days": order_frequency_days,
+            "optimal_order_quantity": optimal_order_quantity,
+            "notes": notes
+        })
+        compute_reorder_suggestions(DATABASE_FILE, symbols=[symbol])
 
         return {
             "success": True,
@@ -2561,7 +3194,7 @@ async def save_custom_stock_period(
 
 
 @app.delete("/api/purchase-proposals/custom-period/{symbol}")
-async def delete_custom_stock_period(symbol: str):
+def delete_custom_stock_period(symbol: str):
     """
     Usuwa niestandardowy okres zapasu dla produktu.
     """
@@ -2575,9 +3208,9 @@ async def delete_custom_stock_period(symbol: str):
         conn.commit()
         conn.close()
 
-        # Inwaliduj cache po usunięciu
-        purchase_proposals_cache["timestamp"] = None
-        purchase_proposals_cache["data"] = None
+        # Usuń parametry tylko tego produktu w cache
+        patch_purchase_proposals_product(symbol, None)
+        compute_reorder_suggestions(DATABASE_FILE, symbols=[symbol])
 
         if rows_deleted == 0:
             return {
@@ -2612,21 +3245,7 @@ async def get_product_seasonality():
     Dane: sprzedaż miesięczna z ostatnich 12 miesięcy
     """
     try:
-        # Połączenie z SQL Server
-        server = os.getenv('SQL_SERVER', '10.10.1.5\\SUBIEKT')
-        database = os.getenv('SQL_DATABASE', 'Nexo_Wilczek')
-        username = os.getenv('SQL_USERNAME', 'sa')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
-        sql_connection = pyodbc.connect(
-            'DRIVER={ODBC Driver 18 for SQL Server};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-            f'UID={username};'
-            f'PWD={password};'
-            'TrustServerCertificate=yes;'
-            'Connection Timeout=30;'
-        )
+        sql_connection = get_sql_server_connection()
         sql_cursor = sql_connection.cursor()
 
         # Pobierz sprzedaż miesięczną dla każdego produktu z ostatnich 12 miesięcy
@@ -2745,7 +3364,7 @@ def run_data_sync():
 
         script_path = os.path.join(os.path.dirname(__file__), '..', 'product_data_manager_optimized.py')
         result = subprocess.run(
-            [sys.executable, script_path],
+            [sys.executable, script_path, "--trigger", "scheduled"],
             capture_output=True,
             text=True,
             timeout=300  # 5 minut timeout
@@ -2763,11 +3382,13 @@ def run_data_sync():
         else:
             print("[!] Synchronizacja zakończyła się z błędem")
             print(result.stderr)
+            fail_running_sync_runs(DATABASE_FILE, "full", f"Kod wyjścia {result.returncode}: {result.stderr[-500:]}")
 
         print("="*60 + "\n")
 
     except subprocess.TimeoutExpired:
         print("[!] Synchronizacja przekroczyła limit czasu (5 minut)")
+        fail_running_sync_runs(DATABASE_FILE, "full", "Przekroczony limit czasu (5 minut)")
         print("="*60 + "\n")
     except Exception as e:
         print(f"[!] Błąd podczas synchronizacji: {e}")
@@ -2776,131 +3397,105 @@ def run_data_sync():
         sync_lock.release()
 
 
+# Stan synchronizacji cen zakupu uruchamianej w tle (POST /api/sync-purchase-prices)
+purchase_prices_sync_lock = threading.Lock()
+purchase_prices_job = {
+    "status": "idle",  # idle, running, done, failed
+    "run_id": None,
+    "phase": None,  # connect, fetch, apply, done
+    "rows_fetched": 0,
+    "priced_symbols": 0,
+    "updated_count": 0,
+    "started_at": None,
+    "finished_at": None,
+    "error": None
+}
+
+
+def run_purchase_prices_sync():
+    """
+    Synchronizacja cen zakupu w tle: nowe dokumenty PZ/FZ i PW trafiają do purchase_price_history,
+    ostatnie ceny przenoszone są do products jednym poleceniem. Postęp w purchase_prices_job.
+    """
+    run = SyncRun(DATABASE_FILE, "purchase_prices", "manual")
+    purchase_prices_job["run_id"] = run.run_id
+
+    def report(phase, **counts):
+        purchase_prices_job["phase"] = phase
+        purchase_prices_job.update(counts)
+
+    try:
+        report("connect")
+        sql_connection = get_sql_server_connection()
+        try:
+            result = sync_purchase_prices_from_documents(DATABASE_FILE, sql_connection, report)
+        finally:
+            sql_connection.close()
+        run.stage("fetch_purchase_prices", rows_read=result["rows_read"])
+        run.stage("write_purchase_prices", rows_written=result["rows_changed"], rows_changed=result["rows_changed"])
+        run.finish()
+        purchase_prices_job["status"] = "done"
+    except Exception as e:
+        print(f"[Ceny Zakupu] Błąd synchronizacji: {e}")
+        run.finish(error=str(e))
+        purchase_prices_job["status"] = "failed"
+        purchase_prices_job["error"] = str(e)
+    finally:
+        purchase_prices_job["finished_at"] = datetime.now().isoformat()
+        purchase_prices_sync_lock.release()
+
+
 @app.post("/api/sync-purchase-prices")
 async def sync_purchase_prices():
     """
-    Synchronizuje ceny zakupu z dokumentów PZ (z powiązanej FZ) i PW z SQL Server.
+    Uruchamia w tle synchronizację cen zakupu z dokumentów PZ (z powiązanej FZ) i PW z SQL Server.
     Dla PZ - cena z powiązanej faktury zakupu FZ
     Dla PW - cena bezpośrednio z pozycji dokumentu PW
+    Pobierane są tylko nowe dokumenty; postęp: GET /api/sync-purchase-prices/status
     """
     try:
-        # Połączenie z SQL Server
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
-        try:
-            sql_connection = pyodbc.connect(
-                'DRIVER={ODBC Driver 18 for SQL Server};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'UID={username};'
-                f'PWD={password};'
-                'TrustServerCertificate=yes;'
-                'Connection Timeout=30;'
-            )
-        except pyodbc.Error as conn_err:
-            raise HTTPException(
-                status_code=503,
-                detail=f"Błąd połączenia z SQL Server: {str(conn_err)}"
-            )
-
-        sql_cursor = sql_connection.cursor()
-
-        # Pobierz ostatnią cenę zakupu dla każdego produktu:
-        # 1. Z dokumentów PZ - cenę bierzemy z powiązanej faktury FZ (przez ob_DokHanId)
-        # 2. Z dokumentów PW - cenę bierzemy bezpośrednio z pozycji PW
-        query = """
-        WITH PurchasePrices AS (
-            -- Ceny z PZ powiązanych z FZ (cena z faktury zakupu)
-            SELECT
-                tw.tw_Symbol AS Symbol,
-                fz_poz.ob_CenaNetto AS CenaZakupuNetto,
-                COALESCE(sl.sl_Nazwa, '') AS Grupa,
-                pz.dok_DataWyst AS DataDok,
-                ROW_NUMBER() OVER (PARTITION BY tw.tw_Symbol ORDER BY pz.dok_DataWyst DESC) AS rn
-            FROM dok__Dokument pz
-            INNER JOIN dok_Pozycja pz_poz ON pz.dok_Id = pz_poz.ob_DokMagId
-            INNER JOIN dok__Dokument fz ON pz_poz.ob_DokHanId = fz.dok_Id
-            INNER JOIN dok_Pozycja fz_poz ON fz.dok_Id = fz_poz.ob_DokHanId AND pz_poz.ob_TowId = fz_poz.ob_TowId
-            INNER JOIN tw__Towar tw ON pz_poz.ob_TowId = tw.tw_Id
-            LEFT JOIN sl__Slownik sl ON tw.tw_IdGrupa = sl.sl_Id
-            WHERE pz.dok_NrPelny LIKE 'PZ%'
-                AND fz.dok_NrPelny LIKE 'FZ%'
-                AND pz.dok_Status <> 2
-                AND fz_poz.ob_CenaNetto > 0
-
-            UNION ALL
-
-            -- Ceny z PW (bezpośrednio z pozycji dokumentu)
-            SELECT
-                tw.tw_Symbol AS Symbol,
-                pw_poz.ob_CenaNetto AS CenaZakupuNetto,
-                COALESCE(sl.sl_Nazwa, '') AS Grupa,
-                pw.dok_DataWyst AS DataDok,
-                ROW_NUMBER() OVER (PARTITION BY tw.tw_Symbol ORDER BY pw.dok_DataWyst DESC) AS rn
-            FROM dok__Dokument pw
-            INNER JOIN dok_Pozycja pw_poz ON pw.dok_Id = pw_poz.ob_DokMagId
-            INNER JOIN tw__Towar tw ON pw_poz.ob_TowId = tw.tw_Id
-            LEFT JOIN sl__Slownik sl ON tw.tw_IdGrupa = sl.sl_Id
-            WHERE pw.dok_NrPelny LIKE 'PW%'
-                AND pw.dok_Status <> 2
-                AND pw_poz.ob_CenaNetto > 0
-        ),
-        LatestPrices AS (
-            SELECT Symbol, CenaZakupuNetto, Grupa,
-                   ROW_NUMBER() OVER (PARTITION BY Symbol ORDER BY DataDok DESC) AS final_rn
-            FROM PurchasePrices
-        )
-        SELECT Symbol, CenaZakupuNetto, Grupa
-        FROM LatestPrices
-        WHERE final_rn = 1
-        """
-
-        sql_cursor.execute(query)
-        rows = sql_cursor.fetchall()
-        sql_connection.close()
-
-        # Aktualizuj lokalną bazę SQLite
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        updated_count = 0
-        for row in rows:
-            symbol = row[0]
-            cena_zakupu = float(row[1] or 0)
-            grupa = row[2] or ''
-
-            cursor.execute("""
-                UPDATE products
-                SET CenaZakupuNetto = ?,
-                    Grupa = ?
-                WHERE Symbol = ?
-            """, (cena_zakupu, grupa, symbol))
+        if not purchase_prices_sync_lock.acquire(blocking=False):
+            return {
+                "success": True,
+                "message": "Synchronizacja cen zakupu już trwa",
+                "job": dict(purchase_prices_job)
+            }
 
-            if cursor.rowcount > 0:
-                updated_count += 1
-
-        conn.commit()
-        conn.close()
+        purchase_prices_job.update({
+            "status": "running",
+            "run_id": None,
+            "phase": None,
+            "rows_fetched": 0,
+            "priced_symbols": 0,
+            "updated_count": 0,
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "error": None
+        })
+        threading.Thread(target=run_purchase_prices_sync, daemon=True, name="purchase-prices-sync").start()
 
         return {
             "success": True,
-            "message": f"Zaktualizowano ceny zakupu dla {updated_count} produktów",
-            "updated_count": updated_count,
-            "total_found": len(rows)
+            "message": "Synchronizacja cen zakupu została uruchomiona w tle",
+            "job": dict(purchase_prices_job)
         }
 
-    except HTTPException:
-        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Błąd podczas synchronizacji cen zakupu: {str(e)}"
+            detail=f"Błąd podczas uruchamiania synchronizacji cen zakupu: {str(e)}"
         )
 
 
+@app.get("/api/sync-purchase-prices/status")
+async def get_purchase_prices_sync_status():
+    """Status i postęp ostatniej synchronizacji cen zakupu"""
+    return {
+        "success": True,
+        "job": dict(purchase_prices_job)
+    }
+
+
 @app.get("/api/products-with-prices")
 async def get_products_with_prices(limit: int = 100, search: Optional[str] = None):
     """
@@ -2990,20 +3585,7 @@ async def test_purchase_docs():
     Szuka dokumentów PW (Przyjęcie Wewnętrzne) z ruchu towarów.
     """
     try:
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
-        sql_connection = pyodbc.connect(
-            'DRIVER={ODBC Driver 18 for SQL Server};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-            f'UID={username};'
-            f'PWD={password};'
-            'TrustServerCertificate=yes;'
-            'Connection Timeout=30;'
-        )
+        sql_connection = get_sql_server_connection()
         sql_cursor = sql_connection.cursor()
 
         # Sprawdź unikalne typy dokumentów
@@ -3080,20 +3662,7 @@ async def test_doc_links():
     Endpoint testowy - sprawdza strukturę powiązań dokumentów w SQL Server.
     """
     try:
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
-        sql_connection = pyodbc.connect(
-            'DRIVER={ODBC Driver 18 for SQL Server};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-            f'UID={username};'
-            f'PWD={password};'
-            'TrustServerCertificate=yes;'
-            'Connection Timeout=30;'
-        )
+        sql_connection = get_sql_server_connection()
         sql_cursor = sql_connection.cursor()
 
         # Sprawdź kolumny tabeli dok__Dokument
@@ -3216,7 +3785,8 @@ async def test_doc_links():
 @app.get("/api/warehouse-stocks")
 async def get_warehouse_stocks(mag_ids: Optional[str] = "1,7,9"):
     """
-    Pobiera stany magazynowe z podziałem na magazyny bezpośrednio z SQL Server.
+    Zwraca stany magazynowe z podziałem na magazyny z lokalnej tabeli product_stock
+    (odświeżanej przez skrypt wsadowy przy każdej synchronizacji).
 
     Parametry:
     - mag_ids: ID magazynów rozdzielone przecinkami (domyślnie: 1,7,9)
@@ -3229,122 +3799,150 @@ async def get_warehouse_stocks(mag_ids: Optional[str] = "1,7,9"):
         if not mag_id_list:
             mag_id_list = [1, 7, 9]
 
-        mag_placeholders = ','.join(str(m) for m in mag_id_list)
-
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
-        sql_connection = pyodbc.connect(
-            'DRIVER={ODBC Driver 18 for SQL Server};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-            f'UID={username};'
-            f'PWD={password};'
-            'TrustServerCertificate=yes;'
-            'Connection Timeout=30;'
+        # Kolumny StanMag1 (GLS), StanMag2 (GLS DEPOZYT), StanMag7 (JEANS), StanMag9 (INNE) są zawsze,
+        # pozostałe magazyny z parametru dochodzą jako kolejne kolumny StanMagN
+        pivot_mags = [1, 2, 7, 9] + [m for m in dict.fromkeys(mag_id_list) if m not in (1, 2, 7, 9)]
+        stan_columns = ",\n                ".join(
+            f"SUM(CASE WHEN ps.MagId = {mag} THEN ps.Stan ELSE 0 END) AS StanMag{mag}" for mag in pivot_mags
         )
-        sql_cursor = sql_connection.cursor()
+        mag_placeholders = ','.join('?' for _ in mag_id_list)
 
-        # Pobierz stany per magazyn z SQL Server
-        # Pobieramy ceny zakupu z lokalnej bazy SQLite, bo SQL Server może nie mieć tc_CenaMag
-        query = f"""
-        SELECT
-            tw.tw_Symbol AS Symbol,
-            tw.tw_Nazwa AS Nazwa,
-            tw.tw_Pole2 AS Marka,
-            tw.tw_pole1 AS Rozmiar,
-            tw.tw_pole8 AS Rodzaj,
-            st.st_MagId AS MagId,
-            st.st_Stan AS Stan,
-            tc.tc_CenaNetto1 AS DetalicznaNetto,
-            tc.tc_CenaBrutto1 AS DetalicznaBrutto,
-            vat.vat_Stawka AS StawkaVAT
-        FROM tw_Stan st
-        INNER JOIN tw__Towar tw ON st.st_TowId = tw.tw_Id
-        LEFT JOIN tw_Cena tc ON st.st_TowId = tc.tc_IdTowar
-        LEFT JOIN sl_StawkaVAT vat ON tw.tw_IdVatSp = vat.vat_Id
-        WHERE st.st_Stan > 0
-            AND st.st_MagId IN ({mag_placeholders})
-        ORDER BY tw.tw_Symbol, st.st_MagId
+        # Wiersz per produkt: stany per magazyn (pivot) + atrybuty i ceny z products
+        per_product = f"""
+            SELECT
+                ps.Symbol AS Symbol,
+                p.Nazwa AS Nazwa,
+                p.Marka AS Marka,
+                p.Rozmiar AS Rozmiar,
+                p.Rodzaj AS Rodzaj,
+                p.DetalicznaNetto AS DetalicznaNetto,
+                COALESCE(p.DetalicznaBrutto, 0) AS DetalicznaBrutto,
+                p.StawkaVAT AS StawkaVAT,
+                CASE WHEN p.CenaZakupuNetto > 0 THEN p.CenaZakupuNetto ELSE 0 END AS CenaZakupuNetto,
+                {stan_columns},
+                SUM(ps.Stan) AS StanTotal
+            FROM product_stock ps
+            LEFT JOIN products p ON p.Symbol = ps.Symbol
+            WHERE ps.MagId IN ({mag_placeholders})
+            GROUP BY ps.Symbol
         """
 
-        sql_cursor.execute(query)
-        rows = sql_cursor.fetchall()
-        sql_connection.close()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(per_product + " ORDER BY ps.Symbol", mag_id_list)
+        columns = [column[0] for column in cursor.description]
+        rows = cursor.fetchall()
+
+        # Sumy per magazyn - jedno zapytanie agregujące
+        totals_columns = ["COUNT(*) AS count"]
+        for mag in (1, 2, 7, 9):
+            totals_columns.append(f"SUM(StanMag{mag} > 0) AS mag{mag}_count")
+        for mag in (1, 2, 7, 9):
+            totals_columns.append(f"SUM(StanMag{mag}) AS mag{mag}_stock")
+        for mag in (1, 2, 7, 9):
+            totals_columns.append(f"SUM(StanMag{mag} * CenaZakupuNetto) AS mag{mag}_value")
+        totals_columns += [
+            "SUM(StanTotal) AS total_stock",
+            "SUM(StanTotal * CenaZakupuNetto) AS total_value",
+            "SUM(StanTotal * DetalicznaBrutto) AS total_value_sales",
+        ]
+        cursor.execute(f"SELECT {', '.join(totals_columns)} FROM ({per_product})", mag_id_list)
+        totals_row = cursor.fetchone()
+        totals = {
+            column[0]: (totals_row[i] or 0) if column[0].endswith('count') else float(totals_row[i] or 0)
+            for i, column in enumerate(cursor.description)
+        }
 
-        # Pobierz ceny zakupu z lokalnej bazy SQLite
-        conn_sqlite = get_db_connection()
-        cursor_sqlite = conn_sqlite.cursor()
-        cursor_sqlite.execute("SELECT Symbol, CenaZakupuNetto FROM products WHERE CenaZakupuNetto > 0")
-        purchase_prices = {row[0]: row[1] for row in cursor_sqlite.fetchall()}
-        conn_sqlite.close()
+        synced_at = read_sync_state(cursor, PRODUCT_STOCK_SYNCED_AT)
+        conn.close()
 
-        # Grupuj dane per produkt, zachowując stany per magazyn
-        products_dict = {}
+        products = []
         for row in rows:
-            symbol = row[0]
-            mag_id = row[5]
-            stan = float(row[6] or 0)
+            product = dict(zip(columns, row))
+            product['DetalicznaNetto'] = float(product['DetalicznaNetto']) if product['DetalicznaNetto'] else 0
+            product['DetalicznaBrutto'] = float(product['DetalicznaBrutto'])
+            product['StawkaVAT'] = float(product['StawkaVAT']) if product['StawkaVAT'] else None
+            products.append(product)
 
-            if symbol not in products_dict:
-                products_dict[symbol] = {
-                    'Symbol': symbol,
-                    'Nazwa': row[1],
-                    'Marka': row[2],
-                    'Rozmiar': row[3],
-                    'Rodzaj': row[4],
-                    'DetalicznaNetto': float(row[7]) if row[7] else 0,
-                    'DetalicznaBrutto': float(row[8]) if row[8] else 0,
-                    'StawkaVAT': float(row[9]) if row[9] else None,
-                    'CenaZakupuNetto': purchase_prices.get(symbol, 0),
-                    'StanMag1': 0,  # GLS
-                    'StanMag2': 0,  # GLS DEPOZYT
-                    'StanMag7': 0,  # JEANS
-                    'StanMag9': 0,  # INNE
-                    'StanTotal': 0
-                }
+        return {
+            "success": True,
+            "products": products,
+            "totals": totals,
+            "mag_ids": mag_id_list,
+            "synced_at": synced_at
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Błąd podczas pobierania stanów magazynowych: {str(e)}"
+        )
 
-            # Zapisz stan dla danego magazynu
-            products_dict[symbol][f'StanMag{mag_id}'] = stan
-            products_dict[symbol]['StanTotal'] += stan
 
-        # Konwertuj do listy
-        products = list(products_dict.values())
+@app.get("/api/stock-history")
+async def get_stock_history(
+    symbol: Optional[str] = None,
+    days: int = 90,
+    mag_ids: Optional[str] = "1,7,9"
+):
+    """
+    Historia stanów z dziennych migawek (stock_snapshot_deltas) - bez zapytań do SQL Server.
 
-        # Oblicz sumy per magazyn
-        totals = {
-            'count': len(products),
-            'mag1_count': sum(1 for p in products if p['StanMag1'] > 0),
-            'mag2_count': sum(1 for p in products if p['StanMag2'] > 0),
-            'mag7_count': sum(1 for p in products if p['StanMag7'] > 0),
-            'mag9_count': sum(1 for p in products if p['StanMag9'] > 0),
-            'mag1_stock': sum(p['StanMag1'] for p in products),
-            'mag2_stock': sum(p['StanMag2'] for p in products),
-            'mag7_stock': sum(p['StanMag7'] for p in products),
-            'mag9_stock': sum(p['StanMag9'] for p in products),
-            'mag1_value': sum(p['StanMag1'] * p['CenaZakupuNetto'] for p in products),
-            'mag2_value': sum(p['StanMag2'] * p['CenaZakupuNetto'] for p in products),
-            'mag7_value': sum(p['StanMag7'] * p['CenaZakupuNetto'] for p in products),
-            'mag9_value': sum(p['StanMag9'] * p['CenaZakupuNetto'] for p in products),
-            'total_stock': sum(p['StanTotal'] for p in products),
-            'total_value': sum(p['StanTotal'] * p['CenaZakupuNetto'] for p in products),
-            'total_value_sales': sum(p['StanTotal'] * p['DetalicznaBrutto'] for p in products)
-        }
+    Parametry:
+    - symbol: symbol produktu - zwraca stany dzienne per magazyn i podsumowanie symbolu;
+      bez symbolu zwraca podsumowanie wszystkich symboli
+    - days: liczba dni wstecz (domyślnie 90)
+    - mag_ids: ID magazynów rozdzielone przecinkami (domyślnie: 1,7,9)
+
+    Podsumowanie: DniObserwacji, DniBezStanu (dni bez stanu), SredniStan, StanKoncowy.
+    """
+    try:
+        mag_id_list = [int(x.strip()) for x in mag_ids.split(',') if x.strip()] or [1, 7, 9]
+        end = datetime.now().date()
+        start = end - timedelta(days=max(days, 1) - 1)
+        symbols = [symbol] if symbol else None
+
+        conn = get_db_connection()
+        summary = summarize_stock_history(conn, start, end, symbols, mag_id_list)
+        history = []
+        if symbol:
+            daily = read_stock_history(conn, start, end, symbols, mag_id_list, per_symbol=False)
+            if not daily.empty:
+                daily.columns = [f"StanMag{mag_id}" for _, mag_id in daily.columns]
+                daily = daily.T.groupby(level=0).sum().T
+                daily["StanTotal"] = daily.sum(axis=1)
+                history = [
+                    {"date": day.strftime('%Y-%m-%d'), **{column: float(value) for column, value in row.items()}}
+                    for day, row in daily.iterrows()
+                ]
+        conn.close()
 
         return {
             "success": True,
-            "products": products,
-            "totals": totals,
-            "mag_ids": mag_id_list
+            "start_date": start.isoformat(),
+            "end_date": end.isoformat(),
+            "mag_ids": mag_id_list,
+            "summary": [
+                {
+                    "Symbol": index,
+                    "DniObserwacji": int(row.DniObserwacji),
+                    "DniBezStanu": int(row.DniBezStanu),
+                    "SredniStan": round(float(row.SredniStan), 2),
+                    "StanKoncowy": float(row.StanKoncowy)
+                }
+                for index, row in summary.iterrows()
+            ],
+            "history": history
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
-        import traceback
         raise HTTPException(
             status_code=500,
-            detail=f"Błąd podczas pobierania stanów magazynowych: {str(e)}"
+            detail=f"Błąd podczas pobierania historii stanów: {str(e)}"
         )
 
 
@@ -3375,26 +3973,14 @@ async def get_seasonality_index(
         cache_age = (datetime.now() - cached["timestamp"]).total_seconds()
         if cache_age < seasonality_cache["cache_duration"]:
             print(f"[CACHE HIT] Sezonowość - zwracam dane z cache (wiek: {cache_age:.0f}s)")
+            record_cache_access("seasonality", True)
             return cached["result"]
+    record_cache_access("seasonality", False)
 
     try:
-        # Połączenie z SQL Server
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
         try:
-            sql_connection = pyodbc.connect(
-                'DRIVER={ODBC Driver 18 for SQL Server};'
-                f'SERVER={server};'
-                f'DATABASE={database};'
-                f'UID={username};'
-                f'PWD={password};'
-                'TrustServerCertificate=yes;'
-                'Connection Timeout=30;'
-            )
-        except pyodbc.Error as conn_err:
+            sql_connection = get_sql_server_connection()
+        except Exception as conn_err:
             raise HTTPException(
                 status_code=503,
                 detail=f"Błąd połączenia z SQL Server: {str(conn_err)}"
@@ -3734,43 +4320,247 @@ async def get_seasonality_index(
         # Sortuj po sumie rocznej malejąco
         results.sort(key=lambda x: x['SumaRoczna'], reverse=True)
 
-        # Pobierz dostępne filtry
-        filters = {
-            'rodzaje': list(set(p['Rodzaj'] for p in results if p['Rodzaj'])),
-            'marki': list(set(p['Marka'] for p in results if p['Marka']))
-        }
-        filters['rodzaje'].sort()
-        filters['marki'].sort()
+        # Pobierz dostępne filtry
+        filters = {
+            'rodzaje': list(set(p['Rodzaj'] for p in results if p['Rodzaj'])),
+            'marki': list(set(p['Marka'] for p in results if p['Marka']))
+        }
+        filters['rodzaje'].sort()
+        filters['marki'].sort()
+
+        result = {
+            "success": True,
+            "data": results[:500],  # Limit do 500 produktów
+            "total_products": len(results),
+            "period": {
+                "start": start_date.strftime('%Y-%m-%d'),
+                "end": end_date.strftime('%Y-%m-%d')
+            },
+            "weeks": weeks_list,  # Lista 52 tygodni w kolejności chronologicznej
+            "filters": filters
+        }
+
+        # Zapisz do cache
+        seasonality_cache["data"][cache_key] = {
+            "result": result,
+            "rows": results,  # Wszystkie produkty (odpowiedź JSON ma limit 500) - dla eksportu
+            "timestamp": datetime.now()
+        }
+        print(f"[CACHE SAVE] Sezonowość - zapisano do cache dla klucza: {cache_key}")
+
+        return result
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        import traceback
+        raise HTTPException(
+            status_code=500,
+            detail=f"Błąd podczas obliczania indeksu sezonowości: {str(e)}"
+        )
+
+
+# =============================================================================
+# EKSPORT CSV/XLSX - strumieniowo z cache lub tabel lokalnej bazy
+# =============================================================================
+
+def export_response(export_format, name, columns, rows, sheet_name):
+    """Odpowiedź strumieniowa z plikiem eksportu (pobieranie zaczyna się od pierwszej porcji)"""
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d_%H%M')}.{export_format}"
+    return StreamingResponse(
+        stream_export(export_format, columns, rows, sheet_name),
+        media_type=XLSX_MEDIA_TYPE if export_format == "xlsx" else CSV_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+def check_export_format(export_format):
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Nieobsługiwany format eksportu: {export_format} (dostępne: {', '.join(EXPORT_FORMATS)})"
+        )
+
+
+@app.get("/api/export/dead-stock")
+async def export_dead_stock(
+    format: str = "csv",
+    min_days: Optional[int] = 0,
+    min_value: Optional[float] = 0,
+    category: Optional[str] = None,
+    marka: Optional[str] = None,
+    rotation_status: Optional[str] = None,
+    sort_by: Optional[str] = "frozen_value"
+):
+    """
+    Eksport analizy dead stock (CSV lub XLSX) z tymi samymi filtrami co /api/dead-stock.
+    Wiersze z cache; gdy cache jest pusty - strumieniowo z tabeli dead_stock_analysis.
+    """
+    check_export_format(format)
+    try:
+        cache_data = global_data_cache["dead_stock"]["data"]
+        if cache_data is not None:
+            items = filter_dead_stock_items(
+                cache_data["items"], min_days, min_value, category, marka, rotation_status, sort_by
+            )
+            columns = list(cache_data["items"][0].keys()) if cache_data["items"] else []
+            rows = (tuple(item.get(column) for column in columns) for item in items)
+            return export_response(format, "dead_stock", columns, rows, "Dead stock")
+
+        # Połączenie używane przez kolejne porcje odpowiedzi (różne wątki puli) - bez check_same_thread
+        sql_query, params = dead_stock_query(min_days, min_value, category, marka, rotation_status, sort_by)
+        conn = sqlite3.connect(str(DATABASE_FILE), check_same_thread=False)
+        cursor = conn.execute(sql_query, params)
+        columns = [description[0] for description in cursor.description]
+
+        def table_rows():
+            try:
+                for chunk in iter_chunks(cursor):
+                    yield from chunk
+            finally:
+                conn.close()
+
+        return export_response(format, "dead_stock", columns, table_rows(), "Dead stock")
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Błąd podczas eksportu dead stock: {str(e)}"
+        )
+
+
+@app.get("/api/export/purchase-proposals")
+async def export_purchase_proposals(
+    format: str = "csv",
+    min_stock_days: int = 30,
+    przeznaczenie: Optional[str] = "SUPLEMENTY",
+    grupa: Optional[str] = None
+):
+    """Eksport propozycji zakupowych (CSV lub XLSX) z tymi samymi parametrami co /api/purchase-proposals"""
+    check_export_format(format)
+    try:
+        przeznaczenie = przeznaczenie.strip().upper() if przeznaczenie and przeznaczenie.strip() else None
+        grupa = grupa.strip().upper() if grupa and grupa.strip() else None
+        frame, _, _ = purchase_proposals_frame(min_stock_days, przeznaczenie, grupa)
+        return export_response(
+            format, "propozycje_zakupowe", list(frame.columns),
+            frame.itertuples(index=False, name=None), "Propozycje zakupowe"
+        )
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Błąd podczas eksportu propozycji zakupowych: {str(e)}"
+        )
+
+
+@app.get("/api/export/seasonality-index")
+async def export_seasonality_index(
+    format: str = "csv",
+    mag_ids: Optional[str] = "1,7,9",
+    rodzaj: Optional[str] = None,
+    marka: Optional[str] = None,
+    symbol: Optional[str] = None
+):
+    """
+    Eksport indeksu sezonowości (CSV lub XLSX) z tymi samymi filtrami co /api/seasonality-index -
+    wszystkie produkty (bez limitu 500), sprzedaż i indeks per tydzień jako kolumny.
+    """
+    check_export_format(format)
+    try:
+        cache_key = f"{mag_ids}_{rodzaj}_{marka}_{symbol}"
+        cached = seasonality_cache["data"].get(cache_key)
+        if not cached or (datetime.now() - cached["timestamp"]).total_seconds() >= seasonality_cache["cache_duration"]:
+            await get_seasonality_index(mag_ids=mag_ids, rodzaj=rodzaj, marka=marka, symbol=symbol)
+            cached = seasonality_cache["data"][cache_key]
+
+        week_keys = [week["key"] for week in cached["result"]["weeks"]]
+        columns = [
+            "Symbol", "Nazwa", "Marka", "Rodzaj", "Model", "SumaRoczna", "SredniaTygodniowa",
+            "TydzienSzczytu", "TydzienMinimum", "StanAktualny", "TrendZmianaProcent", "TrendKierunek"
+        ]
+        columns += [f"Sprzedaz_{key}" for key in week_keys] + [f"Indeks_{key}" for key in week_keys]
+
+        def seasonality_rows():
+            for product in cached["rows"]:
+                weekly = product["DaneTygodniowe"]
+                yield (
+                    product["Symbol"], product["Nazwa"], product["Marka"], product["Rodzaj"], product["Model"],
+                    product["SumaRoczna"], product["SredniaTygodniowa"], product["TydzienSzczytu"],
+                    product["TydzienMinimum"], product["StanAktualny"],
+                    product["Trend"]["zmiana_procent"], product["Trend"]["kierunek"],
+                    *[weekly[key]["sprzedaz"] for key in week_keys],
+                    *[weekly[key]["indeks"] for key in week_keys]
+                )
+
+        return export_response(format, "sezonowosc", columns, seasonality_rows(), "Sezonowość")
 
-        result = {
-            "success": True,
-            "data": results[:500],  # Limit do 500 produktów
-            "total_products": len(results),
-            "period": {
-                "start": start_date.strftime('%Y-%m-%d'),
-                "end": end_date.strftime('%Y-%m-%d')
-            },
-            "weeks": weeks_list,  # Lista 52 tygodni w kolejności chronologicznej
-            "filters": filters
-        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Błąd podczas eksportu indeksu sezonowości: {str(e)}"
+        )
 
-        # Zapisz do cache
-        seasonality_cache["data"][cache_key] = {
-            "result": result,
-            "timestamp": datetime.now()
-        }
-        print(f"[CACHE SAVE] Sezonowość - zapisano do cache dla klucza: {cache_key}")
 
-        return result
+@app.get("/api/export/columnar/{table}")
+def export_columnar_table(table: str, format: str = "parquet"):
+    """
+    Eksport tabeli analitycznej (products, sales_history, dead_stock_analysis, lokalne tabele
+    sprzedaży, dostaw i stanów) do Parquet lub Arrow IPC z zachowanymi typami kolumn.
+    Plik zapisywany jest porcjami do pliku tymczasowego i usuwany po wysłaniu.
+    """
+    if format not in COLUMNAR_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Nieobsługiwany format eksportu: {format} (dostępne: {', '.join(COLUMNAR_FORMATS)})"
+        )
+    if table not in COLUMNAR_EXPORT_TABLES:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Tabela {table} nie jest dostępna do eksportu (dostępne: {', '.join(COLUMNAR_EXPORT_TABLES)})"
+        )
+
+    extension, media_type = COLUMNAR_FORMATS[format]
+    conn = get_db_connection()
+    path = None
+    sent = False
+    try:
+        if not existing_tables(conn, [table]):
+            raise HTTPException(status_code=404, detail=f"Tabela {table} nie istnieje jeszcze w bazie")
+        with tempfile.NamedTemporaryFile(suffix=extension, delete=False) as temp_file:
+            path = temp_file.name
+        rows = write_table(conn, table, path, format)
+        print(f"[EXPORT] {table}: {rows} wierszy ({format})")
+        response = FileResponse(
+            path,
+            media_type=media_type,
+            filename=f"{table}_{datetime.now().strftime('%Y%m%d_%H%M')}{extension}",
+            background=BackgroundTask(os.remove, path)
+        )
+        sent = True
+        return response
 
     except HTTPException:
         raise
+    except RuntimeError as e:
+        # Brak pakietu pyarrow
+        raise HTTPException(status_code=501, detail=str(e))
     except Exception as e:
-        import traceback
         raise HTTPException(
             status_code=500,
-            detail=f"Błąd podczas obliczania indeksu sezonowości: {str(e)}"
+            detail=f"Błąd podczas eksportu tabeli {table}: {str(e)}"
         )
+    finally:
+        conn.close()
+        # Plik tymczasowy usuwany po wysłaniu (BackgroundTask), a przy każdym błędzie - od razu
+        if path and not sent and os.path.exists(path):
+            os.remove(path)
 
 
 # =============================================================================
@@ -3780,7 +4570,7 @@ async def get_seasonality_index(
 def init_ignored_products_table():
     """Inicjalizuje tabelę ignorowanych produktów"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS ignored_products (
@@ -3796,8 +4586,274 @@ def init_ignored_products_table():
         print(f"[DB] Błąd tworzenia tabeli ignored_products: {e}")
 
 
-# Inicjalizuj tabelę przy starcie
-init_ignored_products_table()
+# =============================================================================
+# PROGNOZY POPYTU - odczyt prognoz przeliczanych przez skrypt wsadowy
+# =============================================================================
+
+@app.get("/api/demand-forecast")
+async def get_demand_forecast(
+    level: str = LEVEL_SYMBOL,
+    key: Optional[str] = None,
+    przeznaczenie: Optional[str] = None,
+    history_weeks: int = 12,
+    limit: int = 50
+):
+    """
+    Prognozy popytu z tabel demand_forecasts / demand_forecast_summary.
+
+    Parametry:
+    - level: symbol lub model (ModelSP) - poziom listy produktów
+    - key: symbol lub ModelSP, dla którego zwracany jest wykres (domyślnie suma sklepu)
+    - przeznaczenie: filtr listy produktów
+    - history_weeks: liczba tygodni sprzedaży rzeczywistej na wykresie
+    - limit: liczba produktów z największą prognozą na 4 tygodnie
+
+    Prognozy przeliczane są raz dziennie (product_data_manager_optimized.py) - endpoint tylko czyta tabele.
+    """
+    if level not in (LEVEL_SYMBOL, LEVEL_MODEL):
+        raise HTTPException(status_code=400, detail="Parametr level musi mieć wartość symbol lub model")
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        # Tabela pusta (np. przed pierwszą synchronizacją) - przelicz raz z lokalnej sprzedaży tygodniowej
+        cursor.execute("SELECT 1 FROM demand_forecast_summary LIMIT 1")
+        if cursor.fetchone() is None:
+            compute_demand_forecasts(DATABASE_FILE)
+
+        # Wykres: sprzedaż rzeczywista z sales_weekly + prognoza z przedziałem
+        chart_level, chart_key = (level, key) if key else (LEVEL_TOTAL, "ALL")
+        first_week = (week_start(datetime.now()) - timedelta(weeks=history_weeks)).isoformat()
+        if chart_level == LEVEL_SYMBOL:
+            cursor.execute("""
+                SELECT WeekStart, SUM(IloscSprzedana) FROM sales_weekly
+                WHERE Symbol = ? AND WeekStart >= ? GROUP BY WeekStart
+            """, (chart_key, first_week))
+        elif chart_level == LEVEL_MODEL:
+            cursor.execute("""
+                SELECT WeekStart, SUM(IloscSprzedana) FROM sales_weekly
+                WHERE Symbol IN (SELECT Symbol FROM products WHERE ModelSP = ?) AND WeekStart >= ?
+                GROUP BY WeekStart
+            """, (chart_key, first_week))
+        else:
+            cursor.execute("""
+                SELECT WeekStart, SUM(IloscSprzedana) FROM sales_weekly
+                WHERE WeekStart >= ? GROUP BY WeekStart
+            """, (first_week,))
+        actual = {row[0]: row[1] for row in cursor.fetchall()}
+
+        cursor.execute("""
+            SELECT WeekStart, Forecast, Lower, Upper FROM demand_forecasts
+            WHERE Level = ? AND Key = ? ORDER BY WeekStart
+        """, (chart_level, chart_key))
+        forecast_rows = cursor.fetchall()
+        forecast_start = forecast_rows[0]["WeekStart"] if forecast_rows else week_start(datetime.now()).isoformat()
+
+        chart = []
+        week = datetime.strptime(first_week, "%Y-%m-%d")
+        while week.strftime("%Y-%m-%d") < forecast_start:
+            week_key = week.strftime("%Y-%m-%d")
+            chart.append({"week": week_key, "actual": round(actual.get(week_key, 0), 2)})
+            week += timedelta(weeks=1)
+        for row in forecast_rows:
+            chart.append({
+                "week": row["WeekStart"],
+                "actual": round(actual[row["WeekStart"]], 2) if row["WeekStart"] in actual else None,
+                "forecast": row["Forecast"],
+                "lower": row["Lower"],
+                "upper": row["Upper"]
+            })
+
+        cursor.execute("""
+            SELECT * FROM demand_forecast_summary WHERE Level = ? AND Key = ?
+        """, (chart_level, chart_key))
+        chart_summary = cursor.fetchone()
+
+        # Lista produktów z największą prognozą na 4 tygodnie
+        if level == LEVEL_SYMBOL:
+            where = "AND p.Przeznaczenie = ?" if przeznaczenie else ""
+            cursor.execute(f"""
+                SELECT s.Key, p.Nazwa AS Nazwa, p.Przeznaczenie AS Przeznaczenie, p.Rodzaj AS Rodzaj,
+                       p.Stan AS Stan, s.Method, s.Wape, s.Forecast4w, s.Lower4w, s.Upper4w
+                FROM demand_forecast_summary s
+                LEFT JOIN products p ON p.Symbol = s.Key
+                WHERE s.Level = ? {where}
+                ORDER BY s.Forecast4w DESC
+                LIMIT ?
+            """, [LEVEL_SYMBOL] + ([przeznaczenie] if przeznaczenie else []) + [limit])
+        else:
+            where = "AND s.Key IN (SELECT ModelSP FROM products WHERE Przeznaczenie = ?)" if przeznaczenie else ""
+            cursor.execute(f"""
+                SELECT s.Key, s.Key AS Nazwa,
+                       (SELECT MAX(Przeznaczenie) FROM products WHERE ModelSP = s.Key) AS Przeznaczenie,
+                       (SELECT MAX(Rodzaj) FROM products WHERE ModelSP = s.Key) AS Rodzaj,
+                       (SELECT SUM(Stan) FROM products WHERE ModelSP = s.Key) AS Stan,
+                       s.Method, s.Wape, s.Forecast4w, s.Lower4w, s.Upper4w
+                FROM demand_forecast_summary s
+                WHERE s.Level = ? {where}
+                ORDER BY s.Forecast4w DESC
+                LIMIT ?
+            """, [LEVEL_MODEL] + ([przeznaczenie] if przeznaczenie else []) + [limit])
+
+        products = []
+        for row in cursor.fetchall():
+            stock = row["Stan"] or 0
+            forecast_4w = row["Forecast4w"] or 0
+            # Krytyczny: zapas nie pokryje prognozy na 2 tygodnie; ostrzeżenie: nie pokryje górnej granicy na 4 tygodnie
+            if stock < forecast_4w / 2:
+                status = "critical"
+            elif stock < (row["Upper4w"] or 0):
+                status = "warning"
+            else:
+                status = "ok"
+            products.append({
+                "key": row["Key"],
+                "name": row["Nazwa"] or row["Key"],
+                "przeznaczenie": row["Przeznaczenie"],
+                "rodzaj": row["Rodzaj"],
+                "stock": stock,
+                "method": row["Method"],
+                "accuracy": round(max(1 - row["Wape"], 0), 3) if row["Wape"] is not None else None,
+                "forecast_4w": forecast_4w,
+                "lower_4w": row["Lower4w"],
+                "upper_4w": row["Upper4w"],
+                "status": status,
+                "suggested_order": max(math.ceil((row["Upper4w"] or 0) - stock), 0)
+            })
+
+        cursor.execute("""
+            SELECT Method, COUNT(*) FROM demand_forecast_summary WHERE Level = ? GROUP BY Method
+        """, (level,))
+        methods = {row[0]: row[1] for row in cursor.fetchall()}
+
+        cursor.execute("""
+            SELECT Wape, ComputedAt FROM demand_forecast_summary WHERE Level = ? AND Key = 'ALL'
+        """, (LEVEL_TOTAL,))
+        total = cursor.fetchone()
+        conn.close()
+
+        return {
+            "success": True,
+            "level": level,
+            "chart_key": chart_key,
+            "chart": chart,
+            "chart_summary": dict(chart_summary) if chart_summary else None,
+            "products": products,
+            "methods": methods,
+            "accuracy": round(max(1 - total["Wape"], 0), 3) if total and total["Wape"] is not None else None,
+            "computed_at": total["ComputedAt"] if total else None
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Błąd pobierania prognoz popytu: {str(e)}")
+
+
+# =============================================================================
+# SUGESTIE ZAKUPÓW - punkty zamówienia przeliczane przez skrypt wsadowy
+# =============================================================================
+
+# Dozwolone sortowania /api/reorder-suggestions (klucz -> wyrażenie ORDER BY)
+REORDER_SORT_COLUMNS = {
+    "priority": "PriorytetRank",
+    "days_to_stockout": "DniDoWyczerpania",
+    "order_value": "WartoscZamowienia",
+    "quantity": "IloscDoZamowienia",
+    "stock": "Stan",
+    "daily_rate": "SredniaDzienna",
+    "symbol": "Symbol",
+    "name": "Nazwa",
+}
+
+
+@app.get("/api/reorder-suggestions")
+def get_reorder_suggestions(
+    page: int = 1,
+    page_size: int = 50,
+    sort_by: str = "priority",
+    sort_dir: str = "asc",
+    przeznaczenie: Optional[str] = None,
+    only_to_order: bool = True,
+    search: Optional[str] = None
+):
+    """
+    Sugestie zakupów z tabeli reorder_suggestions (punkt zamówienia, zapas bezpieczeństwa,
+    dni do wyczerpania, ilość do zamówienia), stronicowane i sortowane.
+
+    Parametry:
+    - page, page_size: strona wyników (page_size maks. 500)
+    - sort_by: priority, days_to_stockout, order_value, quantity, stock, daily_rate, symbol, name
+    - sort_dir: asc lub desc
+    - przeznaczenie: filtr przeznaczenia
+    - only_to_order: tylko produkty z ilością do zamówienia > 0
+    - search: fragment symbolu lub nazwy
+    """
+    if sort_by not in REORDER_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"Nieznane sortowanie: {sort_by}")
+    direction = "DESC" if sort_dir.lower() == "desc" else "ASC"
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), 500)
+
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        # Tabela nigdy nie przeliczona dla całego katalogu (przed pierwszą synchronizacją) - przelicz raz
+        # z danych lokalnych. Znacznik zapisuje tylko pełne przeliczenie, więc pojedyncze wiersze zapisane
+        # po zmianie okresu produktu go nie zastępują. Handler synchroniczny (pula wątków) - przeliczenie
+        # nie blokuje pętli zdarzeń
+        if read_sync_state(cursor, REORDER_COMPUTED_AT) is None:
+            compute_reorder_suggestions(DATABASE_FILE)
+
+        conditions = []
+        params = []
+        if przeznaczenie:
+            conditions.append("Przeznaczenie = ?")
+            params.append(przeznaczenie)
+        if only_to_order:
+            conditions.append("IloscDoZamowienia > 0")
+        if search:
+            conditions.append("(Symbol LIKE ? OR Nazwa LIKE ?)")
+            params += [f"%{search}%", f"%{search}%"]
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        cursor.execute(f"""
+            SELECT COUNT(*) AS total,
+                   SUM(CASE WHEN IloscDoZamowienia > 0 THEN 1 ELSE 0 END) AS to_order,
+                   SUM(CASE WHEN Priorytet = 'critical' THEN 1 ELSE 0 END) AS critical,
+                   SUM(CASE WHEN Priorytet = 'high' THEN 1 ELSE 0 END) AS high,
+                   ROUND(SUM(WartoscZamowienia), 2) AS total_value,
+                   MAX(ComputedAt) AS computed_at
+            FROM reorder_suggestions {where}
+        """, params)
+        summary = dict(cursor.fetchone())
+
+        # Puste wartości (np. dni do wyczerpania produktów bez sprzedaży) zawsze na końcu listy
+        order_column = REORDER_SORT_COLUMNS[sort_by]
+        cursor.execute(f"""
+            SELECT * FROM reorder_suggestions {where}
+            ORDER BY {order_column} IS NULL, {order_column} {direction},
+                     DniDoWyczerpania IS NULL, DniDoWyczerpania, Symbol
+            LIMIT ? OFFSET ?
+        """, params + [page_size, (page - 1) * page_size])
+        items = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+
+        total = summary.pop("total") or 0
+        computed_at = summary.pop("computed_at")
+        return {
+            "success": True,
+            "items": items,
+            "total": total,
+            "page": page,
+            "page_size": page_size,
+            "pages": (total + page_size - 1) // page_size,
+            "summary": {key: value or 0 for key, value in summary.items()},
+            "computed_at": computed_at
+        }
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Błąd pobierania sugestii zakupów: {str(e)}")
 
 
 # =============================================================================
@@ -3818,9 +4874,10 @@ async def get_suggested_min_stocks(data: dict):
     - srednia_tygodniowa: średnia tygodniowa sprzedaż
     - proponowany_min: obliczony stan minimalny
     - indeks_sezonowy: aktualny indeks sezonowości
-    """
-    from datetime import datetime, timedelta
 
+    Sprzedaż z ostatnich 52 tygodni ISO pochodzi z lokalnej tabeli sales_weekly
+    (odświeżanej po każdej synchronizacji) - lista symboli może mieć dowolną długość.
+    """
     symbols = data.get('symbols', [])
     stock_weeks = data.get('stock_weeks', 1)
     delivery_weeks = data.get('delivery_weeks', 1)
@@ -3829,88 +4886,36 @@ async def get_suggested_min_stocks(data: dict):
         return {"success": True, "data": {}}
 
     try:
-        # Połączenie z SQL Server
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
-        sql_connection = pyodbc.connect(
-            'DRIVER={ODBC Driver 18 for SQL Server};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-            f'UID={username};'
-            f'PWD={password};'
-            'TrustServerCertificate=yes;'
-            'Connection Timeout=30;'
-        )
-        sql_cursor = sql_connection.cursor()
-
-        # Daty - 52 tygodnie wstecz
+        # Tygodnie ISO: od tygodnia sprzed 52 tygodni do bieżącego (poniedziałki)
         end_date = datetime.now()
-        start_date = end_date - timedelta(weeks=52)
-
-        # Przygotuj placeholder dla symboli
-        symbol_placeholders = ','.join(['?' for _ in symbols])
-
-        # Zapytanie pobierające sprzedaż tygodniową
-        query = f"""
-        SELECT
-            tw.tw_Symbol AS Symbol,
-            DATEPART(ISO_WEEK, dok_DataWyst) AS NumerTygodnia,
-            YEAR(DATEADD(day, 26 - DATEPART(iso_week, dok_DataWyst), dok_DataWyst)) AS RokISO,
-            SUM(CASE WHEN dok_Typ IN (14, 6) THEN -ob_IloscMag ELSE ob_IloscMag END) AS IloscSprzedana
-        FROM vwZstSprzWgKhnt
-        INNER JOIN tw__Towar tw ON ob_TowId = tw.tw_Id
-        WHERE CAST(dok_DataWyst AS DATE) >= ?
-            AND CAST(dok_DataWyst AS DATE) <= ?
-            AND dok_MagId IN (1, 7, 9)
-            AND dok_Podtyp <> 1
-            AND dok_Status <> 2
-            AND tw.tw_Symbol IN ({symbol_placeholders})
-        GROUP BY
-            tw.tw_Symbol,
-            DATEPART(ISO_WEEK, dok_DataWyst),
-            YEAR(DATEADD(day, 26 - DATEPART(iso_week, dok_DataWyst), dok_DataWyst))
-        ORDER BY tw.tw_Symbol, RokISO, NumerTygodnia
-        """
-
-        params = [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')] + symbols
-        sql_cursor.execute(query, params)
-        rows = sql_cursor.fetchall()
-        sql_cursor.close()
-        sql_connection.close()
-
-        # Grupuj dane per symbol
-        sales_by_symbol = {}
-        for row in rows:
-            symbol = row[0]
-            week_num = row[1]
-            year = row[2]
-            qty = float(row[3] or 0)
+        current_week = week_start(end_date)
+        first_week = week_start(end_date - timedelta(weeks=52))
 
-            if symbol not in sales_by_symbol:
-                sales_by_symbol[symbol] = {
-                    'weekly_sales': [],
-                    'recent_weeks': {}
-                }
+        conn = connect_sqlite()
+        cursor = conn.cursor()
 
-            sales_by_symbol[symbol]['weekly_sales'].append(qty)
+        # Tabela pusta (np. przed pierwszą synchronizacją) - wypełnij ją raz na żądanie
+        cursor.execute("SELECT 1 FROM sales_weekly LIMIT 1")
+        if cursor.fetchone() is None:
+            sql_connection = get_sql_server_connection()
+            try:
+                refresh_sales_weekly(DATABASE_FILE, sql_connection)
+            finally:
+                sql_connection.close()
 
-            # Zachowaj sprzedaż z ostatnich tygodni (klucz: rok-tydzień)
-            week_key = f"{year}-{week_num:02d}"
-            sales_by_symbol[symbol]['recent_weeks'][week_key] = qty
+        # Sprzedaż tygodniowa z lokalnej tabeli - porcjami symboli
+        sales_by_symbol = read_weekly_sales(conn, symbols, first_week)
+        conn.close()
 
         # Oblicz proponowany stan minimalny dla każdego symbolu
         result = {}
-        current_week = end_date.isocalendar()[1]
-        current_year = end_date.year
         total_weeks = stock_weeks + delivery_weeks
+        recent_week_keys = [(current_week - timedelta(weeks=i)).isoformat() for i in range(total_weeks)]
 
         for symbol in symbols:
-            data_for_symbol = sales_by_symbol.get(symbol)
+            recent_weeks_data = sales_by_symbol.get(symbol)
 
-            if not data_for_symbol or not data_for_symbol['weekly_sales']:
+            if not recent_weeks_data:
                 result[symbol] = {
                     'srednia_tygodniowa': 0,
                     'proponowany_min': 0,
@@ -3918,21 +4923,14 @@ async def get_suggested_min_stocks(data: dict):
                 }
                 continue
 
-            weekly_sales = data_for_symbol['weekly_sales']
+            # Średnia z tygodni, w których była sprzedaż
+            weekly_sales = list(recent_weeks_data.values())
             avg_weekly = sum(weekly_sales) / len(weekly_sales) if weekly_sales else 0
 
             # Oblicz maksymalny indeks z ostatnich N tygodni
             max_index = 1.0
             if avg_weekly > 0:
-                recent_weeks_data = data_for_symbol['recent_weeks']
-                # Weź ostatnie total_weeks tygodni
-                for i in range(total_weeks):
-                    week_offset = current_week - i
-                    year_offset = current_year
-                    if week_offset <= 0:
-                        week_offset += 52
-                        year_offset -= 1
-                    week_key = f"{year_offset}-{week_offset:02d}"
+                for week_key in recent_week_keys:
                     week_sales = recent_weeks_data.get(week_key, 0)
                     if week_sales > 0:
                         week_index = week_sales / avg_weekly
@@ -3963,7 +4961,7 @@ async def get_suggested_min_stocks(data: dict):
 def init_minimal_stocks_table():
     """Inicjalizuje tabelę grup stanów minimalnych"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         # Tabela główna grup
@@ -4017,10 +5015,6 @@ def init_minimal_stocks_table():
         print(f"[DB] Błąd tworzenia tabeli minimal_stock_groups: {e}")
 
 
-# Inicjalizuj tabelę przy starcie
-init_minimal_stocks_table()
-
-
 def get_products_for_group(filters: dict) -> list:
     """
     Pobiera produkty pasujące do filtrów grupy.
@@ -4029,7 +5023,7 @@ def get_products_for_group(filters: dict) -> list:
     """
     import json
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
@@ -4129,7 +5123,7 @@ def get_products_for_group(filters: dict) -> list:
 async def get_minimal_stock_groups():
     """Pobiera wszystkie grupy stanów minimalnych z obliczonymi sumami"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
@@ -4161,7 +5155,7 @@ async def get_minimal_stock_groups():
 async def get_filter_options():
     """Pobiera dostępne wartości dla filtrów"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         options = {}
@@ -4214,7 +5208,7 @@ async def get_dynamic_filter_options(filters: dict):
         return []
 
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         # Mapowanie filtrów na kolumny
@@ -4309,7 +5303,7 @@ async def get_products_dynamic_filter_options(filters: dict):
         return []
 
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         # Mapowanie filtrów na kolumny
@@ -4383,7 +5377,7 @@ async def get_products_dynamic_filter_options(filters: dict):
 async def get_minimal_stock_group(group_id: int):
     """Pobiera szczegóły grupy wraz z listą produktów"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
 
@@ -4418,7 +5412,7 @@ async def create_minimal_stock_group(group_data: dict):
     """Tworzy nową grupę stanów minimalnych"""
     import json
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         # Konwertuj listy na JSON string
@@ -4482,7 +5476,7 @@ async def update_minimal_stock_group(group_id: int, group_data: dict):
     """Aktualizuje grupę stanów minimalnych"""
     import json
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         # Konwertuj listy na JSON string
@@ -4554,7 +5548,7 @@ async def update_minimal_stock_group(group_id: int, group_data: dict):
 async def delete_minimal_stock_group(group_id: int):
     """Usuwa grupę stanów minimalnych"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         cursor.execute("DELETE FROM minimal_stock_groups WHERE id = ?", (group_id,))
@@ -4579,7 +5573,7 @@ async def delete_minimal_stock_group(group_id: int):
 async def get_ignored_products():
     """Pobiera listę ignorowanych produktów"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
         cursor.execute("SELECT symbol, added_at FROM ignored_products ORDER BY added_at DESC")
         rows = cursor.fetchall()
@@ -4598,7 +5592,7 @@ async def get_ignored_products():
 async def add_ignored_product(symbol: str):
     """Dodaje produkt do listy ignorowanych"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
         cursor.execute("""
             INSERT OR REPLACE INTO ignored_products (symbol, added_at)
@@ -4616,7 +5610,7 @@ async def add_ignored_product(symbol: str):
 async def remove_ignored_product(symbol: str):
     """Usuwa produkt z listy ignorowanych"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
         cursor.execute("DELETE FROM ignored_products WHERE symbol = ?", (symbol,))
         affected = cursor.rowcount
@@ -4652,6 +5646,8 @@ def fetch_footfall_from_agis():
     Loguje się i parsuje tabelę statystyk
     """
     try:
+        from bs4 import BeautifulSoup
+
         session = requests.Session()
 
         # Logowanie
@@ -4888,7 +5884,7 @@ def fetch_footfall_jns_from_topreports():
 def save_footfall_to_db(wejscia: int, store: str = "GLS"):
     """Zapisuje wejścia do bazy SQLite"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         # Utwórz tabelę jeśli nie istnieje
@@ -4926,7 +5922,7 @@ def save_footfall_to_db(wejscia: int, store: str = "GLS"):
 def get_today_footfall(store: str = "GLS"):
     """Pobiera sumę dzisiejszych wejść z bazy"""
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         today = datetime.now().strftime('%Y-%m-%d')
@@ -5097,7 +6093,7 @@ async def sync_footfall():
 
 products_sync_lock = threading.Lock()
 
-def sync_products_from_sql_server():
+def sync_products_from_sql_server(trigger_source="scheduled"):
     """
     Synchronizuje produkty z SQL Server do lokalnej bazy SQLite.
     Pobiera wszystkie atrybuty produktów potrzebne do filtrowania grup.
@@ -5107,28 +6103,15 @@ def sync_products_from_sql_server():
         print("[SYNC-PRODUCTS] Synchronizacja produktów już trwa - pomijam")
         return False
 
+    run = SyncRun(DATABASE_FILE, "products", trigger_source)
     try:
         print("\n" + "="*60)
         print(f"[SYNC-PRODUCTS] Synchronizacja produktów: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print("="*60)
 
-        # Połączenie z SQL Server
-        server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
-        database = os.getenv('SQL_DATABASE', 'Sporting_Leszno')
-        username = os.getenv('SQL_USERNAME', 'zestawienia2')
-        password = os.getenv('SQL_PASSWORD', 'GIO38#@oler!!')
-
-        print(f"[SYNC-PRODUCTS] Łączenie z SQL Server: {server}...")
-
-        sql_connection = pyodbc.connect(
-            'DRIVER={ODBC Driver 18 for SQL Server};'
-            f'SERVER={server};'
-            f'DATABASE={database};'
-            f'UID={username};'
-            f'PWD={password};'
-            'TrustServerCertificate=yes;'
-            'Connection Timeout=60;'
-        )
+        print("[SYNC-PRODUCTS] Łączenie z SQL Server...")
+
+        sql_connection = get_sql_server_connection(timeout=60)
         sql_cursor = sql_connection.cursor()
 
         # Pobierz wszystkie produkty z SQL Server z pełnymi atrybutami
@@ -5174,19 +6157,8 @@ def sync_products_from_sql_server():
         ORDER BY tw.tw_Symbol
         """
 
-        print("[SYNC-PRODUCTS] Pobieranie produktów z SQL Server...")
-        sql_cursor.execute(query)
-        rows = sql_cursor.fetchall()
-        sql_connection.close()
-
-        print(f"[SYNC-PRODUCTS] Pobrano {len(rows)} produktów z SQL Server")
-
-        if not rows:
-            print("[SYNC-PRODUCTS] Brak produktów do synchronizacji")
-            return False
-
         # Zapisz do lokalnej bazy SQLite
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         # Utwórz tabelę jeśli nie istnieje
@@ -5218,57 +6190,88 @@ def sync_products_from_sql_server():
                 IsNew INTEGER DEFAULT 0,
                 CenaZakupuNetto REAL,
                 StawkaVAT REAL,
-                Grupa TEXT
+                Grupa TEXT,
+                LastRunId INTEGER,
+                LastUpdatedTs INTEGER
             )
         """)
+        conn.commit()
+        init_run_stamp_columns(DATABASE_FILE)
+        init_row_hash_columns(DATABASE_FILE)
+
+        # Zapis tylko wierszy ze zmienionym odciskiem (CatalogRowHash); INSERT ... ON CONFLICT
+        # aktualizuje wyłącznie kolumny katalogu - DateAdded, LastStanChange, CenaZakupuNetto itd. zostają.
+        # Wiersze pobierane i zapisywane porcjami (iter_chunks) - pamięć nie rośnie z wielkością katalogu
+        now_dt = datetime.now()
+        now = now_dt.strftime('%Y-%m-%d %H:%M:%S')
+        now_ts = int(now_dt.timestamp())
+        catalog_columns = (
+            "Nazwa", "Marka", "Rozmiar", "Model", "Sezon", "Plec", "Kolor",
+            "Przeznaczenie", "Rodzaj", "JM", "Uwagi", "Opis", "Grupa",
+            "DetalicznaNetto", "DetalicznaBrutto", "StawkaVAT", "Stan", "LastUpdated",
+            "LastRunId", "LastUpdatedTs", CATALOG_HASH_COLUMN
+        )
 
-        # Użyj INSERT OR REPLACE do aktualizacji istniejących produktów
-        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        print("[SYNC-PRODUCTS] Pobieranie produktów z SQL Server...")
+        sql_cursor.execute(query)
 
+        rows_read = 0
         updated_count = 0
-        for row in rows:
-            symbol = row[0]
-            nazwa = row[1] or ''
-            marka = row[2] or ''
-            rozmiar = row[3] or ''
-            model = row[4] or ''
-            sezon = row[5] or ''
-            plec = row[6] or ''
-            kolor = row[7] or ''
-            przeznaczenie = row[8] or ''
-            rodzaj = row[9] or ''
-            jm = row[10] or 'szt'
-            uwagi = row[11] or ''
-            opis = row[12] or ''
-            grupa = row[13] or ''
-            # Konwertuj Decimal na float dla SQLite
-            detaliczna_netto = float(row[14]) if row[14] else 0.0
-            detaliczna_brutto = float(row[15]) if row[15] else 0.0
-            stawka_vat = float(row[16]) if row[16] else 23.0
-            stan = float(row[17]) if row[17] else 0.0
+        for rows in iter_chunks(sql_cursor):
+            rows_read += len(rows)
+            records = {}
+            for row in rows:
+                records[row[0]] = (
+                    row[1] or '',  # Nazwa
+                    row[2] or '',  # Marka
+                    row[3] or '',  # Rozmiar
+                    row[4] or '',  # Model
+                    row[5] or '',  # Sezon
+                    row[6] or '',  # Plec
+                    row[7] or '',  # Kolor
+                    row[8] or '',  # Przeznaczenie
+                    row[9] or '',  # Rodzaj
+                    row[10] or 'szt',  # JM
+                    row[11] or '',  # Uwagi
+                    row[12] or '',  # Opis
+                    row[13] or '',  # Grupa
+                    # Konwertuj Decimal na float dla SQLite
+                    float(row[14]) if row[14] else 0.0,  # DetalicznaNetto
+                    float(row[15]) if row[15] else 0.0,  # DetalicznaBrutto
+                    float(row[16]) if row[16] else 23.0,  # StawkaVAT
+                    float(row[17]) if row[17] else 0.0  # Stan
+                )
 
-            cursor.execute("""
-                INSERT OR REPLACE INTO products
-                (Symbol, Nazwa, Marka, Rozmiar, Model, Sezon, Plec, Kolor,
-                 Przeznaczenie, Rodzaj, JM, Uwagi, Opis, Grupa,
-                 DetalicznaNetto, DetalicznaBrutto, StawkaVAT, Stan, LastUpdated)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (symbol, nazwa, marka, rozmiar, model, sezon, plec, kolor,
-                  przeznaczenie, rodzaj, jm, uwagi, opis, grupa,
-                  detaliczna_netto, detaliczna_brutto, stawka_vat, stan, now))
-            updated_count += 1
+            changed = changed_rows(records, load_fingerprints(cursor, CATALOG_HASH_COLUMN, records.keys()))
+            updated_count += bulk_upsert_products(
+                cursor,
+                catalog_columns,
+                [(symbol,) + values + (now, run.run_id, now_ts, fingerprint) for symbol, values, fingerprint in changed]
+            )
+
+        sql_connection.close()
+        print(f"[SYNC-PRODUCTS] Pobrano {rows_read} produktów z SQL Server")
+
+        if not rows_read:
+            conn.close()
+            print("[SYNC-PRODUCTS] Brak produktów do synchronizacji")
+            run.finish(error="Brak produktów w SQL Server")
+            return False
 
         conn.commit()
         conn.close()
 
-        print(f"[SYNC-PRODUCTS] Zaktualizowano {updated_count} produktów w lokalnej bazie")
+        print(f"[SYNC-PRODUCTS] Zaktualizowano {updated_count} z {rows_read} produktów w lokalnej bazie (pozostałe bez zmian)")
         print(f"[SYNC-PRODUCTS] Synchronizacja zakończona pomyślnie")
+        run.stage("sync_products", rows_read=rows_read, rows_written=updated_count, rows_changed=updated_count)
+        run.finish()
         return True
 
     except Exception as e:
         print(f"[SYNC-PRODUCTS] BŁĄD synchronizacji: {str(e)}")
         import traceback
         traceback.print_exc()
+        run.finish(error=str(e))
         return False
     finally:
         products_sync_lock.release()
@@ -5283,7 +6286,7 @@ async def trigger_products_sync():
     import threading
 
     def run_sync():
-        sync_products_from_sql_server()
+        sync_products_from_sql_server("manual")
 
     threading.Thread(target=run_sync, daemon=True).start()
 
@@ -5299,7 +6302,7 @@ async def get_products_sync_status():
     Sprawdza status synchronizacji produktów.
     """
     try:
-        conn = sqlite3.connect(str(DATABASE_FILE))
+        conn = connect_sqlite()
         cursor = conn.cursor()
 
         # Sprawdź ile produktów jest w bazie
@@ -5333,7 +6336,6 @@ async def get_products_sync_status():
 
 if __name__ == "__main__":
     import uvicorn
-    import sys
 
     PORT = 5555
     print(f"Backend API - Inteligentne Zakupy")
@@ -5341,75 +6343,8 @@ if __name__ == "__main__":
     print(f"Baza danych: {DATABASE_FILE}")
     print(f"Dokumentacja: http://localhost:{PORT}/docs")
 
-    # ==================== INICJALIZACJA CACHE ====================
-    # Ładuj dane do pamięci przy starcie serwera (w tle, nie blokuje startu)
-    init_cache_on_startup()
-
-    # Skonfiguruj cykliczną synchronizację co godzinę (bez początkowej synchronizacji)
-    scheduler.add_job(
-        run_data_sync,
-        trigger=IntervalTrigger(hours=1),
-        id='data_sync_job',
-        name='Synchronizacja danych co godzinę',
-        replace_existing=True
-    )
-
-    # Synchronizacja planów sprzedaży z Google Sheets co 30 minut
-    scheduler.add_job(
-        sync_sales_plans_from_google,
-        trigger=IntervalTrigger(minutes=30),
-        id='sales_plans_sync_job',
-        name='Synchronizacja planów sprzedaży co 30 minut',
-        replace_existing=True
-    )
-
-    # Odświeżanie cache danych co 5 minut (dane w pamięci są zawsze świeże)
-    scheduler.add_job(
-        refresh_all_cache,
-        trigger=IntervalTrigger(minutes=5),
-        id='cache_refresh_job',
-        name='Odświeżanie cache danych co 5 minut',
-        replace_existing=True
-    )
-
-    # Odświeżanie footfall w tle co 5 minut (NIE BLOKUJE API!)
-    scheduler.add_job(
-        refresh_footfall_background,
-        trigger=IntervalTrigger(minutes=5),
-        id='footfall_refresh_job',
-        name='Odświeżanie footfall w tle co 5 minut',
-        replace_existing=True
-    )
-
-    # Synchronizacja produktów z SQL Server co 30 minut
-    scheduler.add_job(
-        sync_products_from_sql_server,
-        trigger=IntervalTrigger(minutes=30),
-        id='products_sync_job',
-        name='Synchronizacja produktów z SQL Server co 30 minut',
-        replace_existing=True
-    )
-
-    # Początkowa synchronizacja planów sprzedaży przy starcie
-    print("\n[SYNC] Synchronizacja planów sprzedaży przy starcie...")
-    sync_sales_plans_from_google()
-
-    # Początkowe pobranie footfall w tle (nie blokuje startu serwera)
-    print("[SYNC] Rozpoczynam pobieranie footfall w tle...")
-    import threading
-    threading.Thread(target=refresh_footfall_background, daemon=True).start()
-
-    # Początkowa synchronizacja produktów przy starcie (w tle, nie blokuje)
-    print("[SYNC] Rozpoczynam synchronizację produktów z SQL Server w tle...")
-    threading.Thread(target=sync_products_from_sql_server, daemon=True).start()
-
-    scheduler.start()
-    print(f"\n[OK] Zaplanowano automatyczną synchronizację danych co 1 godzinę")
-    print(f"[OK] Zaplanowano automatyczną synchronizację planów sprzedaży co 30 minut")
-    print(f"[OK] Zaplanowano odświeżanie cache co 5 minut")
-    print(f"[OK] Zaplanowano odświeżanie footfall w tle co 5 minut")
-    print(f"[OK] Zaplanowano synchronizację produktów z SQL Server co 30 minut")
-
+    # Inicjalizacja cache, synchronizacje startowe i scheduler uruchamiane są
+    # w lifespan (run_startup_phases) - także przy starcie przez "uvicorn main:app"
     print("\n" + "="*60)
     print(f"URUCHAMIANIE SERWERA API")
     print("="*60 + "\n")
@@ -5418,5 +6353,3 @@ if __name__ == "__main__":
         uvicorn.run(app, host="0.0.0.0", port=PORT)
     except (KeyboardInterrupt, SystemExit):
         print("\n\nZamykanie serwera...")
-        scheduler.shutdown()
-        print("[OK] Scheduler zatrzymany")
@@ -0,0 +1,89 @@
+"""
+Lokalna kopia stanów magazynowych z podziałem na magazyny (tabela product_stock).
+
+Skrypt wsadowy (etap sync_product_stock) przy każdej synchronizacji przepisuje do product_stock
+stany tw_Stan > 0 z magazynów STOCK_MAG_IDS, zapisując tylko zmienione pary (Symbol, MagId)
+i usuwając pary, które zniknęły ze źródła. Endpoint /api/warehouse-stocks czyta już z lokalnej bazy.
+"""
+import sqlite3
+from datetime import datetime
+
+from sql_stream import iter_chunks
+from stock_movements import write_sync_state
+
+# Magazyny stanów: 1 GLS, 2 GLS DEPOZYT, 3, 7 JEANS, 9 INNE
+STOCK_MAG_IDS = "1, 2, 3, 7, 9"
+SYNCED_AT_STATE = "product_stock.synced_at"
+
+
+def init_product_stock_table(database_file):
+    """Tworzy tabelę stanów per magazyn jeśli nie istnieje"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS product_stock (
+            Symbol TEXT NOT NULL,
+            MagId INTEGER NOT NULL,
+            Stan REAL NOT NULL,
+            UpdatedAt TEXT,
+            PRIMARY KEY (Symbol, MagId)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_product_stock_mag ON product_stock(MagId)')
+    conn.commit()
+    conn.close()
+
+
+def refresh_product_stock(cursor, sql_connection):
+    """
+    Przepisuje stany per magazyn z SQL Servera do product_stock (commit po stronie wywołującego).
+    Zwraca liczby: pobrane pary symbol/magazyn, zapisane (nowe i zmienione) i usunięte.
+    """
+    query = f"""
+    SELECT tw.tw_Symbol AS Symbol, st.st_MagId AS MagId, SUM(st.st_Stan) AS Stan
+    FROM tw_Stan st
+    INNER JOIN tw__Towar tw ON st.st_TowId = tw.tw_Id
+    WHERE st.st_Stan > 0 AND st.st_MagId IN ({STOCK_MAG_IDS})
+    GROUP BY tw.tw_Symbol, st.st_MagId
+    """
+    sql_cursor = sql_connection.cursor()
+    sql_cursor.execute(query)
+
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS staged_product_stock (
+            Symbol TEXT NOT NULL,
+            MagId INTEGER NOT NULL,
+            Stan REAL NOT NULL,
+            PRIMARY KEY (Symbol, MagId)
+        )
+    ''')
+    cursor.execute('DELETE FROM staged_product_stock')
+    rows_read = 0
+    for rows in iter_chunks(sql_cursor):
+        rows_read += len(rows)
+        cursor.executemany(
+            'INSERT OR REPLACE INTO staged_product_stock (Symbol, MagId, Stan) VALUES (?, ?, ?)',
+            [(row[0], row[1], float(row[2])) for row in rows if row[0]]
+        )
+    sql_cursor.close()
+
+    cursor.execute('''
+        DELETE FROM product_stock
+        WHERE NOT EXISTS (
+            SELECT 1 FROM staged_product_stock s
+            WHERE s.Symbol = product_stock.Symbol AND s.MagId = product_stock.MagId
+        )
+    ''')
+    removed = cursor.rowcount
+    cursor.execute('''
+        INSERT INTO product_stock (Symbol, MagId, Stan, UpdatedAt)
+        SELECT Symbol, MagId, Stan, ? FROM staged_product_stock WHERE true
+        ON CONFLICT(Symbol, MagId) DO UPDATE SET
+            Stan = excluded.Stan,
+            UpdatedAt = excluded.UpdatedAt
+        WHERE product_stock.Stan IS NOT excluded.Stan
+    ''', (datetime.now().strftime('%Y-%m-%d %H:%M:%S'),))
+    written = cursor.rowcount
+    cursor.execute('DROP TABLE staged_product_stock')
+    write_sync_state(cursor, SYNCED_AT_STATE, datetime.now().isoformat(timespec='seconds'))
+    return {'rows_read': rows_read, 'rows_written': written, 'rows_removed': removed}
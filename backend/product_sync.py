@@ -0,0 +1,93 @@
+"""
+Synchronizacja produktów oparta na odciskach wierszy (fingerprint).
+
+Każde źródło produktów zapisuje w products odcisk (skrót) swoich ostatnio zapisanych danych:
+- SqlRowHash - skrypt wsadowy (upload_sql_data_to_sqlite, produkty na stanie),
+- CatalogRowHash - synchronizacja katalogu w serwerze (sync_products_from_sql_server),
+- CsvRowHash - plik stanów ALPINE PRO (add_csv_data_to_sqlite).
+Przy kolejnej synchronizacji zapisywane są tylko wiersze, których odcisk się zmienił, więc
+synchronizacja bez zmian w źródle nie zapisuje żadnego wiersza.
+
+bulk_upsert_products aktualizuje wyłącznie podane kolumny (INSERT ... ON CONFLICT DO UPDATE) -
+pozostałe kolumny (DateAdded, LastStanChange, CenaZakupuNetto, ...) zostają nienaruszone.
+"""
+import hashlib
+import sqlite3
+
+SYMBOL_CHUNK = 500
+SQL_HASH_COLUMN = "SqlRowHash"
+CATALOG_HASH_COLUMN = "CatalogRowHash"
+CSV_HASH_COLUMN = "CsvRowHash"
+
+
+def init_row_hash_columns(database_file):
+    """Migracja: kolumny odcisków wierszy w products"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    try:
+        cursor.execute("PRAGMA table_info(products)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if columns:
+            for hash_column in (SQL_HASH_COLUMN, CATALOG_HASH_COLUMN, CSV_HASH_COLUMN):
+                if hash_column not in columns:
+                    cursor.execute(f'ALTER TABLE products ADD COLUMN {hash_column} TEXT')
+                    print(f"Dodano kolumnę {hash_column}")
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"[SYNC-PRODUCTS] Ostrzeżenie podczas migracji odcisków wierszy: {e}")
+    finally:
+        conn.close()
+
+
+def row_fingerprint(values):
+    """Odcisk wiersza - skrót wartości w ustalonej kolejności kolumn"""
+    return hashlib.blake2b(repr(tuple(values)).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def load_fingerprints(cursor, hash_column, symbols=None):
+    """
+    Zapisane odciski wierszy: {Symbol: odcisk}.
+    symbols: tylko podane symbole (porcja synchronizacji) - zapytania po SYMBOL_CHUNK symboli.
+    """
+    if symbols is None:
+        cursor.execute(f'SELECT Symbol, {hash_column} FROM products')
+        return dict(cursor.fetchall())
+
+    fingerprints = {}
+    unique_symbols = list(dict.fromkeys(symbols))
+    for offset in range(0, len(unique_symbols), SYMBOL_CHUNK):
+        chunk = unique_symbols[offset:offset + SYMBOL_CHUNK]
+        cursor.execute(
+            f'SELECT Symbol, {hash_column} FROM products WHERE Symbol IN ({",".join("?" * len(chunk))})',
+            chunk
+        )
+        fingerprints.update(cursor.fetchall())
+    return fingerprints
+
+
+def changed_rows(records, fingerprints):
+    """
+    Wybiera wiersze do zapisu. records: {Symbol: krotka wartości}.
+    Zwraca listę (Symbol, wartości, odcisk) dla wierszy nowych lub ze zmienionym odciskiem.
+    """
+    changed = []
+    for symbol, values in records.items():
+        fingerprint = row_fingerprint(values)
+        if fingerprints.get(symbol) != fingerprint:
+            changed.append((symbol, values, fingerprint))
+    return changed
+
+
+def bulk_upsert_products(cursor, columns, rows):
+    """
+    Wstawia lub aktualizuje produkty jednym executemany. columns - kolumny poza Symbol;
+    rows - krotki (Symbol, *wartości kolumn). Kolumny spoza listy nie są zmieniane.
+    """
+    all_columns = ("Symbol",) + tuple(columns)
+    cursor.executemany(f'''
+        INSERT INTO products ({', '.join(all_columns)})
+        VALUES ({', '.join('?' * len(all_columns))})
+        ON CONFLICT(Symbol) DO UPDATE SET
+            {', '.join(f'{column} = excluded.{column}' for column in columns)}
+    ''', rows)
+    return len(rows)
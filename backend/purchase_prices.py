@@ -0,0 +1,181 @@
+"""
+Historia cen zakupu (tabela purchase_price_history) i ceny zakupu produktów.
+
+Synchronizacja (POST /api/sync-purchase-prices w main.py) pobiera z SQL Servera tylko nowe
+dokumenty zakupu:
+- PZ - cena z powiązanej faktury zakupu FZ (pozycja FZ tego samego towaru),
+- PW - cena bezpośrednio z pozycji dokumentu PW.
+Nowe są dokumenty o id powyżej największego zapisanego (PZ, FZ lub PW - FZ dopięta do starszej PZ
+też ma nowe id) oraz dokumenty z ostatnich RESYNC_DAYS dni (korekty i anulowania). Pierwsze
+uruchomienie pobiera całą historię.
+
+Ostatnia cena per symbol wyznaczana jest lokalnie (najnowsza data dokumentu), a products
+aktualizowane jest jednym poleceniem - zapisywane są tylko zmienione ceny.
+"""
+import sqlite3
+from datetime import date, datetime, timedelta
+
+RESYNC_DAYS = 30
+FETCH_BATCH = 5000
+
+
+def init_purchase_price_history_table(database_file):
+    """Tworzy tabelę historii cen zakupu jeśli nie istnieje"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS purchase_price_history (
+            PozycjaId INTEGER NOT NULL,
+            CenaPozycjaId INTEGER NOT NULL,
+            DokId INTEGER NOT NULL,
+            FzDokId INTEGER,
+            Symbol TEXT NOT NULL,
+            Zrodlo TEXT NOT NULL,
+            DataDok TEXT NOT NULL,
+            CenaZakupuNetto REAL NOT NULL,
+            PRIMARY KEY (PozycjaId, CenaPozycjaId)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_purchase_price_history_symbol ON purchase_price_history(Symbol, DataDok)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_purchase_price_history_date ON purchase_price_history(DataDok)')
+    conn.commit()
+    conn.close()
+
+
+def _format_datetime(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d 00:00:00')
+    return str(value)[:19]
+
+
+def sync_purchase_prices(database_file, sql_connection, report=None, today=None):
+    """
+    Dopisuje nowe ceny zakupu do purchase_price_history i przenosi ostatnie ceny do products.
+    report(phase, **counts) - opcjonalne raportowanie postępu (fazy: fetch, apply).
+    Zwraca liczby wierszy: pobrane pozycje, symbole z ceną, zmienione produkty.
+    """
+    report = report or (lambda phase, **counts: None)
+    today = today or date.today()
+    resync_start = (today - timedelta(days=RESYNC_DAYS)).strftime('%Y-%m-%d')
+
+    init_purchase_price_history_table(database_file)
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(DokId), MAX(FzDokId) FROM purchase_price_history')
+    last_doc_id, last_fz_id = cursor.fetchone()
+
+    if last_doc_id is None:
+        print("[Ceny Zakupu] Pierwsza synchronizacja - pobieranie całej historii PZ/FZ i PW...")
+        pz_filter = pw_filter = ""
+        params = ()
+    else:
+        watermark = max(last_doc_id, last_fz_id or 0)
+        print(f"[Ceny Zakupu] Pobieranie dokumentów od dok_Id > {watermark} oraz od {resync_start}...")
+        pz_filter = "AND (pz.dok_Id > ? OR fz.dok_Id > ? OR pz.dok_DataWyst >= CAST(? AS DATE))"
+        pw_filter = "AND (pw.dok_Id > ? OR pw.dok_DataWyst >= CAST(? AS DATE))"
+        params = (watermark, watermark, resync_start, watermark, resync_start)
+
+    query = f"""
+    SELECT
+        pz_poz.ob_Id AS PozycjaId,
+        fz_poz.ob_Id AS CenaPozycjaId,
+        pz.dok_Id AS DokId,
+        fz.dok_Id AS FzDokId,
+        tw.tw_Symbol AS Symbol,
+        'PZ' AS Zrodlo,
+        pz.dok_DataWyst AS DataDok,
+        fz_poz.ob_CenaNetto AS CenaZakupuNetto
+    FROM dok__Dokument pz
+    INNER JOIN dok_Pozycja pz_poz ON pz.dok_Id = pz_poz.ob_DokMagId
+    INNER JOIN dok__Dokument fz ON pz_poz.ob_DokHanId = fz.dok_Id
+    INNER JOIN dok_Pozycja fz_poz ON fz.dok_Id = fz_poz.ob_DokHanId AND pz_poz.ob_TowId = fz_poz.ob_TowId
+    INNER JOIN tw__Towar tw ON pz_poz.ob_TowId = tw.tw_Id
+    WHERE pz.dok_NrPelny LIKE 'PZ%'
+        AND fz.dok_NrPelny LIKE 'FZ%'
+        AND pz.dok_Status <> 2
+        AND fz_poz.ob_CenaNetto > 0
+        {pz_filter}
+
+    UNION ALL
+
+    SELECT
+        pw_poz.ob_Id AS PozycjaId,
+        pw_poz.ob_Id AS CenaPozycjaId,
+        pw.dok_Id AS DokId,
+        NULL AS FzDokId,
+        tw.tw_Symbol AS Symbol,
+        'PW' AS Zrodlo,
+        pw.dok_DataWyst AS DataDok,
+        pw_poz.ob_CenaNetto AS CenaZakupuNetto
+    FROM dok__Dokument pw
+    INNER JOIN dok_Pozycja pw_poz ON pw.dok_Id = pw_poz.ob_DokMagId
+    INNER JOIN tw__Towar tw ON pw_poz.ob_TowId = tw.tw_Id
+    WHERE pw.dok_NrPelny LIKE 'PW%'
+        AND pw.dok_Status <> 2
+        AND pw_poz.ob_CenaNetto > 0
+        {pw_filter}
+    """
+    sql_cursor = sql_connection.cursor()
+    sql_cursor.execute(query, params)
+
+    # Kolumny: PozycjaId(0), CenaPozycjaId(1), DokId(2), FzDokId(3), Symbol(4), Zrodlo(5), DataDok(6), CenaZakupuNetto(7)
+    records = []
+    while True:
+        rows = sql_cursor.fetchmany(FETCH_BATCH)
+        if not rows:
+            break
+        records.extend(
+            (row[0], row[1], row[2], row[3], row[4], row[5], _format_datetime(row[6]), float(row[7]))
+            for row in rows if row[4] and row[6]
+        )
+        report("fetch", rows_fetched=len(records))
+    sql_cursor.close()
+
+    # Dokumenty z okna korekt zastępowane w całości (anulowania, zmiany cen na FZ)
+    if last_doc_id is not None:
+        cursor.execute('DELETE FROM purchase_price_history WHERE DataDok >= ?', (resync_start,))
+    cursor.executemany('''
+        INSERT OR REPLACE INTO purchase_price_history
+        (PozycjaId, CenaPozycjaId, DokId, FzDokId, Symbol, Zrodlo, DataDok, CenaZakupuNetto)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', records)
+    report("apply", rows_fetched=len(records))
+
+    # Ostatnia cena per symbol (najnowszy dokument), zapis tylko zmienionych cen
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS staged_purchase_prices (
+            Symbol TEXT PRIMARY KEY,
+            CenaZakupuNetto REAL NOT NULL
+        )
+    ''')
+    cursor.execute('DELETE FROM staged_purchase_prices')
+    cursor.execute('''
+        INSERT INTO staged_purchase_prices (Symbol, CenaZakupuNetto)
+        SELECT Symbol, CenaZakupuNetto FROM (
+            SELECT Symbol, CenaZakupuNetto,
+                   ROW_NUMBER() OVER (PARTITION BY Symbol ORDER BY DataDok DESC, PozycjaId DESC) AS rn
+            FROM purchase_price_history
+        )
+        WHERE rn = 1
+    ''')
+    priced_symbols = cursor.rowcount
+    cursor.execute('''
+        UPDATE products
+        SET CenaZakupuNetto = (
+            SELECT s.CenaZakupuNetto FROM staged_purchase_prices s WHERE s.Symbol = products.Symbol
+        )
+        WHERE EXISTS (
+            SELECT 1 FROM staged_purchase_prices s
+            WHERE s.Symbol = products.Symbol AND products.CenaZakupuNetto IS NOT s.CenaZakupuNetto
+        )
+    ''')
+    updated_count = cursor.rowcount
+    cursor.execute('DROP TABLE staged_purchase_prices')
+    conn.commit()
+    conn.close()
+
+    report("done", rows_fetched=len(records), priced_symbols=priced_symbols, updated_count=updated_count)
+    print(f"[Ceny Zakupu] Pobrano {len(records)} pozycji, ceny dla {priced_symbols} symboli, zmienione: {updated_count}")
+    return {'rows_read': len(records), 'priced_symbols': priced_symbols, 'rows_changed': updated_count}
@@ -0,0 +1,244 @@
+"""
+Propozycje zakupowe dla całego katalogu (tabela purchase_proposals).
+
+Skrypt wsadowy (product_data_manager_optimized.py) po każdej synchronizacji przelicza tabelę
+jednym przebiegiem pandas dla wszystkich przeznaczeń i grup - zapisany wynik dotyczy
+DEFAULT_MIN_STOCK_DAYS. Serwer (main.py) czyta z niej wiersze wybranego przeznaczenia/grupy
+i przelicza stan minimalny w pamięci dla dowolnego min_stock_days.
+
+Stan minimalny = (czas dostawy + częstotliwość zamawiania) × średnie dzienne zużycie z DEMAND_DAYS dni
+Parametry niestandardowe produktów pochodzą z custom_stock_periods.
+
+pandas importowany jest w funkcjach, żeby import modułu nie spowalniał startu serwera.
+"""
+import sqlite3
+from datetime import datetime
+
+DEMAND_DAYS = 90
+DEFAULT_MIN_STOCK_DAYS = 30
+DEFAULT_DELIVERY_TIME_DAYS = 7
+
+# Sprzedaż z ostatnich DEMAND_DAYS dni dla wszystkich towarów (magazyny 1, 2, 7, 9)
+DEMAND_QUERY = f"""
+WITH Sales AS (
+    SELECT
+        ob_TowId,
+        SUM(CASE
+                WHEN dok_Typ IN (14, 6) THEN -ob_IloscMag
+                ELSE ob_IloscMag
+            END) AS IloscSprzedana
+    FROM vwZstSprzWgKhnt
+    WHERE
+        CAST(dok_DataWyst AS DATE) >= DATEADD(day, -{DEMAND_DAYS}, CAST(GETDATE() AS DATE))
+        AND dok_MagId IN (1,2,7,9)
+        AND dok_Podtyp <> 1
+        AND dok_Status <> 2
+    GROUP BY ob_TowId
+)
+SELECT tw__Towar.tw_Symbol AS Symbol, Sales.IloscSprzedana
+FROM Sales
+INNER JOIN tw__Towar ON Sales.ob_TowId = tw__Towar.tw_Id
+"""
+
+# Kolumny wejściowe compute_proposals_frame - wspólne dla przeliczenia wsadowego i odczytu w API
+BASE_COLUMNS = """
+    p.Nazwa, p.Marka, p.Rozmiar, p.JM, p.Stan,
+    p.DetalicznaNetto, p.DetalicznaBrutto, p.CenaZakupuNetto, p.StawkaVAT,
+    c.delivery_time_days, c.order_frequency_days, c.optimal_order_quantity, c.notes
+"""
+
+STATUS_ORDER = {"PONIŻEJ": 0, "OK": 1, "NADMIAR": 2}
+
+
+def init_purchase_proposals_table(database_file):
+    """Tworzy tabelę propozycji zakupowych jeśli nie istnieje"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS purchase_proposals (
+            Symbol TEXT PRIMARY KEY,
+            Przeznaczenie TEXT,
+            Grupa TEXT,
+            Stan REAL,
+            Sprzedaz90Dni REAL,
+            SrednieDzienneZuzycie REAL,
+            CzasDostawy INTEGER,
+            CzestotliwoscZamawiania INTEGER,
+            StanMinimalny REAL,
+            Roznica REAL,
+            Status TEXT,
+            IloscDoZamowienia INTEGER,
+            CenaZakupuNetto REAL,
+            CenaZakupuBrutto REAL,
+            WartoscZamowienia REAL,
+            ComputedAt TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_purchase_proposals_przeznaczenie ON purchase_proposals(Przeznaczenie, Status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_purchase_proposals_grupa ON purchase_proposals(Grupa, Status)')
+    conn.commit()
+    conn.close()
+
+
+def fetch_demand(sql_connection):
+    """Sprzedaż z ostatnich DEMAND_DAYS dni per symbol z SQL Servera"""
+    sql_cursor = sql_connection.cursor()
+    sql_cursor.execute(DEMAND_QUERY)
+    demand = {}
+    for row in sql_cursor.fetchall():
+        if row[0]:
+            demand[row[0]] = float(row[1] or 0)
+    sql_cursor.close()
+    return demand
+
+
+def compute_proposals_frame(df, min_stock_days=DEFAULT_MIN_STOCK_DAYS):
+    """
+    Wektorowo liczy propozycje dla ramki z kolumnami BASE_COLUMNS + Symbol, Sprzedaz90Dni.
+    Zwraca ramkę z polami odpowiedzi /api/purchase-proposals.
+    """
+    import numpy as np
+    import pandas as pd
+
+    def numeric(column, default=0.0):
+        return pd.to_numeric(df[column], errors='coerce').fillna(default).astype(float)
+
+    stan = numeric('Stan')
+    sales = numeric('Sprzedaz90Dni')
+
+    # Użyj domyślnych wartości jeśli nie ma niestandardowych
+    delivery_time_days = numeric('delivery_time_days', DEFAULT_DELIVERY_TIME_DAYS)
+    order_frequency_days = numeric('order_frequency_days', min_stock_days)
+    optimal_order_quantity = numeric('optimal_order_quantity', 0)
+
+    avg_daily_usage = np.where(sales > 0, sales / float(DEMAND_DAYS), 0.0)
+    min_stock = avg_daily_usage * (delivery_time_days + order_frequency_days)
+    difference = stan - min_stock
+
+    status = np.select(
+        [difference < 0, difference < min_stock * 0.2],  # Mniej niż 20% powyżej minimum = OK
+        ["PONIŻEJ", "OK"],
+        default="NADMIAR"
+    )
+    status_color = np.select([status == "PONIŻEJ", status == "OK"], ["red", "green"], default="blue")
+
+    # Ilość do zamówienia zaokrąglona zawsze do góry
+    quantity_to_order = np.where(difference < 0, np.ceil(-difference), 0).astype(int)
+
+    price_netto = numeric('DetalicznaNetto')
+    price_brutto = numeric('DetalicznaBrutto')
+    cena_zakupu_netto = numeric('CenaZakupuNetto')
+    stawka_vat = numeric('StawkaVAT')
+
+    # Jeśli brak stawki VAT, oblicz ją z cen detalicznych
+    vat_from_prices = (stawka_vat == 0) & (price_netto > 0) & (price_brutto > 0)
+    stawka_vat = np.where(vat_from_prices, (price_brutto / price_netto.where(price_netto > 0, 1) - 1) * 100, stawka_vat)
+
+    # Fallback gdy brak ceny zakupu: 60% ceny detalicznej netto i domyślny VAT 23%
+    no_purchase_price = cena_zakupu_netto <= 0
+    cena_zakupu_netto = np.where(no_purchase_price, price_netto * 0.6, cena_zakupu_netto)
+    stawka_vat = np.where(no_purchase_price & (stawka_vat == 0), 23.0, stawka_vat)
+    cena_zakupu_brutto = cena_zakupu_netto * (1 + stawka_vat / 100)
+
+    order_value = quantity_to_order * cena_zakupu_brutto
+    difference = np.where(np.abs(difference) >= 0.01, np.round(difference, 2), 0.0)
+
+    return pd.DataFrame({
+        "Symbol": df['Symbol'].values,
+        "Nazwa": df['Nazwa'].fillna('').values,
+        "Marka": df['Marka'].fillna('').values,
+        "Rozmiar": df['Rozmiar'].fillna('').values,
+        "JM": df['JM'].fillna('szt.').values,
+        "Stan": np.round(stan.values, 2),
+        "Sprzedaz90Dni": np.round(sales.values, 2),
+        "SrednieDzienneZuzycie": np.round(avg_daily_usage, 2),
+        "StanMinimalny": np.round(min_stock, 2),
+        "Roznica": difference,
+        "Status": status,
+        "StatusColor": status_color,
+        "IloscDoZamowienia": quantity_to_order,
+        "CenaZakupuNetto": np.round(cena_zakupu_netto, 2),
+        "CenaZakupuBrutto": np.round(cena_zakupu_brutto, 2),
+        "StawkaVAT": np.round(stawka_vat, 2),
+        "WartoscZamowienia": np.round(order_value, 2),
+        "CenaDetalicznaNetto": np.round(price_netto.values, 2),
+        "CenaDetalicznaBrutto": np.round(price_brutto.values, 2),
+        "CzasDostawy": delivery_time_days.astype(int).values,
+        "CzestotliwoscZamawiania": order_frequency_days.astype(int).values,
+        "OptymalnaWielkoscPartii": optimal_order_quantity.astype(int).values,
+        "CustomNotes": df['notes'].values
+    }, index=df.index)
+
+
+def proposals_summary(frame):
+    """Podsumowanie propozycji jak w odpowiedzi /api/purchase-proposals"""
+    to_order = frame["IloscDoZamowienia"] > 0
+    return {
+        "total_products": int(len(frame)),
+        "products_below_minimum": int((frame["Status"] == "PONIŻEJ").sum()),
+        "products_ok": int((frame["Status"] == "OK").sum()),
+        "products_excess": int((frame["Status"] == "NADMIAR").sum()),
+        "total_purchase_value": round(float(frame.loc[to_order, "WartoscZamowienia"].sum()), 2)
+    }
+
+
+def proposals_records(frame):
+    """Wiersze odpowiedzi JSON - brakujące wartości (np. CustomNotes) jako None"""
+    return frame.astype(object).where(frame.notna(), None).to_dict("records")
+
+
+def sort_proposals(frame):
+    """Najpierw poniżej minimum, potem po największej różnicy"""
+    order = frame["Status"].map(STATUS_ORDER)
+    return frame.assign(_order=order).sort_values(["_order", "Roznica"], kind="stable").drop(columns="_order")
+
+
+def compute_purchase_proposals(database_file, sql_connection, min_stock_days=DEFAULT_MIN_STOCK_DAYS):
+    """
+    Przelicza propozycje zakupowe dla wszystkich produktów (Stan >= 0) i zapisuje je w purchase_proposals.
+    Zwraca liczby wierszy dla historii synchronizacji.
+    """
+    import pandas as pd
+
+    demand = fetch_demand(sql_connection)
+
+    init_purchase_proposals_table(database_file)
+    conn = sqlite3.connect(str(database_file))
+    df = pd.read_sql_query(f"""
+        SELECT p.Symbol,
+               UPPER(TRIM(COALESCE(p.Przeznaczenie, ''))) AS Przeznaczenie,
+               UPPER(TRIM(COALESCE(p.Grupa, ''))) AS Grupa,
+               {BASE_COLUMNS}
+        FROM products p
+        LEFT JOIN custom_stock_periods c ON p.Symbol = c.symbol
+        WHERE p.Stan >= 0
+    """, conn)
+    df['Sprzedaz90Dni'] = df['Symbol'].map(demand).fillna(0.0)
+
+    frame = compute_proposals_frame(df, min_stock_days)
+    computed_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = list(zip(
+        frame["Symbol"], df["Przeznaczenie"], df["Grupa"],
+        frame["Stan"], frame["Sprzedaz90Dni"], frame["SrednieDzienneZuzycie"],
+        frame["CzasDostawy"].astype(int).tolist(), frame["CzestotliwoscZamawiania"].astype(int).tolist(),
+        frame["StanMinimalny"], frame["Roznica"], frame["Status"], frame["IloscDoZamowienia"].astype(int).tolist(),
+        frame["CenaZakupuNetto"], frame["CenaZakupuBrutto"], frame["WartoscZamowienia"],
+        [computed_at] * len(frame)
+    ))
+    rows = [tuple(value.item() if hasattr(value, 'item') else value for value in row) for row in rows]
+
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM purchase_proposals')
+    cursor.executemany('''
+        INSERT INTO purchase_proposals (
+            Symbol, Przeznaczenie, Grupa, Stan, Sprzedaz90Dni, SrednieDzienneZuzycie,
+            CzasDostawy, CzestotliwoscZamawiania, StanMinimalny, Roznica, Status, IloscDoZamowienia,
+            CenaZakupuNetto, CenaZakupuBrutto, WartoscZamowienia, ComputedAt
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+    below = int((frame["Status"] == "PONIŻEJ").sum())
+    print(f"[Purchase Proposals] Przeliczono {len(rows)} produktów ({below} poniżej minimum, sprzedaż {DEMAND_DAYS} dni dla {len(demand)} symboli)")
+    return {'rows_read': len(df) + len(demand), 'rows_written': len(rows)}
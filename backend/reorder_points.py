@@ -0,0 +1,220 @@
+"""
+Punkty zamówienia dla całego katalogu (tabela reorder_suggestions).
+
+Skrypt wsadowy (product_data_manager_optimized.py) po każdej synchronizacji przelicza tabelę
+jednym wektorowym przebiegiem (numpy) dla wszystkich produktów na stanie lub sprzedawanych
+w ostatnich DEMAND_WEEKS tygodniach. Dane są lokalne: stany z products, sprzedaż z sales_weekly,
+parametry dostaw z custom_stock_periods - bez zapytań do SQL Servera. Serwer (main.py) czyta
+tabelę stronami i przelicza pojedyncze symbole po zmianie ich parametrów.
+
+Dla każdego symbolu (L = czas dostawy, R = częstotliwość zamawiania, w dniach):
+- średnia dzienna μ = sprzedaż z DEMAND_WEEKS pełnych tygodni / liczba dni
+- odchylenie dzienne σ = odchylenie sprzedaży tygodniowej / sqrt(7)
+- zapas bezpieczeństwa SS = z · σ · sqrt(L)
+- punkt zamówienia ROP = μ · L + SS, poziom docelowy = ROP + μ · R
+- przy Stan <= ROP zamówienie do poziomu docelowego, zaokrąglone w górę do wielokrotności
+  optimal_order_quantity
+"""
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from sales_weekly import week_start
+from purchase_proposals import DEFAULT_DELIVERY_TIME_DAYS
+from stock_movements import init_sync_state_table, write_sync_state
+
+DEMAND_WEEKS = 13
+DEFAULT_ORDER_FREQUENCY_DAYS = 14
+SERVICE_LEVEL_Z = 1.65  # poziom obsługi 95%
+
+COMPUTED_AT_STATE = "reorder_suggestions.computed_at"
+
+PRIORITY_RANK = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+COLUMNS = (
+    "Symbol", "Nazwa", "Przeznaczenie", "Rodzaj", "Stan", "SredniaDzienna", "OdchylenieDzienne",
+    "CzasDostawy", "CzestotliwoscZamawiania", "OptymalnaWielkoscPartii", "ZapasBezpieczenstwa",
+    "PunktZamowienia", "PoziomDocelowy", "DniDoWyczerpania", "IloscDoZamowienia", "CenaZakupuNetto",
+    "WartoscZamowienia", "Priorytet", "PriorytetRank", "ComputedAt"
+)
+
+
+def init_reorder_suggestions_table(database_file):
+    """Tworzy tabelę punktów zamówienia jeśli nie istnieje"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reorder_suggestions (
+            Symbol TEXT PRIMARY KEY,
+            Nazwa TEXT,
+            Przeznaczenie TEXT,
+            Rodzaj TEXT,
+            Stan REAL,
+            SredniaDzienna REAL,
+            OdchylenieDzienne REAL,
+            CzasDostawy INTEGER,
+            CzestotliwoscZamawiania INTEGER,
+            OptymalnaWielkoscPartii INTEGER,
+            ZapasBezpieczenstwa REAL,
+            PunktZamowienia REAL,
+            PoziomDocelowy REAL,
+            DniDoWyczerpania REAL,
+            IloscDoZamowienia INTEGER,
+            CenaZakupuNetto REAL,
+            WartoscZamowienia REAL,
+            Priorytet TEXT,
+            PriorytetRank INTEGER,
+            ComputedAt TEXT
+        )
+    ''')
+    # Sortowanie listy w API
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reorder_priority ON reorder_suggestions(PriorytetRank, DniDoWyczerpania)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reorder_stockout ON reorder_suggestions(DniDoWyczerpania)')
+    init_sync_state_table(cursor)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reorder_value ON reorder_suggestions(WartoscZamowienia)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reorder_quantity ON reorder_suggestions(IloscDoZamowienia)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_reorder_przeznaczenie ON reorder_suggestions(Przeznaczenie, PriorytetRank)')
+    conn.commit()
+    conn.close()
+
+
+def compute_reorder_frame(products, weekly_sales):
+    """
+    Wektorowo liczy punkty zamówienia.
+    products: ramka z kolumnami Symbol, Nazwa, Przeznaczenie, Rodzaj, Stan, CenaZakupuNetto,
+    DetalicznaNetto, delivery_time_days, order_frequency_days, optimal_order_quantity;
+    weekly_sales: macierz (len(products), DEMAND_WEEKS) sprzedaży tygodniowej w tej samej kolejności.
+    """
+    import numpy as np
+    import pandas as pd
+
+    def numeric(column, default=0.0):
+        return pd.to_numeric(products[column], errors='coerce').fillna(default).astype(float).to_numpy()
+
+    stock = numeric('Stan')
+    delivery = numeric('delivery_time_days', DEFAULT_DELIVERY_TIME_DAYS)
+    frequency = numeric('order_frequency_days', DEFAULT_ORDER_FREQUENCY_DAYS)
+    batch = numeric('optimal_order_quantity', 0)
+
+    weekly = np.clip(weekly_sales, 0, None)  # tygodnie z przewagą zwrotów jako brak sprzedaży
+    daily_rate = weekly.sum(axis=1) / (weekly.shape[1] * 7)
+    daily_std = weekly.std(axis=1) / np.sqrt(7)
+
+    safety_stock = SERVICE_LEVEL_Z * daily_std * np.sqrt(delivery)
+    reorder_point = daily_rate * delivery + safety_stock
+    target = reorder_point + daily_rate * frequency
+
+    needs_order = (stock <= reorder_point) & (daily_rate > 0)
+    quantity = np.where(needs_order, np.ceil(np.maximum(target - stock, 0)), 0)
+    quantity = np.where(needs_order & (batch > 0), np.ceil(quantity / np.where(batch > 0, batch, 1)) * batch, quantity)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_to_stockout = np.where(daily_rate > 0, np.maximum(stock, 0) / daily_rate, np.nan)
+
+    # Krytyczny: zapas skończy się przed dostawą; wysoki: poniżej punktu zamówienia;
+    # średni: zapas wystarczy na mniej niż połowę cyklu zamawiania po dostawie
+    priority = np.select(
+        [
+            needs_order & (days_to_stockout <= delivery),
+            needs_order,
+            (daily_rate > 0) & (stock <= reorder_point + daily_rate * frequency / 2)
+        ],
+        ["critical", "high", "medium"],
+        default="low"
+    )
+
+    # Fallback gdy brak ceny zakupu: 60% ceny detalicznej netto (jak w propozycjach zakupowych)
+    purchase_price = numeric('CenaZakupuNetto')
+    purchase_price = np.where(purchase_price > 0, purchase_price, numeric('DetalicznaNetto') * 0.6)
+
+    return pd.DataFrame({
+        "Symbol": products['Symbol'].to_numpy(),
+        "Nazwa": products['Nazwa'].fillna('').to_numpy(),
+        "Przeznaczenie": products['Przeznaczenie'].fillna('').to_numpy(),
+        "Rodzaj": products['Rodzaj'].fillna('').to_numpy(),
+        "Stan": np.round(stock, 2),
+        "SredniaDzienna": np.round(daily_rate, 3),
+        "OdchylenieDzienne": np.round(daily_std, 3),
+        "CzasDostawy": delivery.astype(int),
+        "CzestotliwoscZamawiania": frequency.astype(int),
+        "OptymalnaWielkoscPartii": batch.astype(int),
+        "ZapasBezpieczenstwa": np.round(safety_stock, 2),
+        "PunktZamowienia": np.round(reorder_point, 2),
+        "PoziomDocelowy": np.round(target, 2),
+        "DniDoWyczerpania": np.round(days_to_stockout, 1),
+        "IloscDoZamowienia": quantity.astype(int),
+        "CenaZakupuNetto": np.round(purchase_price, 2),
+        "WartoscZamowienia": np.round(quantity * purchase_price, 2),
+        "Priorytet": priority,
+        "PriorytetRank": pd.Series(priority).map(PRIORITY_RANK).to_numpy()
+    })
+
+
+def compute_reorder_suggestions(database_file, symbols=None, today=None):
+    """
+    Przelicza punkty zamówienia i zapisuje je w reorder_suggestions.
+    symbols: lista symboli do przeliczenia (np. po zmianie custom_stock_periods), None = cały katalog.
+    Zwraca liczby wierszy dla historii synchronizacji. Przeliczenie całego katalogu zapisuje
+    znacznik COMPUTED_AT_STATE (także gdy nie ma żadnych produktów).
+    """
+    import pandas as pd
+
+    today = today or date.today()
+    current_week = week_start(today)
+    first_week = current_week - timedelta(weeks=DEMAND_WEEKS)
+    weeks = [(first_week + timedelta(weeks=i)).isoformat() for i in range(DEMAND_WEEKS)]
+
+    init_reorder_suggestions_table(database_file)
+    conn = sqlite3.connect(str(database_file))
+
+    # Sprzedaż tygodniowa powstaje przy pierwszej synchronizacji - bez niej nie ma czego liczyć
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sales_weekly'").fetchone() is None:
+        conn.close()
+        print("[Punkty Zamówienia] Brak tabeli sales_weekly - pomijam przeliczenie")
+        return {'rows_read': 0, 'rows_written': 0}
+
+    # Produkty na stanie lub ze sprzedażą w oknie
+    symbol_filter = ""
+    params = [first_week.isoformat(), current_week.isoformat()]
+    if symbols is not None:
+        symbol_filter = f"AND p.Symbol IN ({','.join('?' * len(symbols))})"
+        params += list(symbols)
+    products = pd.read_sql_query(f'''
+        SELECT p.Symbol, p.Nazwa, p.Przeznaczenie, p.Rodzaj, p.Stan, p.CenaZakupuNetto, p.DetalicznaNetto,
+               c.delivery_time_days, c.order_frequency_days, c.optimal_order_quantity
+        FROM products p
+        LEFT JOIN custom_stock_periods c ON c.symbol = p.Symbol
+        WHERE (p.Stan > 0 OR EXISTS (
+            SELECT 1 FROM sales_weekly s WHERE s.Symbol = p.Symbol AND s.WeekStart >= ? AND s.WeekStart < ?
+        )) {symbol_filter}
+    ''', conn, params=params)
+
+    sales = pd.read_sql_query(f'''
+        SELECT s.Symbol, s.WeekStart, s.IloscSprzedana FROM sales_weekly s
+        WHERE s.WeekStart >= ? AND s.WeekStart < ? {symbol_filter.replace('p.Symbol', 's.Symbol')}
+    ''', conn, params=params)
+    weekly = sales.pivot_table(index='Symbol', columns='WeekStart', values='IloscSprzedana', aggfunc='sum', fill_value=0.0)
+    weekly = weekly.reindex(index=products['Symbol'], columns=weeks, fill_value=0.0).fillna(0.0)
+
+    frame = compute_reorder_frame(products, weekly.to_numpy(dtype=float))
+    frame["ComputedAt"] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    records = frame[list(COLUMNS)].astype(object).where(frame[list(COLUMNS)].notna(), None).values.tolist()
+
+    cursor = conn.cursor()
+    if symbols is None:
+        cursor.execute('DELETE FROM reorder_suggestions')
+    else:
+        cursor.executemany('DELETE FROM reorder_suggestions WHERE Symbol = ?', [(s,) for s in symbols])
+    cursor.executemany(f'''
+        INSERT INTO reorder_suggestions ({', '.join(COLUMNS)})
+        VALUES ({', '.join('?' * len(COLUMNS))})
+    ''', records)
+    if symbols is None:
+        write_sync_state(cursor, COMPUTED_AT_STATE, datetime.now().isoformat(timespec='seconds'))
+    conn.commit()
+    conn.close()
+
+    if symbols is None:
+        to_order = int((frame["IloscDoZamowienia"] > 0).sum())
+        print(f"[Punkty Zamówienia] {len(frame)} produktów, do zamówienia: {to_order}, "
+              f"wartość: {frame['WartoscZamowienia'].sum():.2f} zł")
+    return {'rows_read': len(products) + len(sales), 'rows_written': len(records)}
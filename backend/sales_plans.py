@@ -0,0 +1,132 @@
+"""
+Plany sprzedażowe z Google Sheets (tabela sales_plans).
+
+Arkusz pobierany jest w całości (eksport CSV), ale zapisywany tylko gdy jego treść się zmieniła
+(skrót SHA-256 w sync_state), i wtedy tylko wiersze ze zmienionymi wartościami.
+
+Kolumna date przechowuje datę z arkusza (DD.MM.YYYY), date_iso - tę samą datę jako YYYY-MM-DD
+z indeksem, więc zapytania o zakres dat i sortowanie korzystają z indeksu.
+"""
+import csv
+import hashlib
+import sqlite3
+from datetime import datetime
+from io import StringIO
+
+from stock_movements import init_sync_state_table, read_sync_state, write_sync_state
+
+CONTENT_HASH_STATE = "sales_plans.sha256"
+
+
+def init_sales_plans_table(database_file):
+    """Tworzy tabelę planów sprzedażowych i uzupełnia kolumnę date_iso (migracja)"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL UNIQUE,
+            gls REAL DEFAULT 0,
+            four_f REAL DEFAULT 0,
+            jeans REAL DEFAULT 0,
+            total REAL DEFAULT 0,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("PRAGMA table_info(sales_plans)")
+    if 'date_iso' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE sales_plans ADD COLUMN date_iso TEXT')
+        print("Dodano kolumnę date_iso do sales_plans")
+    cursor.execute('SELECT date FROM sales_plans WHERE date_iso IS NULL')
+    missing = [(to_iso_date(row[0]), row[0]) for row in cursor.fetchall()]
+    cursor.executemany('UPDATE sales_plans SET date_iso = ? WHERE date = ?', [row for row in missing if row[0]])
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_plans_date_iso ON sales_plans(date_iso)')
+    init_sync_state_table(cursor)
+    conn.commit()
+    conn.close()
+
+
+def to_iso_date(value):
+    """DD.MM.YYYY (lub YYYY-MM-DD) -> YYYY-MM-DD; None dla nieprawidłowej daty"""
+    value = (value or '').strip()
+    for date_format in ('%d.%m.%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, date_format).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    return None
+
+
+def parse_polish_number(value):
+    """Parsuje liczbę w polskim formacie (przecinek jako separator dziesiętny)"""
+    if not value:
+        return 0.0
+    try:
+        # Usuń cudzysłowy i zamień przecinek na kropkę
+        clean = str(value).strip().replace('"', '').replace(',', '.')
+        return float(clean) if clean else 0.0
+    except (ValueError, TypeError):
+        return 0.0
+
+
+def parse_sales_plans_csv(csv_content):
+    """Wiersze planów z CSV arkusza: {date: (gls, four_f, jeans, total)}"""
+    plans = {}
+    for row in csv.DictReader(StringIO(csv_content)):
+        try:
+            # Obsługa różnych wariantów nazwy kolumny DATA/Data/data
+            date = row.get('DATA', row.get('Data', row.get('data', ''))).strip()
+            if not date:
+                continue
+
+            gls = parse_polish_number(row.get('GLS', row.get('gls', 0)))
+            four_f = parse_polish_number(row.get('4F', row.get('four_f', 0)))
+            jeans = parse_polish_number(row.get('JEANS', row.get('jeans', 0)))
+            plans[date] = (gls, four_f, jeans, gls + four_f + jeans)
+        except (ValueError, KeyError, AttributeError) as e:
+            print(f"[SYNC] Pomijam wiersz: {e}")
+            continue
+    return plans
+
+
+def apply_sales_plans_csv(database_file, csv_content):
+    """
+    Zapisuje plany z CSV arkusza. Niezmieniona treść arkusza jest pomijana, a z pozostałych
+    zapisywane są tylko nowe daty i daty ze zmienionymi wartościami.
+    Zwraca liczby: rows_read, rows_written oraz skipped (treść bez zmian).
+    """
+    init_sales_plans_table(database_file)
+    content_hash = hashlib.sha256(csv_content.encode('utf-8')).hexdigest()
+
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    if read_sync_state(cursor, CONTENT_HASH_STATE) == content_hash:
+        conn.close()
+        return {'rows_read': 0, 'rows_written': 0, 'skipped': True}
+
+    plans = parse_sales_plans_csv(csv_content)
+    cursor.execute('SELECT date, gls, four_f, jeans, total, date_iso FROM sales_plans')
+    stored = {row[0]: (row[1:5], row[5]) for row in cursor.fetchall()}
+
+    changed = []
+    for date, values in plans.items():
+        date_iso = to_iso_date(date)
+        if stored.get(date) != (values, date_iso):
+            changed.append((date, date_iso) + values)
+
+    cursor.executemany('''
+        INSERT INTO sales_plans (date, date_iso, gls, four_f, jeans, total, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(date) DO UPDATE SET
+            date_iso = excluded.date_iso,
+            gls = excluded.gls,
+            four_f = excluded.four_f,
+            jeans = excluded.jeans,
+            total = excluded.total,
+            updated_at = CURRENT_TIMESTAMP
+    ''', changed)
+    write_sync_state(cursor, CONTENT_HASH_STATE, content_hash)
+    conn.commit()
+    conn.close()
+    return {'rows_read': len(plans), 'rows_written': len(changed), 'skipped': False}
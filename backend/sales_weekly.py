@@ -0,0 +1,139 @@
+"""
+Tygodniowa sprzedaż per symbol (tabela sales_weekly) indeksowana tygodniami ISO.
+
+Skrypt wsadowy (product_data_manager_optimized.py) po każdej synchronizacji przelicza ostatnie
+REFRESH_WEEKS tygodnie z SQL Servera (pierwsze uruchomienie: HISTORY_WEEKS tygodni).
+Serwer (main.py) czyta z tabeli sprzedaż dla dowolnie długiej listy symboli - porcjami po
+SYMBOL_CHUNK, bo SQLite (i SQL Server) ograniczają liczbę parametrów zapytania.
+
+Tydzień identyfikuje WeekStart - poniedziałek tygodnia ISO (YYYY-MM-DD). Kolejne tygodnie to
+kolejne poniedziałki, więc przejście przez koniec roku (także lata z 53 tygodniami) nie
+wymaga arytmetyki na numerach tygodni.
+"""
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from sql_stream import iter_chunks
+
+HISTORY_WEEKS = 156  # 3 lata - pełna historia przy pierwszym uruchomieniu i okres przechowywania
+REFRESH_WEEKS = 2  # bieżący i poprzedni tydzień przeliczane przy każdej synchronizacji (korekty dokumentów)
+SYMBOL_CHUNK = 500
+SALES_MAG_IDS = "1, 7, 9"
+
+
+def week_start(day):
+    """Poniedziałek tygodnia ISO zawierającego day"""
+    if isinstance(day, datetime):
+        day = day.date()
+    return day - timedelta(days=day.isoweekday() - 1)
+
+
+def iso_week_start(iso_year, iso_week):
+    """Poniedziałek tygodnia ISO o podanym roku i numerze"""
+    return date.fromisocalendar(int(iso_year), int(iso_week), 1)
+
+
+def init_sales_weekly_table(database_file):
+    """Tworzy tabelę tygodniowej sprzedaży jeśli nie istnieje"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_weekly (
+            Symbol TEXT NOT NULL,
+            WeekStart TEXT NOT NULL,
+            IsoYear INTEGER NOT NULL,
+            IsoWeek INTEGER NOT NULL,
+            IloscSprzedana REAL DEFAULT 0,
+            PRIMARY KEY (Symbol, WeekStart)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_weekly_week ON sales_weekly(WeekStart)')
+    conn.commit()
+    conn.close()
+
+
+def refresh_sales_weekly(database_file, sql_connection, today=None):
+    """
+    Przelicza tygodniową sprzedaż od początku okna odświeżania do dziś.
+    Okno: REFRESH_WEEKS ostatnich tygodni, a gdy tabela jest pusta - HISTORY_WEEKS.
+    Tygodnie starsze niż HISTORY_WEEKS są usuwane.
+    """
+    today = today or date.today()
+    current_week = week_start(today)
+
+    init_sales_weekly_table(database_file)
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(WeekStart) FROM sales_weekly')
+    last_week = cursor.fetchone()[0]
+
+    if last_week:
+        # Od tygodnia ostatniej synchronizacji (przerwa w synchronizacji nie zostawia dziur)
+        window_start = min(date.fromisoformat(last_week), current_week - timedelta(weeks=REFRESH_WEEKS - 1))
+    else:
+        window_start = current_week - timedelta(weeks=HISTORY_WEEKS - 1)
+
+    query = f"""
+    SELECT
+        tw.tw_Symbol AS Symbol,
+        YEAR(DATEADD(day, 26 - DATEPART(iso_week, dok_DataWyst), dok_DataWyst)) AS RokISO,
+        DATEPART(ISO_WEEK, dok_DataWyst) AS NumerTygodnia,
+        SUM(CASE WHEN dok_Typ IN (14, 6) THEN -ob_IloscMag ELSE ob_IloscMag END) AS IloscSprzedana
+    FROM vwZstSprzWgKhnt
+    INNER JOIN tw__Towar tw ON ob_TowId = tw.tw_Id
+    WHERE CAST(dok_DataWyst AS DATE) >= ?
+        AND dok_MagId IN ({SALES_MAG_IDS})
+        AND dok_Podtyp <> 1
+        AND dok_Status <> 2
+    GROUP BY
+        tw.tw_Symbol,
+        YEAR(DATEADD(day, 26 - DATEPART(iso_week, dok_DataWyst), dok_DataWyst)),
+        DATEPART(ISO_WEEK, dok_DataWyst)
+    """
+    sql_cursor = sql_connection.cursor()
+    sql_cursor.execute(query, (window_start.strftime('%Y-%m-%d'),))
+
+    # Okno usuwane przed zapisem, wiersze zapisywane porcjami w tej samej transakcji
+    cursor.execute('DELETE FROM sales_weekly WHERE WeekStart >= ?', (window_start.isoformat(),))
+    rows_read = 0
+    rows_written = 0
+    for rows in iter_chunks(sql_cursor):
+        rows_read += len(rows)
+        records = [
+            (row[0], iso_week_start(row[1], row[2]).isoformat(), int(row[1]), int(row[2]), float(row[3] or 0))
+            for row in rows if row[0]
+        ]
+        cursor.executemany('''
+            INSERT OR REPLACE INTO sales_weekly (Symbol, WeekStart, IsoYear, IsoWeek, IloscSprzedana)
+            VALUES (?, ?, ?, ?, ?)
+        ''', records)
+        rows_written += len(records)
+    sql_cursor.close()
+    retention_start = current_week - timedelta(weeks=HISTORY_WEEKS - 1)
+    cursor.execute('DELETE FROM sales_weekly WHERE WeekStart < ?', (retention_start.isoformat(),))
+    conn.commit()
+    conn.close()
+
+    print(f"[Sprzedaż Tygodniowa] Przeliczono tygodnie od {window_start}: {rows_written} wierszy symbol/tydzień")
+    return {'rows_read': rows_read, 'rows_written': rows_written}
+
+
+def read_weekly_sales(conn, symbols, since_week):
+    """
+    Sprzedaż tygodniowa dla listy symboli od tygodnia since_week (poniedziałek).
+    Zwraca {symbol: {WeekStart: ilość}}; zapytania porcjami po SYMBOL_CHUNK symboli.
+    """
+    sales = {}
+    unique_symbols = list(dict.fromkeys(symbols))
+    cursor = conn.cursor()
+    for offset in range(0, len(unique_symbols), SYMBOL_CHUNK):
+        chunk = unique_symbols[offset:offset + SYMBOL_CHUNK]
+        placeholders = ','.join('?' * len(chunk))
+        cursor.execute(f'''
+            SELECT Symbol, WeekStart, IloscSprzedana
+            FROM sales_weekly
+            WHERE Symbol IN ({placeholders}) AND WeekStart >= ?
+        ''', chunk + [since_week.isoformat()])
+        for symbol, week, qty in cursor.fetchall():
+            sales.setdefault(symbol, {})[week] = float(qty or 0)
+    return sales
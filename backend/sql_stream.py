@@ -0,0 +1,24 @@
+"""
+Strumieniowe pobieranie dużych wyników zapytań porcjami (fetchmany).
+
+Zapytania obejmujące cały katalog lub rok pozycji dokumentów nie są materializowane przez
+fetchall() - wiersze pobierane są porcjami po FETCH_CHUNK_SIZE, a każda porcja jest
+przetwarzana i zapisywana przed pobraniem kolejnej. Szczytowa pamięć zależy od rozmiaru
+porcji, nie od wielkości katalogu czy historii.
+
+Działa z kursorami pyodbc (SQL Server) i sqlite3.
+"""
+FETCH_CHUNK_SIZE = 5000
+
+
+def iter_chunks(cursor, size=FETCH_CHUNK_SIZE):
+    """Zwraca kolejne porcje (listy) wierszy wykonanego zapytania"""
+    try:
+        cursor.arraysize = size  # domyślny rozmiar porcji fetchmany w sterowniku
+    except AttributeError:
+        pass
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            return
+        yield rows
@@ -0,0 +1,189 @@
+"""
+Historia stanów magazynowych per symbol i magazyn (tabela stock_snapshot_deltas).
+
+Raz dziennie (pierwsza synchronizacja danego dnia - stan na otwarcie dnia) skrypt wsadowy w etapie
+snapshot_stock_history zapisuje migawkę product_stock jako różnice względem poprzedniej migawki: tylko
+pary (Symbol, MagId), których stan się zmienił, a pary, które zniknęły z product_stock, ze stanem 0. Wiersz oznacza więc
+"od dnia SnapshotDate stan wynosi Stan" i obowiązuje do następnego wiersza tej pary.
+
+Stan na dowolny dzień to ostatni wiersz pary z SnapshotDate <= dzień, więc odczyt zakresu dat
+to stan bazowy na początek zakresu plus zmiany z zakresu - bez pytania SQL Servera i bez
+odtwarzania stanów z dokumentów. Dni przed pierwszą migawką nie mają danych.
+"""
+import sqlite3
+from datetime import date, timedelta
+
+from stock_movements import read_sync_state, write_sync_state
+
+SNAPSHOT_DATE_STATE = "stock_history.snapshot_date"
+SYMBOL_CHUNK = 500
+
+
+def init_stock_history_table(database_file):
+    """Tworzy tabelę zmian stanów (migawki dzienne) jeśli nie istnieje"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stock_snapshot_deltas (
+            Symbol TEXT NOT NULL,
+            MagId INTEGER NOT NULL,
+            SnapshotDate TEXT NOT NULL,
+            Stan REAL NOT NULL,
+            PRIMARY KEY (Symbol, MagId, SnapshotDate)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_snapshot_deltas_date ON stock_snapshot_deltas(SnapshotDate)')
+    conn.commit()
+    conn.close()
+
+
+def snapshot_stock(cursor, today=None):
+    """
+    Zapisuje dzienną migawkę product_stock jako zmiany względem poprzedniej migawki
+    (commit po stronie wywołującego). Kolejne synchronizacje tego samego dnia są pomijane.
+    Zwraca liczbę zapisanych zmian (None gdy migawka z tego dnia już istnieje).
+    """
+    snapshot_date = (today or date.today()).isoformat()
+    if read_sync_state(cursor, SNAPSHOT_DATE_STATE) == snapshot_date:
+        return None
+
+    # Stan z poprzedniej migawki: ostatni wiersz każdej pary (SQLite zwraca Stan z wiersza z MAX)
+    cursor.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS previous_stock (
+            Symbol TEXT NOT NULL,
+            MagId INTEGER NOT NULL,
+            Stan REAL NOT NULL,
+            PRIMARY KEY (Symbol, MagId)
+        )
+    ''')
+    cursor.execute('DELETE FROM previous_stock')
+    cursor.execute('''
+        INSERT INTO previous_stock (Symbol, MagId, Stan)
+        SELECT Symbol, MagId, Stan FROM (
+            SELECT Symbol, MagId, Stan, MAX(SnapshotDate)
+            FROM stock_snapshot_deltas
+            WHERE SnapshotDate < ?
+            GROUP BY Symbol, MagId
+        )
+        WHERE Stan <> 0
+    ''', (snapshot_date,))
+
+    cursor.execute('DELETE FROM stock_snapshot_deltas WHERE SnapshotDate = ?', (snapshot_date,))
+    cursor.execute('''
+        INSERT INTO stock_snapshot_deltas (Symbol, MagId, SnapshotDate, Stan)
+        SELECT ps.Symbol, ps.MagId, ?, ps.Stan
+        FROM product_stock ps
+        LEFT JOIN previous_stock p ON p.Symbol = ps.Symbol AND p.MagId = ps.MagId
+        WHERE p.Stan IS NOT ps.Stan
+        UNION ALL
+        SELECT p.Symbol, p.MagId, ?, 0
+        FROM previous_stock p
+        WHERE NOT EXISTS (
+            SELECT 1 FROM product_stock ps WHERE ps.Symbol = p.Symbol AND ps.MagId = p.MagId
+        )
+    ''', (snapshot_date, snapshot_date))
+    written = cursor.rowcount
+    cursor.execute('DROP TABLE previous_stock')
+    write_sync_state(cursor, SNAPSHOT_DATE_STATE, snapshot_date)
+    return written
+
+
+def _read_stock_events(conn, start, end, symbols=None, mag_ids=None):
+    """
+    Wiersze (Date, Symbol, MagId, Stan): stan bazowy każdej pary na dzień start (z datą start)
+    i zmiany z zakresu (start, end]. start jest przycinany do pierwszej migawki.
+    Zwraca (wiersze, przycięty start) lub ([], None) gdy brak migawek w zakresie.
+    """
+    cursor = conn.cursor()
+    cursor.execute('SELECT MIN(SnapshotDate) FROM stock_snapshot_deltas')
+    first_date = cursor.fetchone()[0]
+    if first_date is None or first_date > end.isoformat():
+        return [], None
+    start = max(start, date.fromisoformat(first_date))
+
+    mag_filter = f"AND MagId IN ({','.join(str(int(m)) for m in mag_ids)})" if mag_ids else ""
+    symbol_chunks = [None]
+    if symbols is not None:
+        unique_symbols = list(dict.fromkeys(symbols))
+        symbol_chunks = [unique_symbols[i:i + SYMBOL_CHUNK] for i in range(0, len(unique_symbols), SYMBOL_CHUNK)]
+
+    events = []
+    for chunk in symbol_chunks:
+        symbol_filter = f"AND Symbol IN ({','.join('?' * len(chunk))})" if chunk else ""
+        symbol_params = list(chunk) if chunk else []
+        cursor.execute(f'''
+            SELECT Symbol, MagId, Stan, MAX(SnapshotDate)
+            FROM stock_snapshot_deltas
+            WHERE SnapshotDate <= ? {mag_filter} {symbol_filter}
+            GROUP BY Symbol, MagId
+        ''', [start.isoformat()] + symbol_params)
+        events.extend((start.isoformat(), symbol, mag_id, stan) for symbol, mag_id, stan, _ in cursor.fetchall())
+        cursor.execute(f'''
+            SELECT SnapshotDate, Symbol, MagId, Stan
+            FROM stock_snapshot_deltas
+            WHERE SnapshotDate > ? AND SnapshotDate <= ? {mag_filter} {symbol_filter}
+        ''', [start.isoformat(), end.isoformat()] + symbol_params)
+        events.extend(cursor.fetchall())
+    return events, start
+
+
+def read_stock_history(conn, start, end, symbols=None, mag_ids=None, per_symbol=True):
+    """
+    Dzienne stany w zakresie [start, end]: DataFrame z indeksem dni i kolumnami symboli
+    (per_symbol=True - suma magazynów) lub parami (Symbol, MagId).
+    Rozwija dane do postaci dziennej - przeznaczone dla wybranych symboli; dla całego
+    katalogu lepiej użyć summarize_stock_history.
+    """
+    import pandas as pd
+
+    events, start = _read_stock_events(conn, start, end, symbols, mag_ids)
+    if not events:
+        return pd.DataFrame()
+
+    frame = pd.DataFrame(events, columns=['Date', 'Symbol', 'MagId', 'Stan'])
+    frame['Date'] = pd.to_datetime(frame['Date'])
+    wide = frame.pivot_table(index='Date', columns=['Symbol', 'MagId'], values='Stan', aggfunc='last')
+    wide = wide.reindex(pd.date_range(start, end, freq='D')).ffill().fillna(0.0)
+    if per_symbol:
+        wide = wide.T.groupby(level='Symbol').sum().T
+    return wide
+
+
+def summarize_stock_history(conn, start, end, symbols=None, mag_ids=None):
+    """
+    Podsumowanie stanów w zakresie [start, end] per symbol (suma magazynów), liczone na
+    odcinkach między zmianami - bez rozwijania do postaci dziennej.
+    Zwraca DataFrame indeksowany Symbol: DniObserwacji (od pierwszej migawki symbolu w zakresie),
+    DniBezStanu, SredniStan, StanKoncowy.
+    """
+    import pandas as pd
+
+    columns = ['DniObserwacji', 'DniBezStanu', 'SredniStan', 'StanKoncowy']
+    events, start = _read_stock_events(conn, start, end, symbols, mag_ids)
+    if not events:
+        return pd.DataFrame(columns=columns).rename_axis('Symbol')
+
+    frame = pd.DataFrame(events, columns=['Date', 'Symbol', 'MagId', 'Stan'])
+    frame['Date'] = pd.to_datetime(frame['Date'])
+    frame = frame.sort_values(['Symbol', 'MagId', 'Date'])
+
+    # Zmiana stanu pary względem poprzedniego wiersza, zsumowana per symbol i dzień
+    frame['Zmiana'] = frame['Stan'] - frame.groupby(['Symbol', 'MagId'])['Stan'].shift(fill_value=0.0)
+    per_symbol = frame.groupby(['Symbol', 'Date'], as_index=False)['Zmiana'].sum()
+    per_symbol['Stan'] = per_symbol.groupby('Symbol')['Zmiana'].cumsum().round(6)
+
+    # Odcinek trwa do następnej zmiany symbolu (ostatni - do końca zakresu włącznie)
+    period_end = pd.Timestamp(end + timedelta(days=1))
+    next_date = per_symbol.groupby('Symbol')['Date'].shift(-1).fillna(period_end)
+    per_symbol['Dni'] = (next_date - per_symbol['Date']).dt.days
+    per_symbol['DniBezStanu'] = per_symbol['Dni'].where(per_symbol['Stan'] <= 0, 0)
+    per_symbol['StanDni'] = per_symbol['Stan'] * per_symbol['Dni']
+
+    grouped = per_symbol.groupby('Symbol')
+    summary = pd.DataFrame({
+        'DniObserwacji': grouped['Dni'].sum(),
+        'DniBezStanu': grouped['DniBezStanu'].sum(),
+        'StanKoncowy': grouped['Stan'].last(),
+    })
+    summary['SredniStan'] = grouped['StanDni'].sum() / summary['DniObserwacji']
+    return summary[columns]
@@ -0,0 +1,222 @@
+"""
+Lokalne kopie ruchów towarów z SQL Servera: dostawy PZ/PW (tabela deliveries) i dzienna
+sprzedaż per symbol (tabela sales_daily).
+
+Skrypt wsadowy (product_data_manager_optimized.py) przy każdej synchronizacji pobiera tylko nowe
+dane, a analiza rotacji dostaw, daty pierwszej dostawy i wiek zapasu w dead stock czytają już
+z lokalnej bazy:
+- deliveries: pozycje dokumentów o id większym niż największe zapisane (znacznik dok_Id) oraz
+  dokumenty z ostatnich RESYNC_DAYS dni (korekty i anulowania). Pierwsze uruchomienie pobiera
+  całą historię - daty pierwszej dostawy wymagają pełnej historii.
+- sales_daily: sprzedaż od ostatniego zapisanego dnia (minimum REFRESH_DAYS dni wstecz),
+  przechowywana przez HISTORY_DAYS dni (okno analizy rotacji).
+
+Etapy przetwarzające te dane przyrostowo zapisują swoje znaczniki w tabeli sync_state
+(read_sync_state / write_sync_state).
+"""
+import sqlite3
+from datetime import date, datetime, timedelta
+
+from sql_stream import iter_chunks
+
+RESYNC_DAYS = 7
+REFRESH_DAYS = 3
+HISTORY_DAYS = 366
+DELIVERY_MAG_IDS = "1, 2, 3, 7, 9"
+SALES_MAG_IDS = "1, 7, 9"
+
+
+def init_stock_movements_tables(database_file):
+    """Tworzy tabele dostaw i dziennej sprzedaży jeśli nie istnieją"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deliveries (
+            PozycjaId INTEGER PRIMARY KEY,
+            DokId INTEGER NOT NULL,
+            Symbol TEXT NOT NULL,
+            MagId INTEGER,
+            Typ INTEGER,
+            Status INTEGER,
+            DataDostawy TEXT NOT NULL,
+            Ilosc REAL DEFAULT 0
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_symbol_date ON deliveries(Symbol, DataDostawy)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_date ON deliveries(DataDostawy)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deliveries_dok ON deliveries(DokId)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            Symbol TEXT NOT NULL,
+            DataSprzedazy TEXT NOT NULL,
+            IloscSprzedana REAL DEFAULT 0,
+            PRIMARY KEY (Symbol, DataSprzedazy)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sales_daily_date ON sales_daily(DataSprzedazy)')
+    init_sync_state_table(cursor)
+    conn.commit()
+    conn.close()
+
+
+def init_sync_state_table(cursor):
+    """Tabela znaczników etapów przyrostowych (commit po stronie wywołującego)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            Name TEXT PRIMARY KEY,
+            Value TEXT,
+            UpdatedAt TEXT
+        )
+    ''')
+
+
+def read_sync_state(cursor, name, default=None):
+    """Znacznik etapu przyrostowego (None/default gdy etap jeszcze nie działał)"""
+    cursor.execute('SELECT Value FROM sync_state WHERE Name = ?', (name,))
+    row = cursor.fetchone()
+    return row[0] if row and row[0] is not None else default
+
+
+def write_sync_state(cursor, name, value):
+    """Zapisuje znacznik etapu przyrostowego (commit po stronie wywołującego)"""
+    cursor.execute('''
+        INSERT INTO sync_state (Name, Value, UpdatedAt) VALUES (?, ?, ?)
+        ON CONFLICT(Name) DO UPDATE SET Value = excluded.Value, UpdatedAt = excluded.UpdatedAt
+    ''', (name, str(value), datetime.now().isoformat()))
+
+
+def _format_datetime(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.strftime('%Y-%m-%d 00:00:00')
+    return str(value)[:19]
+
+
+def refresh_deliveries(database_file, sql_connection, today=None):
+    """
+    Dopisuje nowe pozycje dostaw PZ/PW (dok_Id powyżej znacznika) i odświeża dokumenty
+    z ostatnich RESYNC_DAYS dni. Zwraca liczby wierszy dla historii synchronizacji.
+    """
+    today = today or date.today()
+    resync_start = (today - timedelta(days=RESYNC_DAYS)).strftime('%Y-%m-%d')
+
+    init_stock_movements_tables(database_file)
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(DokId) FROM deliveries')
+    last_doc_id = cursor.fetchone()[0]
+
+    if last_doc_id is None:
+        print("[Dostawy] Pierwsza synchronizacja - pobieranie całej historii PZ/PW...")
+        doc_filter, params = "", ()
+    else:
+        print(f"[Dostawy] Pobieranie dokumentów od dok_Id > {last_doc_id} oraz od {resync_start}...")
+        doc_filter = "AND (d.dok_Id > ? OR d.dok_DataWyst >= CAST(? AS DATE))"
+        params = (last_doc_id, resync_start)
+
+    query = f"""
+    SELECT
+        dp.ob_Id AS PozycjaId,
+        d.dok_Id AS DokId,
+        tw.tw_Symbol AS Symbol,
+        d.dok_MagId AS MagId,
+        d.dok_Typ AS Typ,
+        d.dok_Status AS Status,
+        d.dok_DataWyst AS DataDostawy,
+        dp.ob_IloscMag AS Ilosc
+    FROM
+        dok__Dokument d
+    INNER JOIN
+        dok_Pozycja dp ON d.dok_Id = dp.ob_DokMagId
+    INNER JOIN
+        tw__Towar tw ON dp.ob_TowId = tw.tw_Id
+    WHERE
+        (d.dok_NrPelny LIKE 'PZ%' OR d.dok_NrPelny LIKE 'PW%')
+        AND d.dok_MagId IN ({DELIVERY_MAG_IDS})
+        {doc_filter}
+    """
+    sql_cursor = sql_connection.cursor()
+    sql_cursor.execute(query, params)
+
+    # Dokumenty z okna korekt zastępowane w całości (usunięte pozycje i anulowania)
+    if last_doc_id is not None:
+        cursor.execute('DELETE FROM deliveries WHERE DataDostawy >= ?', (resync_start,))
+
+    # Kolumny: PozycjaId(0), DokId(1), Symbol(2), MagId(3), Typ(4), Status(5), DataDostawy(6), Ilosc(7)
+    written = 0
+    for rows in iter_chunks(sql_cursor):
+        records = [
+            (row[0], row[1], row[2], row[3], row[4], row[5], _format_datetime(row[6]), float(row[7] or 0))
+            for row in rows if row[2] and row[6]
+        ]
+        cursor.executemany('''
+            INSERT OR REPLACE INTO deliveries (PozycjaId, DokId, Symbol, MagId, Typ, Status, DataDostawy, Ilosc)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', records)
+        written += len(records)
+    sql_cursor.close()
+    conn.commit()
+    conn.close()
+
+    print(f"[Dostawy] Zapisano {written} pozycji dostaw")
+    return {'rows_read': written, 'rows_written': written}
+
+
+def refresh_sales_daily(database_file, sql_connection, today=None):
+    """
+    Przelicza dzienną sprzedaż per symbol od ostatniego zapisanego dnia (minimum REFRESH_DAYS
+    dni wstecz; pusta tabela - HISTORY_DAYS dni). Dni starsze niż HISTORY_DAYS są usuwane.
+    """
+    today = today or date.today()
+    retention_start = today - timedelta(days=HISTORY_DAYS)
+
+    init_stock_movements_tables(database_file)
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(DataSprzedazy) FROM sales_daily')
+    last_day = cursor.fetchone()[0]
+
+    if last_day:
+        window_start = min(date.fromisoformat(last_day), today - timedelta(days=REFRESH_DAYS))
+    else:
+        window_start = retention_start
+
+    query = f"""
+    SELECT
+        tw.tw_Symbol AS Symbol,
+        CAST(dok_DataWyst AS DATE) AS DataSprzedazy,
+        SUM(CASE WHEN dok_Typ IN (14, 6) THEN -ob_IloscMag ELSE ob_IloscMag END) AS IloscSprzedana
+    FROM vwZstSprzWgKhnt
+    INNER JOIN tw__Towar tw ON ob_TowId = tw.tw_Id
+    WHERE CAST(dok_DataWyst AS DATE) >= ?
+        AND dok_MagId IN ({SALES_MAG_IDS})
+        AND dok_Podtyp <> 1
+        AND dok_Status <> 2
+    GROUP BY
+        tw.tw_Symbol,
+        CAST(dok_DataWyst AS DATE)
+    """
+    sql_cursor = sql_connection.cursor()
+    sql_cursor.execute(query, (window_start.strftime('%Y-%m-%d'),))
+
+    cursor.execute('DELETE FROM sales_daily WHERE DataSprzedazy >= ?', (window_start.isoformat(),))
+    # Kolumny: Symbol(0), DataSprzedazy(1), IloscSprzedana(2)
+    written = 0
+    for rows in iter_chunks(sql_cursor):
+        records = [
+            (row[0], _format_datetime(row[1])[:10], float(row[2] or 0))
+            for row in rows if row[0] and row[1]
+        ]
+        cursor.executemany('''
+            INSERT OR REPLACE INTO sales_daily (Symbol, DataSprzedazy, IloscSprzedana)
+            VALUES (?, ?, ?)
+        ''', records)
+        written += len(records)
+    sql_cursor.close()
+    cursor.execute('DELETE FROM sales_daily WHERE DataSprzedazy < ?', (retention_start.isoformat(),))
+    conn.commit()
+    conn.close()
+
+    print(f"[Sprzedaż Dzienna] Przeliczono dni od {window_start}: {written} wierszy symbol/dzień")
+    return {'rows_read': written, 'rows_written': written}
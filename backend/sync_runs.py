@@ -0,0 +1,230 @@
+"""
+Historia uruchomień synchronizacji (tabele sync_runs i sync_run_stages).
+
+Używane przez serwer (main.py - plany, produkty, ceny zakupu) oraz przez skrypt wsadowy
+(product_data_manager_optimized.py - pełna synchronizacja). Moduł zależy tylko od sqlite3,
+więc import nie spowalnia startu serwera.
+
+Typy uruchomień (run_type): full, products, sales_plans, purchase_prices
+Źródło uruchomienia (trigger_source): scheduled, manual, startup, cli
+Status: running, success, partial (błąd części etapów), failed
+
+Uruchomienia zapisujące produkty oznaczają zmienione wiersze products/change_log swoim id
+i czasem epoch (init_run_stamp_columns).
+"""
+import sqlite3
+import time
+from datetime import datetime
+
+
+def init_sync_runs_tables(database_file):
+    """Tworzy tabele historii synchronizacji jeśli nie istnieją"""
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_type TEXT NOT NULL,
+            trigger_source TEXT,
+            status TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            finished_at TEXT,
+            duration_seconds REAL,
+            rows_read INTEGER DEFAULT 0,
+            rows_written INTEGER DEFAULT 0,
+            rows_changed INTEGER DEFAULT 0,
+            error TEXT
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_run_stages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            finished_at TEXT NOT NULL,
+            duration_seconds REAL,
+            rows_read INTEGER DEFAULT 0,
+            rows_written INTEGER DEFAULT 0,
+            rows_changed INTEGER DEFAULT 0,
+            error TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_runs_type_started ON sync_runs(run_type, started_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sync_run_stages_run ON sync_run_stages(run_id)')
+    conn.commit()
+    conn.close()
+
+
+class SyncRun:
+    """
+    Jedno uruchomienie synchronizacji.
+
+    run = SyncRun(DATABASE_FILE, "products", "scheduled")
+    run.stage("fetch", rows_read=1200)          # czas etapu liczony od poprzedniego etapu
+    run.stage("write", rows_written=1200, rows_changed=35)
+    run.finish()                                 # lub run.finish(error="...")
+
+    Błędy zapisu historii są tylko logowane - nigdy nie przerywają samej synchronizacji.
+    """
+
+    def __init__(self, database_file, run_type, trigger_source="scheduled"):
+        self.database_file = database_file
+        self.run_type = run_type
+        self.run_id = None
+        self.started = time.time()
+        self.last_mark = self.started
+        self.stage_errors = 0
+        try:
+            init_sync_runs_tables(database_file)
+            conn = sqlite3.connect(str(database_file))
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO sync_runs (run_type, trigger_source, status, started_at)
+                VALUES (?, ?, 'running', ?)
+            ''', (run_type, trigger_source, datetime.fromtimestamp(self.started).isoformat()))
+            self.run_id = cursor.lastrowid
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"[SYNC-RUNS] Nie udało się zapisać startu {run_type}: {e}")
+
+    def stage(self, name, rows_read=0, rows_written=0, rows_changed=0, error=None):
+        """Zapisuje zakończony etap (czas od poprzedniego etapu lub startu)"""
+        now = time.time()
+        started, self.last_mark = self.last_mark, now
+        if error:
+            self.stage_errors += 1
+        if self.run_id is None:
+            return
+        try:
+            conn = sqlite3.connect(str(self.database_file))
+            conn.execute('''
+                INSERT INTO sync_run_stages (
+                    run_id, stage, status, started_at, finished_at, duration_seconds,
+                    rows_read, rows_written, rows_changed, error
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                self.run_id, name, 'failed' if error else 'success',
+                datetime.fromtimestamp(started).isoformat(), datetime.fromtimestamp(now).isoformat(),
+                round(now - started, 3), int(rows_read or 0), int(rows_written or 0), int(rows_changed or 0),
+                str(error) if error else None
+            ))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"[SYNC-RUNS] Nie udało się zapisać etapu {name}: {e}")
+
+    def finish(self, error=None):
+        """Zamyka uruchomienie - sumuje wiersze z etapów i ustala status"""
+        if self.run_id is None:
+            return
+        if error:
+            status = 'failed'
+        elif self.stage_errors:
+            status = 'partial'
+        else:
+            status = 'success'
+        now = time.time()
+        try:
+            conn = sqlite3.connect(str(self.database_file))
+            conn.execute('''
+                UPDATE sync_runs SET
+                    status = ?,
+                    finished_at = ?,
+                    duration_seconds = ?,
+                    rows_read = (SELECT COALESCE(SUM(rows_read), 0) FROM sync_run_stages WHERE run_id = ?),
+                    rows_written = (SELECT COALESCE(SUM(rows_written), 0) FROM sync_run_stages WHERE run_id = ?),
+                    rows_changed = (SELECT COALESCE(SUM(rows_changed), 0) FROM sync_run_stages WHERE run_id = ?),
+                    error = ?
+                WHERE id = ?
+            ''', (
+                status, datetime.fromtimestamp(now).isoformat(), round(now - self.started, 3),
+                self.run_id, self.run_id, self.run_id, str(error) if error else None, self.run_id
+            ))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"[SYNC-RUNS] Nie udało się zapisać końca {self.run_type}: {e}")
+
+
+def fail_running_sync_runs(database_file, run_type, error):
+    """
+    Oznacza niezakończone uruchomienia jako failed - np. gdy proces skryptu wsadowego
+    został przerwany (timeout) i nie zdążył sam zapisać wyniku.
+    """
+    try:
+        conn = sqlite3.connect(str(database_file))
+        conn.execute('''
+            UPDATE sync_runs SET status = 'failed', finished_at = ?, error = ?
+            WHERE run_type = ? AND status = 'running'
+        ''', (datetime.now().isoformat(), str(error), run_type))
+        conn.commit()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"[SYNC-RUNS] Nie udało się oznaczyć przerwanych uruchomień {run_type}: {e}")
+
+
+def init_run_stamp_columns(database_file):
+    """
+    Migracja: znaczniki synchronizacji w products (LastRunId, LastUpdatedTs) i change_log (RunId, ChangeTs).
+    Id uruchomienia i czas epoch są indeksowane - zapytania "co zmieniło się w ostatnim uruchomieniu /
+    ostatnich N minutach" to wyszukiwanie zakresu w indeksie zamiast datetime() na każdym wierszu.
+    """
+    conn = sqlite3.connect(str(database_file))
+    cursor = conn.cursor()
+    try:
+        cursor.execute("PRAGMA table_info(products)")
+        products_columns = [column[1] for column in cursor.fetchall()]
+        if products_columns:
+            if 'LastRunId' not in products_columns:
+                cursor.execute('ALTER TABLE products ADD COLUMN LastRunId INTEGER')
+                print("Dodano kolumnę LastRunId")
+            if 'LastUpdatedTs' not in products_columns:
+                cursor.execute('ALTER TABLE products ADD COLUMN LastUpdatedTs INTEGER')
+                # LastUpdated zapisywany jest w czasie lokalnym - modyfikator 'utc' przelicza go na epoch
+                cursor.execute("""
+                    UPDATE products SET LastUpdatedTs = CAST(strftime('%s', LastUpdated, 'utc') AS INTEGER)
+                    WHERE LastUpdated IS NOT NULL
+                """)
+                print("Dodano kolumnę LastUpdatedTs")
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_last_run ON products(LastRunId)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_updated_ts ON products(LastUpdatedTs)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_new_ts ON products(LastUpdatedTs) WHERE IsNew = 1')
+
+        cursor.execute("PRAGMA table_info(change_log)")
+        change_log_columns = [column[1] for column in cursor.fetchall()]
+        if change_log_columns:
+            if 'RunId' not in change_log_columns:
+                cursor.execute('ALTER TABLE change_log ADD COLUMN RunId INTEGER')
+                print("Dodano kolumnę RunId do change_log")
+            if 'ChangeTs' not in change_log_columns:
+                cursor.execute('ALTER TABLE change_log ADD COLUMN ChangeTs INTEGER')
+                cursor.execute("""
+                    UPDATE change_log SET ChangeTs = CAST(strftime('%s', ChangeDate, 'utc') AS INTEGER)
+                    WHERE ChangeDate IS NOT NULL
+                """)
+                print("Dodano kolumnę ChangeTs do change_log")
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_run ON change_log(RunId)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_ts ON change_log(ChangeTs)')
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"[SYNC-RUNS] Ostrzeżenie podczas migracji znaczników synchronizacji: {e}")
+    finally:
+        conn.close()
+
+
+def get_last_run_id(database_file, run_types=('full', 'products')):
+    """Id ostatniego zakończonego uruchomienia, które zapisuje produkty (None gdy brak historii)"""
+    placeholders = ','.join('?' * len(run_types))
+    try:
+        conn = sqlite3.connect(str(database_file))
+        row = conn.execute(f'''
+            SELECT MAX(id) FROM sync_runs
+            WHERE run_type IN ({placeholders}) AND status != 'running'
+        ''', tuple(run_types)).fetchone()
+        conn.close()
+        return row[0] if row else None
+    except sqlite3.Error:
+        return None
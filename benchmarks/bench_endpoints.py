@@ -0,0 +1,369 @@
+"""
+Benchmark endpointów /api/* na syntetycznych danych Subiekta - bez dostępu do sieci.
+
+Kroki:
+1. Generuje zamiennik bazy Subiekta (subiekt_standin.py) o zadanej liczbie pozycji sprzedaży
+2. Buduje lokalną bazę product_states.db etapami z product_data_manager_optimized.py
+   (z połączeniem SQL Server podmienionym na zamiennik)
+3. Wywołuje endpointy przez TestClient i raportuje p50/p95 opóźnienia oraz szczytową pamięć
+
+Użycie:
+    python benchmarks/bench_endpoints.py --lines 10000
+    python benchmarks/bench_endpoints.py --lines 1000000 --repeat 3 --json wyniki.json
+    python benchmarks/bench_endpoints.py --only dead-stock,warehouse-stocks
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+# Tło (scheduler, synchronizacje z siecią) wyłączone zanim main zostanie zaimportowany
+os.environ['ENABLE_BACKGROUND_JOBS'] = '0'
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(REPO_DIR / 'backend'))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import subiekt_standin  # noqa: E402
+
+# Endpointy pomijane - wymagają sieci (Google Sheets, AGIS, CSV) lub zmieniają konfigurację
+SKIPPED = {
+    "POST /api/update-database": "uruchamia pełny skrypt wsadowy (bench_pipeline)",
+    "POST /api/sales-plans/sync": "Google Sheets",
+    "GET /api/footfall": "AGIS",
+    "POST /api/footfall/sync": "AGIS",
+    "POST /api/sync-products": "zadanie w tle",
+    "GET /api/test-purchase-docs": "endpoint diagnostyczny",
+    "GET /api/test-doc-links": "endpoint diagnostyczny",
+    "POST /api/purchase-proposals/custom-period": "zapis konfiguracji",
+    "DELETE /api/purchase-proposals/custom-period/{symbol}": "zapis konfiguracji",
+    "POST /api/minimal-stocks": "zapis konfiguracji",
+    "PUT /api/minimal-stocks/{group_id}": "zapis konfiguracji",
+    "DELETE /api/minimal-stocks/{group_id}": "zapis konfiguracji",
+    "POST /api/ignored-products/{symbol}": "zapis konfiguracji",
+    "DELETE /api/ignored-products/{symbol}": "zapis konfiguracji",
+}
+
+
+def quiet():
+    """Wycisza printy modułów aplikacji podczas pomiarów"""
+    return contextlib.redirect_stdout(io.StringIO())
+
+
+def build_local_database(standin_path, workdir):
+    """Buduje product_states.db etapami skryptu wsadowego na danych z zamiennika"""
+    import product_data_manager_optimized as pdm
+    import migrate_stock_periods
+
+    local_db = Path(workdir) / 'product_states.db'
+    if local_db.exists():
+        local_db.unlink()
+
+    pdm.DATABASE_FILE = local_db
+    pdm.get_sql_connection = lambda: subiekt_standin.connect(standin_path)
+    migrate_stock_periods.DATABASE_FILE = local_db
+
+    stages = [
+        ("init_db", pdm.init_db),
+        ("upload_sql_data_to_sqlite", pdm.upload_sql_data_to_sqlite),
+        ("sync_product_stock", pdm.sync_product_stock),
+        ("snapshot_stock_history", pdm.snapshot_stock_history),
+        ("sync_sales_history", pdm.sync_sales_history),
+        ("sync_sales_weekly", pdm.sync_sales_weekly),
+        ("sync_stock_movements", pdm.sync_stock_movements),
+        ("sync_product_dates_from_pz", pdm.sync_product_dates_from_pz),
+        ("compute_dead_stock_analysis", pdm.compute_dead_stock_analysis),
+        ("compute_purchase_proposals", pdm.compute_purchase_proposals),
+        ("compute_reorder_suggestions", pdm.compute_reorder_suggestions),
+        ("compute_demand_forecasts", pdm.compute_demand_forecasts),
+        ("migrate_stock_periods", migrate_stock_periods.migrate_database),
+    ]
+    from sync_runs import SyncRun
+
+    timings = {}
+    run = None
+    for name, stage in stages:
+        start = time.perf_counter()
+        with quiet():
+            result = stage()
+        timings[name] = round(time.perf_counter() - start, 3)
+        print(f"  [BUILD] {name}: {timings[name]}s")
+        # Budowa zapisywana jak uruchomienie skryptu wsadowego (dane dla /api/sync-runs)
+        if run is None:
+            run = SyncRun(local_db, 'full', 'bench')
+        elif isinstance(result, dict):
+            run.stage(name, rows_read=result.get('rows_read', 0), rows_written=result.get('rows_written', 0),
+                      rows_changed=result.get('rows_changed', 0), error=result.get('error'))
+    run.finish()
+
+    # Plany sprzedażowe na bieżący i poprzedni miesiąc (normalnie z Google Sheets)
+    conn = sqlite3.connect(str(local_db))
+    day = date.today().replace(day=1) - timedelta(days=31)
+    while day <= date.today() + timedelta(days=31):
+        conn.execute(
+            "INSERT OR REPLACE INTO sales_plans (date, gls, four_f, jeans, total) VALUES (?, ?, ?, ?, ?)",
+            (day.strftime('%d.%m.%Y'), 12000.0, 8000.0, 3000.0, 23000.0)
+        )
+        day += timedelta(days=1)
+    conn.commit()
+    conn.close()
+    return local_db, timings
+
+
+def endpoint_cases(main, symbols):
+    """Lista przypadków: (nazwa, metoda, ścieżka, parametry, body, przygotowanie przed wywołaniem)"""
+    today = date.today()
+    last_30 = {"start_date": (today - timedelta(days=30)).isoformat(), "end_date": today.isoformat()}
+    last_90 = {"start_date": (today - timedelta(days=90)).isoformat(), "end_date": today.isoformat()}
+    some_symbol = symbols[0] if symbols else "TW0000001"
+
+    conn = sqlite3.connect(str(main.DATABASE_FILE))
+    run_id = conn.execute("SELECT MAX(id) FROM sync_runs").fetchone()[0] or 1
+    conn.close()
+
+    def clear_seasonality():
+        main.seasonality_cache["data"].clear()
+
+    def clear_dead_stock():
+        # Eksport bez cache - strumieniowo z tabeli dead_stock_analysis
+        main.global_data_cache["dead_stock"]["data"] = None
+
+    def store_metrics_from_database():
+        # Odczyt z Google Sheets działa tylko w tle - endpoint zwraca ostatni zapisany odczyt
+        main.store_metrics_cache["4F"] = None
+        main.save_store_metrics_to_db(
+            {"jednostka": "4F", "wynik": 18250.5, "wejscia": 640, "sztuki": 212, "paragony": 97, "upt": 2.19, "konwersja": 15.2},
+            datetime.now()
+        )
+
+    def store_metrics_from_cache():
+        main.store_metrics_cache["4F"] = {"jednostka": "4F", "wynik": 18250.5, "wejscia": 640, "sztuki": 212,
+                                          "paragony": 97, "upt": 2.19, "konwersja": 15.2}
+        main.store_metrics_cache["timestamp"] = time.time()
+
+    def ensure_minimal_stock_group():
+        # Grupa tworzona bezpośrednio w bazie (POST /api/minimal-stocks jest pomijany)
+        conn = sqlite3.connect(str(main.DATABASE_FILE))
+        conn.execute(
+            "INSERT OR IGNORE INTO minimal_stock_groups (id, name, min_stock, filter_rodzaj) VALUES (1, ?, ?, ?)",
+            ("Benchmark", 10, json.dumps(["KURTKA"]))
+        )
+        conn.commit()
+        conn.close()
+
+    cases = [
+        ("server-info", "GET", "/api/server-info", None, None, None),
+        ("database-status", "GET", "/api/database-status", None, None, None),
+        ("cache-status", "GET", "/api/cache-status", None, None, None),
+        ("ready", "GET", "/api/ready", None, None, None),
+        ("metrics", "GET", "/api/metrics", None, None, None),
+        ("sync-runs", "GET", "/api/sync-runs", None, None, None),
+        ("sync-run", "GET", f"/api/sync-runs/{run_id}", None, None, None),
+        ("sales-data", "GET", "/api/sales-data", {"force_refresh": "true"}, None, None),
+        ("sales-summary", "GET", "/api/sales-summary", None, None, None),
+        ("changes-recent", "GET", "/api/changes/recent", {"limit": 100}, None, None),
+        ("products-new", "GET", "/api/products/new", None, None, None),
+        ("products-updated", "GET", "/api/products/updated", {"minutes": 60}, None, None),
+        ("products-updated-last-run", "GET", "/api/products/updated", {"last_run": "true"}, None, None),
+        ("sales-history", "GET", "/api/sales-history", dict(last_90, period="daily"), None, None),
+        ("sales-items", "GET", "/api/sales-items", dict(last_30, limit=500), None, None),
+        ("sales-items-trend", "GET", "/api/sales-items-trend", dict(last_90, group_by="week"), None, None),
+        ("sales-items-filters", "GET", "/api/sales-items/filters", None, None, None),
+        ("stats", "GET", "/api/stats", None, None, None),
+        ("dashboard-stats", "GET", "/api/dashboard-stats", {"force_refresh": "true"}, None, None),
+        ("dead-stock", "GET", "/api/dead-stock", {"force_refresh": "true"}, None, None),
+        ("warehouse-rotation-value", "GET", "/api/warehouse-rotation-value", None, None, None),
+        ("sales-plans", "GET", "/api/sales-plans", None, None, None),
+        ("sales-plans-today", "GET", "/api/sales-plans/today", None, None, None),
+        ("store-metrics", "GET", "/api/store-metrics", None, None, store_metrics_from_database),
+        ("store-metrics-cached", "GET", "/api/store-metrics", None, None, store_metrics_from_cache),
+        ("purchase-proposals", "GET", "/api/purchase-proposals",
+         {"min_stock_days": 30, "force_refresh": "true"}, None, None),
+        ("purchase-proposals-cached", "GET", "/api/purchase-proposals", {"min_stock_days": 45}, None, None),
+        ("purchase-proposals-grupa", "GET", "/api/purchase-proposals", {"przeznaczenie": "", "grupa": "OBUWIE"}, None, None),
+        ("purchase-proposals-all", "GET", "/api/purchase-proposals", {"przeznaczenie": ""}, None, None),
+        ("purchase-proposal-categories", "GET", "/api/purchase-proposals/categories", None, None, None),
+        ("reorder-suggestions", "GET", "/api/reorder-suggestions", None, None, None),
+        ("reorder-suggestions-all-by-stockout", "GET", "/api/reorder-suggestions",
+         {"only_to_order": "false", "sort_by": "days_to_stockout", "page": 3}, None, None),
+        ("demand-forecast", "GET", "/api/demand-forecast", None, None, None),
+        ("demand-forecast-model", "GET", "/api/demand-forecast", {"level": "model", "key": "BLUZA ADIDAS 00045"}, None, None),
+        ("product-seasonality", "GET", "/api/product-seasonality", None, None, None),
+        ("sync-purchase-prices", "POST", "/api/sync-purchase-prices", None, None, None),
+        ("sync-purchase-prices-status", "GET", "/api/sync-purchase-prices/status", None, None, None),
+        ("products-with-prices", "GET", "/api/products-with-prices", {"limit": 100}, None, None),
+        ("warehouse-stocks", "GET", "/api/warehouse-stocks", {"mag_ids": "1,7,9"}, None, None),
+        ("export-dead-stock-csv", "GET", "/api/export/dead-stock", {"format": "csv"}, None, clear_dead_stock),
+        ("export-dead-stock-xlsx", "GET", "/api/export/dead-stock", {"format": "xlsx"}, None, clear_dead_stock),
+        ("export-purchase-proposals-xlsx", "GET", "/api/export/purchase-proposals",
+         {"format": "xlsx", "przeznaczenie": ""}, None, None),
+        ("export-seasonality-index-csv", "GET", "/api/export/seasonality-index", {"format": "csv", "mag_ids": "1,7,9"}, None, None),
+        ("stock-history", "GET", "/api/stock-history", {"days": 90}, None, None),
+        ("stock-history-symbol", "GET", "/api/stock-history", {"symbol": some_symbol, "days": 90}, None, None),
+        ("seasonality-index", "GET", "/api/seasonality-index", {"mag_ids": "1,7,9"}, None, clear_seasonality),
+        ("suggested-min-stocks", "POST", "/api/suggested-min-stocks", None,
+         {"symbols": symbols, "stock_weeks": 2, "delivery_weeks": 1}, None),
+        ("suggested-min-stocks-5000", "POST", "/api/suggested-min-stocks", None,
+         {"symbols": [f"TW{i:07d}" for i in range(1, 5001)], "stock_weeks": 2, "delivery_weeks": 1}, None),
+        ("minimal-stocks", "GET", "/api/minimal-stocks", None, None, None),
+        ("minimal-stocks-group", "GET", "/api/minimal-stocks/1", None, None, ensure_minimal_stock_group),
+        ("minimal-stocks-filter-options", "GET", "/api/minimal-stocks/filter-options", None, None, None),
+        ("minimal-stocks-filter-options-dynamic", "POST", "/api/minimal-stocks/filter-options-dynamic",
+         None, {"rodzaj": "KURTKA"}, None),
+        ("products-filter-options-dynamic", "POST", "/api/products/filter-options-dynamic",
+         None, {"tylko_ze_stanem": True}, None),
+        ("ignored-products", "GET", "/api/ignored-products", None, None, None),
+        ("products-sync-status", "GET", "/api/products-sync-status", None, None, None),
+        ("product-symbol-lookup", "GET", "/api/products-with-prices", {"search": some_symbol}, None, None),
+    ]
+
+    # Eksport kolumnowy wymaga opcjonalnego pakietu pyarrow
+    try:
+        import pyarrow  # noqa: F401
+        cases += [
+            ("export-columnar-products", "GET", "/api/export/columnar/products", {"format": "parquet"}, None, None),
+            ("export-columnar-sales-weekly", "GET", "/api/export/columnar/sales_weekly", {"format": "arrow"}, None, None),
+        ]
+    except ImportError:
+        SKIPPED["GET /api/export/columnar/{table}"] = "brak pakietu pyarrow"
+    return cases
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    k = (len(ordered) - 1) * pct / 100.0
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def call(client, method, path, params, body, prepare):
+    if prepare:
+        prepare()
+    start = time.perf_counter()
+    with quiet():
+        response = client.request(method, path, params=params, json=body)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return response, elapsed_ms
+
+
+def run_benchmarks(client, cases, repeat):
+    results = []
+    for name, method, path, params, body, prepare in cases:
+        response, cold_ms = call(client, method, path, params, body, prepare)
+
+        timings = []
+        for _ in range(repeat):
+            _, elapsed_ms = call(client, method, path, params, body, prepare)
+            timings.append(elapsed_ms)
+
+        tracemalloc.start()
+        call(client, method, path, params, body, prepare)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        result = {
+            "name": name,
+            "method": method,
+            "path": path,
+            "status": response.status_code,
+            "bytes": len(response.content),
+            "cold_ms": round(cold_ms, 1),
+            "p50_ms": round(percentile(timings, 50), 1),
+            "p95_ms": round(percentile(timings, 95), 1),
+            "mean_ms": round(statistics.mean(timings), 1),
+            "peak_mb": round(peak / 1024 / 1024, 2),
+        }
+        results.append(result)
+        print(f"  {name:40s} {result['status']:>4} {result['cold_ms']:>10.1f} {result['p50_ms']:>10.1f} "
+              f"{result['p95_ms']:>10.1f} {result['peak_mb']:>9.2f} {result['bytes']:>11}")
+    return results
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark endpointów /api/* na syntetycznych danych Subiekta")
+    parser.add_argument("--lines", type=int, default=10000, help="liczba pozycji sprzedaży (10k -> 1M)")
+    parser.add_argument("--products", type=int, default=None, help="liczba towarów (domyślnie lines/20)")
+    parser.add_argument("--repeat", type=int, default=5, help="liczba powtórzeń na endpoint (do p50/p95)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", type=str, default=None, help="lista nazw endpointów rozdzielona przecinkami")
+    parser.add_argument("--symbols", type=int, default=200, help="liczba symboli dla suggested-min-stocks")
+    parser.add_argument("--workdir", type=str, default=None, help="katalog na bazy (domyślnie tymczasowy)")
+    parser.add_argument("--json", type=str, default=None, help="zapisz wyniki do pliku JSON")
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="iz_bench_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    print(f"[BENCH] Katalog roboczy: {workdir}")
+
+    start = time.perf_counter()
+    standin_path = subiekt_standin.generate_dataset(
+        workdir / f"subiekt_{args.lines}.db", lines=args.lines, products=args.products, seed=args.seed
+    )
+    print(f"[BENCH] Zamiennik Subiekta: {standin_path} ({time.perf_counter() - start:.1f}s)")
+
+    print("[BENCH] Budowanie lokalnej bazy...")
+    local_db, build_timings = build_local_database(standin_path, workdir)
+
+    with quiet():
+        import main
+    main.DATABASE_FILE = local_db
+    main.get_sql_server_connection = lambda timeout=30: main.TimedConnection(
+        subiekt_standin.connect(standin_path), "sqlserver"
+    )
+
+    from fastapi.testclient import TestClient
+
+    conn = sqlite3.connect(str(local_db))
+    symbols = [r[0] for r in conn.execute(
+        "SELECT Symbol FROM products ORDER BY Stan DESC, Symbol LIMIT ?", (args.symbols,)
+    ).fetchall()]
+    conn.close()
+
+    cases = endpoint_cases(main, symbols)
+    if args.only:
+        wanted = {n.strip() for n in args.only.split(',') if n.strip()}
+        cases = [c for c in cases if c[0] in wanted]
+
+    print(f"\n[BENCH] {len(cases)} endpointów, {args.repeat} powtórzeń, {args.lines} pozycji sprzedaży")
+    print(f"  {'endpoint':40s} {'HTTP':>4} {'cold [ms]':>10} {'p50 [ms]':>10} {'p95 [ms]':>10} "
+          f"{'peak [MB]':>9} {'odp. [B]':>11}")
+    with TestClient(main.app) as client:
+        results = run_benchmarks(client, cases, args.repeat)
+
+    print("\n[BENCH] Pominięte:")
+    for route, reason in SKIPPED.items():
+        print(f"  {route} - {reason}")
+
+    failed = [r for r in results if r["status"] >= 400]
+    if failed:
+        print(f"\n[BENCH] Endpointy z błędem HTTP: {', '.join(r['name'] for r in failed)}")
+
+    if args.json:
+        report = {
+            "lines": args.lines,
+            "products": args.products or max(500, args.lines // 20),
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "build_seconds": build_timings,
+            "endpoints": results,
+            "skipped": SKIPPED,
+        }
+        Path(args.json).write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"[BENCH] Wyniki zapisane: {args.json}")
+
+
+if __name__ == "__main__":
+    main_cli()
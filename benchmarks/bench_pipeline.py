@@ -0,0 +1,389 @@
+"""
+Benchmark etapów skryptu wsadowego (execute_script) na syntetycznych katalogach 10k / 100k / 1M SKU.
+
+Dla każdego etapu mierzy czas, liczbę przetworzonych wierszy (wiersze/s) i szczytowe RSS.
+Każdy etap uruchamiany jest w osobnym procesie, więc szczytowe RSS dotyczy tylko tego etapu.
+Skrypt przechodzi cały łańcuch dwa razy: "initial" (pusta baza) i "hourly" (kolejny przebieg
+na tej samej bazie - tak jak co godzinę w schedulerze).
+
+Oba przebiegi powtarzane są --repeat razy (każde powtórzenie od pustej bazy), a raport zawiera
+medianę czasu i RSS z powtórzeń - pojedynczy pomiar etapu trwającego ułamek sekundy jest zbyt zaszumiony.
+
+Wyniki porównywane są z zapisanymi baselines (benchmarks/baselines/pipeline_<sku>.json);
+etap wolniejszy lub cięższy o więcej niż --threshold i jednocześnie o więcej niż tolerancja
+bezwzględna (--min-delta-s / --min-delta-mb) oznaczany jest jako REGRESJA i skrypt kończy się kodem 1.
+Etap zakończony wyjątkiem również kończy skrypt kodem 1, a wyniki z błędami nie są zapisywane jako baseline.
+
+Użycie:
+    python benchmarks/bench_pipeline.py --scales 10000
+    python benchmarks/bench_pipeline.py --scales 10000,100000 --save-baseline
+    python benchmarks/bench_pipeline.py --scales 1000000 --threshold 0.5 --repeat 1
+"""
+import argparse
+import contextlib
+import functools
+import http.server
+import json
+import os
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+BASELINES_DIR = BENCH_DIR / 'baselines'
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import subiekt_standin  # noqa: E402
+
+DEFAULT_SCALES = "10000,100000,1000000"
+
+STAGES = [
+    "upload_sql_data_to_sqlite",
+    "sync_product_stock",
+    "snapshot_stock_history",
+    "add_csv_data_to_sqlite",
+    "sync_sales_history",
+    "sync_sales_weekly",
+    "sync_stock_movements",
+    "sync_product_dates_from_pz",
+    "compute_dead_stock_analysis",
+    "compute_purchase_proposals",
+    "compute_reorder_suggestions",
+    "compute_demand_forecasts",
+    "compact_change_log",
+]
+
+# Liczba wierszy wejściowych etapu - zapytania odpowiadające źródłom danych poszczególnych etapów
+SOURCE_ROW_QUERIES = {
+    "upload_sql_data_to_sqlite":
+        "SELECT COUNT(*) FROM tw_Stan WHERE st_Stan > 0 AND st_MagId IN (1, 3, 7, 9)",
+    "sync_product_stock":
+        "SELECT COUNT(*) FROM tw_Stan WHERE st_Stan > 0 AND st_MagId IN (1, 2, 3, 7, 9)",
+    "sync_sales_history":
+        "SELECT COUNT(*) FROM vwZstSprzWgKhnt WHERE dok_MagId IN (1, 7, 9) AND dok_Podtyp <> 1 AND dok_Status <> 2",
+    "sync_sales_weekly":
+        "SELECT COUNT(*) FROM vwZstSprzWgKhnt WHERE dok_MagId IN (1, 7, 9) AND dok_Podtyp <> 1 AND dok_Status <> 2",
+    "sync_stock_movements":
+        "SELECT COUNT(*) FROM dok_Pozycja p INNER JOIN dok__Dokument d ON d.dok_Id = p.ob_DokMagId "
+        "WHERE (d.dok_NrPelny LIKE 'PZ%' OR d.dok_NrPelny LIKE 'PW%') AND d.dok_MagId IN (1, 2, 3, 7, 9)",
+}
+
+# Tabela lokalna zapisywana przez etap
+TARGET_TABLES = {
+    "upload_sql_data_to_sqlite": "products",
+    "sync_product_stock": "product_stock",
+    "snapshot_stock_history": "stock_snapshot_deltas",
+    "add_csv_data_to_sqlite": "products",
+    "sync_sales_history": "sales_history",
+    "sync_sales_weekly": "sales_weekly",
+    "sync_stock_movements": "deliveries",
+    "sync_product_dates_from_pz": "products",
+    "compute_dead_stock_analysis": "dead_stock_analysis",
+    "compute_purchase_proposals": "purchase_proposals",
+    "compute_reorder_suggestions": "reorder_suggestions",
+    "compute_demand_forecasts": "demand_forecasts",
+    "compact_change_log": "change_log_daily",
+}
+
+
+def peak_rss_mb():
+    """Szczytowe RSS bieżącego procesu w MB (/proc lub resource na Unix, psutil na Windows, inaczej None)"""
+    # Linux: VmHWM jest zerowane przy exec, ru_maxrss dziedziczy szczyt procesu rodzica
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    try:
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / 1024 / 1024, 1)
+    except ImportError:
+        return None
+
+
+def generate_stan_csv(path, rows, seed):
+    """Plik stan.csv w formacie dostawcy ALPINE PRO (ISO-8859-2, separator ';')"""
+    rng = np.random.default_rng(seed)
+    kolory = subiekt_standin.KOLORY
+    rozmiary = subiekt_standin.ROZMIARY
+    with open(path, 'w', encoding='iso-8859-2', newline='') as f:
+        f.write("KODEAN13;Model;Kolor;Stan;PCena;Cena_Detal;Rozmiar\n")
+        for i in range(rows):
+            cena = round(float(rng.gamma(2.0, 90.0)) + 19.99, 2)
+            promo = round(cena * 0.8, 2) if rng.random() < 0.2 else ''
+            f.write(f"{5900000000000 + i};KURTKA ALPINE PRO {i // 5:05d} (MJCA{i // 5:05d});"
+                    f"{kolory[i % len(kolory)]};{int(rng.poisson(3))};{promo};{cena};{rozmiary[i % len(rozmiary)]}\n")
+    return path
+
+
+@contextlib.contextmanager
+def serve_directory(directory):
+    """Lokalny serwer HTTP udający serwer dostawcy z plikiem stan.csv"""
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    handler = functools.partial(QuietHandler, directory=str(directory))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def count_rows(db_path, table):
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    except sqlite3.Error:
+        return 0
+    finally:
+        conn.close()
+
+
+def run_stage_in_process(stage, db_path, standin_path, csv_url):
+    """Uruchamia jeden etap w bieżącym procesie (tryb --stage) i wypisuje wynik jako JSON"""
+    import product_data_manager_optimized as pdm
+
+    pdm.DATABASE_FILE = Path(db_path)
+    pdm.get_sql_connection = lambda: subiekt_standin.connect(standin_path)
+
+    stage_func = getattr(pdm, stage)
+    args = (csv_url,) if stage == "add_csv_data_to_sqlite" else ()
+    rss_before = peak_rss_mb()
+    error = None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(open(os.devnull, 'w', encoding='utf-8')):
+            stage_func(*args)
+    except Exception as e:
+        error = str(e)
+    wall = time.perf_counter() - start
+    print(json.dumps({"wall_s": wall, "peak_rss_mb": peak_rss_mb(), "base_rss_mb": rss_before, "error": error}))
+
+
+def run_stage(stage, db_path, standin_path, csv_url, csv_rows):
+    """Uruchamia etap w osobnym procesie i zbiera metryki"""
+    if stage == "add_csv_data_to_sqlite":
+        rows_in = csv_rows
+    elif stage in SOURCE_ROW_QUERIES:
+        conn = subiekt_standin.connect(standin_path)
+        rows_in = conn.cursor().execute(SOURCE_ROW_QUERIES[stage]).fetchone()[0]
+        conn.close()
+    elif stage == "compact_change_log":
+        rows_in = count_rows(db_path, "change_log")
+    elif stage == "snapshot_stock_history":
+        rows_in = count_rows(db_path, "product_stock")
+    else:
+        rows_in = count_rows(db_path, "products")
+
+    target = TARGET_TABLES[stage]
+    before = count_rows(db_path, target)
+    proc = subprocess.run(
+        [sys.executable, __file__, "--stage", stage, "--db", str(db_path),
+         "--standin", str(standin_path), "--csv-url", csv_url],
+        capture_output=True, text=True, cwd=str(REPO_DIR)
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Etap {stage} zakończony błędem:\n{proc.stderr[-2000:]}")
+    metrics = json.loads(proc.stdout.strip().splitlines()[-1])
+    after = count_rows(db_path, target)
+
+    wall = metrics["wall_s"]
+    return {
+        "stage": stage,
+        "wall_s": round(wall, 3),
+        "rows_in": rows_in,
+        "rows_per_s": round(rows_in / wall, 1) if wall > 0 else None,
+        "table_rows": after,
+        "table_rows_added": after - before,
+        "peak_rss_mb": metrics["peak_rss_mb"],
+        "base_rss_mb": metrics["base_rss_mb"],
+        "error": metrics["error"],
+    }
+
+
+def run_pipeline(db_path, standin_path, csv_url, csv_rows):
+    import product_data_manager_optimized as pdm
+
+    pdm.DATABASE_FILE = Path(db_path)
+    with contextlib.redirect_stdout(open(os.devnull, 'w', encoding='utf-8')):
+        pdm.init_db()
+
+    results = []
+    for stage in STAGES:
+        result = run_stage(stage, db_path, standin_path, csv_url, csv_rows)
+        results.append(result)
+        rss = f"{result['peak_rss_mb']:.1f}" if result['peak_rss_mb'] is not None else "-"
+        print(f"    {stage:32s} {result['wall_s']:>9.3f} {result['rows_in']:>10} {result['rows_per_s'] or 0:>12.1f} "
+              f"{rss:>9}{'  BŁĄD: ' + result['error'] if result['error'] else ''}")
+    return results
+
+
+def median_results(repeats):
+    """Łączy powtórzenia przebiegu: mediana czasu i RSS każdego etapu (pomiary z powtórzeń w wall_s_runs)"""
+    merged = []
+    for stage_results in zip(*repeats):
+        result = dict(stage_results[0])
+        walls = [r["wall_s"] for r in stage_results]
+        rss = [r["peak_rss_mb"] for r in stage_results if r["peak_rss_mb"] is not None]
+        result["wall_s"] = round(statistics.median(walls), 3)
+        result["wall_s_runs"] = walls
+        result["rows_per_s"] = round(result["rows_in"] / result["wall_s"], 1) if result["wall_s"] > 0 else None
+        result["peak_rss_mb"] = round(statistics.median(rss), 1) if rss else None
+        result["error"] = next((r["error"] for r in stage_results if r["error"]), None)
+        merged.append(result)
+    return merged
+
+
+def baseline_path(sku):
+    return BASELINES_DIR / f"pipeline_{sku}.json"
+
+
+def compare_with_baseline(sku, report, threshold, min_delta):
+    """
+    Zwraca listę regresji względem zapisanego baseline. Regresja: wzrost mediany o więcej niż
+    threshold (względnie) i o więcej niż min_delta[metryka] (bezwzględnie).
+    """
+    path = baseline_path(sku)
+    if not path.exists():
+        print(f"  [BASELINE] Brak {path.name} - zapisz przez --save-baseline")
+        return []
+
+    baseline = json.loads(path.read_text(encoding='utf-8'))
+    regressions = []
+    for run_name, stages in report["runs"].items():
+        base_stages = {s["stage"]: s for s in baseline["runs"].get(run_name, [])}
+        for stage in stages:
+            base = base_stages.get(stage["stage"])
+            if not base:
+                continue
+            for metric in ("wall_s", "peak_rss_mb"):
+                current, previous = stage.get(metric), base.get(metric)
+                if current is None or not previous:
+                    continue
+                if current > previous * (1 + threshold) and current - previous > min_delta[metric]:
+                    regressions.append(
+                        f"{run_name}/{stage['stage']} {metric}: {previous} -> {current} "
+                        f"(+{(current / previous - 1) * 100:.0f}%)"
+                    )
+    return regressions
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark etapów skryptu wsadowego")
+    parser.add_argument("--scales", type=str, default=DEFAULT_SCALES, help="liczby SKU rozdzielone przecinkami")
+    parser.add_argument("--lines-per-sku", type=int, default=3, help="pozycji sprzedaży na SKU")
+    parser.add_argument("--csv-ratio", type=float, default=0.1, help="wiersze stan.csv jako ułamek SKU")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--threshold", type=float, default=0.25, help="dopuszczalny wzrost czasu/RSS (0.25 = 25%%)")
+    parser.add_argument("--min-delta-s", type=float, default=0.25,
+                        help="wzrost czasu etapu poniżej tej wartości [s] nie jest regresją")
+    parser.add_argument("--min-delta-mb", type=float, default=16.0,
+                        help="wzrost RSS etapu poniżej tej wartości [MB] nie jest regresją")
+    parser.add_argument("--repeat", type=int, default=3, help="powtórzenia przebiegów (raport: mediana)")
+    parser.add_argument("--save-baseline", action="store_true", help="zapisz wyniki jako nowe baselines")
+    parser.add_argument("--workdir", type=str, default=None, help="katalog na bazy (domyślnie tymczasowy)")
+    parser.add_argument("--json", type=str, default=None, help="zapisz pełny raport do pliku JSON")
+    # Tryb wewnętrzny - pojedynczy etap w osobnym procesie
+    parser.add_argument("--stage", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--db", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--standin", type=str, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--csv-url", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stage:
+        run_stage_in_process(args.stage, args.db, args.standin, args.csv_url)
+        return 0
+
+    workdir = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="iz_pipeline_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    print(f"[BENCH] Katalog roboczy: {workdir}")
+
+    all_reports = []
+    all_regressions = []
+    all_errors = []
+    for sku in [int(s) for s in args.scales.split(',') if s.strip()]:
+        print(f"\n[BENCH] Katalog {sku} SKU")
+        start = time.perf_counter()
+        standin_path = subiekt_standin.generate_dataset(
+            workdir / f"subiekt_{sku}sku.db", lines=sku * args.lines_per_sku, products=sku, seed=args.seed
+        )
+        csv_rows = max(1, int(sku * args.csv_ratio))
+        csv_dir = workdir / f"csv_{sku}"
+        csv_dir.mkdir(exist_ok=True)
+        generate_stan_csv(csv_dir / "stan.csv", csv_rows, args.seed)
+        print(f"  [BENCH] Dane wygenerowane w {time.perf_counter() - start:.1f}s")
+
+        db_path = workdir / f"product_states_{sku}.db"
+        report = {"sku": sku, "lines_per_sku": args.lines_per_sku, "csv_rows": csv_rows,
+                  "seed": args.seed, "python": sys.version.split()[0], "repeat": args.repeat, "runs": {}}
+        repeats = {"initial": [], "hourly": []}
+        with serve_directory(csv_dir) as base_url:
+            for repeat in range(args.repeat):
+                # Każde powtórzenie od pustej bazy - przebieg initial mierzy zawsze pierwszą synchronizację
+                if db_path.exists():
+                    db_path.unlink()
+                for run_name in ("initial", "hourly"):
+                    label = f"{run_name} {repeat + 1}/{args.repeat}"
+                    print(f"  [{label}] {'etap':32s} {'czas [s]':>9} {'wiersze':>10} {'wiersze/s':>12} {'RSS [MB]':>9}")
+                    repeats[run_name].append(run_pipeline(db_path, standin_path, f"{base_url}/stan.csv", csv_rows))
+        report["runs"] = {run_name: median_results(runs) for run_name, runs in repeats.items()}
+
+        min_delta = {"wall_s": args.min_delta_s, "peak_rss_mb": args.min_delta_mb}
+        regressions = compare_with_baseline(sku, report, args.threshold, min_delta)
+        for regression in regressions:
+            print(f"  [REGRESJA] {regression}")
+        all_regressions.extend(regressions)
+
+        # Etap zakończony wyjątkiem mierzy przerwany przebieg - taki wynik nie może zostać baseline
+        errors = [f"{run_name}/{stage['stage']}: {stage['error']}"
+                  for run_name, stages in report["runs"].items() for stage in stages if stage["error"]]
+        for error in errors:
+            print(f"  [BŁĄD] {error}")
+        all_errors.extend(errors)
+
+        if args.save_baseline and errors:
+            print(f"  [BASELINE] Pominięto {baseline_path(sku).name} - przebieg zawiera błędy etapów")
+        elif args.save_baseline:
+            BASELINES_DIR.mkdir(exist_ok=True)
+            baseline_path(sku).write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding='utf-8')
+            print(f"  [BASELINE] Zapisano {baseline_path(sku).name}")
+        all_reports.append(report)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(all_reports, indent=2, ensure_ascii=False), encoding='utf-8')
+        print(f"[BENCH] Wyniki zapisane: {args.json}")
+
+    if all_errors:
+        print(f"\n[BENCH] {len(all_errors)} etapów zakończonych błędem")
+        return 1
+    if all_regressions and not args.save_baseline:
+        print(f"\n[BENCH] Wykryto {len(all_regressions)} regresji (próg {args.threshold * 100:.0f}%)")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
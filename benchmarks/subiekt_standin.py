@@ -0,0 +1,521 @@
+"""
+Lokalny zamiennik bazy Subiekt GT (SQL Server) dla benchmarków.
+
+- generate_dataset() - syntetyczne dane (towary, stany, ceny, dokumenty sprzedaży,
+  dostawy PZ/PW z fakturami FZ) w pliku SQLite o tych samych nazwach tabel i kolumn
+  co Subiekt: tw__Towar, tw_Stan, tw_Cena, sl__Slownik, sl_StawkaVAT,
+  dok__Dokument, dok_Pozycja oraz widok vwZstSprzWgKhnt
+- connect() - połączenie zgodne z podzbiorem API pyodbc używanym w projekcie,
+  tłumaczące składnię T-SQL (CAST AS DATE, DATEADD, DATEPART, TOP, ISNULL...) na SQLite
+
+Typy dokumentów jak w Subiekcie: 1 FZ, 2 FS, 6 KFS, 10 PZ, 12 PW, 14 ZW, 21 PA.
+"""
+import re
+import sqlite3
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+
+MAGAZYNY_SPRZEDAZY = [1, 7, 9]
+MAGAZYNY_SPRZEDAZY_UDZIAL = [0.6, 0.25, 0.15]
+MAGAZYNY_STANOW = [1, 2, 3, 7, 9]
+MAGAZYNY_STANOW_UDZIAL = [0.45, 0.15, 0.05, 0.25, 0.10]
+
+MARKI = ['4F', 'ALPINE PRO', 'NIKE', 'ADIDAS', 'PUMA', 'WRANGLER', 'LEE', 'OLIMP', 'TREC', 'BRUBECK']
+RODZAJE = ['KURTKA', 'BLUZA', 'T-SHIRT', 'SPODNIE', 'BUTY', 'CZAPKA', 'JEANSY', 'ODŻYWKA', 'BATON']
+PRZEZNACZENIA = ['TURYSTYKA', 'BIEGANIE', 'LIFESTYLE', 'TRENING', 'SUPLEMENTY', 'NARCIARSTWO']
+GRUPY = ['ODZIEŻ', 'OBUWIE', 'AKCESORIA', 'SUPLEMENTY', 'JEANS']
+ROZMIARY = ['XS', 'S', 'M', 'L', 'XL', 'XXL', '38', '40', '42', '44', 'UNI']
+KOLORY = ['CZARNY', 'BIAŁY', 'GRANATOWY', 'CZERWONY', 'ZIELONY', 'SZARY', 'NIEBIESKI']
+SEZONY = ['WIOSNA-LATO 2024', 'JESIEŃ-ZIMA 2024', 'WIOSNA-LATO 2025', 'JESIEŃ-ZIMA 2025', 'CAŁOROCZNY']
+PLCI = ['DAMSKIE', 'MĘSKIE', 'DZIECIĘCE', 'UNISEX']
+STAWKI_VAT = [(1, 23.0), (2, 8.0), (3, 5.0)]
+
+# (dok_Typ, prefiks numeru, udział) dla dokumentów sprzedaży
+TYPY_SPRZEDAZY = [(21, 'PA', 0.70), (2, 'FS', 0.25), (14, 'ZW', 0.03), (6, 'KFS', 0.02)]
+
+SCHEMA = """
+CREATE TABLE tw__Towar (
+    tw_Id INTEGER PRIMARY KEY,
+    tw_Symbol TEXT NOT NULL,
+    tw_Nazwa TEXT,
+    tw_Opis TEXT,
+    tw_Uwagi TEXT,
+    tw_JM TEXT,
+    tw_Pole2 TEXT,
+    tw_pole1 TEXT,
+    tw_pole3 TEXT,
+    tw_pole4 TEXT,
+    tw_pole5 TEXT,
+    tw_pole6 TEXT,
+    tw_pole7 TEXT,
+    tw_pole8 TEXT,
+    tw_IdGrupa INTEGER,
+    tw_IdVatSp INTEGER,
+    tw_StawkaVat REAL
+);
+CREATE TABLE tw_Stan (
+    st_TowId INTEGER NOT NULL,
+    st_MagId INTEGER NOT NULL,
+    st_Stan REAL NOT NULL,
+    PRIMARY KEY (st_TowId, st_MagId)
+);
+CREATE TABLE tw_Cena (
+    tc_IdTowar INTEGER PRIMARY KEY,
+    tc_CenaNetto1 REAL,
+    tc_CenaBrutto1 REAL,
+    tc_CenaMag REAL
+);
+CREATE TABLE sl__Slownik (
+    sl_Id INTEGER PRIMARY KEY,
+    sl_Nazwa TEXT
+);
+CREATE TABLE sl_StawkaVAT (
+    vat_Id INTEGER PRIMARY KEY,
+    vat_Stawka REAL
+);
+CREATE TABLE dok__Dokument (
+    dok_Id INTEGER PRIMARY KEY,
+    dok_Typ INTEGER NOT NULL,
+    dok_Podtyp INTEGER NOT NULL DEFAULT 0,
+    dok_Status INTEGER NOT NULL DEFAULT 1,
+    dok_MagId INTEGER,
+    dok_NrPelny TEXT,
+    dok_DataWyst TEXT,
+    dok_DoDokId INTEGER,
+    dok_DoDokNrPelny TEXT
+);
+CREATE TABLE dok_Pozycja (
+    ob_Id INTEGER PRIMARY KEY,
+    ob_DokHanId INTEGER,
+    ob_DokMagId INTEGER,
+    ob_TowId INTEGER NOT NULL,
+    ob_IloscMag REAL,
+    ob_CenaNetto REAL,
+    ob_WartNetto REAL,
+    ob_WartBrutto REAL
+);
+CREATE VIEW vwZstSprzWgKhnt AS
+SELECT d.dok_Id, d.dok_Typ, d.dok_Podtyp, d.dok_Status, d.dok_MagId, d.dok_NrPelny, d.dok_DataWyst,
+       p.ob_TowId, p.ob_IloscMag, p.ob_CenaNetto, p.ob_WartNetto, p.ob_WartBrutto
+FROM dok__Dokument d
+INNER JOIN dok_Pozycja p ON p.ob_DokHanId = d.dok_Id
+WHERE d.dok_Typ IN (2, 6, 14, 21);
+CREATE TABLE standin_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+INDEXES = """
+CREATE UNIQUE INDEX idx_tw_symbol ON tw__Towar(tw_Symbol);
+CREATE INDEX idx_dok_data ON dok__Dokument(dok_DataWyst);
+CREATE INDEX idx_dok_nr ON dok__Dokument(dok_NrPelny);
+CREATE INDEX idx_ob_han ON dok_Pozycja(ob_DokHanId);
+CREATE INDEX idx_ob_mag ON dok_Pozycja(ob_DokMagId);
+CREATE INDEX idx_ob_tow ON dok_Pozycja(ob_TowId);
+"""
+
+
+# ==================== GENERATOR DANYCH ====================
+
+def _dataset_params(lines, products, days, seed):
+    return {"lines": str(lines), "products": str(products), "days": str(days), "seed": str(seed),
+            "generated_on": date.today().isoformat()}
+
+
+def _random_datetimes(rng, n, days, today):
+    """Losowe daty z ostatnich `days` dni z sezonowością roczną i godzinami otwarcia sklepu"""
+    offsets = np.arange(days)
+    day_dates = [today - timedelta(days=int(o)) for o in offsets]
+    doy = np.array([d.timetuple().tm_yday for d in day_dates])
+    weights = 1.0 + 0.5 * np.sin(2 * np.pi * (doy - 80) / 365.0)
+    weights /= weights.sum()
+    picked = rng.choice(offsets, size=n, p=weights)
+    seconds = rng.integers(8 * 3600, 20 * 3600, size=n)
+    base = datetime.combine(today, datetime.min.time())
+    return [base - timedelta(days=int(o)) + timedelta(seconds=int(s)) for o, s in zip(picked, seconds)]
+
+
+def generate_dataset(path, lines=10000, products=None, days=3 * 365, seed=42, force=False):
+    """
+    Generuje syntetyczną bazę Subiekta w pliku SQLite.
+
+    - lines: liczba pozycji dokumentów sprzedaży (10k -> 1M)
+    - products: liczba towarów (domyślnie lines / 20, min. 500)
+    - days: zakres historii w dniach
+    Istniejący plik z tymi samymi parametrami (z dzisiejszą datą) jest używany ponownie.
+    """
+    path = Path(path)
+    products = products or max(500, lines // 20)
+    params = _dataset_params(lines, products, days, seed)
+
+    if path.exists() and not force:
+        try:
+            conn = sqlite3.connect(str(path))
+            existing = dict(conn.execute("SELECT key, value FROM standin_meta").fetchall())
+            conn.close()
+            if existing == params:
+                return path
+        except sqlite3.Error:
+            pass
+        path.unlink()
+    elif path.exists():
+        path.unlink()
+
+    rng = np.random.default_rng(seed)
+    today = date.today()
+
+    conn = sqlite3.connect(str(path))
+    conn.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;")
+    conn.executescript(SCHEMA)
+
+    conn.executemany("INSERT INTO sl__Slownik VALUES (?, ?)", list(enumerate(GRUPY, start=1)))
+    conn.executemany("INSERT INTO sl_StawkaVAT VALUES (?, ?)", STAWKI_VAT)
+
+    # --- Towary: modele w kilku rozmiarach ---
+    tow_ids = np.arange(1, products + 1)
+    model_ids = (tow_ids - 1) // 5
+    marka = rng.integers(0, len(MARKI), size=products)
+    rodzaj = rng.integers(0, len(RODZAJE), size=products)
+    przezn = rng.integers(0, len(PRZEZNACZENIA), size=products)
+    grupa = rng.integers(1, len(GRUPY) + 1, size=products)
+    kolor = rng.integers(0, len(KOLORY), size=products)
+    sezon = rng.integers(0, len(SEZONY), size=products)
+    plec = rng.integers(0, len(PLCI), size=products)
+    vat = rng.choice([1, 1, 1, 2, 3], size=products)
+    brutto = np.round(rng.gamma(2.0, 80.0, size=products) + 9.99, 2)
+
+    # Cechy modelu wspólne dla wszystkich rozmiarów
+    for arr in (marka, rodzaj, przezn, grupa, kolor, sezon, plec):
+        arr[:] = arr[(model_ids * 5).clip(max=products - 1)]
+
+    towary = []
+    ceny = []
+    for i in range(products):
+        tid = int(tow_ids[i])
+        model = f"{RODZAJE[rodzaj[i]]} {MARKI[marka[i]]} {int(model_ids[i]):05d}"
+        vat_rate = dict(STAWKI_VAT)[int(vat[i])]
+        towary.append((
+            tid, f"TW{tid:07d}", f"{model} {KOLORY[kolor[i]]}", None, None, 'szt.',
+            MARKI[marka[i]], ROZMIARY[tid % len(ROZMIARY)], model, SEZONY[sezon[i]], PLCI[plec[i]],
+            KOLORY[kolor[i]], PRZEZNACZENIA[przezn[i]], RODZAJE[rodzaj[i]], int(grupa[i]), int(vat[i]), vat_rate
+        ))
+        netto = round(float(brutto[i]) / (1 + vat_rate / 100), 2)
+        ceny.append((tid, netto, float(brutto[i]), round(netto * 0.55, 2)))
+    conn.executemany(f"INSERT INTO tw__Towar VALUES ({','.join('?' * 17)})", towary)
+    conn.executemany("INSERT INTO tw_Cena VALUES (?, ?, ?, ?)", ceny)
+
+    # --- Stany: 1-2 magazyny na towar, ~30% zerowych ---
+    stany = []
+    for i in range(products):
+        mags = rng.choice(MAGAZYNY_STANOW, size=int(rng.integers(1, 3)), replace=False, p=MAGAZYNY_STANOW_UDZIAL)
+        for mag in mags:
+            qty = 0.0 if rng.random() < 0.3 else float(rng.poisson(4) + 1)
+            stany.append((int(tow_ids[i]), int(mag), qty))
+    conn.executemany("INSERT INTO tw_Stan VALUES (?, ?, ?)", stany)
+
+    # --- Dokumenty: najpierw zbierz wszystkie, potem nadaj dok_Id chronologicznie ---
+    popularity = 1.0 / np.power(rng.permutation(products) + 1, 0.8)
+    popularity /= popularity.sum()
+
+    n_sales_docs = max(1, lines // 3)
+    sales_doc_dates = _random_datetimes(rng, n_sales_docs, days, today)
+    sales_doc_types = rng.choice(len(TYPY_SPRZEDAZY), size=n_sales_docs, p=[t[2] for t in TYPY_SPRZEDAZY])
+    sales_doc_mags = rng.choice(MAGAZYNY_SPRZEDAZY, size=n_sales_docs, p=MAGAZYNY_SPRZEDAZY_UDZIAL)
+    sales_doc_podtyp = (rng.random(n_sales_docs) < 0.01).astype(int)
+    sales_doc_status = np.where(rng.random(n_sales_docs) < 0.01, 2, 1)
+
+    # Dostawy: ~3 dostawy na towar, pozycje grupowane po ~20 w dokumencie PZ lub PW
+    n_delivery_lines = products * 3
+    delivery_dates = sorted(_random_datetimes(rng, n_delivery_lines, days, today))
+    delivery_tow = rng.choice(tow_ids, size=n_delivery_lines, p=popularity)
+    delivery_qty = rng.integers(5, 50, size=n_delivery_lines)
+
+    docs = []  # (data, rodzaj, indeks)
+    docs.extend((d, 'S', i) for i, d in enumerate(sales_doc_dates))
+    n_delivery_docs = max(1, n_delivery_lines // 20)
+    for j in range(n_delivery_docs):
+        docs.append((delivery_dates[j * 20], 'D', j))
+    docs.sort(key=lambda x: x[0])
+
+    dok_rows = []
+    sales_doc_id = np.zeros(n_sales_docs, dtype=np.int64)
+    delivery_doc_ids = {}
+    next_id = 1
+    counters = {}
+    for doc_date, kind, idx in docs:
+        year = doc_date.year
+        if kind == 'S':
+            typ, prefix, _ = TYPY_SPRZEDAZY[sales_doc_types[idx]]
+            counters[prefix] = counters.get(prefix, 0) + 1
+            dok_rows.append((next_id, typ, int(sales_doc_podtyp[idx]), int(sales_doc_status[idx]),
+                             int(sales_doc_mags[idx]), f"{prefix} {counters[prefix]}/{year}",
+                             doc_date.strftime('%Y-%m-%d %H:%M:%S'), None, None))
+            sales_doc_id[idx] = next_id
+            next_id += 1
+        else:
+            mag = int(rng.choice(MAGAZYNY_STANOW, p=MAGAZYNY_STANOW_UDZIAL))
+            if rng.random() < 0.1:
+                counters['PW'] = counters.get('PW', 0) + 1
+                dok_rows.append((next_id, 12, 0, 1, mag, f"PW {counters['PW']}/{year}",
+                                 doc_date.strftime('%Y-%m-%d %H:%M:%S'), None, None))
+                delivery_doc_ids[idx] = (next_id, None)
+                next_id += 1
+            else:
+                counters['PZ'] = counters.get('PZ', 0) + 1
+                counters['FZ'] = counters.get('FZ', 0) + 1
+                pz_id, fz_id = next_id, next_id + 1
+                pz_nr, fz_nr = f"PZ {counters['PZ']}/{year}", f"FZ {counters['FZ']}/{year}"
+                dok_rows.append((pz_id, 10, 0, 1, mag, pz_nr, doc_date.strftime('%Y-%m-%d %H:%M:%S'), fz_id, fz_nr))
+                fz_date = doc_date + timedelta(days=int(rng.integers(0, 3)))
+                dok_rows.append((fz_id, 1, 0, 1, mag, fz_nr, fz_date.strftime('%Y-%m-%d %H:%M:%S'), pz_id, pz_nr))
+                delivery_doc_ids[idx] = (pz_id, fz_id)
+                next_id += 2
+    conn.executemany(f"INSERT INTO dok__Dokument VALUES ({','.join('?' * 9)})", dok_rows)
+
+    # --- Pozycje sprzedaży ---
+    price_by_tow = {c[0]: (c[1], c[2], c[3]) for c in ceny}
+    line_doc = np.sort(rng.integers(0, n_sales_docs, size=lines))
+    line_tow = rng.choice(tow_ids, size=lines, p=popularity)
+    line_qty = rng.choice([1, 1, 1, 1, 2, 2, 3], size=lines)
+    ob_id = 1
+    batch = []
+    for k in range(lines):
+        doc_id = int(sales_doc_id[line_doc[k]])
+        tid = int(line_tow[k])
+        netto, brutto_tow, _ = price_by_tow[tid]
+        qty = float(line_qty[k])
+        batch.append((ob_id, doc_id, doc_id, tid, qty, netto, round(netto * qty, 2), round(brutto_tow * qty, 2)))
+        ob_id += 1
+        if len(batch) >= 50000:
+            conn.executemany("INSERT INTO dok_Pozycja VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+
+    # --- Pozycje dostaw: PZ (ilość) + FZ (cena zakupu) lub PW (ilość i cena) ---
+    for k in range(n_delivery_lines):
+        j = min(k // 20, n_delivery_docs - 1)
+        mag_doc_id, fz_id = delivery_doc_ids[j]
+        tid = int(delivery_tow[k])
+        cena_zakupu = round(price_by_tow[tid][2] * float(rng.uniform(0.9, 1.1)), 2)
+        qty = float(delivery_qty[k])
+        batch.append((ob_id, fz_id, mag_doc_id, tid, qty, cena_zakupu, round(cena_zakupu * qty, 2),
+                      round(cena_zakupu * qty * 1.23, 2)))
+        ob_id += 1
+        if fz_id is not None:
+            batch.append((ob_id, fz_id, None, tid, qty, cena_zakupu, round(cena_zakupu * qty, 2),
+                          round(cena_zakupu * qty * 1.23, 2)))
+            ob_id += 1
+        if len(batch) >= 50000:
+            conn.executemany("INSERT INTO dok_Pozycja VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO dok_Pozycja VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+
+    conn.executescript(INDEXES)
+    conn.executemany("INSERT INTO standin_meta VALUES (?, ?)", list(params.items()))
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return path
+
+
+# ==================== TŁUMACZENIE T-SQL -> SQLite ====================
+
+_CAST_DATE = re.compile(r"CAST\(((?:[^()]|\([^()]*\))*?)\s+AS\s+DATE\)", re.IGNORECASE)
+_UNIT_FUNCS = re.compile(r"\b(DATEADD|DATEPART)\(\s*(\w+)\s*,", re.IGNORECASE)
+_TOP = re.compile(r"^(\s*SELECT)\s+TOP\s+(\d+)\s", re.IGNORECASE)
+_ISNULL = re.compile(r"\bISNULL\(", re.IGNORECASE)
+
+_translation_cache = {}
+
+
+def translate(sql):
+    """Tłumaczy konstrukcje T-SQL używane w projekcie na dialekt SQLite"""
+    cached = _translation_cache.get(sql)
+    if cached is not None:
+        return cached
+
+    out = _UNIT_FUNCS.sub(lambda m: f"{m.group(1).upper()}('{m.group(2).lower()}',", sql)
+    out = _ISNULL.sub("IFNULL(", out)
+    previous = None
+    while previous != out:
+        previous = out
+        out = _CAST_DATE.sub(r"date(\1)", out)
+    top = _TOP.match(out)
+    if top:
+        out = f"{top.group(1)} {out[top.end():]}\nLIMIT {top.group(2)}"
+
+    _translation_cache[sql] = out
+    return out
+
+
+def _to_datetime(value):
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    return datetime.fromisoformat(str(value))
+
+
+def _format_like(value, result):
+    """Zwraca datę w tym samym formacie co wejście (z czasem lub bez)"""
+    if isinstance(value, str) and len(value) <= 10:
+        return result.strftime('%Y-%m-%d')
+    return result.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _dateadd(unit, number, value):
+    dt = _to_datetime(value)
+    if dt is None or number is None:
+        return None
+    number = int(number)
+    if unit in ('day', 'dd', 'd'):
+        result = dt + timedelta(days=number)
+    elif unit in ('week', 'wk', 'ww'):
+        result = dt + timedelta(weeks=number)
+    elif unit in ('month', 'mm', 'm'):
+        month_index = dt.month - 1 + number
+        year = dt.year + month_index // 12
+        month = month_index % 12 + 1
+        day = min(dt.day, [31, 29 if year % 4 == 0 and (year % 100 != 0 or year % 400 == 0) else 28,
+                           31, 30, 31, 30, 31, 31, 30, 31, 30, 31][month - 1])
+        result = dt.replace(year=year, month=month, day=day)
+    elif unit in ('year', 'yy', 'yyyy'):
+        result = _dateadd('month', number * 12, dt)
+        return result
+    else:
+        raise ValueError(f"DATEADD: nieobsługiwana jednostka {unit}")
+    return _format_like(value, result)
+
+
+def _datepart(part, value):
+    dt = _to_datetime(value)
+    if dt is None:
+        return None
+    if part in ('iso_week', 'isowk', 'isoww'):
+        return dt.isocalendar()[1]
+    if part in ('week', 'wk', 'ww'):
+        # SQL Server (DATEFIRST 7): tydzień 1 zawiera 1 stycznia, tygodnie od niedzieli
+        jan1 = date(dt.year, 1, 1)
+        jan1_dow = (jan1.weekday() + 1) % 7
+        return (dt.timetuple().tm_yday - 1 + jan1_dow) // 7 + 1
+    if part in ('year', 'yy', 'yyyy'):
+        return dt.year
+    if part in ('month', 'mm', 'm'):
+        return dt.month
+    if part in ('day', 'dd', 'd'):
+        return dt.day
+    if part in ('weekday', 'dw'):
+        return (dt.weekday() + 1) % 7 + 1
+    raise ValueError(f"DATEPART: nieobsługiwana część {part}")
+
+
+def _format(value, fmt):
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return str(int(value)).zfill(len(fmt))
+    dt = _to_datetime(value)
+    return dt.strftime(fmt.replace('yyyy', '%Y').replace('MM', '%m').replace('dd', '%d'))
+
+
+def _concat(*args):
+    return ''.join('' if a is None else str(a) for a in args)
+
+
+def _getdate():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+_ISO_DATE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+_ISO_DATETIME = re.compile(r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}")
+
+
+def _convert_value(value):
+    """Daty zwracane jako tekst zamienia na date/datetime (jak pyodbc)"""
+    if isinstance(value, str) and value[:1].isdigit() and len(value) >= 10:
+        if len(value) == 10 and _ISO_DATE.match(value):
+            return date.fromisoformat(value)
+        if _ISO_DATETIME.match(value):
+            return datetime.fromisoformat(value)
+    return value
+
+
+def _convert_row(row):
+    return tuple(_convert_value(v) for v in row)
+
+
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.strftime('%Y-%m-%d %H:%M:%S'))
+
+
+class StandInCursor:
+    """Kursor zgodny z używanym podzbiorem pyodbc.Cursor"""
+
+    def __init__(self, connection):
+        self._cursor = connection.cursor()
+        self.arraysize = 1000
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        self._cursor.execute(translate(sql), tuple(params))
+        return self
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        return _convert_row(row) if row is not None else None
+
+    def fetchmany(self, size=None):
+        return [_convert_row(r) for r in self._cursor.fetchmany(size or self.arraysize)]
+
+    def fetchall(self):
+        return [_convert_row(r) for r in self._cursor.fetchall()]
+
+    def __iter__(self):
+        for row in self._cursor:
+            yield _convert_row(row)
+
+    def close(self):
+        self._cursor.close()
+
+
+class StandInConnection:
+    """Połączenie zgodne z używanym podzbiorem pyodbc.Connection (tylko odczyt)"""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(f"file:{Path(path).as_posix()}?mode=ro", uri=True, check_same_thread=False)
+        self._conn.create_function("DATEADD", 3, _dateadd, deterministic=True)
+        self._conn.create_function("DATEPART", 2, _datepart, deterministic=True)
+        self._conn.create_function("YEAR", 1, lambda v: _datepart('year', v), deterministic=True)
+        self._conn.create_function("MONTH", 1, lambda v: _datepart('month', v), deterministic=True)
+        self._conn.create_function("DAY", 1, lambda v: _datepart('day', v), deterministic=True)
+        self._conn.create_function("FORMAT", 2, _format, deterministic=True)
+        self._conn.create_function("CONCAT", -1, _concat, deterministic=True)
+        self._conn.create_function("GETDATE", 0, _getdate)
+
+    def cursor(self):
+        return StandInCursor(self._conn)
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self._conn.close()
+
+
+def connect(path):
+    """Zwraca połączenie do zamiennika Subiekta (odpowiednik pyodbc.connect)"""
+    return StandInConnection(path)
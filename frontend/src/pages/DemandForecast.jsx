@@ -1,65 +1,93 @@
-import { useState } from 'react'
-import { Brain, Calendar, TrendingUp, AlertCircle, CheckCircle, HelpCircle, X } from 'lucide-react'
-import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, Area, AreaChart } from 'recharts'
+import { useState, useEffect } from 'react'
+import { Brain, Calendar, TrendingUp, AlertCircle, CheckCircle, HelpCircle, X, RefreshCw } from 'lucide-react'
+import { Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer, Area, ComposedChart } from 'recharts'
+import { API_BASE_URL } from '../config/api'
 
-const forecastData = [
-  { period: 'Tydz 1', rzeczywiste: 4500, prognoza: null, dolnyPrzedzial: null, gornyPrzedzial: null },
-  { period: 'Tydz 2', rzeczywiste: 4800, prognoza: null, dolnyPrzedzial: null, gornyPrzedzial: null },
-  { period: 'Tydz 3', rzeczywiste: 5200, prognoza: null, dolnyPrzedzial: null, gornyPrzedzial: null },
-  { period: 'Tydz 4', rzeczywiste: 4900, prognoza: null, dolnyPrzedzial: null, gornyPrzedzial: null },
-  { period: 'Tydz 5', rzeczywiste: null, prognoza: 5400, dolnyPrzedzial: 4800, gornyPrzedzial: 6000 },
-  { period: 'Tydz 6', rzeczywiste: null, prognoza: 5800, dolnyPrzedzial: 5100, gornyPrzedzial: 6500 },
-  { period: 'Tydz 7', rzeczywiste: null, prognoza: 6200, dolnyPrzedzial: 5400, gornyPrzedzial: 7000 },
-  { period: 'Tydz 8', rzeczywiste: null, prognoza: 5900, dolnyPrzedzial: 5200, gornyPrzedzial: 6600 },
-]
-
-const productForecasts = [
-  {
-    name: 'Laptop Dell XPS 15',
-    category: 'Elektronika',
-    currentStock: 12,
-    forecastedDemand: 28,
-    confidence: 92,
-    status: 'warning',
-    recommendation: 'Zamów 20 sztuk w ciągu 3 dni'
-  },
-  {
-    name: 'Kurtka zimowa M',
-    category: 'Odzież',
-    currentStock: 45,
-    forecastedDemand: 15,
-    confidence: 88,
-    status: 'ok',
-    recommendation: 'Poziom zapasów optymalny'
-  },
-  {
-    name: 'Kawa ziarnista 1kg',
-    category: 'Spożywcze',
-    currentStock: 8,
-    forecastedDemand: 35,
-    confidence: 95,
-    status: 'critical',
-    recommendation: 'PILNE: Zamów 30 sztuk natychmiast'
-  },
-  {
-    name: 'Zestaw narzędzi',
-    category: 'Dom i ogród',
-    currentStock: 22,
-    forecastedDemand: 18,
-    confidence: 85,
-    status: 'ok',
-    recommendation: 'Poziom zapasów optymalny'
-  },
-]
+const METHOD_LABELS = {
+  SEASONAL: 'Wygładzanie wykładnicze z sezonowością',
+  SES: 'Wygładzanie wykładnicze',
+  CROSTON: 'Croston (popyt sporadyczny)',
+  TSB: 'TSB (popyt zanikający)',
+  NONE: 'Średnia (za mało danych)'
+}
 
-const seasonalEvents = [
-  { event: 'Czarny Piątek', date: '24.11.2024', impact: '+45%', category: 'Elektronika' },
-  { event: 'Święta Bożego Narodzenia', date: '20-26.12.2024', impact: '+65%', category: 'Wszystkie' },
-  { event: 'Wyprzedaż zimowa', date: '01-15.01.2025', impact: '+30%', category: 'Odzież' },
-]
+const formatWeek = (week) => {
+  const [, month, day] = week.split('-')
+  return `${day}.${month}`
+}
 
 function DemandForecast() {
+  const API_URL = API_BASE_URL
   const [showHelp, setShowHelp] = useState(false);
+  const [loading, setLoading] = useState(false)
+  const [error, setError] = useState(null)
+  const [level, setLevel] = useState('symbol')
+  const [przeznaczenie, setPrzeznaczenie] = useState('')
+  const [przeznaczenia, setPrzeznaczenia] = useState([])
+  const [selected, setSelected] = useState(null)
+  const [data, setData] = useState({ chart: [], products: [], methods: {}, accuracy: null, computed_at: null })
+
+  useEffect(() => {
+    fetchCategories()
+  }, [])
+
+  useEffect(() => {
+    fetchForecast()
+  }, [level, przeznaczenie, selected])
+
+  const fetchCategories = async () => {
+    try {
+      const response = await fetch(`${API_URL}/api/purchase-proposals/categories`)
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+      const result = await response.json()
+      setPrzeznaczenia(result.przeznaczenia || [])
+    } catch (error) {
+      console.error("Błąd podczas pobierania przeznaczeń:", error)
+    }
+  }
+
+  const fetchForecast = async () => {
+    try {
+      setLoading(true)
+      setError(null)
+      const params = new URLSearchParams({ level, limit: 50 })
+      if (przeznaczenie) params.append('przeznaczenie', przeznaczenie)
+      if (selected) params.append('key', selected)
+      const response = await fetch(`${API_URL}/api/demand-forecast?${params}`)
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+      setData(await response.json())
+    } catch (error) {
+      setError(error)
+      console.error("Błąd podczas pobierania prognoz popytu:", error)
+    } finally {
+      setLoading(false)
+    }
+  }
+
+  const changeLevel = (value) => {
+    setSelected(null)
+    setLevel(value)
+  }
+
+  const chartData = data.chart.map(point => ({
+    period: formatWeek(point.week),
+    rzeczywiste: point.actual,
+    prognoza: point.forecast ?? null,
+    przedzial: point.forecast !== undefined ? [point.lower, point.upper] : null
+  }))
+
+  const recommendation = (product) => {
+    if (product.suggested_order <= 0) return 'Poziom zapasów wystarczający'
+    if (product.status === 'critical') return `PILNE: Zamów ${product.suggested_order} szt.`
+    return `Zamów ${product.suggested_order} szt.`
+  }
+
+  const accuracy = data.accuracy !== null && data.accuracy !== undefined ? (data.accuracy * 100).toFixed(1) : null
+  const chartTitle = selected ? selected : 'Cały sklep'
 
   return (
     <div className="space-y-6">
@@ -67,24 +95,63 @@ function DemandForecast() {
       <div className="flex items-center justify-between">
         <div>
           <h1 className="text-3xl font-bold text-gray-900">Prognozowanie Popytu</h1>
-          <p className="text-gray-500 mt-1">Przewidywanie przyszłego zapotrzebowania z wykorzystaniem AI</p>
+          <p className="text-gray-500 mt-1">Przewidywanie przyszłego zapotrzebowania na podstawie historii sprzedaży</p>
+        </div>
+        <div className="flex items-center space-x-3">
+          <div className="flex items-center space-x-2 px-4 py-2 bg-green-100 rounded-lg">
+            <Brain className="w-5 h-5 text-green-600" />
+            <span className="text-sm font-medium text-green-900">
+              {data.computed_at ? `Przeliczono: ${data.computed_at}` : 'Brak prognoz'}
+            </span>
+          </div>
+          <button onClick={fetchForecast} className="btn-primary flex items-center space-x-2" disabled={loading}>
+            <RefreshCw className={`w-4 h-4 ${loading ? 'animate-spin' : ''}`} />
+            <span>Odśwież</span>
+          </button>
+        </div>
+      </div>
+
+      {error && (
+        <div className="card bg-red-50 border-2 border-red-200 text-red-800">
+          Nie udało się pobrać prognoz: {error.message}
+        </div>
+      )}
+
+      {/* Filtry */}
+      <div className="card flex flex-wrap items-center gap-4">
+        <div>
+          <label className="block text-sm font-medium text-gray-700 mb-1">Poziom</label>
+          <select value={level} onChange={(e) => changeLevel(e.target.value)} className="w-full p-2 border border-gray-300 rounded-lg">
+            <option value="symbol">Symbol</option>
+            <option value="model">Model (ModelSP)</option>
+          </select>
         </div>
-        <div className="flex items-center space-x-2 px-4 py-2 bg-green-100 rounded-lg">
-          <Brain className="w-5 h-5 text-green-600" />
-          <span className="text-sm font-medium text-green-900">Model AI: Aktywny</span>
+        <div>
+          <label className="block text-sm font-medium text-gray-700 mb-1">Przeznaczenie</label>
+          <select value={przeznaczenie} onChange={(e) => setPrzeznaczenie(e.target.value)} className="w-full p-2 border border-gray-300 rounded-lg">
+            <option value="">Wszystkie</option>
+            {przeznaczenia.map(c => (
+              <option key={c.name} value={c.name}>{c.name}</option>
+            ))}
+          </select>
         </div>
+        {selected && (
+          <button onClick={() => setSelected(null)} className="text-sm text-primary-600 hover:underline mt-5">
+            Pokaż cały sklep na wykresie
+          </button>
+        )}
       </div>
 
       {/* Wykres prognozy */}
       <div className="card">
         <div className="flex items-center justify-between mb-4">
-          <h2 className="text-lg font-semibold text-gray-900">Prognoza sprzedaży - następne 4 tygodnie</h2>
+          <h2 className="text-lg font-semibold text-gray-900">Prognoza sprzedaży - {chartTitle}</h2>
           <div className="text-sm text-gray-500">
-            Dokładność modelu: <span className="font-medium text-green-600">91.5%</span>
+            Dokładność prognoz (13 tygodni): <span className="font-medium text-green-600">{accuracy !== null ? `${accuracy}%` : '-'}</span>
           </div>
         </div>
         <ResponsiveContainer width="100%" height={400}>
-          <AreaChart data={forecastData}>
+          <ComposedChart data={chartData}>
             <CartesianGrid strokeDasharray="3 3" />
             <XAxis dataKey="period" />
             <YAxis />
@@ -92,28 +159,18 @@ function DemandForecast() {
             <Legend />
             <Area
               type="monotone"
-              dataKey="dolnyPrzedzial"
-              stackId="1"
-              stroke="none"
-              fill="#bae6fd"
-              fillOpacity={0.3}
-              name="Dolny przedział"
-            />
-            <Area
-              type="monotone"
-              dataKey="gornyPrzedzial"
-              stackId="1"
+              dataKey="przedzial"
               stroke="none"
               fill="#bae6fd"
-              fillOpacity={0.3}
-              name="Górny przedział"
+              fillOpacity={0.5}
+              name="Przedział 90%"
             />
             <Line
               type="monotone"
               dataKey="rzeczywiste"
               stroke="#10b981"
               strokeWidth={3}
-              dot={{ r: 5 }}
+              dot={{ r: 4 }}
               name="Rzeczywista sprzedaż"
             />
             <Line
@@ -122,16 +179,16 @@ function DemandForecast() {
               stroke="#0ea5e9"
               strokeWidth={3}
               strokeDasharray="5 5"
-              dot={{ r: 5 }}
+              dot={{ r: 4 }}
               name="Prognozowana sprzedaż"
             />
-          </AreaChart>
+          </ComposedChart>
         </ResponsiveContainer>
       </div>
 
       {/* Prognozy produktów */}
       <div className="card">
-        <h2 className="text-lg font-semibold text-gray-900 mb-4">Prognozy dla kluczowych produktów</h2>
+        <h2 className="text-lg font-semibold text-gray-900 mb-4">Produkty z największą prognozą (4 tygodnie)</h2>
         <div className="overflow-x-auto">
           <table className="w-full">
             <thead>
@@ -139,14 +196,18 @@ function DemandForecast() {
                 <th className="text-left py-3 px-4 text-sm font-semibold text-gray-900">Produkt</th>
                 <th className="text-left py-3 px-4 text-sm font-semibold text-gray-900">Kategoria</th>
                 <th className="text-center py-3 px-4 text-sm font-semibold text-gray-900">Stan magazynowy</th>
-                <th className="text-center py-3 px-4 text-sm font-semibold text-gray-900">Prognoza (30 dni)</th>
-                <th className="text-center py-3 px-4 text-sm font-semibold text-gray-900">Pewność</th>
+                <th className="text-center py-3 px-4 text-sm font-semibold text-gray-900">Prognoza (4 tygodnie)</th>
+                <th className="text-center py-3 px-4 text-sm font-semibold text-gray-900">Dokładność</th>
                 <th className="text-left py-3 px-4 text-sm font-semibold text-gray-900">Rekomendacja</th>
               </tr>
             </thead>
             <tbody>
-              {productForecasts.map((product, index) => (
-                <tr key={index} className="border-b border-gray-100 hover:bg-gray-50">
+              {data.products.map((product) => (
+                <tr
+                  key={product.key}
+                  onClick={() => setSelected(product.key)}
+                  className={`border-b border-gray-100 hover:bg-gray-50 cursor-pointer ${selected === product.key ? 'bg-primary-50' : ''}`}
+                >
                   <td className="py-4 px-4">
                     <div className="flex items-center space-x-2">
                       {product.status === 'critical' && (
@@ -158,66 +219,75 @@ function DemandForecast() {
                       {product.status === 'ok' && (
                         <CheckCircle className="w-5 h-5 text-green-500" />
                       )}
-                      <span className="font-medium text-gray-900">{product.name}</span>
+                      <div>
+                        <span className="font-medium text-gray-900">{product.name}</span>
+                        <p className="text-xs text-gray-500">{product.key} • {METHOD_LABELS[product.method] || product.method}</p>
+                      </div>
                     </div>
                   </td>
-                  <td className="py-4 px-4 text-sm text-gray-600">{product.category}</td>
+                  <td className="py-4 px-4 text-sm text-gray-600">
+                    {[product.przeznaczenie, product.rodzaj].filter(Boolean).join(' / ')}
+                  </td>
                   <td className="py-4 px-4 text-center">
                     <span className={`inline-flex items-center px-3 py-1 rounded-full text-sm font-medium ${
                       product.status === 'critical' ? 'bg-red-100 text-red-800' :
                       product.status === 'warning' ? 'bg-orange-100 text-orange-800' :
                       'bg-green-100 text-green-800'
                     }`}>
-                      {product.currentStock} szt.
+                      {product.stock} szt.
                     </span>
                   </td>
                   <td className="py-4 px-4 text-center font-medium text-gray-900">
-                    {product.forecastedDemand} szt.
+                    {product.forecast_4w.toFixed(1)} szt.
+                    <p className="text-xs text-gray-500 font-normal">
+                      {product.lower_4w.toFixed(1)} - {product.upper_4w.toFixed(1)}
+                    </p>
                   </td>
                   <td className="py-4 px-4 text-center">
-                    <div className="flex items-center justify-center">
-                      <div className="w-full max-w-[80px]">
-                        <div className="bg-gray-200 rounded-full h-2">
-                          <div
-                            className="bg-primary-600 h-2 rounded-full"
-                            style={{ width: `${product.confidence}%` }}
-                          ></div>
+                    {product.accuracy !== null ? (
+                      <div className="flex items-center justify-center">
+                        <div className="w-full max-w-[80px]">
+                          <div className="bg-gray-200 rounded-full h-2">
+                            <div
+                              className="bg-primary-600 h-2 rounded-full"
+                              style={{ width: `${product.accuracy * 100}%` }}
+                            ></div>
+                          </div>
                         </div>
+                        <span className="ml-2 text-sm font-medium text-gray-900">{(product.accuracy * 100).toFixed(0)}%</span>
                       </div>
-                      <span className="ml-2 text-sm font-medium text-gray-900">{product.confidence}%</span>
-                    </div>
+                    ) : (
+                      <span className="text-sm text-gray-400">-</span>
+                    )}
                   </td>
-                  <td className="py-4 px-4 text-sm text-gray-600">{product.recommendation}</td>
+                  <td className="py-4 px-4 text-sm text-gray-600">{recommendation(product)}</td>
                 </tr>
               ))}
+              {!loading && data.products.length === 0 && (
+                <tr>
+                  <td colSpan={6} className="py-8 text-center text-gray-500">Brak prognoz dla wybranych filtrów</td>
+                </tr>
+              )}
             </tbody>
           </table>
         </div>
       </div>
 
-      {/* Wydarzenia sezonowe */}
+      {/* Metody prognozowania */}
       <div className="card bg-gradient-to-br from-orange-50 to-amber-50 border-2 border-orange-200">
         <div className="flex items-start space-x-4">
           <div className="w-12 h-12 bg-gradient-to-br from-orange-500 to-amber-600 rounded-lg flex items-center justify-center flex-shrink-0">
             <Calendar className="w-6 h-6 text-white" />
           </div>
           <div className="flex-1">
-            <h3 className="text-lg font-semibold text-gray-900 mb-3">Nadchodzące wydarzenia sezonowe</h3>
+            <h3 className="text-lg font-semibold text-gray-900 mb-3">Metody prognozowania</h3>
             <div className="space-y-3">
-              {seasonalEvents.map((event, index) => (
-                <div key={index} className="bg-white/70 rounded-lg p-4 flex items-center justify-between">
-                  <div>
-                    <p className="font-medium text-gray-900">{event.event}</p>
-                    <p className="text-sm text-gray-600 mt-1">
-                      {event.date} • Kategoria: {event.category}
-                    </p>
-                  </div>
-                  <div className="text-right">
-                    <div className="flex items-center space-x-1 text-green-600">
-                      <TrendingUp className="w-4 h-4" />
-                      <span className="font-bold text-lg">{event.impact}</span>
-                    </div>
-                    <p className="text-xs text-gray-500 mt-1">Prognozowany wzrost</p>
+              {Object.entries(data.methods).map(([method, count]) => (
+                <div key={method} className="bg-white/70 rounded-lg p-4 flex items-center justify-between">
+                  <p className="font-medium text-gray-900">{METHOD_LABELS[method] || method}</p>
+                  <div className="flex items-center space-x-1 text-green-600">
+                    <TrendingUp className="w-4 h-4" />
+                    <span className="font-bold text-lg">{count}</span>
                   </div>
                 </div>
               ))}
@@ -232,29 +302,29 @@ function DemandForecast() {
           <h3 className="font-semibold text-gray-900 mb-3">Dane historyczne</h3>
           <p className="text-sm text-gray-600 mb-2">Analiza obejmuje:</p>
           <ul className="text-sm text-gray-600 space-y-1">
-            <li>• 24 miesiące danych sprzedaży</li>
-            <li>• 150+ sezonowych wzorców</li>
-            <li>• 50+ akcji promocyjnych</li>
+            <li>• do 3 lat tygodniowej sprzedaży</li>
+            <li>• magazyny 1, 7, 9 (bez anulowanych dokumentów)</li>
+            <li>• korekty i zwroty</li>
           </ul>
         </div>
 
         <div className="card bg-purple-50 border-2 border-purple-200">
-          <h3 className="font-semibold text-gray-900 mb-3">Czynniki zewnętrzne</h3>
-          <p className="text-sm text-gray-600 mb-2">Uwzględnione:</p>
+          <h3 className="font-semibold text-gray-900 mb-3">Sezonowość</h3>
+          <p className="text-sm text-gray-600 mb-2">Uwzględniona:</p>
           <ul className="text-sm text-gray-600 space-y-1">
-            <li>• Święta i wydarzenia</li>
-            <li>• Trendy rynkowe</li>
-            <li>• Pogoda i sezonowość</li>
+            <li>• profil tygodni ISO z min. 2 lat historii</li>
+            <li>• przedział 90% rosnący z horyzontem</li>
+            <li>• przeliczenie raz dziennie po synchronizacji</li>
           </ul>
         </div>
 
         <div className="card bg-green-50 border-2 border-green-200">
-          <h3 className="font-semibold text-gray-900 mb-3">Algorytmy AI</h3>
+          <h3 className="font-semibold text-gray-900 mb-3">Modele</h3>
           <p className="text-sm text-gray-600 mb-2">Wykorzystywane:</p>
           <ul className="text-sm text-gray-600 space-y-1">
-            <li>• ARIMA (szeregi czasowe)</li>
-            <li>• Prophet (sezonowość)</li>
-            <li>• XGBoost (wzorce)</li>
+            <li>• wygładzanie wykładnicze (popyt regularny)</li>
+            <li>• Croston (popyt sporadyczny)</li>
+            <li>• TSB (popyt zanikający)</li>
           </ul>
         </div>
       </div>
@@ -287,8 +357,8 @@ function DemandForecast() {
               <div>
                 <h3 className="text-lg font-semibold text-gray-900 mb-2">Do czego sluzy ten widok?</h3>
                 <p className="text-gray-600">
-                  Widok Prognozowanie Popytu wykorzystuje sztuczna inteligencje do przewidywania przyszlego zapotrzebowania
-                  na produkty. Pomaga planowac zakupy i unikac brakow towarowych.
+                  Widok Prognozowanie Popytu przewiduje tygodniowe zapotrzebowanie na produkty i modele na podstawie
+                  historii sprzedazy. Pomaga planowac zakupy i unikac brakow towarowych.
                 </p>
               </div>
               <div>
@@ -297,22 +367,22 @@ function DemandForecast() {
                   <div className="flex items-start space-x-3 p-3 bg-green-50 rounded-lg">
                     <Brain className="w-5 h-5 text-green-600 mt-0.5 flex-shrink-0" />
                     <div>
-                      <p className="font-medium text-gray-900">Model AI</p>
-                      <p className="text-sm text-gray-600">Zaawansowane algorytmy (ARIMA, Prophet, XGBoost) analizujace wzorce sprzedazy.</p>
+                      <p className="font-medium text-gray-900">Modele prognoz</p>
+                      <p className="text-sm text-gray-600">Wygladzanie wykladnicze (z sezonowoscia) dla produktow sprzedawanych regularnie, Croston/TSB dla sprzedawanych sporadycznie.</p>
                     </div>
                   </div>
                   <div className="flex items-start space-x-3 p-3 bg-blue-50 rounded-lg">
                     <TrendingUp className="w-5 h-5 text-blue-600 mt-0.5 flex-shrink-0" />
                     <div>
                       <p className="font-medium text-gray-900">Wykresy prognoz</p>
-                      <p className="text-sm text-gray-600">Wizualizacja przewidywanej sprzedazy z przedzialem ufnosci.</p>
+                      <p className="text-sm text-gray-600">Wizualizacja przewidywanej sprzedazy z przedzialem 90%. Kliknij produkt w tabeli, aby zobaczyc jego wykres.</p>
                     </div>
                   </div>
                   <div className="flex items-start space-x-3 p-3 bg-orange-50 rounded-lg">
                     <Calendar className="w-5 h-5 text-orange-600 mt-0.5 flex-shrink-0" />
                     <div>
-                      <p className="font-medium text-gray-900">Wydarzenia sezonowe</p>
-                      <p className="text-sm text-gray-600">Uwzglednianie swiat, promocji i wydarzen wplywajacych na popyt.</p>
+                      <p className="font-medium text-gray-900">Sezonowosc</p>
+                      <p className="text-sm text-gray-600">Produkty z co najmniej 2 latami historii maja prognoze korygowana o profil sezonowy tygodni roku.</p>
                     </div>
                   </div>
                   <div className="flex items-start space-x-3 p-3 bg-red-50 rounded-lg">
@@ -328,7 +398,7 @@ function DemandForecast() {
                 <h4 className="font-medium text-gray-900 mb-2">Wskazowka</h4>
                 <p className="text-sm text-gray-600">
                   Zwracaj uwage na produkty oznaczone jako "KRYTYCZNE" (czerwone) - wymagaja natychmiastowego dzialania.
-                  Wskaznik pewnosci informuje o wiarygodnosci prognozy.
+                  Dokladnosc to 1 - WAPE prognoz z ostatnich 13 tygodni.
                 </p>
               </div>
             </div>
@@ -28,6 +28,9 @@ function PurchaseProposals() {
     items: []
   }))
   const [minStockDays, setMinStockDays] = useState(30)
+  const [przeznaczenie, setPrzeznaczenie] = useState('SUPLEMENTY')
+  const [grupa, setGrupa] = useState('')
+  const [categories, setCategories] = useState({ przeznaczenia: [], grupy: [] })
   const [searchTerm, setSearchTerm] = useState('')
   const [editingSymbol, setEditingSymbol] = useState(null)
   const [deliveryTime, setDeliveryTime] = useState(7)
@@ -38,14 +41,36 @@ function PurchaseProposals() {
   const [sortDirection, setSortDirection] = useState('desc')
   const [showHelp, setShowHelp] = useState(false)
 
+  useEffect(() => {
+    fetchCategories()
+  }, [])
+
   useEffect(() => {
     fetchProposals()
-  }, [minStockDays])
+  }, [minStockDays, przeznaczenie, grupa])
+
+  const fetchCategories = async () => {
+    try {
+      const response = await fetch(`${API_URL}/api/purchase-proposals/categories`)
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+      const result = await response.json()
+      setCategories({ przeznaczenia: result.przeznaczenia || [], grupy: result.grupy || [] })
+    } catch (error) {
+      console.error("Błąd podczas pobierania kategorii propozycji:", error)
+    }
+  }
 
   const fetchProposals = async () => {
     try {
       setLoading(true)
-      const response = await fetch(`${API_URL}/api/purchase-proposals?min_stock_days=${minStockDays}`)
+      const params = new URLSearchParams({
+        min_stock_days: minStockDays,
+        przeznaczenie: przeznaczenie,
+        grupa: grupa
+      })
+      const response = await fetch(`${API_URL}/api/purchase-proposals?${params}`)
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`)
       }
@@ -60,6 +85,8 @@ function PurchaseProposals() {
     }
   }
 
+  const categoryLabel = [przeznaczenie, grupa].filter(Boolean).join(' / ') || 'Wszystkie produkty'
+
   const formatNumber = (num, decimals = 2) => {
     if (isNaN(num)) return '0,00'
     const fixed = Number(num).toFixed(decimals)
@@ -238,7 +265,7 @@ function PurchaseProposals() {
       {/* Nagłówek */}
       <div className="flex items-center justify-between">
         <div>
-          <h1 className="text-3xl font-bold text-gray-900">Propozycje Zakupowe - Suplementy</h1>
+          <h1 className="text-3xl font-bold text-gray-900">Propozycje Zakupowe - {categoryLabel}</h1>
           <p className="text-gray-500 mt-1">Automatyczne wyliczanie stanów minimalnych na podstawie średniego zużycia</p>
         </div>
         <div className="flex items-center space-x-3">
@@ -263,7 +290,7 @@ function PurchaseProposals() {
               </p>
               <div className="flex items-center mt-2 text-blue-600">
                 <Package className="w-4 h-4 mr-1" />
-                <span className="text-sm font-medium">Suplementy</span>
+                <span className="text-sm font-medium">{categoryLabel}</span>
               </div>
             </div>
           </div>
@@ -318,7 +345,49 @@ function PurchaseProposals() {
       {/* Filtry */}
       <div className="card">
         <div className="space-y-4">
-          <div className="grid grid-cols-1 md:grid-cols-2 gap-4">
+          <div className="grid grid-cols-1 md:grid-cols-4 gap-4">
+            <div>
+              <label className="block text-sm font-medium text-gray-700 mb-2">
+                Przeznaczenie
+              </label>
+              <select
+                value={przeznaczenie}
+                onChange={(e) => setPrzeznaczenie(e.target.value)}
+                className="w-full p-2 border border-gray-300 rounded-lg"
+              >
+                <option value="">Wszystkie</option>
+                {!categories.przeznaczenia.some(c => c.name === przeznaczenie) && przeznaczenie && (
+                  <option value={przeznaczenie}>{przeznaczenie}</option>
+                )}
+                {categories.przeznaczenia.map(c => (
+                  <option key={c.name} value={c.name}>
+                    {c.name} ({c.below_minimum}/{c.products})
+                  </option>
+                ))}
+              </select>
+              <p className="text-xs text-gray-500 mt-1">
+                W nawiasie: poniżej minimum / wszystkie (30 dni zapasu)
+              </p>
+            </div>
+
+            <div>
+              <label className="block text-sm font-medium text-gray-700 mb-2">
+                Grupa
+              </label>
+              <select
+                value={grupa}
+                onChange={(e) => setGrupa(e.target.value)}
+                className="w-full p-2 border border-gray-300 rounded-lg"
+              >
+                <option value="">Wszystkie</option>
+                {categories.grupy.map(c => (
+                  <option key={c.name} value={c.name}>
+                    {c.name} ({c.below_minimum}/{c.products})
+                  </option>
+                ))}
+              </select>
+            </div>
+
             <div>
               <label className="block text-sm font-medium text-gray-700 mb-2">
                 Okres zapasu (dni)
@@ -1,49 +1,7 @@
-import { useState } from 'react'
-import { ShoppingCart, Tag, TrendingDown, Clock, Package, DollarSign, HelpCircle, X } from 'lucide-react'
+import { useState, useEffect } from 'react'
+import { ShoppingCart, Tag, TrendingDown, Clock, Package, DollarSign, HelpCircle, X, ChevronLeft, ChevronRight, ArrowUpDown } from 'lucide-react'
 import { BarChart, Bar, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts'
-
-const purchaseSuggestions = [
-  {
-    product: 'Laptop Dell XPS 15',
-    category: 'Elektronika',
-    currentStock: 12,
-    recommendedOrder: 25,
-    avgSalesPerWeek: 6,
-    daysToStockout: 14,
-    priority: 'high',
-    reason: 'Prognozowany wzrost popytu o 40% w następnym miesiącu'
-  },
-  {
-    product: 'Kawa ziarnista 1kg',
-    category: 'Spożywcze',
-    currentStock: 8,
-    recommendedOrder: 40,
-    avgSalesPerWeek: 9,
-    daysToStockout: 6,
-    priority: 'critical',
-    reason: 'Niski stan magazynowy, ryzyko wyczerpania zapasów'
-  },
-  {
-    product: 'Mysz bezprzewodowa',
-    category: 'Elektronika',
-    currentStock: 35,
-    recommendedOrder: 20,
-    avgSalesPerWeek: 4,
-    daysToStockout: 60,
-    priority: 'low',
-    reason: 'Standardowe uzupełnienie zapasów'
-  },
-  {
-    product: 'Słuchawki Bluetooth',
-    category: 'Elektronika',
-    currentStock: 18,
-    recommendedOrder: 30,
-    avgSalesPerWeek: 7,
-    daysToStockout: 18,
-    priority: 'medium',
-    reason: 'Zbliżający się sezon świąteczny - zwiększony popyt'
-  },
-]
+import { API_BASE_URL } from '../config/api'
 
 const discountSuggestions = [
   {
@@ -88,8 +46,68 @@ const rotationData = [
   { category: 'Dom i ogród', rotacja: 3.8, optymalny: 5 },
 ]
 
+const PRIORITY_LABELS = { critical: 'Krytyczny', high: 'Wysoki', medium: 'Średni', low: 'Niski' }
+
+const reorderReason = (item) => {
+  if (item.Priorytet === 'critical') {
+    return `Zapas skończy się przed dostawą (${item.CzasDostawy} dni)`
+  }
+  if (item.Priorytet === 'high') {
+    return `Stan poniżej punktu zamówienia (${item.PunktZamowienia} szt.)`
+  }
+  return 'Standardowe uzupełnienie zapasów'
+}
+
 function PurchaseSuggestions() {
+  const API_URL = API_BASE_URL
   const [showHelp, setShowHelp] = useState(false);
+  const [loading, setLoading] = useState(false)
+  const [reorder, setReorder] = useState({ items: [], total: 0, pages: 0, summary: {}, computed_at: null })
+  const [page, setPage] = useState(1)
+  const [sortBy, setSortBy] = useState('priority')
+  const [sortDir, setSortDir] = useState('asc')
+
+  useEffect(() => {
+    fetchReorderSuggestions()
+  }, [page, sortBy, sortDir])
+
+  const fetchReorderSuggestions = async () => {
+    try {
+      setLoading(true)
+      const params = new URLSearchParams({ page, page_size: 25, sort_by: sortBy, sort_dir: sortDir })
+      const response = await fetch(`${API_URL}/api/reorder-suggestions?${params}`)
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`)
+      }
+      setReorder(await response.json())
+    } catch (error) {
+      console.error("Błąd podczas pobierania sugestii zakupów:", error)
+    } finally {
+      setLoading(false)
+    }
+  }
+
+  const changeSort = (field) => {
+    if (sortBy === field) {
+      setSortDir(sortDir === 'asc' ? 'desc' : 'asc')
+    } else {
+      setSortBy(field)
+      setSortDir(field === 'order_value' || field === 'quantity' ? 'desc' : 'asc')
+    }
+    setPage(1)
+  }
+
+  const SortHeader = ({ field, children, align = 'text-center' }) => (
+    <th
+      onClick={() => changeSort(field)}
+      className={`${align} py-3 px-4 text-sm font-semibold text-gray-900 cursor-pointer hover:text-primary-600`}
+    >
+      <span className="inline-flex items-center space-x-1">
+        <span>{children}</span>
+        <ArrowUpDown className={`w-3 h-3 ${sortBy === field ? 'text-primary-600' : 'text-gray-400'}`} />
+      </span>
+    </th>
+  )
 
   return (
     <div className="space-y-6">
@@ -107,7 +125,10 @@ function PurchaseSuggestions() {
           <div className="flex items-center justify-between">
             <div>
               <p className="text-sm text-gray-600 font-medium">Produkty do zamówienia</p>
-              <p className="text-3xl font-bold text-gray-900 mt-2">24</p>
+              <p className="text-3xl font-bold text-gray-900 mt-2">{reorder.summary.to_order || 0}</p>
+              <p className="text-xs text-gray-500 mt-1">
+                {(reorder.summary.total_value || 0).toLocaleString('pl-PL', { maximumFractionDigits: 0 })} zł netto
+              </p>
             </div>
             <ShoppingCart className="w-10 h-10 text-blue-600" />
           </div>
@@ -151,60 +172,98 @@ function PurchaseSuggestions() {
             <ShoppingCart className="w-5 h-5 mr-2 text-primary-600" />
             Rekomendowane zamówienia
           </h2>
-          <button className="btn-primary text-sm">Generuj zamówienie</button>
+          <span className="text-sm text-gray-500">
+            {reorder.computed_at ? `Przeliczono: ${reorder.computed_at}` : ''}
+          </span>
         </div>
         <div className="overflow-x-auto">
           <table className="w-full">
             <thead>
               <tr className="border-b border-gray-200">
-                <th className="text-left py-3 px-4 text-sm font-semibold text-gray-900">Priorytet</th>
-                <th className="text-left py-3 px-4 text-sm font-semibold text-gray-900">Produkt</th>
-                <th className="text-center py-3 px-4 text-sm font-semibold text-gray-900">Stan obecny</th>
-                <th className="text-center py-3 px-4 text-sm font-semibold text-gray-900">Do zamówienia</th>
-                <th className="text-center py-3 px-4 text-sm font-semibold text-gray-900">Dni do wyczerpania</th>
+                <SortHeader field="priority" align="text-left">Priorytet</SortHeader>
+                <SortHeader field="name" align="text-left">Produkt</SortHeader>
+                <SortHeader field="stock">Stan obecny</SortHeader>
+                <SortHeader field="quantity">Do zamówienia</SortHeader>
+                <SortHeader field="days_to_stockout">Dni do wyczerpania</SortHeader>
+                <SortHeader field="order_value">Wartość</SortHeader>
                 <th className="text-left py-3 px-4 text-sm font-semibold text-gray-900">Powód</th>
               </tr>
             </thead>
             <tbody>
-              {purchaseSuggestions.map((item, index) => (
-                <tr key={index} className="border-b border-gray-100 hover:bg-gray-50">
+              {reorder.items.map((item) => (
+                <tr key={item.Symbol} className="border-b border-gray-100 hover:bg-gray-50">
                   <td className="py-4 px-4">
                     <span className={`inline-flex items-center px-3 py-1 rounded-full text-xs font-medium ${
-                      item.priority === 'critical' ? 'bg-red-100 text-red-800' :
-                      item.priority === 'high' ? 'bg-orange-100 text-orange-800' :
-                      item.priority === 'medium' ? 'bg-yellow-100 text-yellow-800' :
+                      item.Priorytet === 'critical' ? 'bg-red-100 text-red-800' :
+                      item.Priorytet === 'high' ? 'bg-orange-100 text-orange-800' :
+                      item.Priorytet === 'medium' ? 'bg-yellow-100 text-yellow-800' :
                       'bg-gray-100 text-gray-800'
                     }`}>
-                      {item.priority === 'critical' ? 'Krytyczny' :
-                       item.priority === 'high' ? 'Wysoki' :
-                       item.priority === 'medium' ? 'Średni' : 'Niski'}
+                      {PRIORITY_LABELS[item.Priorytet]}
                     </span>
                   </td>
                   <td className="py-4 px-4">
-                    <p className="font-medium text-gray-900">{item.product}</p>
-                    <p className="text-sm text-gray-500">{item.category}</p>
+                    <p className="font-medium text-gray-900">{item.Nazwa}</p>
+                    <p className="text-sm text-gray-500">
+                      {item.Symbol} • {[item.Przeznaczenie, item.Rodzaj].filter(Boolean).join(' / ')}
+                    </p>
                   </td>
-                  <td className="py-4 px-4 text-center font-medium text-gray-900">{item.currentStock} szt.</td>
+                  <td className="py-4 px-4 text-center font-medium text-gray-900">{item.Stan} szt.</td>
                   <td className="py-4 px-4 text-center">
-                    <span className="font-bold text-primary-600 text-lg">{item.recommendedOrder} szt.</span>
+                    <span className="font-bold text-primary-600 text-lg">{item.IloscDoZamowienia} szt.</span>
+                    <p className="text-xs text-gray-500">
+                      {item.SredniaDzienna} szt./dzień • zapas bezp. {item.ZapasBezpieczenstwa}
+                    </p>
                   </td>
                   <td className="py-4 px-4 text-center">
                     <div className="flex items-center justify-center space-x-1">
                       <Clock className="w-4 h-4 text-gray-400" />
                       <span className={`font-medium ${
-                        item.daysToStockout < 10 ? 'text-red-600' :
-                        item.daysToStockout < 20 ? 'text-orange-600' : 'text-green-600'
+                        item.DniDoWyczerpania === null ? 'text-gray-400' :
+                        item.DniDoWyczerpania < 10 ? 'text-red-600' :
+                        item.DniDoWyczerpania < 20 ? 'text-orange-600' : 'text-green-600'
                       }`}>
-                        {item.daysToStockout} dni
+                        {item.DniDoWyczerpania === null ? '-' : `${Math.floor(item.DniDoWyczerpania)} dni`}
                       </span>
                     </div>
                   </td>
-                  <td className="py-4 px-4 text-sm text-gray-600">{item.reason}</td>
+                  <td className="py-4 px-4 text-center text-gray-900">
+                    {item.WartoscZamowienia.toLocaleString('pl-PL', { minimumFractionDigits: 2, maximumFractionDigits: 2 })} zł
+                  </td>
+                  <td className="py-4 px-4 text-sm text-gray-600">{reorderReason(item)}</td>
                 </tr>
               ))}
+              {!loading && reorder.items.length === 0 && (
+                <tr>
+                  <td colSpan={7} className="py-8 text-center text-gray-500">Brak produktów do zamówienia</td>
+                </tr>
+              )}
             </tbody>
           </table>
         </div>
+        {reorder.pages > 1 && (
+          <div className="flex items-center justify-between mt-4">
+            <span className="text-sm text-gray-500">
+              Strona {page} z {reorder.pages} ({reorder.total} produktów)
+            </span>
+            <div className="flex space-x-2">
+              <button
+                onClick={() => setPage(page - 1)}
+                disabled={page <= 1}
+                className="p-2 rounded-lg border border-gray-300 disabled:opacity-40"
+              >
+                <ChevronLeft className="w-4 h-4" />
+              </button>
+              <button
+                onClick={() => setPage(page + 1)}
+                disabled={page >= reorder.pages}
+                className="p-2 rounded-lg border border-gray-300 disabled:opacity-40"
+              >
+                <ChevronRight className="w-4 h-4" />
+              </button>
+            </div>
+          </div>
+        )}
       </div>
 
       {/* Sugestie przecen */}
@@ -339,7 +398,7 @@ function PurchaseSuggestions() {
                     <ShoppingCart className="w-5 h-5 text-blue-600 mt-0.5 flex-shrink-0" />
                     <div>
                       <p className="font-medium text-gray-900">Rekomendowane zamowienia</p>
-                      <p className="text-sm text-gray-600">Lista produktow wymagajacych uzupelnienia z priorytetami i przewidywanymi terminami wyczerpania.</p>
+                      <p className="text-sm text-gray-600">Produkty ponizej punktu zamowienia (sprzedaz z 13 tygodni, czas dostawy, zapas bezpieczenstwa) z priorytetami i przewidywanymi terminami wyczerpania.</p>
                     </div>
                   </div>
                   <div className="flex items-start space-x-3 p-3 bg-orange-50 rounded-lg">
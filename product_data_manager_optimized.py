@@ -1,19 +1,34 @@
-import pyodbc
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 from decimal import Decimal
+import hashlib
 import time
 import requests
 import pandas as pd
+import numpy as np
 import io
+import itertools
 import sys
 import os
 import sqlite3
 from dotenv import load_dotenv
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+from sync_runs import SyncRun, init_sync_runs_tables, init_run_stamp_columns
+import purchase_proposals
+import sales_weekly
+import demand_forecast
+import reorder_points
+import stock_movements
+import product_sync
+import product_stock
+import stock_history
+from sql_stream import iter_chunks
+
 
 def get_sql_connection():
     """Tworzy połączenie z SQL Server używając pyodbc."""
+    import pyodbc  # import leniwy - moduł da się zaimportować bez sterownika ODBC
     conn_str = (
         f'DRIVER={{ODBC Driver 18 for SQL Server}};'
         f'SERVER={os.getenv("SQL_SERVER", "10.101.101.5").split(chr(92))[0]};'
@@ -30,6 +45,12 @@ load_dotenv()
 SCRIPT_DIR = Path(__file__).parent
 DATABASE_FILE = SCRIPT_DIR / 'product_states.db'
 
+# Ile dni surowych zdarzeń change_log trzymać - starsze zwijane są do change_log_daily
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', '90'))
+
+# Id bieżącego uruchomienia z sync_runs - upsert_product oznacza nim zmienione wiersze
+current_run_id = None
+
 # --- Funkcja pomocnicza do wyciągania ModelSP ---
 def extract_model_sp(value):
     words = str(value).upper().split()
@@ -73,7 +94,9 @@ def init_db():
             PreviousStan REAL DEFAULT 0,
             PreviousPrice REAL DEFAULT 0,
             IsNew INTEGER DEFAULT 0,
-            DateAdded TEXT
+            DateAdded TEXT,
+            LastRunId INTEGER,
+            LastUpdatedTs INTEGER
         )
     ''')
 
@@ -86,10 +109,31 @@ def init_db():
             OldValue REAL,
             NewValue REAL,
             ChangeDate TEXT,
+            RunId INTEGER,
+            ChangeTs INTEGER,
             FOREIGN KEY (Symbol) REFERENCES products(Symbol)
         )
     ''')
 
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_date ON change_log(ChangeDate)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_symbol_date ON change_log(Symbol, ChangeDate)')
+
+    # Dzienne podsumowania zdarzeń change_log starszych niż CHANGE_LOG_RETENTION_DAYS
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log_daily (
+            Symbol TEXT NOT NULL,
+            ChangeDay TEXT NOT NULL,
+            ChangeType TEXT NOT NULL,
+            Changes INTEGER NOT NULL,
+            FirstOldValue REAL,
+            LastNewValue REAL,
+            MinValue REAL,
+            MaxValue REAL,
+            PRIMARY KEY (Symbol, ChangeDay, ChangeType)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_daily_day ON change_log_daily(ChangeDay)')
+
     # Tabela do przechowywania historii sprzedaży
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS sales_history (
@@ -191,7 +235,9 @@ def init_db():
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS custom_stock_periods (
             symbol TEXT PRIMARY KEY,
-            custom_period_days INTEGER NOT NULL,
+            delivery_time_days INTEGER DEFAULT 7,
+            order_frequency_days INTEGER DEFAULT 14,
+            optimal_order_quantity INTEGER DEFAULT 0,
             notes TEXT,
             created_at TEXT DEFAULT CURRENT_TIMESTAMP,
             updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
@@ -254,6 +300,20 @@ def init_db():
             cursor.execute('ALTER TABLE products ADD COLUMN StawkaVAT REAL')
             print("Dodano kolumnę StawkaVAT")
 
+        # Parametry zapasu w custom_stock_periods (jak w backend/migrate_stock_periods.py) - potrzebne
+        # do przeliczenia propozycji zakupowych także gdy migracja serwera nie była uruchomiona
+        cursor.execute("PRAGMA table_info(custom_stock_periods)")
+        stock_period_columns = [column[1] for column in cursor.fetchall()]
+
+        for column_name, column_type in (
+            ('delivery_time_days', 'INTEGER DEFAULT 7'),
+            ('order_frequency_days', 'INTEGER DEFAULT 14'),
+            ('optimal_order_quantity', 'INTEGER DEFAULT 0'),
+        ):
+            if column_name not in stock_period_columns:
+                cursor.execute(f'ALTER TABLE custom_stock_periods ADD COLUMN {column_name} {column_type}')
+                print(f"Dodano kolumnę {column_name} do custom_stock_periods")
+
         # Sprawdź kolumny w dead_stock_analysis
         cursor.execute("PRAGMA table_info(dead_stock_analysis)")
         dead_stock_columns = [column[1] for column in cursor.fetchall()]
@@ -283,14 +343,28 @@ def init_db():
 
     conn.commit()
     conn.close()
+    init_sync_runs_tables(DATABASE_FILE)
+    init_run_stamp_columns(DATABASE_FILE)
+    purchase_proposals.init_purchase_proposals_table(DATABASE_FILE)
+    sales_weekly.init_sales_weekly_table(DATABASE_FILE)
+    demand_forecast.init_demand_forecast_tables(DATABASE_FILE)
+    reorder_points.init_reorder_suggestions_table(DATABASE_FILE)
+    stock_movements.init_stock_movements_tables(DATABASE_FILE)
+    product_stock.init_product_stock_table(DATABASE_FILE)
+    stock_history.init_stock_history_table(DATABASE_FILE)
+    product_sync.init_row_hash_columns(DATABASE_FILE)
     print(f"Baza danych SQLite '{DATABASE_FILE}' zainicjowana.")
 
 # --- Funkcja do upsert produktu z śledzeniem zmian ---
 def upsert_product(cursor, symbol, product_data, source='SQL'):
     """
-    Wstawia lub aktualizuje produkt, śledząc zmiany stanu i ceny
+    Wstawia lub aktualizuje produkt, śledząc zmiany stanu i ceny.
+    Wiersze products i change_log oznaczane są id bieżącego uruchomienia (current_run_id) i czasem epoch.
+    Zwraca True gdy produkt jest nowy lub zmienił się stan/cena.
     """
-    now = datetime.now().isoformat()
+    now_dt = datetime.now()
+    now = now_dt.isoformat()
+    now_ts = int(now_dt.timestamp())
 
     # Sprawdź czy produkt już istnieje
     cursor.execute('SELECT Symbol, Stan, DetalicznaBrutto FROM products WHERE Symbol = ?', (symbol,))
@@ -346,7 +420,9 @@ def upsert_product(cursor, symbol, product_data, source='SQL'):
                 LastPriceChange = ?,
                 PreviousStan = ?,
                 PreviousPrice = ?,
-                IsNew = 0
+                IsNew = 0,
+                LastRunId = ?,
+                LastUpdatedTs = ?
             WHERE Symbol = ?
         ''', (
             product_data['Nazwa'],
@@ -374,24 +450,28 @@ def upsert_product(cursor, symbol, product_data, source='SQL'):
             now if price_changed else old_last_price_change,
             old_stan if stan_changed else old_previous_stan,
             old_price if price_changed else old_previous_price,
+            current_run_id,
+            now_ts,
             symbol
         ))
 
         # Loguj zmiany
         if stan_changed:
             cursor.execute('''
-                INSERT INTO change_log (Symbol, ChangeType, OldValue, NewValue, ChangeDate)
-                VALUES (?, 'STAN', ?, ?, ?)
-            ''', (symbol, old_stan, new_stan, now))
+                INSERT INTO change_log (Symbol, ChangeType, OldValue, NewValue, ChangeDate, RunId, ChangeTs)
+                VALUES (?, 'STAN', ?, ?, ?, ?, ?)
+            ''', (symbol, old_stan, new_stan, now, current_run_id, now_ts))
             print(f"  [{source}] ZMIANA STANU: {symbol} ({old_stan} -> {new_stan})")
 
         if price_changed:
             cursor.execute('''
-                INSERT INTO change_log (Symbol, ChangeType, OldValue, NewValue, ChangeDate)
-                VALUES (?, 'PRICE', ?, ?, ?)
-            ''', (symbol, old_price, new_price, now))
+                INSERT INTO change_log (Symbol, ChangeType, OldValue, NewValue, ChangeDate, RunId, ChangeTs)
+                VALUES (?, 'PRICE', ?, ?, ?, ?, ?)
+            ''', (symbol, old_price, new_price, now, current_run_id, now_ts))
             print(f"  [{source}] ZMIANA CENY: {symbol} ({old_price} -> {new_price})")
 
+        return bool(stan_changed or price_changed)
+
     else:
         # Nowy produkt
         cursor.execute('''
@@ -401,8 +481,9 @@ def upsert_product(cursor, symbol, product_data, source='SQL'):
                 CenaPromocyjna, Opis, Uwagi, Model, Rozmiar, Marka, ModelSP,
                 Sezon, Plec, Kolor, Przeznaczenie, Rodzaj, Grupa,
                 LastUpdated, LastStanChange, LastPriceChange,
-                PreviousStan, PreviousPrice, IsNew, DateAdded
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                PreviousStan, PreviousPrice, IsNew, DateAdded,
+                LastRunId, LastUpdatedTs
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             symbol,
             product_data['Nazwa'],
@@ -431,14 +512,17 @@ def upsert_product(cursor, symbol, product_data, source='SQL'):
             0,
             0,
             1,  # IsNew = 1 dla nowych produktów
-            now  # DateAdded - data dodania do bazy
+            now,  # DateAdded - data dodania do bazy
+            current_run_id,
+            now_ts
         ))
 
         cursor.execute('''
-            INSERT INTO change_log (Symbol, ChangeType, OldValue, NewValue, ChangeDate)
-            VALUES (?, 'NEW', 0, ?, ?)
-        ''', (symbol, new_stan, now))
+            INSERT INTO change_log (Symbol, ChangeType, OldValue, NewValue, ChangeDate, RunId, ChangeTs)
+            VALUES (?, 'NEW', 0, ?, ?, ?, ?)
+        ''', (symbol, new_stan, now, current_run_id, now_ts))
         print(f"  [{source}] NOWY PRODUKT: {symbol}")
+        return True
 
 # --- Funkcja do pobrania danych z SQL Server i zapisania ich do SQLite ---
 def upload_sql_data_to_sqlite():
@@ -450,7 +534,7 @@ def upload_sql_data_to_sqlite():
     print(f"\n[SQL Server] Laczenie z baza danych...")
     try:
         connection = get_sql_connection()
-    except pyodbc.Error as conn_err:
+    except Exception as conn_err:
         print(f"Blad polaczenia z SQL Server: {conn_err}")
         raise
 
@@ -485,112 +569,206 @@ def upload_sql_data_to_sqlite():
     GROUP BY Tw_Symbol, Tw_Nazwa, st_MagId, tw_Pole2, tw_Opis, tw_pole1, tw_pole3,
              tw_pole6, tw_pole5, tw_pole4, tw_pole7, tw_pole8, sl_Nazwa, tc_CenaNetto1, tc_CenaBrutto1,
              tc_CenaMag, tw_StawkaVat, tw_Uwagi
+    ORDER BY Tw_Symbol, st_MagId
     """
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    print(f"[SQL Server] Pobrano {len(rows)} produktow")
-
     conn_sqlite = sqlite3.connect(DATABASE_FILE)
     cursor_sqlite = conn_sqlite.cursor()
 
+    # Flaga IsNew dotyczy produktów dodanych w bieżącym cyklu
+    cursor_sqlite.execute('UPDATE products SET IsNew = 0 WHERE IsNew = 1')
+
+    cursor.execute(query)
+
+    # Wiersze pobierane i zapisywane porcjami - pamięć nie rośnie z wielkością katalogu.
     # Kolumny: Symbol(0), Nazwa(1), Stan(2), MagID(3), Marka(4), JM(5), Model(6), Opis(7),
     # Rozmiar(8), DetalicznaNetto(9), DetalicznaBrutto(10), CenaZakupuNetto(11), StawkaVAT(12),
     # Uwagi(13), ModelSP(14), Sezon(15), Plec(16), Kolor(17), Przeznaczenie(18), Rodzaj(19), Grupa(20)
-    changes_count = 0
-    for row in rows:
-        netto = float(row[9]) if isinstance(row[9], Decimal) else row[9]
-        brutto = float(row[10]) if isinstance(row[10], Decimal) else row[10]
-        cena_zakupu = float(row[11]) if isinstance(row[11], (int, float, Decimal)) and row[11] is not None else None
-        stawka_vat = float(row[12]) if isinstance(row[12], (int, float, Decimal)) and row[12] is not None else None
-
-        product_data = {
-            'Nazwa': row[1],
-            'Stan': float(row[2]),
-            'JM': row[5],
-            'DetalicznaNetto': netto,
-            'DetalicznaBrutto': brutto,
-            'CenaZakupuNetto': cena_zakupu,
-            'StawkaVAT': stawka_vat,
-            'CenaPromocyjna': None,
-            'Opis': row[7],
-            'Uwagi': row[13],
-            'Model': row[6],
-            'Rozmiar': row[8],
-            'Marka': row[4],
-            'ModelSP': row[14],
-            'Sezon': row[15],
-            'Plec': row[16],
-            'Kolor': row[17],
-            'Przeznaczenie': row[18],
-            'Rodzaj': row[19],
-            'Grupa': row[20],
-        }
+    # Wiersze są posortowane po symbolu i magazynie, więc dla symbolu zapisywany jest zawsze wiersz
+    # ostatniego magazynu (ten sam przy każdej synchronizacji - stały odcisk). Ostatni symbol porcji
+    # może mieć dalsze wiersze w kolejnej porcji, więc jego zapis jest odkładany do następnej porcji.
+    rows_read = 0
+    written_count = 0
+    changed_count = 0
+
+    def write_products(products_data):
+        """Zapis tylko produktów ze zmienionym odciskiem danych z SQL Server (SqlRowHash)"""
+        nonlocal written_count, changed_count
+        records = {symbol: tuple(data.values()) for symbol, data in products_data.items()}
+        fingerprints = product_sync.load_fingerprints(cursor_sqlite, product_sync.SQL_HASH_COLUMN, records.keys())
+        changed = product_sync.changed_rows(records, fingerprints)
+
+        for symbol, values, fingerprint in changed:
+            if upsert_product(cursor_sqlite, symbol, products_data[symbol], 'SQL'):
+                changed_count += 1
+        cursor_sqlite.executemany(
+            f'UPDATE products SET {product_sync.SQL_HASH_COLUMN} = ? WHERE Symbol = ?',
+            [(fingerprint, symbol) for symbol, values, fingerprint in changed]
+        )
+        written_count += len(changed)
 
-        upsert_product(cursor_sqlite, row[0], product_data, 'SQL')
-        changes_count += 1
+    pending = {}
+    for rows in iter_chunks(cursor):
+        rows_read += len(rows)
+        products_data = pending
+        for row in rows:
+            netto = float(row[9]) if isinstance(row[9], Decimal) else row[9]
+            brutto = float(row[10]) if isinstance(row[10], Decimal) else row[10]
+            cena_zakupu = float(row[11]) if isinstance(row[11], (int, float, Decimal)) and row[11] is not None else None
+            stawka_vat = float(row[12]) if isinstance(row[12], (int, float, Decimal)) and row[12] is not None else None
+
+            # Kolejny wiersz tego samego symbolu (następny magazyn) nadpisuje poprzedni
+            products_data[row[0]] = {
+                'Nazwa': row[1],
+                'Stan': float(row[2]),
+                'JM': row[5],
+                'DetalicznaNetto': netto,
+                'DetalicznaBrutto': brutto,
+                'CenaZakupuNetto': cena_zakupu,
+                'StawkaVAT': stawka_vat,
+                'CenaPromocyjna': None,
+                'Opis': row[7],
+                'Uwagi': row[13],
+                'Model': row[6],
+                'Rozmiar': row[8],
+                'Marka': row[4],
+                'ModelSP': row[14],
+                'Sezon': row[15],
+                'Plec': row[16],
+                'Kolor': row[17],
+                'Przeznaczenie': row[18],
+                'Rodzaj': row[19],
+                'Grupa': row[20],
+            }
+
+        last_symbol = rows[-1][0]
+        pending = {last_symbol: products_data.pop(last_symbol)}
+        write_products(products_data)
+    write_products(pending)
 
     conn_sqlite.commit()
     conn_sqlite.close()
     cursor.close()
     connection.close()
-    print(f"[SQL Server] Przetworzono {changes_count} produktow")
+    print(f"[SQL Server] Pobrano {rows_read} wierszy, zapisano {written_count} produktow (pozostale bez zmian)")
+    return {'rows_read': rows_read, 'rows_written': written_count, 'rows_changed': changed_count}
 
 # --- Funkcja do pobrania danych z pliku CSV i zapisania ich do SQLite ---
+def prepare_csv_products(csv_df):
+    """
+    Kolumny produktów z pliku stan.csv liczone na całych kolumnach (zamiast iterrows).
+    ModelSP jak extract_model_sp: ostatni wyraz modelu, a gdy jest liczbą - dwa ostatnie.
+    Zwraca ramkę z kolumnami products i indeksem Symbol.
+    """
+    model = csv_df['Model'].fillna('').astype(str).str.upper()
+    kolor = csv_df['Kolor'] if 'Kolor' in csv_df else pd.Series('', index=csv_df.index)
+    rozmiar = csv_df['Rozmiar'] if 'Rozmiar' in csv_df else pd.Series('', index=csv_df.index)
+
+    words = model.str.split()
+    last = words.str[-1]
+    two_last = words.str[-2] + ' ' + last
+    model_sp = pd.Series(
+        np.where(last.str.isdigit().fillna(False) & (words.str.len() >= 2), two_last, last.fillna('')),
+        index=csv_df.index
+    )
+
+    def numeric(column):
+        return pd.to_numeric(csv_df[column], errors='coerce').astype(float)
+
+    def nullable(series):
+        return series.astype(object).where(series.notna(), None)
+
+    frame = pd.DataFrame({
+        'Symbol': csv_df['KODEAN13'].astype(str).str.upper(),
+        'Nazwa': (model + ' ' + kolor.fillna('').astype(str)).str.upper(),
+        'Stan': numeric('Stan'),
+        'JM': 'szt.',
+        'DetalicznaNetto': None,
+        'DetalicznaBrutto': nullable(numeric('Cena_Detal')),
+        'CenaPromocyjna': nullable(numeric('PCena')),
+        'Opis': model_sp,
+        'Uwagi': None,
+        'Model': model,
+        'Rozmiar': nullable(rozmiar),
+        'Marka': 'ALPINE PRO',
+        'ModelSP': model_sp,
+        'Sezon': None,
+        'Plec': None,
+        'Kolor': nullable(kolor),
+        'Przeznaczenie': None,
+        'Rodzaj': None,
+    })
+    # Powtórzony kod EAN - ostatni wiersz wygrywa (jak kolejne upserty)
+    return frame.drop_duplicates('Symbol', keep='last').set_index('Symbol')
+
+
 def add_csv_data_to_sqlite(csv_url):
+    """
+    Stany ALPINE PRO z pliku stan.csv. Plik pobierany warunkowo (If-None-Match / If-Modified-Since)
+    i porównywany ze skrótem SHA-256 poprzedniej wersji - niezmieniony plik jest pomijany w całości.
+    Zapisywane są tylko produkty ze zmienionym odciskiem wiersza (CsvRowHash).
+    """
     print(f"\n[CSV] Pobieranie danych z {csv_url}...")
-    try:
-        response = requests.get(csv_url, timeout=30)
-        response.raise_for_status()
-        csv_data = response.content
-        csv_df = pd.read_csv(io.StringIO(csv_data.decode('ISO-8859-2')), sep=';')
-        print(f"[CSV] Pobrano {len(csv_df)} produktow")
-    except Exception as e:
-        print(f"Blad przy pobieraniu lub wczytywaniu pliku CSV: {e}")
-        return
-
     conn_sqlite = sqlite3.connect(DATABASE_FILE)
     cursor_sqlite = conn_sqlite.cursor()
 
-    changes_count = 0
-    for _, row in csv_df.iterrows():
-        symbol = str(row['KODEAN13']).upper()
-        nazwa = (str(row['Model']) + ' ' + str(row['Kolor'])).upper()
-        stan = row['Stan']
-        jm = 'szt.'
-        marka = 'ALPINE PRO'
-        model_full = str(row['Model']).upper()
-        model_sp = extract_model_sp(row['Model'])
-        cena_promocyjna = row['PCena']
-        detaliczna_brutto = row['Cena_Detal']
-        rozmiar = row.get('Rozmiar', '')
-        kolor = row.get('Kolor', '')
-
-        product_data = {
-            'Nazwa': nazwa,
-            'Stan': float(stan),
-            'JM': jm,
-            'DetalicznaNetto': None,
-            'DetalicznaBrutto': float(detaliczna_brutto) if isinstance(detaliczna_brutto, (int, float, Decimal)) else None,
-            'CenaPromocyjna': float(cena_promocyjna) if isinstance(cena_promocyjna, (int, float, Decimal)) else None,
-            'Opis': model_sp,
-            'Uwagi': None,
-            'Model': model_full,
-            'Rozmiar': rozmiar,
-            'Marka': marka,
-            'ModelSP': model_sp,
-            'Sezon': None,
-            'Plec': None,
-            'Kolor': kolor,
-            'Przeznaczenie': None,
-            'Rodzaj': None,
-        }
-
-        upsert_product(cursor_sqlite, symbol, product_data, 'CSV')
-        changes_count += 1
+    headers = {}
+    if stock_movements.read_sync_state(cursor_sqlite, 'csv_feed.url') == csv_url:
+        etag = stock_movements.read_sync_state(cursor_sqlite, 'csv_feed.etag')
+        last_modified = stock_movements.read_sync_state(cursor_sqlite, 'csv_feed.last_modified')
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        previous_hash = stock_movements.read_sync_state(cursor_sqlite, 'csv_feed.sha256')
+    else:
+        previous_hash = None
 
+    try:
+        response = requests.get(csv_url, timeout=30, headers=headers)
+        if response.status_code == 304:
+            print("[CSV] Plik bez zmian (304 Not Modified) - pomijam")
+            conn_sqlite.close()
+            return {}
+        response.raise_for_status()
+        content_hash = hashlib.sha256(response.content).hexdigest()
+        if content_hash == previous_hash:
+            print("[CSV] Plik bez zmian (ten sam skrót SHA-256) - pomijam")
+            csv_df = None
+        else:
+            csv_df = pd.read_csv(io.BytesIO(response.content), sep=';', encoding='ISO-8859-2')
+            print(f"[CSV] Pobrano {len(csv_df)} produktow")
+    except Exception as e:
+        print(f"Blad przy pobieraniu lub wczytywaniu pliku CSV: {e}")
+        conn_sqlite.close()
+        return {'error': str(e)}
+
+    result = {}
+    if csv_df is not None:
+        products_frame = prepare_csv_products(csv_df)
+        records = dict(zip(products_frame.index, products_frame.itertuples(index=False, name=None)))
+        fingerprints = product_sync.load_fingerprints(cursor_sqlite, product_sync.CSV_HASH_COLUMN, records.keys())
+        changed = product_sync.changed_rows(records, fingerprints)
+
+        columns = list(products_frame.columns)
+        changed_count = 0
+        for symbol, values, fingerprint in changed:
+            if upsert_product(cursor_sqlite, symbol, dict(zip(columns, values)), 'CSV'):
+                changed_count += 1
+        cursor_sqlite.executemany(
+            f'UPDATE products SET {product_sync.CSV_HASH_COLUMN} = ? WHERE Symbol = ?',
+            [(fingerprint, symbol) for symbol, values, fingerprint in changed]
+        )
+        print(f"[CSV] Zapisano {len(changed)} z {len(records)} produktow (pozostale bez zmian)")
+        result = {'rows_read': len(csv_df), 'rows_written': len(changed), 'rows_changed': changed_count}
+
+    # Walidatory zapisywane razem z danymi - po błędzie zapisu plik zostanie pobrany ponownie
+    stock_movements.write_sync_state(cursor_sqlite, 'csv_feed.url', csv_url)
+    stock_movements.write_sync_state(cursor_sqlite, 'csv_feed.etag', response.headers.get('ETag', ''))
+    stock_movements.write_sync_state(cursor_sqlite, 'csv_feed.last_modified', response.headers.get('Last-Modified', ''))
+    stock_movements.write_sync_state(cursor_sqlite, 'csv_feed.sha256', content_hash)
     conn_sqlite.commit()
     conn_sqlite.close()
-    print(f"[CSV] Przetworzono {changes_count} produktow")
+    return result
 
 # --- Funkcja do synchronizacji historii sprzedaży ---
 def sync_sales_history():
@@ -604,9 +782,9 @@ def sync_sales_history():
 
     try:
         connection = get_sql_connection()
-    except pyodbc.Error as conn_err:
+    except Exception as conn_err:
         print(f"[Historia Sprzedaży] Błąd połączenia: {str(conn_err)}")
-        return
+        return {'error': str(conn_err)}
 
     cursor_sql = connection.cursor()
 
@@ -700,197 +878,215 @@ def sync_sales_history():
         connection.close()
 
         print(f"[Historia Sprzedaży] Zsynchronizowano {records_count} rekordów")
+        return {'rows_read': len(rows), 'rows_written': records_count, 'rows_changed': records_count}
 
     except Exception as e:
         print(f"[Historia Sprzedaży] Błąd podczas synchronizacji: {str(e)}")
         cursor_sql.close()
         connection.close()
+        return {'error': str(e)}
+
+def sync_sales_weekly():
+    """Przelicza tygodniową sprzedaż per symbol (tabela sales_weekly) dla ostatnich tygodni"""
+    print("\n[Sprzedaż Tygodniowa] Łączenie z bazą danych SQL Server...")
+    try:
+        connection = get_sql_connection()
+    except Exception as conn_err:
+        print(f"[Sprzedaż Tygodniowa] Błąd połączenia: {str(conn_err)}")
+        return {'error': str(conn_err)}
+
+    try:
+        return sales_weekly.refresh_sales_weekly(DATABASE_FILE, connection)
+    except Exception as e:
+        print(f"[Sprzedaż Tygodniowa] Błąd podczas synchronizacji: {str(e)}")
+        return {'error': str(e)}
+    finally:
+        connection.close()
+
+def sync_product_stock():
+    """Przepisuje stany per magazyn (tabela product_stock) - tylko zmienione i usunięte pary symbol/magazyn"""
+    print("\n[Stany] Łączenie z bazą danych SQL Server...")
+    try:
+        connection = get_sql_connection()
+    except Exception as conn_err:
+        print(f"[Stany] Błąd połączenia: {str(conn_err)}")
+        return {'error': str(conn_err)}
+
+    conn_sqlite = sqlite3.connect(DATABASE_FILE)
+    try:
+        stock = product_stock.refresh_product_stock(conn_sqlite.cursor(), connection)
+        conn_sqlite.commit()
+        print(f"[Stany] Stany per magazyn: {stock['rows_read']} pozycji, zapisano {stock['rows_written']}, usunięto {stock['rows_removed']}")
+        return stock
+    except Exception as e:
+        print(f"[Stany] Błąd podczas synchronizacji: {str(e)}")
+        return {'error': str(e)}
+    finally:
+        conn_sqlite.close()
+        connection.close()
+
+def snapshot_stock_history():
+    """Dzienna migawka stanów z product_stock (zmiany względem poprzedniej) - pierwsza synchronizacja dnia"""
+    conn_sqlite = sqlite3.connect(DATABASE_FILE)
+    try:
+        cursor_sqlite = conn_sqlite.cursor()
+        snapshot_changes = stock_history.snapshot_stock(cursor_sqlite)
+        conn_sqlite.commit()
+        if snapshot_changes is None:
+            print("[Stany] Migawka stanów na dziś już zapisana")
+            return {}
+        cursor_sqlite.execute('SELECT COUNT(*) FROM product_stock')
+        rows_read = cursor_sqlite.fetchone()[0]
+        print(f"[Stany] Migawka stanów na dziś: {snapshot_changes} zmian względem poprzedniej")
+        return {'rows_read': rows_read, 'rows_written': snapshot_changes}
+    except Exception as e:
+        print(f"[Stany] Błąd migawki stanów: {str(e)}")
+        return {'error': str(e)}
+    finally:
+        conn_sqlite.close()
+
+def sync_stock_movements():
+    """Dopisuje nowe dostawy PZ/PW (tabela deliveries) i dzienną sprzedaż per symbol (sales_daily)"""
+    print("\n[Dostawy] Łączenie z bazą danych SQL Server...")
+    try:
+        connection = get_sql_connection()
+    except Exception as conn_err:
+        print(f"[Dostawy] Błąd połączenia: {str(conn_err)}")
+        return {'error': str(conn_err)}
+
+    try:
+        deliveries = stock_movements.refresh_deliveries(DATABASE_FILE, connection)
+        sales = stock_movements.refresh_sales_daily(DATABASE_FILE, connection)
+        return {
+            'rows_read': deliveries['rows_read'] + sales['rows_read'],
+            'rows_written': deliveries['rows_written'] + sales['rows_written']
+        }
+    except Exception as e:
+        print(f"[Dostawy] Błąd podczas synchronizacji: {str(e)}")
+        return {'error': str(e)}
+    finally:
+        connection.close()
 
 # --- Funkcja do pobierania szczegółowej historii dostaw i rotacji ---
-def get_detailed_product_rotation():
+def get_detailed_product_rotation(symbols=None):
     """
-    Pobiera szczegółową historię dostaw (PZ) i sprzedaży dla każdego produktu.
+    Pobiera szczegółową historię dostaw (PZ) i sprzedaży dla każdego produktu
+    z lokalnych tabel deliveries i sales_daily (bez zapytań do SQL Servera).
     Analizuje rotację MIĘDZY dostawami i wykrywa produkty które nie sprzedają się
     pomimo że poprzednie partie zeszły.
 
+    symbols: zbiór symboli do analizy (np. produkty na stanie), None = wszystkie z dostawami.
+    Wiersze pozostałych symboli są pomijane już przy odczycie kursora.
+
+    Symulacja stanu działa na posortowanych tablicach zdarzeń (symbol, dzień, dostawa przed
+    sprzedażą tego samego dnia): stan z obcięciem do zera = suma narastająca - min(0, minimum
+    sumy narastającej), a zerowy stan występuje gdy suma narastająca osiąga nowe minimum <= 0.
+
     Zwraca słownik z następującymi informacjami dla każdego produktu:
     - deliveries: lista dostaw
-    - rotation_analysis: analiza rotacji między dostawami
+    - rotation_analysis: liczba i ilość dostaw, czy był zerowy stan
     - has_zero_stock_history: czy był moment zerowego stanu
     - last_zero_date: data ostatniego zerowego stanu
     - sales_after_last_delivery: sprzedaż po ostatniej dostawie
     """
     try:
-        print("\n[Rotacja Dostaw] Łączenie z bazą danych SQL Server...")
-        connection = get_sql_connection()
-        cursor_sql = connection.cursor()
-
-        # Pobierz dostawy (PZ/PW) z ostatniego roku dla każdego produktu
+        # Dostawy (PZ/PW) i sprzedaż dzienna z ostatniego roku z lokalnych tabel (etap sync_stock_movements)
         # To pozwoli nam obliczyć dni bez ruchu od ostatniej dostawy, jeśli brak sprzedaży
-        deliveries_query = """
-        SELECT
-            tw.tw_Symbol AS Symbol,
-            d.dok_DataWyst AS DataDostawy,
-            dp.ob_IloscMag AS Ilosc,
-            d.dok_Id AS DokumentId
-        FROM
-            dok__Dokument d
-        INNER JOIN
-            dok_Pozycja dp ON d.dok_Id = dp.ob_DokMagId
-        INNER JOIN
-            tw__Towar tw ON dp.ob_TowId = tw.tw_Id
-        WHERE
-            (d.dok_NrPelny LIKE 'PZ%' OR d.dok_NrPelny LIKE 'PW%')  -- Dokumenty zakupu (przyjęcie zewnętrzne/wewnętrzne)
-            AND d.dok_MagId IN (1, 2, 3, 7, 9)
-            AND d.dok_Status <> 2
-            AND dp.ob_IloscMag > 0
-            AND CAST(d.dok_DataWyst AS DATE) >= DATEADD(day, -365, CAST(GETDATE() AS DATE))
-        ORDER BY
-            tw.tw_Symbol, d.dok_DataWyst
-        """
-
-        cursor_sql.execute(deliveries_query)
-        deliveries = cursor_sql.fetchall()
-
-        print(f"[Rotacja Dostaw] Pobrano {len(deliveries)} rekordów dostaw (PZ/PW)")
-
-        # Grupuj dostawy po produktach
-        # Kolumny: Symbol(0), DataDostawy(1), Ilosc(2), DokumentId(3)
-        product_deliveries = {}
-        for row in deliveries:
-            symbol = row[0]
-            if symbol not in product_deliveries:
-                product_deliveries[symbol] = {
-                    'deliveries': [],
-                    'has_zero_stock_history': False,
-                    'last_zero_date': None,
-                    'rotation_analysis': None
-                }
-
-            product_deliveries[symbol]['deliveries'].append({
-                'date': row[1],
-                'quantity': float(row[2] or 0),
-                'doc_id': row[3]
-            })
-
-        # Pobierz WSZYSTKIE sprzedaże jednym zapytaniem (optymalizacja!)
-        print(f"[Rotacja Dostaw] Pobieram historię sprzedaży...")
-        all_sales_query = """
-        SELECT
-            tw.tw_Symbol AS Symbol,
-            CAST(d.dok_DataWyst AS DATE) AS DataSprzedazy,
-            SUM(CASE
-                WHEN d.dok_Typ IN (14, 6) THEN -dp.ob_IloscMag
-                ELSE dp.ob_IloscMag
-            END) AS IloscSprzedana
-        FROM
-            dok__Dokument d
-        INNER JOIN
-            dok_Pozycja dp ON d.dok_Id = dp.ob_DokMagId
-        INNER JOIN
-            tw__Towar tw ON dp.ob_TowId = tw.tw_Id
-        WHERE
-            d.dok_DataWyst >= DATEADD(day, -365, GETDATE())
-            AND d.dok_MagId IN (1, 7, 9)
-            AND d.dok_Status <> 2
-            AND d.dok_Podtyp <> 1
-        GROUP BY
-            tw.tw_Symbol, CAST(d.dok_DataWyst AS DATE)
-        ORDER BY
-            tw.tw_Symbol, DataSprzedazy
-        """
-
-        cursor_sql.execute(all_sales_query)
-        all_sales_data = cursor_sql.fetchall()
+        since = (datetime.now().date() - timedelta(days=365)).isoformat()
+        conn_sqlite = sqlite3.connect(DATABASE_FILE)
+        cursor_sqlite = conn_sqlite.cursor()
+        cursor_sqlite.execute('''
+            SELECT Symbol, DataDostawy, Ilosc
+            FROM deliveries
+            WHERE Status <> 2 AND Ilosc > 0 AND DataDostawy >= ?
+            ORDER BY Symbol, DataDostawy
+        ''', (since,))
+
+        # Kolumny: Symbol(0), DataDostawy(1), Ilosc(2)
+        delivery_symbols, delivery_dates, delivery_qty = [], [], []
+        delivery_rows = 0
+        for row in cursor_sqlite:
+            delivery_rows += 1
+            if symbols is not None and row[0] not in symbols:
+                continue
+            delivery_symbols.append(row[0])
+            delivery_dates.append(datetime.strptime(row[1], '%Y-%m-%d %H:%M:%S'))
+            delivery_qty.append(float(row[2] or 0))
+
+        print(f"[Rotacja Dostaw] Wczytano {delivery_rows} rekordów dostaw (PZ/PW), analizowanych: {len(delivery_symbols)}")
 
-        # Grupuj sprzedaże po produktach
         # Kolumny: Symbol(0), DataSprzedazy(1), IloscSprzedana(2)
-        sales_by_product = {}
-        for row in all_sales_data:
-            symbol = row[0]
-            if symbol not in sales_by_product:
-                sales_by_product[symbol] = []
-            sales_by_product[symbol].append({
-                'date': row[1],
-                'quantity': float(row[2] or 0)
-            })
-
-        # Dla każdego produktu analizuj rotację
-        print(f"[Rotacja Dostaw] Analizuję rotację dla {len(product_deliveries)} produktów...")
-
-        for symbol, data in product_deliveries.items():
-            deliveries_sorted = sorted(data['deliveries'], key=lambda x: x['date'])
-            sales_data = sales_by_product.get(symbol, [])
-
-            # Symuluj stan magazynowy na podstawie dostaw i sprzedaży
-            # aby wykryć momenty zerowego stanu
-            stock_simulation = []
-            current_stock = 0
-            had_zero = False
-            last_zero_date = None
-
-            # Połącz dostawy i sprzedaż w jedną chronologiczną listę
-            events = []
-            for delivery in deliveries_sorted:
-                events.append({
-                    'date': delivery['date'].date() if hasattr(delivery['date'], 'date') else delivery['date'],
-                    'type': 'delivery',
-                    'quantity': delivery['quantity']
-                })
-
-            for sale in sales_data:
-                events.append({
-                    'date': sale['date'],
-                    'type': 'sale',
-                    'quantity': sale['quantity']
-                })
-
-            # Sortuj wszystkie wydarzenia chronologicznie
-            events.sort(key=lambda x: x['date'])
-
-            # Symuluj stan magazynowy
-            for event in events:
-                if event['type'] == 'delivery':
-                    current_stock += event['quantity']
-                else:  # sale
-                    current_stock -= event['quantity']
-
-                if current_stock <= 0:
-                    had_zero = True
-                    last_zero_date = event['date']
-                    current_stock = max(0, current_stock)  # Nie może być ujemny
-
-                stock_simulation.append({
-                    'date': event['date'],
-                    'type': event['type'],
-                    'quantity': event['quantity'],
-                    'stock_after': current_stock
-                })
-
-            data['has_zero_stock_history'] = had_zero
-            data['last_zero_date'] = last_zero_date
-            data['rotation_analysis'] = {
-                'total_deliveries': len(deliveries_sorted),
-                'total_delivered_qty': sum(d['quantity'] for d in deliveries_sorted),
-                'had_zero_stock': had_zero,
-                'stock_events': stock_simulation
-            }
+        # Sprzedaż potrzebna tylko dla symboli z dostawami
+        cursor_sqlite.execute('''
+            SELECT Symbol, DataSprzedazy, IloscSprzedana
+            FROM sales_daily
+            WHERE DataSprzedazy >= ?
+        ''', (since,))
+        with_deliveries = set(delivery_symbols)
+        sale_symbols, sale_dates, sale_qty = [], [], []
+        for row in cursor_sqlite:
+            if row[0] in with_deliveries:
+                sale_symbols.append(row[0])
+                sale_dates.append(row[1])
+                sale_qty.append(float(row[2] or 0))
+
+        cursor_sqlite.close()
+        conn_sqlite.close()
 
-            # Oblicz sprzedaż po ostatniej dostawie
-            if deliveries_sorted:
-                last_delivery_date = deliveries_sorted[-1]['date']
-                comparison_date = last_delivery_date.date() if hasattr(last_delivery_date, 'date') else last_delivery_date
-                sales_after_last = sum(
-                    event['quantity']
-                    for event in stock_simulation
-                    if event['type'] == 'sale' and event['date'] > comparison_date
-                )
-                data['sales_after_last_delivery'] = sales_after_last
-            else:
-                data['sales_after_last_delivery'] = 0
+        if not delivery_symbols:
+            print(f"[Rotacja Dostaw] Brak dostaw do analizy")
+            return {}
+
+        print(f"[Rotacja Dostaw] Analizuję rotację dla {len(with_deliveries)} produktów...")
+
+        # Tablice zdarzeń: dostawy (kind 0) przed sprzedażą (kind 1) tego samego dnia
+        codes, uniques = pd.factorize(pd.Series(delivery_symbols + sale_symbols))
+        days = pd.to_datetime(pd.Series(delivery_dates + sale_dates)).to_numpy().astype('datetime64[D]')
+        kinds = np.concatenate([np.zeros(len(delivery_symbols), dtype=np.int8), np.ones(len(sale_symbols), dtype=np.int8)])
+        quantities = np.array(delivery_qty + sale_qty, dtype=float)
+
+        order = np.lexsort((kinds, days, codes))
+        codes, days, kinds, quantities = codes[order], days[order], kinds[order], quantities[order]
+        is_delivery = kinds == 0
+
+        # Stan z obcięciem do zera: zerowy stan gdy suma narastająca <= min(0, wcześniejsze minimum)
+        cumulative = pd.Series(np.where(is_delivery, quantities, -quantities)).groupby(codes).cumsum()
+        previous_min = cumulative.groupby(codes).cummin().groupby(codes).shift(1, fill_value=0.0).clip(upper=0.0)
+        zero_event = (cumulative <= previous_min + 1e-9).to_numpy()
+
+        symbol_count = len(uniques)
+        had_zero = np.bincount(codes[zero_event], minlength=symbol_count) > 0
+        last_zero_day = pd.Series(days[zero_event]).groupby(codes[zero_event]).last()
+
+        # Sprzedaż po dniu ostatniej dostawy
+        last_delivery_day = pd.Series(days[is_delivery]).groupby(codes[is_delivery]).max()
+        last_delivery_by_code = last_delivery_day.reindex(range(symbol_count)).to_numpy().astype('datetime64[D]')
+        after_last = ~is_delivery & (days > last_delivery_by_code[codes])
+        sales_after_last = np.bincount(codes[after_last], weights=quantities[after_last], minlength=symbol_count)
+        total_deliveries = np.bincount(codes[is_delivery], minlength=symbol_count)
+        total_delivered = np.bincount(codes[is_delivery], weights=quantities[is_delivery], minlength=symbol_count)
+
+        # Lista dostaw per symbol (wiek zapasu w analizie dead stock), chronologicznie
+        deliveries_by_symbol = {}
+        for symbol, delivery_date, quantity in sorted(
+            zip(delivery_symbols, delivery_dates, delivery_qty), key=lambda x: (x[0], x[1])
+        ):
+            deliveries_by_symbol.setdefault(symbol, []).append({'date': delivery_date, 'quantity': quantity})
 
-        cursor_sql.close()
-        connection.close()
+        product_deliveries = {}
+        for code, symbol in enumerate(uniques):
+            zero_day = last_zero_day.get(code)
+            product_deliveries[symbol] = {
+                'deliveries': deliveries_by_symbol[symbol],
+                'has_zero_stock_history': bool(had_zero[code]),
+                'last_zero_date': pd.Timestamp(zero_day).date() if zero_day is not None else None,
+                'rotation_analysis': {
+                    'total_deliveries': int(total_deliveries[code]),
+                    'total_delivered_qty': float(total_delivered[code]),
+                    'had_zero_stock': bool(had_zero[code])
+                },
+                'sales_after_last_delivery': float(sales_after_last[code])
+            }
 
         print(f"[Rotacja Dostaw] Zakończono analizę rotacji")
         return product_deliveries
@@ -902,81 +1098,143 @@ def get_detailed_product_rotation():
         return {}
 
 
-# --- Funkcja do synchronizacji dat dodania produktów z dokumentów sprzedaży ---
+# --- Funkcja do synchronizacji dat dodania produktów z dokumentów PZ ---
 def sync_product_dates_from_pz():
     """
-    Pobiera pierwsze daty sprzedaży dla każdego produktu
-    i aktualizuje pole DateAdded w bazie SQLite
+    Pobiera pierwsze daty dokumentów PZ z lokalnej tabeli deliveries i aktualizuje pole
+    DateAdded w bazie SQLite - przyrostowo, tylko dla produktów:
+    - bez DateAdded lub dodanych od poprzedniego uruchomienia etapu,
+    - z nowymi pozycjami dostaw (PozycjaId powyżej znacznika z sync_state).
+    Daty trafiają do tabeli tymczasowej, a products aktualizowane jest jednym poleceniem.
     """
     try:
-        print("\n[Daty produktów] Łączenie z bazą danych SQL Server...")
-        connection = get_sql_connection()
-        cursor_sql = connection.cursor()
-
-        # Pobierz MIN(DataWystawienia) dla każdego produktu z dokumentów sprzedaży
-        query = """
-        SELECT
-            tw.tw_Symbol AS Symbol,
-            MIN(d.dok_DataWyst) AS PierwszaDataDokumentu
-        FROM
-            dok__Dokument d
-        INNER JOIN
-            dok_Pozycja dp ON d.dok_Id = dp.ob_DokMagId
-        INNER JOIN
-            tw__Towar tw ON dp.ob_TowId = tw.tw_Id
-        WHERE
-            d.dok_Typ IN (10, 11)  -- Paragon i Faktura sprzedaży
-            AND d.dok_MagId IN (1, 7, 9)
-        GROUP BY
-            tw.tw_Symbol
-        """
-
-        cursor_sql.execute(query)
-        rows = cursor_sql.fetchall()
-
-        print(f"[Daty produktów] Pobrano {len(rows)} dat pierwszej sprzedaży")
+        print("\n[Daty produktów] Odczyt pierwszych dat dostaw z lokalnej tabeli deliveries...")
+        started_at = datetime.now().isoformat()
 
         # Połącz z bazą SQLite
         conn_sqlite = sqlite3.connect(DATABASE_FILE)
         cursor_sqlite = conn_sqlite.cursor()
 
-        # Kolumny: Symbol(0), PierwszaDataDokumentu(1)
-        updated_count = 0
-        for row in rows:
-            symbol = row[0]
-            first_pz_date = row[1]
-
-            if first_pz_date:
-                # Aktualizuj DateAdded tylko jeśli jest NULL lub nowsze niż data PZ
-                cursor_sqlite.execute('''
-                    UPDATE products
-                    SET DateAdded = ?
-                    WHERE Symbol = ?
-                    AND (DateAdded IS NULL OR DateAdded > ?)
-                ''', (
-                    first_pz_date.strftime('%Y-%m-%d %H:%M:%S'),
-                    symbol,
-                    first_pz_date.strftime('%Y-%m-%d %H:%M:%S')
-                ))
-
-                if cursor_sqlite.rowcount > 0:
-                    updated_count += 1
-
+        last_position_id = int(stock_movements.read_sync_state(cursor_sqlite, 'product_dates.position_id', 0))
+        last_checked_at = stock_movements.read_sync_state(cursor_sqlite, 'product_dates.checked_at', '')
+        cursor_sqlite.execute('SELECT COALESCE(MAX(PozycjaId), 0) FROM deliveries')
+        max_position_id = cursor_sqlite.fetchone()[0]
+
+        # MIN(DataDostawy) z dokumentów PZ tylko dla symboli kandydatów
+        cursor_sqlite.execute('''
+            CREATE TEMP TABLE IF NOT EXISTS staged_first_dates (
+                Symbol TEXT PRIMARY KEY,
+                PierwszaDataDokumentu TEXT NOT NULL
+            )
+        ''')
+        cursor_sqlite.execute('DELETE FROM staged_first_dates')
+        cursor_sqlite.execute('''
+            INSERT INTO staged_first_dates (Symbol, PierwszaDataDokumentu)
+            SELECT Symbol, MIN(DataDostawy)
+            FROM deliveries
+            WHERE Typ = 10 AND MagId IN (1, 7, 9)
+              AND Symbol IN (
+                  SELECT Symbol FROM deliveries WHERE PozycjaId > ?
+                  UNION
+                  SELECT Symbol FROM products WHERE DateAdded IS NULL OR DateAdded >= ?
+              )
+            GROUP BY Symbol
+        ''', (last_position_id, last_checked_at))
+        staged_count = cursor_sqlite.rowcount
+
+        print(f"[Daty produktów] Przygotowano {staged_count} dat pierwszej dostawy (nowe dostawy od PozycjaId > {last_position_id})")
+
+        # Aktualizuj DateAdded tylko jeśli jest NULL lub nowsze niż data PZ
+        cursor_sqlite.execute('''
+            UPDATE products
+            SET DateAdded = (
+                SELECT s.PierwszaDataDokumentu FROM staged_first_dates s WHERE s.Symbol = products.Symbol
+            )
+            WHERE EXISTS (
+                SELECT 1 FROM staged_first_dates s
+                WHERE s.Symbol = products.Symbol
+                  AND (products.DateAdded IS NULL OR products.DateAdded > s.PierwszaDataDokumentu)
+            )
+        ''')
+        updated_count = cursor_sqlite.rowcount
+        cursor_sqlite.execute('DROP TABLE staged_first_dates')
+
+        stock_movements.write_sync_state(cursor_sqlite, 'product_dates.position_id', max_position_id)
+        stock_movements.write_sync_state(cursor_sqlite, 'product_dates.checked_at', started_at)
         conn_sqlite.commit()
         conn_sqlite.close()
 
-        cursor_sql.close()
-        connection.close()
-
         print(f"[Daty produktów] Zaktualizowano {updated_count} produktów")
+        return {'rows_read': staged_count, 'rows_written': updated_count, 'rows_changed': updated_count}
 
     except Exception as e:
         print(f"[Daty produktów] Błąd podczas synchronizacji: {str(e)}")
         import traceback
         traceback.print_exc()
+        return {'error': str(e)}
+
+# --- Kompaktowanie change_log ---
+def compact_change_log(retention_days=None):
+    """
+    Zwija zdarzenia change_log starsze niż retention_days do dziennych podsumowań
+    per symbol i typ zmiany (change_log_daily), a następnie usuwa je z change_log.
+    Granica jest wyrównana do początku dnia, więc każdy dzień zwijany jest w całości.
+    """
+    retention_days = CHANGE_LOG_RETENTION_DAYS if retention_days is None else retention_days
+    cutoff = (datetime.now().date() - timedelta(days=retention_days)).isoformat()
+
+    conn = sqlite3.connect(DATABASE_FILE)
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT COUNT(*) FROM change_log WHERE ChangeDate < ?', (cutoff,))
+    old_events = cursor.fetchone()[0]
+    if old_events == 0:
+        conn.close()
+        print(f"[Change Log] Brak zdarzeń starszych niż {cutoff}")
+        return {'rows_read': 0, 'rows_written': 0, 'rows_changed': 0}
+
+    changes_before = conn.total_changes
+    cursor.execute('''
+        WITH Grouped AS (
+            SELECT
+                Symbol,
+                substr(ChangeDate, 1, 10) AS ChangeDay,
+                ChangeType,
+                COUNT(*) AS Changes,
+                MIN(id) AS FirstId,
+                MAX(id) AS LastId,
+                MIN(NewValue) AS MinValue,
+                MAX(NewValue) AS MaxValue
+            FROM change_log
+            WHERE ChangeDate < ?
+            GROUP BY Symbol, substr(ChangeDate, 1, 10), ChangeType
+        )
+        INSERT INTO change_log_daily (
+            Symbol, ChangeDay, ChangeType, Changes, FirstOldValue, LastNewValue, MinValue, MaxValue
+        )
+        SELECT g.Symbol, g.ChangeDay, g.ChangeType, g.Changes, f.OldValue, l.NewValue, g.MinValue, g.MaxValue
+        FROM Grouped g
+        INNER JOIN change_log f ON f.id = g.FirstId
+        INNER JOIN change_log l ON l.id = g.LastId
+        WHERE 1
+        ON CONFLICT(Symbol, ChangeDay, ChangeType) DO UPDATE SET
+            Changes = Changes + excluded.Changes,
+            LastNewValue = excluded.LastNewValue,
+            MinValue = MIN(MinValue, excluded.MinValue),
+            MaxValue = MAX(MaxValue, excluded.MaxValue)
+    ''', (cutoff,))
+    summaries = conn.total_changes - changes_before
+
+    cursor.execute('DELETE FROM change_log WHERE ChangeDate < ?', (cutoff,))
+    conn.commit()
+    conn.close()
+
+    print(f"[Change Log] Zwinięto {old_events} zdarzeń sprzed {cutoff} do {summaries} podsumowań dziennych")
+    return {'rows_read': old_events, 'rows_written': summaries, 'rows_changed': old_events}
 
 # --- Funkcja do pobierania statystyk ---
-def get_stats():
+def get_stats(run_id=None):
+    """Statystyki uruchomienia - produkty i zmiany oznaczone jego id (indeksy LastRunId / RunId)"""
     conn = sqlite3.connect(DATABASE_FILE)
     cursor = conn.cursor()
 
@@ -986,18 +1244,14 @@ def get_stats():
     cursor.execute('SELECT COUNT(*) FROM products WHERE IsNew = 1')
     new_products = cursor.fetchone()[0]
 
-    # Produkty zmienione w ostatnim uruchomieniu (ostatnie 6 minut)
+    # Produkty zaktualizowane w tym uruchomieniu
     cursor.execute('''
         SELECT COUNT(*) FROM products
-        WHERE datetime(LastUpdated) > datetime('now', '-6 minutes')
-        AND IsNew = 0
-    ''')
+        WHERE LastRunId = ? AND IsNew = 0
+    ''', (run_id,))
     recently_updated = cursor.fetchone()[0]
 
-    cursor.execute('''
-        SELECT COUNT(*) FROM change_log
-        WHERE datetime(ChangeDate) > datetime('now', '-6 minutes')
-    ''')
+    cursor.execute('SELECT COUNT(*) FROM change_log WHERE RunId = ?', (run_id,))
     recent_changes = cursor.fetchone()[0]
 
     conn.close()
@@ -1019,17 +1273,14 @@ def compute_dead_stock_analysis():
     """
     print("\n[Dead Stock Analysis] Rozpoczynam przeliczanie analizy...")
 
-    # Pobierz szczegółową historię dostaw dla wszystkich produktów
-    product_deliveries = get_detailed_product_rotation()
-
     # Połączenie z SQLite
     conn_sqlite = sqlite3.connect(DATABASE_FILE)
     cursor_sqlite = conn_sqlite.cursor()
 
-    # Pobierz wszystkie produkty z bazy SQLite
-    cursor_sqlite.execute("SELECT * FROM products")
-    products = cursor_sqlite.fetchall()
-    columns = [description[0] for description in cursor_sqlite.description]
+    # Szczegółowa historia dostaw tylko dla produktów na stanie (pozostałe są pomijane w analizie)
+    cursor_sqlite.execute("SELECT Symbol FROM products WHERE Stan > 0")
+    stocked_symbols = {row[0] for row in cursor_sqlite.fetchall()}
+    product_deliveries = get_detailed_product_rotation(stocked_symbols)
 
     # Połączenie z SQL Server dla historii sprzedaży
     server = os.getenv('SQL_SERVER', r'10.101.101.5\INSERTGT')
@@ -1039,10 +1290,10 @@ def compute_dead_stock_analysis():
 
     try:
         sql_connection = get_sql_connection()
-    except pyodbc.Error as conn_err:
+    except Exception as conn_err:
         print(f"[Dead Stock Analysis] Błąd połączenia z SQL Server: {conn_err}")
         conn_sqlite.close()
-        return
+        return {'error': str(conn_err)}
 
     sql_cursor = sql_connection.cursor()
 
@@ -1107,27 +1358,28 @@ def compute_dead_stock_analysis():
         YearlySales.ob_TowId IS NOT NULL OR LastSale.ob_TowId IS NOT NULL
     """
 
+    # Konwertuj dane sprzedaży na słownik - porcjami, tylko dla produktów na stanie
+    # Kolumny: Symbol(0), IloscSprzedana(1), WartoscSprzedazy(2), OstatniaSprzedaz(3)
+    sales_data = {}
+    sales_rows_read = 0
     try:
         sql_cursor.execute(sales_query)
-        sales_rows = sql_cursor.fetchall()
+        for rows in iter_chunks(sql_cursor):
+            sales_rows_read += len(rows)
+            for row in rows:
+                symbol = row[0]
+                if symbol in stocked_symbols:
+                    sales_data[symbol] = {
+                        "IloscSprzedana": float(row[1] or 0),
+                        "WartoscSprzedazy": float(row[2] or 0),
+                        "OstatniaSprzedaz": row[3].strftime('%Y-%m-%d') if row[3] else None
+                    }
     except Exception as e:
         print(f"[Dead Stock Analysis] Błąd zapytania SQL: {e}")
         sql_cursor.close()
         sql_connection.close()
         conn_sqlite.close()
-        return
-
-    # Konwertuj dane sprzedaży na słownik
-    # Kolumny: Symbol(0), IloscSprzedana(1), WartoscSprzedazy(2), OstatniaSprzedaz(3)
-    sales_data = {}
-    for row in sales_rows:
-        symbol = row[0]
-        if symbol:
-            sales_data[symbol] = {
-                "IloscSprzedana": float(row[1] or 0),
-                "WartoscSprzedazy": float(row[2] or 0),
-                "OstatniaSprzedaz": row[3].strftime('%Y-%m-%d') if row[3] else None
-            }
+        return {'error': str(e)}
 
     sql_cursor.close()
     sql_connection.close()
@@ -1139,8 +1391,15 @@ def compute_dead_stock_analysis():
     today = datetime.now()
     analysis_timestamp = today.strftime('%Y-%m-%d %H:%M:%S')
     analyzed_count = 0
+    products_read = 0
 
-    for product in products:
+    # Produkty na stanie czytane porcjami osobnym kursorem (zapis wyników przez cursor_sqlite)
+    products_cursor = conn_sqlite.cursor()
+    products_cursor.execute("SELECT * FROM products WHERE Stan > 0")
+    columns = [description[0] for description in products_cursor.description]
+
+    for product in itertools.chain.from_iterable(iter_chunks(products_cursor)):
+        products_read += 1
         product_dict = dict(zip(columns, product))
         symbol = product_dict.get('Symbol')
 
@@ -1461,23 +1720,105 @@ def compute_dead_stock_analysis():
 
     print(f"[Dead Stock Analysis] Przeanalizowano {analyzed_count} produktów")
     print(f"[Dead Stock Analysis] Zakończono o {analysis_timestamp}")
+    return {'rows_read': products_read + sales_rows_read, 'rows_written': analyzed_count}
+
+def compute_purchase_proposals():
+    """
+    Przelicza propozycje zakupowe dla wszystkich przeznaczeń i grup (tabela purchase_proposals).
+    API czyta z tabeli tylko wybraną kategorię zamiast odpytywać SQL Server przy każdej zmianie.
+    """
+    print("\n[Purchase Proposals] Rozpoczynam przeliczanie propozycji zakupowych...")
+    try:
+        sql_connection = get_sql_connection()
+    except Exception as conn_err:
+        print(f"[Purchase Proposals] Błąd połączenia z SQL Server: {conn_err}")
+        return {'error': str(conn_err)}
+
+    try:
+        return purchase_proposals.compute_purchase_proposals(DATABASE_FILE, sql_connection)
+    except Exception as e:
+        print(f"[Purchase Proposals] Błąd przeliczania: {e}")
+        return {'error': str(e)}
+    finally:
+        sql_connection.close()
+
+def compute_reorder_suggestions():
+    """
+    Przelicza punkty zamówienia dla całego katalogu (tabela reorder_suggestions).
+    Dane lokalne: stany z products, sprzedaż z sales_weekly, parametry z custom_stock_periods.
+    """
+    print("\n[Punkty Zamówienia] Rozpoczynam przeliczanie punktów zamówienia...")
+    try:
+        return reorder_points.compute_reorder_suggestions(DATABASE_FILE)
+    except Exception as e:
+        print(f"[Punkty Zamówienia] Błąd przeliczania: {e}")
+        return {'error': str(e)}
+
+def compute_demand_forecasts():
+    """
+    Przelicza prognozy popytu (symbole, ModelSP) z tabeli sales_weekly.
+    Raz dziennie - przy pierwszej synchronizacji danego dnia; kolejne przebiegi pomijają etap.
+    """
+    if demand_forecast.last_computed_date(DATABASE_FILE) == datetime.now().date():
+        print("\n[Prognozy] Prognozy przeliczone dzisiaj - pomijam")
+        return {}
+
+    print("\n[Prognozy] Rozpoczynam przeliczanie prognoz popytu...")
+    try:
+        return demand_forecast.compute_demand_forecasts(DATABASE_FILE)
+    except Exception as e:
+        print(f"[Prognozy] Błąd przeliczania: {e}")
+        return {'error': str(e)}
 
 # Główna funkcja wykonawcza
-def execute_script():
+def run_stage(run, name, func, *args):
+    """Uruchamia etap i zapisuje jego czas oraz liczby wierszy w historii synchronizacji"""
+    try:
+        result = func(*args) or {}
+    except Exception as e:
+        run.stage(name, error=str(e))
+        raise
+    run.stage(
+        name,
+        rows_read=result.get('rows_read', 0),
+        rows_written=result.get('rows_written', 0),
+        rows_changed=result.get('rows_changed', 0),
+        error=result.get('error')
+    )
+    return result
+
+
+def execute_script(trigger_source='cli'):
     print(f"\n{'='*60}")
     print(f"Rozpoczynam aktualizacje danych: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"{'='*60}")
 
+    global current_run_id
     init_db()
-    upload_sql_data_to_sqlite()
-    csv_url = 'https://176.32.163.90/ealpinepro2/dane/sporting/stan.csv'
-    add_csv_data_to_sqlite(csv_url)
-    sync_sales_history()
-    sync_product_dates_from_pz()  # Synchronizuj daty dodania z dokumentów PZ
-    compute_dead_stock_analysis()  # Przelicz analizę dead stock
+    run = SyncRun(DATABASE_FILE, 'full', trigger_source)
+    current_run_id = run.run_id
+    try:
+        run_stage(run, 'upload_sql_data_to_sqlite', upload_sql_data_to_sqlite)
+        run_stage(run, 'sync_product_stock', sync_product_stock)  # Stany per magazyn (product_stock)
+        run_stage(run, 'snapshot_stock_history', snapshot_stock_history)  # Dzienna migawka stanów (stock_snapshot_deltas)
+        csv_url = 'https://176.32.163.90/ealpinepro2/dane/sporting/stan.csv'
+        run_stage(run, 'add_csv_data_to_sqlite', add_csv_data_to_sqlite, csv_url)
+        run_stage(run, 'sync_sales_history', sync_sales_history)
+        run_stage(run, 'sync_sales_weekly', sync_sales_weekly)  # Tygodniowa sprzedaż per symbol (stany minimalne)
+        run_stage(run, 'sync_stock_movements', sync_stock_movements)  # Lokalne kopie dostaw PZ/PW i sprzedaży dziennej
+        run_stage(run, 'sync_product_dates_from_pz', sync_product_dates_from_pz)  # Synchronizuj daty dodania z dokumentów PZ
+        run_stage(run, 'compute_dead_stock_analysis', compute_dead_stock_analysis)  # Przelicz analizę dead stock
+        run_stage(run, 'compute_purchase_proposals', compute_purchase_proposals)  # Propozycje zakupowe dla całego katalogu
+        run_stage(run, 'compute_reorder_suggestions', compute_reorder_suggestions)  # Punkty zamówienia (sugestie zakupów)
+        run_stage(run, 'compute_demand_forecasts', compute_demand_forecasts)  # Prognozy popytu (raz dziennie)
+        run_stage(run, 'compact_change_log', compact_change_log)  # Retencja surowych zdarzeń change_log
+    except Exception as e:
+        run.finish(error=str(e))
+        raise
+    run.finish()
 
     # Statystyki
-    stats = get_stats()
+    stats = get_stats(run.run_id)
     print(f"\n{'='*60}")
     print(f"PODSUMOWANIE:")
     print(f"  Laczna liczba produktow: {stats['total']}")
@@ -1487,10 +1828,10 @@ def execute_script():
     print(f"{'='*60}\n")
 
 # Retry i pętla główna
-def execute_script_with_retry(retry_count=5):
+def execute_script_with_retry(retry_count=5, trigger_source='cli'):
     for attempt in range(retry_count):
         try:
-            execute_script()
+            execute_script(trigger_source)
             print(f"Script executed successfully at {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
             return
         except Exception as e:
@@ -1512,8 +1853,9 @@ if __name__ == '__main__':
     # Inicjalizacja bazy danych przy starcie skryptu
     init_db()
 
-    # Uruchom raz
-    execute_script_with_retry()
+    # Uruchom raz (--trigger scheduled/manual przekazywane przez serwer do historii synchronizacji)
+    trigger_source = sys.argv[sys.argv.index('--trigger') + 1] if '--trigger' in sys.argv[:-1] else 'cli'
+    execute_script_with_retry(trigger_source=trigger_source)
 
     # Pętla co 5 minut (tylko jeśli uruchomiony bezpośrednio)
     # while True: